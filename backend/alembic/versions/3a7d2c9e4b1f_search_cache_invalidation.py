@@ -0,0 +1,45 @@
+"""Search cache invalidation log
+
+Revision ID: 3a7d2c9e4b1f
+Revises: 904e5138fffb
+Create Date: 2026-10-18 09:12:31.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3a7d2c9e4b1f"
+down_revision = "904e5138fffb"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "search_cache_invalidation",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("document_id", sa.String(), nullable=False),
+        sa.Column(
+            "time_created",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_search_cache_invalidation_time_created"),
+        "search_cache_invalidation",
+        ["time_created"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_search_cache_invalidation_time_created"),
+        table_name="search_cache_invalidation",
+    )
+    op.drop_table("search_cache_invalidation")
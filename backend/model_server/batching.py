@@ -0,0 +1,123 @@
+import queue
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass
+from dataclasses import field
+
+from payserai.configs.model_configs import EMBED_REQUEST_BATCH_MAX_SIZE
+from payserai.configs.model_configs import EMBED_REQUEST_BATCH_MAX_WAIT_MS
+from payserai.utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+@dataclass
+class _PendingEmbedRequest:
+    texts: list[str]
+    future: Future = field(default_factory=Future)
+
+
+class EmbedRequestBatcher:
+    """Coalesces concurrent embedding requests into a single call of `embed_func`.
+
+    The first request to arrive opens a batch, which is then held open for at most
+    `max_wait_ms` or until `max_batch_size` texts have been gathered. The texts of all
+    gathered requests are embedded together and the results are split back out to each
+    of the waiting callers. Requests which alone exceed `max_batch_size` are run as their
+    own batch."""
+
+    def __init__(
+        self,
+        embed_func: Callable[[list[str]], list[list[float]]],
+        max_batch_size: int = EMBED_REQUEST_BATCH_MAX_SIZE,
+        max_wait_ms: float = EMBED_REQUEST_BATCH_MAX_WAIT_MS,
+    ) -> None:
+        self.embed_func = embed_func
+        self.max_batch_size = max_batch_size
+        self.max_wait_secs = max_wait_ms / 1000
+
+        self._queue: queue.Queue[_PendingEmbedRequest] = queue.Queue()
+        # A request pulled off the queue that did not fit into the previous batch
+        self._carry_over: _PendingEmbedRequest | None = None
+        self._worker: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run, name="embed-request-batcher", daemon=True
+            )
+            self._worker.start()
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """Blocks until the batch containing these texts has been embedded"""
+        if not texts:
+            return []
+
+        self.start()
+        pending = _PendingEmbedRequest(texts=texts)
+        self._queue.put(pending)
+        return pending.future.result()
+
+    def _next_request(self, timeout: float | None) -> _PendingEmbedRequest | None:
+        if self._carry_over is not None:
+            pending, self._carry_over = self._carry_over, None
+            return pending
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _gather_batch(self) -> list[_PendingEmbedRequest]:
+        first = self._next_request(timeout=None)
+        if first is None:
+            return []
+
+        batch = [first]
+        num_texts = len(first.texts)
+        deadline = time.monotonic() + self.max_wait_secs
+        while num_texts < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            pending = self._next_request(timeout=remaining)
+            if pending is None:
+                break
+
+            if num_texts + len(pending.texts) > self.max_batch_size:
+                self._carry_over = pending
+                break
+
+            batch.append(pending)
+            num_texts += len(pending.texts)
+
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._gather_batch()
+            if not batch:
+                continue
+
+            all_texts = [text for pending in batch for text in pending.texts]
+            try:
+                embeddings = self.embed_func(all_texts)
+            except Exception as e:
+                logger.exception(f"Failed to embed batch of {len(all_texts)} texts")
+                for pending in batch:
+                    pending.future.set_exception(e)
+                continue
+
+            logger.debug(
+                f"Embedded {len(batch)} coalesced requests with {len(all_texts)} texts"
+            )
+            start_ind = 0
+            for pending in batch:
+                end_ind = start_ind + len(pending.texts)
+                pending.future.set_result(embeddings[start_ind:end_ind])
+                start_ind = end_ind
@@ -1,17 +1,23 @@
 from fastapi import APIRouter
+from fastapi import Header
 from fastapi import HTTPException
+from fastapi import Response
 
+from model_server.batching import EmbedRequestBatcher
 from payserai.configs.model_configs import CROSS_ENCODER_MODEL_ENSEMBLE
 from payserai.configs.model_configs import DOCUMENT_ENCODER_MODEL
+from payserai.configs.model_configs import ENABLE_EMBED_REQUEST_BATCHING
 from payserai.configs.model_configs import NORMALIZE_EMBEDDINGS
 from payserai.search.search_nlp_models import get_local_embedding_model
-from payserai.search.search_nlp_models import get_local_reranking_model_ensemble
+from payserai.search.search_nlp_models import get_local_reranking_scorer
 from payserai.utils.logger import setup_logger
 from payserai.utils.timing import log_function_time
 from shared_models.model_server_models import EmbedRequest
 from shared_models.model_server_models import EmbedResponse
+from shared_models.model_server_models import FLOAT_MATRIX_CONTENT_TYPE
 from shared_models.model_server_models import RerankRequest
 from shared_models.model_server_models import RerankResponse
+from shared_models.model_server_models import serialize_float_matrix
 
 logger = setup_logger()
 
@@ -19,6 +25,8 @@ WARM_UP_STRING = "Payserai is amazing"
 
 router = APIRouter(prefix="/encoder")
 
+_EMBED_BATCHER: EmbedRequestBatcher | None = None
+
 
 @log_function_time(print_only=True)
 def embed_text(
@@ -34,33 +42,58 @@ def embed_text(
     return embeddings
 
 
+def get_embed_batcher() -> EmbedRequestBatcher:
+    global _EMBED_BATCHER
+    if _EMBED_BATCHER is None:
+        _EMBED_BATCHER = EmbedRequestBatcher(embed_func=embed_text)
+    return _EMBED_BATCHER
+
+
 @log_function_time(print_only=True)
 def calc_sim_scores(query: str, docs: list[str]) -> list[list[float]]:
-    cross_encoders = get_local_reranking_model_ensemble()
-    sim_scores = [
-        encoder.predict([(query, doc) for doc in docs]).tolist()  # type: ignore
-        for encoder in cross_encoders
-    ]
-    return sim_scores
+    return get_local_reranking_scorer().predict(query=query, passages=docs).tolist()
+
 
+def _accepts_float_matrix(accept: str | None) -> bool:
+    return accept is not None and FLOAT_MATRIX_CONTENT_TYPE in accept
 
-@router.post("/bi-encoder-embed")
+
+@router.post("/bi-encoder-embed", response_model=EmbedResponse)
 def process_embed_request(
     embed_request: EmbedRequest,
-) -> EmbedResponse:
+    accept: str | None = Header(default=None),
+) -> EmbedResponse | Response:
     try:
-        embeddings = embed_text(texts=embed_request.texts)
+        if ENABLE_EMBED_REQUEST_BATCHING:
+            embeddings = get_embed_batcher().embed(embed_request.texts)
+        else:
+            embeddings = embed_text(texts=embed_request.texts)
+
+        if _accepts_float_matrix(accept):
+            return Response(
+                content=serialize_float_matrix(embeddings),
+                media_type=FLOAT_MATRIX_CONTENT_TYPE,
+            )
         return EmbedResponse(embeddings=embeddings)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/cross-encoder-scores")
-def process_rerank_request(embed_request: RerankRequest) -> RerankResponse:
+@router.post("/cross-encoder-scores", response_model=RerankResponse)
+def process_rerank_request(
+    embed_request: RerankRequest,
+    accept: str | None = Header(default=None),
+) -> RerankResponse | Response:
     try:
         sim_scores = calc_sim_scores(
             query=embed_request.query, docs=embed_request.documents
         )
+
+        if _accepts_float_matrix(accept):
+            return Response(
+                content=serialize_float_matrix(sim_scores),
+                media_type=FLOAT_MATRIX_CONTENT_TYPE,
+            )
         return RerankResponse(scores=sim_scores)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -70,12 +103,14 @@ def warm_up_bi_encoder() -> None:
     logger.info(f"Warming up Bi-Encoders: {DOCUMENT_ENCODER_MODEL}")
     get_local_embedding_model().encode(WARM_UP_STRING)
 
+    if ENABLE_EMBED_REQUEST_BATCHING:
+        logger.info("Starting embedding request batcher")
+        get_embed_batcher().start()
+
 
 def warm_up_cross_encoders() -> None:
     logger.info(f"Warming up Cross-Encoders: {CROSS_ENCODER_MODEL_ENSEMBLE}")
 
-    cross_encoders = get_local_reranking_model_ensemble()
-    [
-        cross_encoder.predict((WARM_UP_STRING, WARM_UP_STRING))
-        for cross_encoder in cross_encoders
-    ]
+    get_local_reranking_scorer().predict(
+        query=WARM_UP_STRING, passages=[WARM_UP_STRING]
+    )
@@ -12,10 +12,11 @@ from payserai.background.task_utils import name_cc_cleanup_task
 from payserai.background.task_utils import name_document_set_sync_task
 from payserai.configs.app_configs import FILE_CONNECTOR_TMP_STORAGE_PATH
 from payserai.configs.app_configs import JOB_TIMEOUT
+from payserai.configs.chat_configs import SEMANTIC_SEARCH_CACHE_TTL_SECS
 from payserai.connectors.file.utils import file_age_in_hours
 from payserai.db.connector_credential_pair import get_connector_credential_pair
 from payserai.db.deletion_attempt import check_deletion_attempt_is_allowed
-from payserai.db.document import prepare_to_modify_documents
+from payserai.db.document import modify_documents_with_locks
 from payserai.db.document_set import delete_document_set
 from payserai.db.document_set import fetch_document_sets
 from payserai.db.document_set import fetch_document_sets_for_documents
@@ -26,6 +27,8 @@ from payserai.db.engine import build_connection_string
 from payserai.db.engine import get_sqlalchemy_engine
 from payserai.db.engine import SYNC_DB_API
 from payserai.db.models import DocumentSet
+from payserai.db.search_cache import delete_old_search_cache_invalidations
+from payserai.db.search_cache import record_search_cache_invalidations
 from payserai.db.tasks import check_live_task_not_timed_out
 from payserai.db.tasks import get_latest_task
 from payserai.document_index.factory import get_default_document_index
@@ -98,30 +101,36 @@ def sync_document_set_task(document_set_id: int) -> None:
         document_ids: list[str], document_index: DocumentIndex
     ) -> None:
         logger.debug(f"Syncing document sets for: {document_ids}")
-        # begin a transaction, release lock at the end
+        # begin a transaction per round of locked documents, release lock at the end
         with Session(get_sqlalchemy_engine()) as db_session:
-            # acquires a lock on the documents so that no other process can modify them
-            prepare_to_modify_documents(
-                db_session=db_session, document_ids=document_ids
-            )
 
-            # get current state of document sets for these documents
-            document_set_map = {
-                document_id: document_sets
-                for document_id, document_sets in fetch_document_sets_for_documents(
-                    document_ids=document_ids, db_session=db_session
-                )
-            }
-
-            # update Vespa
-            document_index.update(
-                update_requests=[
-                    UpdateRequest(
-                        document_ids=[document_id],
-                        document_sets=set(document_set_map.get(document_id, [])),
+            def _sync_locked_documents(locked_ids: list[str]) -> None:
+                # get current state of document sets for these documents
+                document_set_map = {
+                    document_id: document_sets
+                    for document_id, document_sets in fetch_document_sets_for_documents(
+                        document_ids=locked_ids, db_session=db_session
                     )
-                    for document_id in document_ids
-                ]
+                }
+
+                # update Vespa
+                document_index.update(
+                    update_requests=[
+                        UpdateRequest(
+                            document_ids=[document_id],
+                            document_sets=set(document_set_map.get(document_id, [])),
+                        )
+                        for document_id in locked_ids
+                    ]
+                )
+                record_search_cache_invalidations(locked_ids, db_session)
+
+            # acquires a lock on the documents so that no other process can modify them,
+            # documents locked by another process are synced once it releases them
+            modify_documents_with_locks(
+                db_session=db_session,
+                document_ids=document_ids,
+                modify_fn=_sync_locked_documents,
             )
 
     with Session(get_sqlalchemy_engine()) as db_session:
@@ -215,6 +224,19 @@ def clean_old_temp_files_task(
             os.remove(full_file_path)
 
 
+@celery_app.task(
+    name="clean_old_search_cache_invalidations_task", soft_time_limit=JOB_TIMEOUT
+)
+def clean_old_search_cache_invalidations_task() -> None:
+    """The API servers only poll for recent invalidations, anything older than their
+    cache TTL is irrelevant"""
+    max_age = max(
+        timedelta(seconds=2 * SEMANTIC_SEARCH_CACHE_TTL_SECS), timedelta(hours=1)
+    )
+    with Session(get_sqlalchemy_engine()) as db_session:
+        delete_old_search_cache_invalidations(max_age=max_age, db_session=db_session)
+
+
 #####
 # Celery Beat (Periodic Tasks) Settings
 #####
@@ -227,4 +249,8 @@ celery_app.conf.beat_schedule = {
         "task": "clean_old_temp_files_task",
         "schedule": timedelta(minutes=30),
     },
+    "clean-old-search-cache-invalidations": {
+        "task": "clean_old_search_cache_invalidations_task",
+        "schedule": timedelta(hours=1),
+    },
 }
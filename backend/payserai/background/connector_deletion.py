@@ -23,7 +23,7 @@ from payserai.db.document import delete_document_by_connector_credential_pair
 from payserai.db.document import delete_documents_complete
 from payserai.db.document import get_document_connector_cnts
 from payserai.db.document import get_documents_for_connector_credential_pair
-from payserai.db.document import prepare_to_modify_documents
+from payserai.db.document import modify_documents_with_locks
 from payserai.db.document_set import get_document_sets_by_ids
 from payserai.db.document_set import (
     mark_cc_pair__document_set_relationships_to_be_deleted__no_commit,
@@ -31,6 +31,7 @@ from payserai.db.document_set import (
 from payserai.db.engine import get_sqlalchemy_engine
 from payserai.db.index_attempt import delete_index_attempts
 from payserai.db.models import ConnectorCredentialPair
+from payserai.db.search_cache import record_search_cache_invalidations
 from payserai.document_index.interfaces import DocumentIndex
 from payserai.document_index.interfaces import UpdateRequest
 from payserai.server.documents.models import ConnectorCredentialPairIdentifier
@@ -48,55 +49,63 @@ def _delete_connector_credential_pair_batch(
     document_index: DocumentIndex,
 ) -> None:
     with Session(get_sqlalchemy_engine()) as db_session:
-        # acquire lock for all documents in this batch so that indexing can't
-        # override the deletion
-        prepare_to_modify_documents(db_session=db_session, document_ids=document_ids)
 
-        document_connector_cnts = get_document_connector_cnts(
-            db_session=db_session, document_ids=document_ids
-        )
+        def _delete_locked_documents(locked_ids: list[str]) -> None:
+            document_connector_cnts = get_document_connector_cnts(
+                db_session=db_session, document_ids=locked_ids
+            )
 
-        # figure out which docs need to be completely deleted
-        document_ids_to_delete = [
-            document_id for document_id, cnt in document_connector_cnts if cnt == 1
-        ]
-        logger.debug(f"Deleting documents: {document_ids_to_delete}")
-        document_index.delete(doc_ids=document_ids_to_delete)
-        delete_documents_complete(
-            db_session=db_session,
-            document_ids=document_ids_to_delete,
-        )
+            # figure out which docs need to be completely deleted
+            document_ids_to_delete = [
+                document_id for document_id, cnt in document_connector_cnts if cnt == 1
+            ]
+            logger.debug(f"Deleting documents: {document_ids_to_delete}")
+            document_index.delete(doc_ids=document_ids_to_delete)
+            delete_documents_complete(
+                db_session=db_session,
+                document_ids=document_ids_to_delete,
+            )
 
-        # figure out which docs need to be updated
-        document_ids_to_update = [
-            document_id for document_id, cnt in document_connector_cnts if cnt > 1
-        ]
-        access_for_documents = get_access_for_documents(
-            document_ids=document_ids_to_update,
-            db_session=db_session,
-            cc_pair_to_delete=ConnectorCredentialPairIdentifier(
-                connector_id=connector_id,
-                credential_id=credential_id,
-            ),
-        )
-        update_requests = [
-            UpdateRequest(
-                document_ids=[document_id],
-                access=access,
+            # figure out which docs need to be updated
+            document_ids_to_update = [
+                document_id for document_id, cnt in document_connector_cnts if cnt > 1
+            ]
+            access_for_documents = get_access_for_documents(
+                document_ids=document_ids_to_update,
+                db_session=db_session,
+                cc_pair_to_delete=ConnectorCredentialPairIdentifier(
+                    connector_id=connector_id,
+                    credential_id=credential_id,
+                ),
+            )
+            update_requests = [
+                UpdateRequest(
+                    document_ids=[document_id],
+                    access=access,
+                )
+                for document_id, access in access_for_documents.items()
+            ]
+            logger.debug(f"Updating documents: {document_ids_to_update}")
+            document_index.update(update_requests=update_requests)
+            delete_document_by_connector_credential_pair(
+                db_session=db_session,
+                document_ids=document_ids_to_update,
+                connector_credential_pair_identifier=ConnectorCredentialPairIdentifier(
+                    connector_id=connector_id,
+                    credential_id=credential_id,
+                ),
             )
-            for document_id, access in access_for_documents.items()
-        ]
-        logger.debug(f"Updating documents: {document_ids_to_update}")
-        document_index.update(update_requests=update_requests)
-        delete_document_by_connector_credential_pair(
+            record_search_cache_invalidations(
+                document_ids_to_delete + document_ids_to_update, db_session
+            )
+
+        # acquire lock for the documents so that indexing can't override the deletion,
+        # documents locked by another job are handled once it releases them
+        modify_documents_with_locks(
             db_session=db_session,
-            document_ids=document_ids_to_update,
-            connector_credential_pair_identifier=ConnectorCredentialPairIdentifier(
-                connector_id=connector_id,
-                credential_id=credential_id,
-            ),
+            document_ids=document_ids,
+            modify_fn=_delete_locked_documents,
         )
-        db_session.commit()
 
 
 def cleanup_synced_entities(
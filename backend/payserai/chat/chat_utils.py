@@ -1,4 +1,5 @@
 import re
+from collections.abc import AsyncIterator
 from collections.abc import Callable
 from collections.abc import Iterator
 from functools import lru_cache
@@ -7,11 +8,14 @@ from typing import cast
 from langchain.schema.messages import BaseMessage
 from langchain.schema.messages import HumanMessage
 from langchain.schema.messages import SystemMessage
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from payserai.chat.models import CitationInfo
 from payserai.chat.models import PayseraiAnswerPiece
 from payserai.chat.models import LlmDoc
+from payserai.chat.models import LLMRelevanceFilterResponse
+from payserai.chat.models import StreamingError
 from payserai.configs.chat_configs import MULTILINGUAL_QUERY_EXPANSION
 from payserai.configs.chat_configs import NUM_DOCUMENT_TOKENS_FED_TO_GENERATIVE_MODEL
 from payserai.configs.constants import IGNORE_FOR_QA
@@ -19,9 +23,11 @@ from payserai.configs.model_configs import GEN_AI_HISTORY_CUTOFF
 from payserai.configs.model_configs import GEN_AI_MAX_INPUT_TOKENS
 from payserai.db.chat import get_chat_messages_by_session
 from payserai.db.models import ChatMessage
+from payserai.db.models import Passist
 from payserai.db.models import Prompt
 from payserai.indexing.models import InferenceChunk
-from payserai.llm.utils import check_number_of_tokens
+from payserai.llm.utils import count_prompt_tokens
+from payserai.llm.utils import get_chunk_token_count
 from payserai.prompts.chat_prompts import CHAT_USER_CONTEXT_FREE_PROMPT
 from payserai.prompts.chat_prompts import CHAT_USER_PROMPT
 from payserai.prompts.chat_prompts import CITATION_REMINDER
@@ -31,6 +37,10 @@ from payserai.prompts.chat_prompts import REQUIRE_CITATION_STATEMENT
 from payserai.prompts.constants import CODE_BLOCK_PAT
 from payserai.prompts.direct_qa_prompts import LANGUAGE_HINT
 from payserai.prompts.prompt_utils import get_current_llm_day_time
+from payserai.search.models import SearchQuery
+from payserai.utils.logger import setup_logger
+
+logger = setup_logger()
 
 # Maps connector enum string to a more natural language representation for the LLM
 # If not on the list, uses the original but slightly cleaned up, see below
@@ -116,6 +126,7 @@ def llm_doc_from_inference_chunk(inf_chunk: InferenceChunk) -> LlmDoc:
         source_type=inf_chunk.source_type,
         updated_at=inf_chunk.updated_at,
         link=inf_chunk.source_links[0] if inf_chunk.source_links else None,
+        token_count=inf_chunk.token_count,
     )
 
 
@@ -173,7 +184,14 @@ def build_chat_user_message(
     )
 
     user_prompt = user_prompt.strip()
-    token_count = len(llm_tokenizer(user_prompt))
+    # The documents make up most of the prompt, their token counts are already known
+    token_count = count_prompt_tokens(
+        user_prompt,
+        counted_texts=[
+            (doc.content.strip(), get_chunk_token_count(doc)) for doc in context_docs
+        ],
+        encode_fn=llm_tokenizer,
+    )
     user_msg = HumanMessage(content=user_prompt)
 
     return user_msg, token_count
@@ -185,7 +203,7 @@ def _get_usable_chunks(
     total_token_count = 0
     usable_chunks = []
     for chunk in chunks:
-        chunk_token_count = check_number_of_tokens(chunk.content)
+        chunk_token_count = get_chunk_token_count(chunk)
         if total_token_count + chunk_token_count > token_limit:
             break
 
@@ -236,9 +254,9 @@ def get_chunks_for_qa(
     Only selects chunks viable for Q&A, within the token limit, and prioritize those selected
     by the LLM in a separate flow (this can be turned off)
 
-    Note, the batch_offset calculation has to count the batches from the beginning each time as
-    there's no way to know which chunks were included in the prior batches without recounting atm,
-    this is somewhat slow as it requires tokenizing all the chunks again
+    Note, the batch_offset calculation counts the batches from the beginning each time as
+    there's no way to know which chunks were included in the prior batches. This only sums
+    up the chunk token counts, which are stored with the chunks at indexing time
     """
     batch_index = 0
     latest_batch_indices: list[int] = []
@@ -252,8 +270,7 @@ def get_chunks_for_qa(
             ):
                 continue
 
-            # We calculate it live in case the user uses a different LLM + tokenizer
-            chunk_token = check_number_of_tokens(chunk.content)
+            chunk_token = get_chunk_token_count(chunk)
             # 50 for an approximate/slight overestimate for # tokens for metadata for the chunk
             token_count += chunk_token + 50
 
@@ -283,6 +300,42 @@ def get_chunks_for_qa(
     return latest_batch_indices
 
 
+def select_llm_chunks(
+    top_chunks: list[InferenceChunk],
+    llm_chunk_selection: list[bool],
+    passist: Passist,
+    default_num_chunks: float,
+    default_chunk_size: int,
+) -> list[InferenceChunk]:
+    """The chunks passed to the LLM, within the token budget of the passist"""
+    num_llm_chunks = (
+        passist.num_chunks if passist.num_chunks is not None else default_num_chunks
+    )
+    llm_chunks_indices = get_chunks_for_qa(
+        chunks=top_chunks,
+        llm_chunk_selection=llm_chunk_selection,
+        token_limit=num_llm_chunks * default_chunk_size,
+    )
+    llm_chunks = [top_chunks[i] for i in llm_chunks_indices]
+
+    logger.debug(
+        f"Chunks fed to LLM: {[chunk.semantic_identifier for chunk in llm_chunks]}"
+    )
+    return llm_chunks
+
+
+def llm_relevance_filter_response(
+    llm_chunk_selection: list[bool], search_query: SearchQuery
+) -> LLMRelevanceFilterResponse:
+    return LLMRelevanceFilterResponse(
+        relevant_chunk_indices=[
+            index for index, value in enumerate(llm_chunk_selection) if value
+        ]
+        if not search_query.skip_llm_chunk_filter
+        else []
+    )
+
+
 def create_chat_chain(
     chat_session_id: int,
     db_session: Session,
@@ -405,56 +458,74 @@ def drop_messages_history_overflow(
     return prompt
 
 
-def extract_citations_from_stream(
-    tokens: Iterator[str],
-    context_docs: list[LlmDoc],
-    doc_id_to_rank_map: dict[str, int],
-) -> Iterator[PayseraiAnswerPiece | CitationInfo]:
-    max_citation_num = len(context_docs)
-    curr_segment = ""
-    prepend_bracket = False
-    cited_inds = set()
-    for token in tokens:
+class _CitationStreamProcessor:
+    """Rewrites the [n] citations in the streamed LLM output to the rank of the cited
+    document, fed one token at a time so that both blocking and async token streams can
+    be processed the same way"""
+
+    def __init__(
+        self, context_docs: list[LlmDoc], doc_id_to_rank_map: dict[str, int]
+    ) -> None:
+        self.context_docs = context_docs
+        self.doc_id_to_rank_map = doc_id_to_rank_map
+        self.max_citation_num = len(context_docs)
+        self.curr_segment = ""
+        self.prepend_bracket = False
+        self.cited_inds: set[int] = set()
+
+    def process_token(self, token: str) -> list[PayseraiAnswerPiece | CitationInfo]:
+        packets: list[PayseraiAnswerPiece | CitationInfo] = []
+
         # Special case of [1][ where ][ is a single token
         # This is where the model attempts to do consecutive citations like [1][2]
-        if prepend_bracket:
-            curr_segment += "[" + curr_segment
-            prepend_bracket = False
+        if self.prepend_bracket:
+            self.curr_segment += "[" + self.curr_segment
+            self.prepend_bracket = False
 
-        curr_segment += token
+        self.curr_segment += token
 
         possible_citation_pattern = r"(\[\d*$)"  # [1, [, etc
-        possible_citation_found = re.search(possible_citation_pattern, curr_segment)
+        possible_citation_found = re.search(
+            possible_citation_pattern, self.curr_segment
+        )
 
         citation_pattern = r"\[(\d+)\]"  # [1], [2] etc
-        citation_found = re.search(citation_pattern, curr_segment)
+        citation_found = re.search(citation_pattern, self.curr_segment)
 
         if citation_found:
             numerical_value = int(citation_found.group(1))
-            if 1 <= numerical_value <= max_citation_num:
-                context_llm_doc = context_docs[
+            if 1 <= numerical_value <= self.max_citation_num:
+                context_llm_doc = self.context_docs[
                     numerical_value - 1
                 ]  # remove 1 index offset
 
                 link = context_llm_doc.link
-                target_citation_num = doc_id_to_rank_map[context_llm_doc.document_id]
+                target_citation_num = self.doc_id_to_rank_map[
+                    context_llm_doc.document_id
+                ]
 
                 # Use the citation number for the document's rank in
                 # the search (or selected docs) results
-                curr_segment = re.sub(
-                    rf"\[{numerical_value}\]", f"[{target_citation_num}]", curr_segment
+                self.curr_segment = re.sub(
+                    rf"\[{numerical_value}\]",
+                    f"[{target_citation_num}]",
+                    self.curr_segment,
                 )
 
-                if target_citation_num not in cited_inds:
-                    cited_inds.add(target_citation_num)
-                    yield CitationInfo(
-                        citation_num=target_citation_num,
-                        document_id=context_llm_doc.document_id,
+                if target_citation_num not in self.cited_inds:
+                    self.cited_inds.add(target_citation_num)
+                    packets.append(
+                        CitationInfo(
+                            citation_num=target_citation_num,
+                            document_id=context_llm_doc.document_id,
+                        )
                     )
 
                 if link:
-                    curr_segment = re.sub(r"\[", "[[", curr_segment, count=1)
-                    curr_segment = re.sub("]", f"]]({link})", curr_segment, count=1)
+                    self.curr_segment = re.sub(r"\[", "[[", self.curr_segment, count=1)
+                    self.curr_segment = re.sub(
+                        "]", f"]]({link})", self.curr_segment, count=1
+                    )
 
                 # In case there's another open bracket like [1][, don't want to match this
             possible_citation_found = None
@@ -462,18 +533,66 @@ def extract_citations_from_stream(
         # if we see "[", but haven't seen the right side, hold back - this may be a
         # citation that needs to be replaced with a link
         if possible_citation_found:
-            continue
+            return packets
 
         # Special case with back to back citations [1][2]
-        if curr_segment and curr_segment[-1] == "[":
-            curr_segment = curr_segment[:-1]
-            prepend_bracket = True
+        if self.curr_segment and self.curr_segment[-1] == "[":
+            self.curr_segment = self.curr_segment[:-1]
+            self.prepend_bracket = True
 
-        yield PayseraiAnswerPiece(answer_piece=curr_segment)
-        curr_segment = ""
+        packets.append(PayseraiAnswerPiece(answer_piece=self.curr_segment))
+        self.curr_segment = ""
+        return packets
 
-    if curr_segment:
-        if prepend_bracket:
-            yield PayseraiAnswerPiece(answer_piece="[" + curr_segment)
-        else:
-            yield PayseraiAnswerPiece(answer_piece=curr_segment)
+    def finish(self) -> list[PayseraiAnswerPiece | CitationInfo]:
+        if not self.curr_segment:
+            return []
+        if self.prepend_bracket:
+            return [PayseraiAnswerPiece(answer_piece="[" + self.curr_segment)]
+        return [PayseraiAnswerPiece(answer_piece=self.curr_segment)]
+
+
+def extract_citations_from_stream(
+    tokens: Iterator[str],
+    context_docs: list[LlmDoc],
+    doc_id_to_rank_map: dict[str, int],
+) -> Iterator[PayseraiAnswerPiece | CitationInfo]:
+    processor = _CitationStreamProcessor(context_docs, doc_id_to_rank_map)
+    for token in tokens:
+        yield from processor.process_token(token)
+
+    yield from processor.finish()
+
+
+async def aextract_citations_from_stream(
+    tokens: AsyncIterator[str],
+    context_docs: list[LlmDoc],
+    doc_id_to_rank_map: dict[str, int],
+) -> AsyncIterator[PayseraiAnswerPiece | CitationInfo]:
+    """Same as extract_citations_from_stream, for async token streams"""
+    processor = _CitationStreamProcessor(context_docs, doc_id_to_rank_map)
+    async for token in tokens:
+        for packet in processor.process_token(token):
+            yield packet
+
+    for packet in processor.finish():
+        yield packet
+
+
+class StreamedAnswer:
+    """Collects what is saved with the response message from the streamed answer
+    packets, fed one at a time so blocking and async streams are handled the same way"""
+
+    def __init__(self) -> None:
+        self.answer = ""
+        self.error: str | None = None
+        self.citations: list[CitationInfo] = []
+
+    def add(self, packet: BaseModel) -> None:
+        if isinstance(packet, PayseraiAnswerPiece):
+            if packet.answer_piece:
+                self.answer += packet.answer_piece
+        elif isinstance(packet, StreamingError):
+            self.error = packet.error
+        elif isinstance(packet, CitationInfo):
+            self.citations.append(packet)
@@ -1,3 +1,4 @@
+from collections.abc import AsyncIterator
 from collections.abc import Iterator
 from datetime import datetime
 from typing import Any
@@ -20,6 +21,8 @@ class LlmDoc(BaseModel):
     source_type: DocumentSource
     updated_at: datetime | None
     link: str | None
+    # Number of LLM tokens in the content, None if not known upfront
+    token_count: int | None = None
 
 
 # First chunk of info for streaming QA
@@ -94,6 +97,10 @@ AnswerQuestionStreamReturn = Iterator[
     PayseraiAnswerPiece | PayseraiQuotes | StreamingError
 ]
 
+AnswerQuestionAsyncStreamReturn = AsyncIterator[
+    PayseraiAnswerPiece | PayseraiQuotes | StreamingError
+]
+
 
 class LLMMetricsContainer(BaseModel):
     prompt_tokens: int
@@ -1,22 +1,28 @@
+import asyncio
+from collections.abc import AsyncIterator
 from collections.abc import Callable
 from collections.abc import Iterator
-from functools import partial
 from typing import cast
+from uuid import UUID
 
+from langchain.schema.messages import BaseMessage
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from payserai.chat.chat_utils import build_chat_system_message
 from payserai.chat.chat_utils import build_chat_user_message
 from payserai.chat.chat_utils import create_chat_chain
 from payserai.chat.chat_utils import drop_messages_history_overflow
+from payserai.chat.chat_utils import aextract_citations_from_stream
 from payserai.chat.chat_utils import extract_citations_from_stream
-from payserai.chat.chat_utils import get_chunks_for_qa
 from payserai.chat.chat_utils import llm_doc_from_inference_chunk
+from payserai.chat.chat_utils import llm_relevance_filter_response
 from payserai.chat.chat_utils import map_document_id_order
+from payserai.chat.chat_utils import select_llm_chunks
+from payserai.chat.chat_utils import StreamedAnswer
 from payserai.chat.models import CitationInfo
 from payserai.chat.models import PayseraiAnswerPiece
 from payserai.chat.models import LlmDoc
-from payserai.chat.models import LLMRelevanceFilterResponse
 from payserai.chat.models import QADocsResponse
 from payserai.chat.models import StreamingError
 from payserai.configs.chat_configs import CHUNK_SIZE
@@ -33,6 +39,8 @@ from payserai.db.chat import get_or_create_root_message
 from payserai.db.chat import translate_db_message_to_chat_message_detail
 from payserai.db.chat import translate_db_search_doc_to_server_search_doc
 from payserai.db.models import ChatMessage
+from payserai.db.models import ChatSession
+from payserai.db.models import Passist
 from payserai.db.models import SearchDoc as DbSearchDoc
 from payserai.db.models import User
 from payserai.document_index.factory import get_default_document_index
@@ -43,13 +51,21 @@ from payserai.llm.interfaces import LLM
 from payserai.llm.utils import get_default_llm_token_encode
 from payserai.llm.utils import translate_history_to_basemessages
 from payserai.search.models import OptionalSearchSetting
+from payserai.search.models import QueryFlow
 from payserai.search.models import RetrievalDetails
+from payserai.search.models import SavedSearchDoc
+from payserai.search.models import SearchQuery
+from payserai.search.models import SearchType
+from payserai.search.request_preprocessing import aretrieval_preprocessing
 from payserai.search.request_preprocessing import retrieval_preprocessing
+from payserai.search.search_runner import afull_chunk_search_generator
+from payserai.search.search_runner import ainference_documents_from_ids
 from payserai.search.search_runner import chunks_to_search_docs
 from payserai.search.search_runner import full_chunk_search_generator
 from payserai.search.search_runner import inference_documents_from_ids
 from payserai.secondary_llm_flows.choose_search import check_if_need_search
 from payserai.secondary_llm_flows.query_expansion import history_based_query_rephrase
+from payserai.server.query_and_chat.models import ChatMessageDetail
 from payserai.server.query_and_chat.models import CreateChatMessageRequest
 from payserai.server.utils import get_json_line
 from payserai.utils.logger import setup_logger
@@ -58,6 +74,48 @@ from payserai.utils.timing import log_generator_function_time
 logger = setup_logger()
 
 
+def _build_chat_prompt(
+    query_message: ChatMessage,
+    history: list[ChatMessage],
+    context_docs: list[LlmDoc],
+    llm_tokenizer: Callable,
+    all_doc_useful: bool,
+) -> list[BaseMessage]:
+    if query_message.prompt is None:
+        raise RuntimeError("No prompt received for generating Gen AI answer.")
+
+    context_exists = len(context_docs) > 0
+
+    system_message_or_none, system_tokens = build_chat_system_message(
+        prompt=query_message.prompt,
+        context_exists=context_exists,
+        llm_tokenizer=llm_tokenizer,
+    )
+
+    history_basemessages, history_token_counts = translate_history_to_basemessages(
+        history
+    )
+
+    # Be sure the context_docs passed to build_chat_user_message
+    # Is the same as passed in later for extracting citations
+    user_message, user_tokens = build_chat_user_message(
+        chat_message=query_message,
+        prompt=query_message.prompt,
+        context_docs=context_docs,
+        llm_tokenizer=llm_tokenizer,
+        all_doc_useful=all_doc_useful,
+    )
+
+    return drop_messages_history_overflow(
+        system_msg=system_message_or_none,
+        system_token_count=system_tokens,
+        history_msgs=history_basemessages,
+        history_token_counts=history_token_counts,
+        final_msg=user_message,
+        final_msg_token_count=user_tokens,
+    )
+
+
 def generate_ai_chat_response(
     query_message: ChatMessage,
     history: list[ChatMessage],
@@ -79,43 +137,61 @@ def generate_ai_chat_response(
         raise RuntimeError("No prompt received for generating Gen AI answer.")
 
     try:
-        context_exists = len(context_docs) > 0
-
-        system_message_or_none, system_tokens = build_chat_system_message(
-            prompt=query_message.prompt,
-            context_exists=context_exists,
+        prompt = _build_chat_prompt(
+            query_message=query_message,
+            history=history,
+            context_docs=context_docs,
             llm_tokenizer=llm_tokenizer,
+            all_doc_useful=all_doc_useful,
         )
 
-        history_basemessages, history_token_counts = translate_history_to_basemessages(
-            history
+        # Good Debug/Breakpoint
+        tokens = llm.stream(prompt)
+
+        yield from extract_citations_from_stream(
+            tokens, context_docs, doc_id_to_rank_map
         )
 
-        # Be sure the context_docs passed to build_chat_user_message
-        # Is the same as passed in later for extracting citations
-        user_message, user_tokens = build_chat_user_message(
-            chat_message=query_message,
-            prompt=query_message.prompt,
+    except Exception as e:
+        logger.exception(f"LLM failed to produce valid chat message, error: {e}")
+        yield StreamingError(error=str(e))
+
+
+async def agenerate_ai_chat_response(
+    query_message: ChatMessage,
+    history: list[ChatMessage],
+    context_docs: list[LlmDoc],
+    doc_id_to_rank_map: dict[str, int],
+    llm: LLM | None,
+    llm_tokenizer: Callable,
+    all_doc_useful: bool,
+) -> AsyncIterator[PayseraiAnswerPiece | CitationInfo | StreamingError]:
+    if llm is None:
+        try:
+            llm = get_default_llm()
+        except GenAIDisabledException:
+            # Not an error if it's a user configuration
+            yield PayseraiAnswerPiece(answer_piece=DISABLED_GEN_AI_MSG)
+            return
+
+    if query_message.prompt is None:
+        raise RuntimeError("No prompt received for generating Gen AI answer.")
+
+    try:
+        prompt = _build_chat_prompt(
+            query_message=query_message,
+            history=history,
             context_docs=context_docs,
             llm_tokenizer=llm_tokenizer,
             all_doc_useful=all_doc_useful,
         )
 
-        prompt = drop_messages_history_overflow(
-            system_msg=system_message_or_none,
-            system_token_count=system_tokens,
-            history_msgs=history_basemessages,
-            history_token_counts=history_token_counts,
-            final_msg=user_message,
-            final_msg_token_count=user_tokens,
-        )
-
-        # Good Debug/Breakpoint
-        tokens = llm.stream(prompt)
+        tokens = llm.astream(prompt)
 
-        yield from extract_citations_from_stream(
+        async for packet in aextract_citations_from_stream(
             tokens, context_docs, doc_id_to_rank_map
-        )
+        ):
+            yield packet
 
     except Exception as e:
         logger.exception(f"LLM failed to produce valid chat message, error: {e}")
@@ -142,6 +218,205 @@ def translate_citations(
     return citation_to_saved_doc_id_map
 
 
+def _create_user_message_on_mainline(
+    new_msg_req: CreateChatMessageRequest,
+    user_id: UUID | None,
+    llm_tokenizer: Callable,
+    db_session: Session,
+) -> tuple[ChatMessage, ChatMessage, list[ChatMessage]]:
+    """Returns the new user message and the linear chain of messages it ends"""
+    chat_session_id = new_msg_req.chat_session_id
+    parent_id = new_msg_req.parent_message_id
+    message_text = new_msg_req.message
+
+    # Every chat Session begins with an empty root message
+    root_message = get_or_create_root_message(
+        chat_session_id=chat_session_id, db_session=db_session
+    )
+
+    if parent_id is not None:
+        parent_message = get_chat_message(
+            chat_message_id=parent_id,
+            user_id=user_id,
+            db_session=db_session,
+        )
+    else:
+        parent_message = root_message
+
+    # Create new message at the right place in the tree and update the parent's child pointer
+    # Don't commit yet until we verify the chat message chain
+    new_user_message = create_new_chat_message(
+        chat_session_id=chat_session_id,
+        parent_message=parent_message,
+        prompt_id=new_msg_req.prompt_id,
+        message=message_text,
+        token_count=len(llm_tokenizer(message_text)),
+        message_type=MessageType.USER,
+        db_session=db_session,
+        commit=False,
+    )
+
+    # Create linear history of messages
+    final_msg, history_msgs = create_chat_chain(
+        chat_session_id=chat_session_id, db_session=db_session
+    )
+
+    if final_msg.id != new_user_message.id:
+        db_session.rollback()
+        raise RuntimeError(
+            "The new message was not on the mainline. "
+            "Be sure to update the chat pointers before calling this."
+        )
+
+    # Save now to save the latest chat message
+    db_session.commit()
+
+    return new_user_message, final_msg, history_msgs
+
+
+# Frontend will erase whatever answer and show this instead
+# This will be the issue 99% of the time
+_LLM_FAILED_ERROR = "LLM failed to respond, have you set your API key?"
+_SAVE_RESPONSE_FAILED_ERROR = "Failed to parse LLM output"
+
+
+def _start_chat_turn(
+    new_msg_req: CreateChatMessageRequest,
+    user_id: UUID | None,
+    llm_tokenizer: Callable,
+    db_session: Session,
+) -> tuple[ChatSession, ChatMessage, ChatMessage, list[ChatMessage]]:
+    if new_msg_req.search_doc_ids is None and new_msg_req.retrieval_options is None:
+        raise RuntimeError(
+            "Must specify a set of documents for chat or specify search options"
+        )
+
+    chat_session = get_chat_session_by_id(
+        chat_session_id=new_msg_req.chat_session_id,
+        user_id=user_id,
+        db_session=db_session,
+    )
+    new_user_message, final_msg, history_msgs = _create_user_message_on_mainline(
+        new_msg_req=new_msg_req,
+        user_id=user_id,
+        llm_tokenizer=llm_tokenizer,
+        db_session=db_session,
+    )
+    # Relationships can't be lazy loaded once back on the event loop
+    chat_session.passist.document_sets
+    final_msg.prompt
+    return chat_session, new_user_message, final_msg, history_msgs
+
+
+def _get_llm_or_none() -> LLM | None:
+    try:
+        return get_default_llm()
+    except GenAIDisabledException:
+        return None
+
+
+def _search_setting(
+    retrieval_options: RetrievalDetails | None, passist: Passist
+) -> bool | None:
+    """Whether the request and the passist call for a search, None if the LLM decides"""
+    # Retrieval options are only None if reference_doc_ids are provided
+    if retrieval_options is None or passist.num_chunks == 0:
+        return False
+    if retrieval_options.run_search == OptionalSearchSetting.ALWAYS:
+        return True
+    if retrieval_options.run_search == OptionalSearchSetting.NEVER:
+        return False
+    return None
+
+
+def _get_reference_docs(
+    reference_doc_ids: list[int],
+    chat_session: ChatSession,
+    user_id: UUID | None,
+    db_session: Session,
+) -> tuple[list[tuple[str, int]], list[DbSearchDoc]]:
+    """The identifiers to fetch the selected documents with and their saved search docs"""
+    identifier_tuples = get_doc_query_identifiers_from_model(
+        search_doc_ids=reference_doc_ids,
+        chat_session=chat_session,
+        user_id=user_id,
+        db_session=db_session,
+    )
+
+    # In case the search doc is deleted, just don't include it
+    # though this should never happen
+    db_search_docs_or_none = [
+        get_db_search_doc_by_id(doc_id=doc_id, db_session=db_session)
+        for doc_id in reference_doc_ids
+    ]
+    return identifier_tuples, [db_sd for db_sd in db_search_docs_or_none if db_sd]
+
+
+def _save_search_docs(
+    top_chunks: list[InferenceChunk], db_session: Session
+) -> tuple[list[DbSearchDoc], list[SavedSearchDoc]]:
+    db_search_docs = [
+        create_db_search_doc(server_search_doc=top_doc, db_session=db_session)
+        for top_doc in chunks_to_search_docs(top_chunks)
+    ]
+    return db_search_docs, [
+        translate_db_search_doc_to_server_search_doc(db_search_doc)
+        for db_search_doc in db_search_docs
+    ]
+
+
+def _qa_docs_response(
+    rephrased_query: str | None,
+    response_docs: list[SavedSearchDoc],
+    retrieval_request: SearchQuery,
+    predicted_search_type: SearchType | None,
+    predicted_flow: QueryFlow | None,
+) -> QADocsResponse:
+    return QADocsResponse(
+        rephrased_query=rephrased_query,
+        top_documents=response_docs,
+        predicted_flow=predicted_flow,
+        predicted_search=predicted_search_type,
+        applied_source_filters=retrieval_request.filters.source_type,
+        applied_time_cutoff=retrieval_request.filters.time_cutoff,
+        recency_bias_multiplier=retrieval_request.recency_bias_multiplier,
+    )
+
+
+def _save_chat_response(
+    new_user_message: ChatMessage,
+    rephrased_query: str | None,
+    reference_db_search_docs: list[DbSearchDoc] | None,
+    streamed_answer: StreamedAnswer | None,
+    llm_tokenizer: Callable,
+    db_session: Session,
+) -> ChatMessageDetail:
+    """Saves the AI response message, without a streamed answer if no answer was asked for"""
+    db_citations = None
+    if streamed_answer is not None and reference_db_search_docs:
+        db_citations = translate_citations(
+            citations_list=streamed_answer.citations,
+            db_docs=reference_db_search_docs,
+        )
+
+    answer = streamed_answer.answer if streamed_answer is not None else ""
+    gen_ai_response_message = create_new_chat_message(
+        chat_session_id=new_user_message.chat_session_id,
+        parent_message=new_user_message,
+        prompt_id=new_user_message.prompt_id,
+        message=answer,
+        rephrased_query=rephrased_query,
+        token_count=len(llm_tokenizer(answer)) if answer else 0,
+        message_type=MessageType.ASSISTANT,
+        error=streamed_answer.error if streamed_answer is not None else None,
+        reference_docs=reference_db_search_docs,
+        db_session=db_session,
+        commit=True,
+        citations=db_citations,
+    )
+    return translate_db_message_to_chat_message_detail(gen_ai_response_message)
+
+
 @log_generator_function_time()
 def stream_chat_message(
     new_msg_req: CreateChatMessageRequest,
@@ -160,93 +435,35 @@ def stream_chat_message(
     """
     try:
         user_id = user.id if user is not None else None
-
-        chat_session = get_chat_session_by_id(
-            chat_session_id=new_msg_req.chat_session_id,
-            user_id=user_id,
-            db_session=db_session,
-        )
-
-        message_text = new_msg_req.message
-        chat_session_id = new_msg_req.chat_session_id
-        parent_id = new_msg_req.parent_message_id
-        prompt_id = new_msg_req.prompt_id
         reference_doc_ids = new_msg_req.search_doc_ids
         retrieval_options = new_msg_req.retrieval_options
-        passist = chat_session.passist
         query_override = new_msg_req.query_override
 
-        if reference_doc_ids is None and retrieval_options is None:
-            raise RuntimeError(
-                "Must specify a set of documents for chat or specify search options"
-            )
-
-        try:
-            llm = get_default_llm()
-        except GenAIDisabledException:
-            llm = None
-
+        llm = _get_llm_or_none()
         llm_tokenizer = get_default_llm_token_encode()
         document_index = get_default_document_index()
 
-        # Every chat Session begins with an empty root message
-        root_message = get_or_create_root_message(
-            chat_session_id=chat_session_id, db_session=db_session
-        )
-
-        if parent_id is not None:
-            parent_message = get_chat_message(
-                chat_message_id=parent_id,
-                user_id=user_id,
-                db_session=db_session,
-            )
-        else:
-            parent_message = root_message
-
-        # Create new message at the right place in the tree and update the parent's child pointer
-        # Don't commit yet until we verify the chat message chain
-        new_user_message = create_new_chat_message(
-            chat_session_id=chat_session_id,
-            parent_message=parent_message,
-            prompt_id=prompt_id,
-            message=message_text,
-            token_count=len(llm_tokenizer(message_text)),
-            message_type=MessageType.USER,
+        chat_session, new_user_message, final_msg, history_msgs = _start_chat_turn(
+            new_msg_req=new_msg_req,
+            user_id=user_id,
+            llm_tokenizer=llm_tokenizer,
             db_session=db_session,
-            commit=False,
-        )
-
-        # Create linear history of messages
-        final_msg, history_msgs = create_chat_chain(
-            chat_session_id=chat_session_id, db_session=db_session
         )
+        passist = chat_session.passist
 
-        if final_msg.id != new_user_message.id:
-            db_session.rollback()
-            raise RuntimeError(
-                "The new message was not on the mainline. "
-                "Be sure to update the chat pointers before calling this."
+        run_search = _search_setting(retrieval_options, passist)
+        if run_search is None:
+            run_search = check_if_need_search(
+                query_message=final_msg, history=history_msgs, llm=llm
             )
 
-        # Save now to save the latest chat message
-        db_session.commit()
-
-        run_search = False
-        # Retrieval options are only None if reference_doc_ids are provided
-        if retrieval_options is not None and passist.num_chunks != 0:
-            if retrieval_options.run_search == OptionalSearchSetting.ALWAYS:
-                run_search = True
-            elif retrieval_options.run_search == OptionalSearchSetting.NEVER:
-                run_search = False
-            else:
-                run_search = check_if_need_search(
-                    query_message=final_msg, history=history_msgs, llm=llm
-                )
-
         rephrased_query = None
+        reference_db_search_docs: list[DbSearchDoc] | None = None
+        llm_docs: list[LlmDoc] = []
+        doc_id_to_rank_map: dict[str, int] = {}
         if reference_doc_ids:
-            identifier_tuples = get_doc_query_identifiers_from_model(
-                search_doc_ids=reference_doc_ids,
+            identifier_tuples, reference_db_search_docs = _get_reference_docs(
+                reference_doc_ids=reference_doc_ids,
                 chat_session=chat_session,
                 user_id=user_id,
                 db_session=db_session,
@@ -254,25 +471,14 @@ def stream_chat_message(
 
             # Generates full documents currently
             # May extend to include chunk ranges
-            llm_docs: list[LlmDoc] = inference_documents_from_ids(
+            llm_docs = inference_documents_from_ids(
                 doc_identifiers=identifier_tuples,
-                document_index=get_default_document_index(),
+                document_index=document_index,
             )
             doc_id_to_rank_map = map_document_id_order(
                 cast(list[InferenceChunk | LlmDoc], llm_docs)
             )
 
-            # In case the search doc is deleted, just don't include it
-            # though this should never happen
-            db_search_docs_or_none = [
-                get_db_search_doc_by_id(doc_id=doc_id, db_session=db_session)
-                for doc_id in reference_doc_ids
-            ]
-
-            reference_db_search_docs = [
-                db_sd for db_sd in db_search_docs_or_none if db_sd
-            ]
-
         elif run_search:
             rephrased_query = (
                 history_based_query_rephrase(
@@ -298,9 +504,6 @@ def stream_chat_message(
                 search_query=retrieval_request,
                 document_index=document_index,
             )
-            time_cutoff = retrieval_request.filters.time_cutoff
-            recency_bias_multiplier = retrieval_request.recency_bias_multiplier
-            run_llm_chunk_filter = not retrieval_request.skip_llm_chunk_filter
 
             # First fetch and return the top chunks to the UI so the user can
             # immediately see some results
@@ -311,90 +514,52 @@ def stream_chat_message(
                 cast(list[InferenceChunk | LlmDoc], top_chunks)
             )
 
-            top_docs = chunks_to_search_docs(top_chunks)
-
-            reference_db_search_docs = [
-                create_db_search_doc(server_search_doc=top_doc, db_session=db_session)
-                for top_doc in top_docs
-            ]
-
-            response_docs = [
-                translate_db_search_doc_to_server_search_doc(db_search_doc)
-                for db_search_doc in reference_db_search_docs
-            ]
-
-            initial_response = QADocsResponse(
-                rephrased_query=rephrased_query,
-                top_documents=response_docs,
-                predicted_flow=predicted_flow,
-                predicted_search=predicted_search_type,
-                applied_source_filters=retrieval_request.filters.source_type,
-                applied_time_cutoff=time_cutoff,
-                recency_bias_multiplier=recency_bias_multiplier,
-            ).dict()
-            yield get_json_line(initial_response)
+            reference_db_search_docs, response_docs = _save_search_docs(
+                top_chunks, db_session=db_session
+            )
+            yield get_json_line(
+                _qa_docs_response(
+                    rephrased_query,
+                    response_docs,
+                    retrieval_request,
+                    predicted_search_type,
+                    predicted_flow,
+                ).dict()
+            )
 
             # Get the final ordering of chunks for the LLM call
             llm_chunk_selection = cast(list[bool], next(documents_generator))
 
             # Yield the list of LLM selected chunks for showing the LLM selected icons in the UI
-            llm_relevance_filtering_response = LLMRelevanceFilterResponse(
-                relevant_chunk_indices=[
-                    index for index, value in enumerate(llm_chunk_selection) if value
-                ]
-                if run_llm_chunk_filter
-                else []
-            ).dict()
-            yield get_json_line(llm_relevance_filtering_response)
+            yield get_json_line(
+                llm_relevance_filter_response(
+                    llm_chunk_selection, retrieval_request
+                ).dict()
+            )
 
             # Prep chunks to pass to LLM
-            num_llm_chunks = (
-                passist.num_chunks
-                if passist.num_chunks is not None
-                else default_num_chunks
-            )
-            llm_chunks_indices = get_chunks_for_qa(
-                chunks=top_chunks,
-                llm_chunk_selection=llm_chunk_selection,
-                token_limit=num_llm_chunks * default_chunk_size,
-            )
-            llm_chunks = [top_chunks[i] for i in llm_chunks_indices]
-            llm_docs = [llm_doc_from_inference_chunk(chunk) for chunk in llm_chunks]
-
-        else:
-            llm_docs = []
-            doc_id_to_rank_map = {}
-            reference_db_search_docs = None
-
-        # Cannot determine these without the LLM step or breaking out early
-        partial_response = partial(
-            create_new_chat_message,
-            chat_session_id=chat_session_id,
-            parent_message=new_user_message,
-            prompt_id=prompt_id,
-            # message=,
-            rephrased_query=rephrased_query,
-            # token_count=,
-            message_type=MessageType.ASSISTANT,
-            # error=,
-            reference_docs=reference_db_search_docs,
-            db_session=db_session,
-            commit=True,
-        )
+            llm_docs = [
+                llm_doc_from_inference_chunk(chunk)
+                for chunk in select_llm_chunks(
+                    top_chunks,
+                    llm_chunk_selection,
+                    passist=passist,
+                    default_num_chunks=default_num_chunks,
+                    default_chunk_size=default_chunk_size,
+                )
+            ]
 
         # If no prompt is provided, this is interpreted as not wanting an AI Answer
         # Simply provide/save the retrieval results
         if final_msg.prompt is None:
-            gen_ai_response_message = partial_response(
-                message="",
-                token_count=0,
-                citations=None,
-                error=None,
-            )
-            msg_detail_response = translate_db_message_to_chat_message_detail(
-                gen_ai_response_message
+            msg_detail_response = _save_chat_response(
+                new_user_message=new_user_message,
+                rephrased_query=rephrased_query,
+                reference_db_search_docs=reference_db_search_docs,
+                streamed_answer=None,
+                llm_tokenizer=llm_tokenizer,
+                db_session=db_session,
             )
-
             yield get_json_line(msg_detail_response.dict())
 
             # Stop here after saving message details, the above still needs to be sent for the
@@ -413,59 +578,217 @@ def stream_chat_message(
         )
 
         # Capture outputs and errors
-        llm_output = ""
-        error: str | None = None
-        citations: list[CitationInfo] = []
+        streamed_answer = StreamedAnswer()
         for packet in response_packets:
-            if isinstance(packet, PayseraiAnswerPiece):
-                token = packet.answer_piece
-                if token:
-                    llm_output += token
-            elif isinstance(packet, StreamingError):
-                error = packet.error
-            elif isinstance(packet, CitationInfo):
-                citations.append(packet)
-                continue
-
-            yield get_json_line(packet.dict())
+            streamed_answer.add(packet)
+            # Citations are saved with the response message instead
+            if not isinstance(packet, CitationInfo):
+                yield get_json_line(packet.dict())
     except Exception as e:
         logger.exception(e)
+        yield get_json_line(StreamingError(error=_LLM_FAILED_ERROR).dict())
+        return
 
-        # Frontend will erase whatever answer and show this instead
-        # This will be the issue 99% of the time
-        error_packet = StreamingError(
-            error="LLM failed to respond, have you set your API key?"
+    # Saving Gen AI answer and responding with message info
+    try:
+        msg_detail_response = _save_chat_response(
+            new_user_message=new_user_message,
+            rephrased_query=rephrased_query,
+            reference_db_search_docs=reference_db_search_docs,
+            streamed_answer=streamed_answer,
+            llm_tokenizer=llm_tokenizer,
+            db_session=db_session,
         )
+        yield get_json_line(msg_detail_response.dict())
+    except Exception as e:
+        logger.exception(e)
+        yield get_json_line(StreamingError(error=_SAVE_RESPONSE_FAILED_ERROR).dict())
 
-        yield get_json_line(error_packet.dict())
-        return
 
-    # Post-LLM answer processing
+@log_generator_function_time()
+async def astream_chat_message(
+    new_msg_req: CreateChatMessageRequest,
+    user: User | None,
+    db_session: AsyncSession,
+    # Needed to translate passist num_chunks to tokens to the LLM
+    default_num_chunks: float = DEFAULT_NUM_CHUNKS_FED_TO_CHAT,
+    default_chunk_size: int = CHUNK_SIZE,
+) -> AsyncIterator[str]:
+    """Same stream as stream_chat_message without holding a thread for the duration of
+    the request. The DB steps run through the async session, the secondary LLM flows
+    which don't have an async client run in worker threads."""
     try:
-        db_citations = None
-        if reference_db_search_docs:
-            db_citations = translate_citations(
-                citations_list=citations,
-                db_docs=reference_db_search_docs,
-            )
+        user_id = user.id if user is not None else None
+        reference_doc_ids = new_msg_req.search_doc_ids
+        retrieval_options = new_msg_req.retrieval_options
+        query_override = new_msg_req.query_override
+
+        llm = _get_llm_or_none()
+        llm_tokenizer = get_default_llm_token_encode()
+        document_index = get_default_document_index()
 
-        # Saving Gen AI answer and responding with message info
-        gen_ai_response_message = partial_response(
-            message=llm_output,
-            token_count=len(llm_tokenizer(llm_output)),
-            citations=db_citations,
-            error=error,
+        (
+            chat_session,
+            new_user_message,
+            final_msg,
+            history_msgs,
+        ) = await db_session.run_sync(
+            lambda session: _start_chat_turn(
+                new_msg_req=new_msg_req,
+                user_id=user_id,
+                llm_tokenizer=llm_tokenizer,
+                db_session=session,
+            )
         )
+        passist = chat_session.passist
+
+        run_search = _search_setting(retrieval_options, passist)
+        if run_search is None:
+            run_search = await asyncio.to_thread(
+                check_if_need_search,
+                query_message=final_msg,
+                history=history_msgs,
+                llm=llm,
+            )
+
+        rephrased_query = None
+        reference_db_search_docs: list[DbSearchDoc] | None = None
+        llm_docs: list[LlmDoc] = []
+        doc_id_to_rank_map: dict[str, int] = {}
+        if reference_doc_ids:
+            identifier_tuples, reference_db_search_docs = await db_session.run_sync(
+                lambda session: _get_reference_docs(
+                    reference_doc_ids=cast(list[int], reference_doc_ids),
+                    chat_session=chat_session,
+                    user_id=user_id,
+                    db_session=session,
+                )
+            )
+
+            llm_docs = await ainference_documents_from_ids(
+                doc_identifiers=identifier_tuples,
+                document_index=document_index,
+            )
+            doc_id_to_rank_map = map_document_id_order(
+                cast(list[InferenceChunk | LlmDoc], llm_docs)
+            )
+
+        elif run_search:
+            rephrased_query = (
+                await asyncio.to_thread(
+                    history_based_query_rephrase,
+                    query_message=final_msg,
+                    history=history_msgs,
+                    llm=llm,
+                )
+                if query_override is None
+                else query_override
+            )
+
+            (
+                retrieval_request,
+                predicted_search_type,
+                predicted_flow,
+            ) = await aretrieval_preprocessing(
+                query=rephrased_query,
+                retrieval_details=cast(RetrievalDetails, retrieval_options),
+                passist=passist,
+                user=user,
+            )
+
+            documents_generator = afull_chunk_search_generator(
+                search_query=retrieval_request,
+                document_index=document_index,
+            )
+
+            try:
+                top_chunks = cast(
+                    list[InferenceChunk], await anext(documents_generator)
+                )
+                doc_id_to_rank_map = map_document_id_order(
+                    cast(list[InferenceChunk | LlmDoc], top_chunks)
+                )
 
-        msg_detail_response = translate_db_message_to_chat_message_detail(
-            gen_ai_response_message
+                reference_db_search_docs, response_docs = await db_session.run_sync(
+                    lambda session: _save_search_docs(top_chunks, db_session=session)
+                )
+                yield get_json_line(
+                    _qa_docs_response(
+                        rephrased_query,
+                        response_docs,
+                        retrieval_request,
+                        predicted_search_type,
+                        predicted_flow,
+                    ).dict()
+                )
+
+                llm_chunk_selection = cast(list[bool], await anext(documents_generator))
+            finally:
+                await documents_generator.aclose()
+
+            yield get_json_line(
+                llm_relevance_filter_response(
+                    llm_chunk_selection, retrieval_request
+                ).dict()
+            )
+
+            llm_docs = [
+                llm_doc_from_inference_chunk(chunk)
+                for chunk in select_llm_chunks(
+                    top_chunks,
+                    llm_chunk_selection,
+                    passist=passist,
+                    default_num_chunks=default_num_chunks,
+                    default_chunk_size=default_chunk_size,
+                )
+            ]
+
+        if final_msg.prompt is None:
+            msg_detail_response = await db_session.run_sync(
+                lambda session: _save_chat_response(
+                    new_user_message=new_user_message,
+                    rephrased_query=rephrased_query,
+                    reference_db_search_docs=reference_db_search_docs,
+                    streamed_answer=None,
+                    llm_tokenizer=llm_tokenizer,
+                    db_session=session,
+                )
+            )
+            yield get_json_line(msg_detail_response.dict())
+            return
+
+        response_packets = agenerate_ai_chat_response(
+            query_message=final_msg,
+            history=history_msgs,
+            context_docs=llm_docs,
+            doc_id_to_rank_map=doc_id_to_rank_map,
+            llm=llm,
+            llm_tokenizer=llm_tokenizer,
+            all_doc_useful=reference_doc_ids is not None,
         )
 
-        yield get_json_line(msg_detail_response.dict())
+        streamed_answer = StreamedAnswer()
+        async for packet in response_packets:
+            streamed_answer.add(packet)
+            if not isinstance(packet, CitationInfo):
+                yield get_json_line(packet.dict())
     except Exception as e:
         logger.exception(e)
+        yield get_json_line(StreamingError(error=_LLM_FAILED_ERROR).dict())
+        return
 
-        # Frontend will erase whatever answer and show this instead
-        error_packet = StreamingError(error="Failed to parse LLM output")
-
-        yield get_json_line(error_packet.dict())
+    try:
+        msg_detail_response = await db_session.run_sync(
+            lambda session: _save_chat_response(
+                new_user_message=new_user_message,
+                rephrased_query=rephrased_query,
+                reference_db_search_docs=reference_db_search_docs,
+                streamed_answer=streamed_answer,
+                llm_tokenizer=llm_tokenizer,
+                db_session=session,
+            )
+        )
+        yield get_json_line(msg_detail_response.dict())
+    except Exception as e:
+        logger.exception(e)
+        yield get_json_line(StreamingError(error=_SAVE_RESPONSE_FAILED_ERROR).dict())
@@ -95,6 +95,22 @@ VESPA_TENANT_PORT = os.environ.get("VESPA_TENANT_PORT") or "19071"
 VESPA_DEPLOYMENT_ZIP = (
     os.environ.get("VESPA_DEPLOYMENT_ZIP") or "/app/payserai/vespa-app.zip"
 )
+# Max number of concurrent write requests (index/update/delete) kept in flight against Vespa
+VESPA_FEED_MAX_IN_FLIGHT = int(os.environ.get("VESPA_FEED_MAX_IN_FLIGHT") or 64)
+# Max number of concurrent read requests kept in flight against Vespa by one multi query
+# retrieval, e.g. the multilingual rephrasings of a search or fetching a set of documents
+VESPA_QUERY_MAX_IN_FLIGHT = int(os.environ.get("VESPA_QUERY_MAX_IN_FLIGHT") or 16)
+# Re-indexed documents only have their added or changed chunks written and their vanished
+# chunks deleted, chunks with only new permissions / document sets / boost are updated in
+# place. Set to false to delete and rewrite every chunk of a re-indexed document instead.
+VESPA_INCREMENTAL_REINDEX = (
+    os.environ.get("VESPA_INCREMENTAL_REINDEX", "True").lower() != "false"
+)
+# Where the index is persisted when DOCUMENT_INDEX_TYPE is "local", which keeps the index in
+# process instead of using Vespa. Every process using the index must see this directory.
+LOCAL_DOCUMENT_INDEX_DIR = (
+    os.environ.get("LOCAL_DOCUMENT_INDEX_DIR") or "/home/storage/local_index"
+)
 # Number of documents in a batch during indexing (further batching done by chunks before passing to bi-encoder)
 try:
     INDEX_BATCH_SIZE = int(os.environ.get("INDEX_BATCH_SIZE", 16))
@@ -168,6 +184,13 @@ CONTINUE_ON_CONNECTOR_FAILURE = os.environ.get(
 # fairly large amount of memory in order to increase substantially, since
 # each worker loads the embedding models into memory.
 NUM_INDEXING_WORKERS = int(os.environ.get("NUM_INDEXING_WORKERS") or 1)
+# If set, chunking + embedding of the next document batches overlaps with writing the
+# previous batch to the document index, each stage running in its own thread
+ENABLE_PIPELINED_INDEXING = (
+    os.environ.get("ENABLE_PIPELINED_INDEXING", "").lower() == "true"
+)
+# Max number of document batches waiting in front of each pipelined indexing stage
+INDEXING_PIPELINE_QUEUE_SIZE = int(os.environ.get("INDEXING_PIPELINE_QUEUE_SIZE") or 2)
 CHUNK_OVERLAP = 0
 # More accurate results at the expense of indexing speed and index size (stores additional 4 MINI_CHUNK vectors)
 ENABLE_MINI_CHUNK = os.environ.get("ENABLE_MINI_CHUNK", "").lower() == "true"
@@ -177,6 +200,12 @@ ENABLE_MINI_CHUNK = os.environ.get("ENABLE_MINI_CHUNK", "").lower() == "true"
 MINI_CHUNK_SIZE = 150
 # Timeout to wait for job's last update before killing it, in hours
 CLEANUP_INDEXING_JOBS_TIMEOUT = int(os.environ.get("CLEANUP_INDEXING_JOBS_TIMEOUT", 1))
+# Max seconds indexing, connector deletion and document set sync wait for documents which
+# are locked by another job. The other documents of the batch are updated in Postgres
+# meanwhile, but the rest of the work on the batch (e.g. chunking) waits for all of them.
+DOCUMENT_LOCK_MAX_WAIT_SECS = float(
+    os.environ.get("DOCUMENT_LOCK_MAX_WAIT_SECS") or 300
+)
 
 
 #####
@@ -194,6 +223,30 @@ MODEL_SERVER_PORT = int(os.environ.get("MODEL_SERVER_PORT") or "9000")
 INDEXING_MODEL_SERVER_HOST = (
     os.environ.get("INDEXING_MODEL_SERVER_HOST") or MODEL_SERVER_HOST
 )
+# If set, embeddings and reranking scores are requested from the model server as raw float32
+# matrices rather than JSON. Much smaller payloads and faster parsing for large indexing batches
+MODEL_SERVER_BINARY_TRANSPORT = (
+    os.environ.get("MODEL_SERVER_BINARY_TRANSPORT", "").lower() == "true"
+)
+# Connections to the model server are pooled and kept alive across requests
+MODEL_SERVER_POOL_SIZE = int(os.environ.get("MODEL_SERVER_POOL_SIZE") or 20)
+MODEL_SERVER_TIMEOUT_SECS = float(os.environ.get("MODEL_SERVER_TIMEOUT_SECS") or 120)
+# Connection failures and 5xx responses are retried with jittered exponential backoff
+MODEL_SERVER_RETRIES = int(os.environ.get("MODEL_SERVER_RETRIES") or 2)
+MODEL_SERVER_RETRY_BACKOFF_SECS = float(
+    os.environ.get("MODEL_SERVER_RETRY_BACKOFF_SECS") or 0.5
+)
+
+
+#####
+# Thread Pool Configs
+#####
+# Blocking work that is fanned out to threads (index queries, LLM calls, the reads around
+# Vespa writes) runs on process wide pools of these sizes instead of a new pool per call.
+# Work beyond the pool size waits in queue, the calling thread helps out in the meantime
+SEARCH_IO_THREADS = int(os.environ.get("SEARCH_IO_THREADS") or 32)
+LLM_THREADS = int(os.environ.get("LLM_THREADS") or 32)
+VESPA_WRITE_THREADS = int(os.environ.get("VESPA_WRITE_THREADS") or 16)
 
 
 #####
@@ -23,6 +23,11 @@ DEFAULT_NUM_CHUNKS_FED_TO_CHAT: float = (
 NUM_DOCUMENT_TOKENS_FED_TO_CHAT = int(
     os.environ.get("NUM_DOCUMENT_TOKENS_FED_TO_CHAT") or (CHUNK_SIZE * 3)
 )
+# Token counts are stored with the chunks at indexing time, chunks indexed before that
+# are tokenized at query time with the counts kept in an LRU cache of this size
+CHUNK_TOKEN_COUNT_CACHE_SIZE = int(
+    os.environ.get("CHUNK_TOKEN_COUNT_CACHE_SIZE") or 50_000
+)
 # For selecting a different LLM question-answering prompt format
 # Valid values: default, cot, weak
 QA_PROMPT_OVERRIDE = os.environ.get("QA_PROMPT_OVERRIDE") or None
@@ -42,6 +47,19 @@ DISABLE_LLM_FILTER_EXTRACTION = (
 DISABLE_LLM_CHUNK_FILTER = (
     os.environ.get("DISABLE_LLM_CHUNK_FILTER", "").lower() == "true"
 )
+# Number of chunks the LLM evaluates for usefulness in a single prompt. At 1, every chunk
+# gets its own LLM call, larger values trade some accuracy for fewer calls per search
+LLM_CHUNK_FILTER_BATCH_SIZE = int(os.environ.get("LLM_CHUNK_FILTER_BATCH_SIZE") or 1)
+# Usefulness verdicts are cached per query, chunk content and model, 0 disables the cache
+LLM_CHUNK_FILTER_CACHE_SIZE = int(
+    os.environ.get("LLM_CHUNK_FILTER_CACHE_SIZE") or 10_000
+)
+LLM_CHUNK_FILTER_CACHE_TTL_SECS = int(
+    os.environ.get("LLM_CHUNK_FILTER_CACHE_TTL_SECS") or 60 * 60 * 24
+)
+# If set, the verdicts are also stored in a SQLite file at this path so that they are
+# shared between API server workers and survive restarts
+LLM_CHUNK_FILTER_CACHE_PATH = os.environ.get("LLM_CHUNK_FILTER_CACHE_PATH") or None
 # Whether the LLM should be used to decide if a search would help given the chat history
 DISABLE_LLM_CHOOSE_SEARCH = (
     os.environ.get("DISABLE_LLM_CHOOSE_SEARCH", "").lower() == "true"
@@ -67,9 +85,36 @@ HYBRID_ALPHA = max(0, min(1, float(os.environ.get("HYBRID_ALPHA") or 0.66)))
 TITLE_CONTENT_RATIO = max(
     0, min(1, float(os.environ.get("TITLE_CONTENT_RATIO") or 0.20))
 )
+# Vector search goes through the HNSW index of the embeddings, which is approximate. Set to
+# false for an exact search over every chunk, which has full recall but is slow on large
+# indices
+VECTOR_SEARCH_APPROXIMATE = (
+    os.environ.get("VECTOR_SEARCH_APPROXIMATE", "True").lower() != "false"
+)
+# Extra candidates explored in the HNSW graph beyond the number of hits asked for, higher
+# values give better recall of the approximate vector search at the cost of latency
+VECTOR_SEARCH_EXPLORE_ADDITIONAL_HITS = int(
+    os.environ.get("VECTOR_SEARCH_EXPLORE_ADDITIONAL_HITS") or 0
+)
 # A list of languages passed to the LLM to rephase the query
 # For example "English,French,Spanish", be sure to use the "," separator
 MULTILINGUAL_QUERY_EXPANSION = os.environ.get("MULTILINGUAL_QUERY_EXPANSION") or None
+# Start the first search on the raw user query while the query rephrasing, filter extraction
+# and intent model run. The results are only used if the final query retrieves the same way,
+# otherwise the search is issued again
+ENABLE_SPECULATIVE_RETRIEVAL = (
+    os.environ.get("ENABLE_SPECULATIVE_RETRIEVAL", "").lower() == "true"
+)
+# Reuse the reranked chunks and LLM chunk selection of a recent search whose query embedding
+# is at least this similar and which has the same filters. Entries are dropped when any of
+# their documents is reindexed, deleted or has its boost/visibility changed. 0 disables it
+SEMANTIC_SEARCH_CACHE_SIZE = int(os.environ.get("SEMANTIC_SEARCH_CACHE_SIZE") or 0)
+SEMANTIC_SEARCH_CACHE_TTL_SECS = int(
+    os.environ.get("SEMANTIC_SEARCH_CACHE_TTL_SECS") or 600
+)
+SEMANTIC_SEARCH_CACHE_SIMILARITY_THRESHOLD = float(
+    os.environ.get("SEMANTIC_SEARCH_CACHE_SIMILARITY_THRESHOLD") or 0.95
+)
 
 # The backend logic for this being True isn't fully supported yet
 HARD_DELETE_CHATS = False
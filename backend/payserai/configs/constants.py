@@ -31,6 +31,8 @@ BOOST = "boost"
 DOC_UPDATED_AT = "doc_updated_at"  # Indexed as seconds since epoch
 PRIMARY_OWNERS = "primary_owners"
 SECONDARY_OWNERS = "secondary_owners"
+# Number of LLM tokens of the chunk content, computed at indexing time
+TOKEN_COUNT = "token_count"
 RECENCY_BIAS = "recency_bias"
 HIDDEN = "hidden"
 SCORE = "score"
@@ -65,6 +67,14 @@ class DocumentSource(str, Enum):
 class DocumentIndexType(str, Enum):
     COMBINED = "combined"  # Vespa
     SPLIT = "split"  # Typesense + Qdrant
+    LOCAL = "local"  # In-process, persisted to LOCAL_DOCUMENT_INDEX_DIR
+
+
+class EmbeddingPrecision(str, Enum):
+    # Cell type of the embedding tensors in the document index
+    FLOAT = "float"
+    BFLOAT16 = "bfloat16"  # Half the memory, float with a 7 bit mantissa
+    INT8 = "int8"  # Quarter of the memory, every vector scaled to -127..127
 
 
 class AuthType(str, Enum):
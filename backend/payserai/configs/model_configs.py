@@ -1,5 +1,7 @@
 import os
 
+from payserai.configs.constants import EmbeddingPrecision
+
 #####
 # Embedding/Reranking Model Configs
 #####
@@ -15,6 +17,12 @@ DOCUMENT_ENCODER_MODEL = (
 )
 # If the below is changed, Vespa deployment must also be changed
 DOC_EMBEDDING_DIM = 384
+# How the document index stores the embeddings, one of "float", "bfloat16" or "int8". The
+# smaller types save most of the index memory with a small loss in ranking precision.
+# Switching an existing Vespa index requires scripts/migrate_vespa_embedding_precision.py
+EMBEDDING_PRECISION = (
+    os.environ.get("EMBEDDING_PRECISION") or EmbeddingPrecision.FLOAT.value
+).lower()
 # Model should be chosen with 512 context size, ideally don't change this
 DOC_EMBEDDING_CONTEXT_SIZE = 512
 NORMALIZE_EMBEDDINGS = (
@@ -29,6 +37,35 @@ ASYM_QUERY_PREFIX = os.environ.get("ASYM_QUERY_PREFIX", "")
 ASYM_PASSAGE_PREFIX = os.environ.get("ASYM_PASSAGE_PREFIX", "")
 # Purely an optimization, memory limitation consideration
 BATCH_SIZE_ENCODE_CHUNKS = 8
+# Number of query embeddings kept in memory by the API server, set to 0 to disable the cache
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE") or 4096)
+QUERY_EMBEDDING_CACHE_TTL_SECS = int(
+    os.environ.get("QUERY_EMBEDDING_CACHE_TTL_SECS") or 60 * 60 * 24
+)
+# If set, query embeddings are additionally stored in a SQLite file at this path so that they
+# are shared across API server workers and survive restarts
+QUERY_EMBEDDING_CACHE_PATH = os.environ.get("QUERY_EMBEDDING_CACHE_PATH") or None
+# If set, passage embeddings are stored in a SQLite file at this path keyed by a hash of the
+# model, passage prefix and chunk text, so unchanged chunks are not re-embedded on re-index
+CHUNK_EMBEDDING_CACHE_PATH = os.environ.get("CHUNK_EMBEDDING_CACHE_PATH") or None
+# Oldest entries beyond this count are evicted, roughly 8KB per entry with the default model
+CHUNK_EMBEDDING_CACHE_MAX_ENTRIES = int(
+    os.environ.get("CHUNK_EMBEDDING_CACHE_MAX_ENTRIES") or 200_000
+)
+CHUNK_EMBEDDING_CACHE_MAX_AGE_DAYS = int(
+    os.environ.get("CHUNK_EMBEDDING_CACHE_MAX_AGE_DAYS") or 30
+)
+# If set, the model server coalesces concurrent embedding requests into a single forward pass.
+# Mostly beneficial for CPU-only deployments serving many concurrent users
+ENABLE_EMBED_REQUEST_BATCHING = (
+    os.environ.get("ENABLE_EMBED_REQUEST_BATCHING", "").lower() == "true"
+)
+# Max number of texts in one coalesced batch, requests larger than this are run on their own
+EMBED_REQUEST_BATCH_MAX_SIZE = int(os.environ.get("EMBED_REQUEST_BATCH_MAX_SIZE") or 32)
+# How long the first request of a batch waits for others to join before the batch is run
+EMBED_REQUEST_BATCH_MAX_WAIT_MS = float(
+    os.environ.get("EMBED_REQUEST_BATCH_MAX_WAIT_MS") or 5
+)
 # This controls the minimum number of pytorch "threads" to allocate to the embedding
 # model. If torch finds more threads on its own, this value is not used.
 MIN_THREADS_ML_MODELS = int(os.environ.get("MIN_THREADS_ML_MODELS") or 1)
@@ -50,6 +87,20 @@ CROSS_ENCODER_MODEL_ENSEMBLE = [
 CROSS_ENCODER_RANGE_MAX = 12
 CROSS_ENCODER_RANGE_MIN = -12
 CROSS_EMBED_CONTEXT_SIZE = 512
+# Number of (query, passage) pairs passed through a cross encoder at once
+CROSS_ENCODER_BATCH_SIZE = int(os.environ.get("CROSS_ENCODER_BATCH_SIZE") or 32)
+# Run the models of the ensemble at the same time instead of one after the other
+CROSS_ENCODER_CONCURRENT_ENSEMBLE = (
+    os.environ.get("CROSS_ENCODER_CONCURRENT_ENSEMBLE", "").lower() != "false"
+)
+# If set, passages that the first model of the ensemble scores below this are not scored
+# by the rest of the ensemble. Off by default as it changes the scores of those passages.
+# The scores of the default ensemble are within the RANGE above, -8 is clearly irrelevant
+CROSS_ENCODER_EARLY_CUTOFF_SCORE = (
+    float(os.environ["CROSS_ENCODER_EARLY_CUTOFF_SCORE"])
+    if os.environ.get("CROSS_ENCODER_EARLY_CUTOFF_SCORE")
+    else None
+)
 
 # Unused currently, can't be used with the current default encoder model due to its output range
 SEARCH_DISTANCE_CUTOFF = 0
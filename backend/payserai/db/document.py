@@ -1,5 +1,10 @@
+import random
+import threading
 import time
+from collections.abc import Callable
 from collections.abc import Sequence
+from dataclasses import dataclass
+from dataclasses import replace
 from datetime import datetime
 from uuid import UUID
 
@@ -11,6 +16,7 @@ from sqlalchemy import select
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
+from payserai.configs.app_configs import DOCUMENT_LOCK_MAX_WAIT_SECS
 from payserai.configs.constants import DEFAULT_BOOST
 from payserai.db.feedback import delete_document_feedback_for_documents
 from payserai.db.models import ConnectorCredentialPair
@@ -278,46 +284,138 @@ def delete_documents_complete(db_session: Session, document_ids: list[str]) -> N
     db_session.commit()
 
 
-def acquire_document_locks(db_session: Session, document_ids: list[str]) -> bool:
-    """Acquire locks for the specified documents. Ideally this shouldn't be
-    called with large list of document_ids (an exception could be made if the
-    length of holding the lock is very short).
+@dataclass
+class DocumentLockStats:
+    # Rounds in which documents were locked and modified
+    acquisitions: int = 0
+    # Documents which another job held the lock for when they were first tried
+    deferred_documents: int = 0
+    # Documents still locked by another job after the max wait
+    timed_out_documents: int = 0
+    # Backoff before retrying deferred documents, documents locked right away don't wait
+    total_wait_secs: float = 0.0
+    max_wait_secs: float = 0.0
 
-    Will simply raise an exception if any of the documents are already locked.
-    This prevents deadlocks (assuming that the caller passes in all required
-    document IDs in a single call).
-    """
-    stmt = (
-        select(DbDocument)
-        .where(DbDocument.id.in_(document_ids))
-        .with_for_update(nowait=True)
+
+_LOCK_STATS = DocumentLockStats()
+_LOCK_STATS_LOCK = threading.Lock()
+
+_LOCK_RETRY_BASE_DELAY = 0.5
+_LOCK_RETRY_MAX_DELAY = 30.0
+
+
+def get_document_lock_stats() -> DocumentLockStats:
+    """Lock contention of the document modifications of this process"""
+    with _LOCK_STATS_LOCK:
+        return replace(_LOCK_STATS)
+
+
+def _record_lock_wait(
+    acquisitions: int, deferred: int, timed_out: int, wait_secs: float
+) -> None:
+    with _LOCK_STATS_LOCK:
+        _LOCK_STATS.acquisitions += acquisitions
+        _LOCK_STATS.deferred_documents += deferred
+        _LOCK_STATS.timed_out_documents += timed_out
+        _LOCK_STATS.total_wait_secs += wait_secs
+        _LOCK_STATS.max_wait_secs = max(_LOCK_STATS.max_wait_secs, wait_secs)
+
+
+def _lock_retry_delay(attempt: int) -> float:
+    # Full jitter, so that jobs deferred by the same lock holder don't retry in lockstep
+    return random.uniform(
+        0, min(_LOCK_RETRY_MAX_DELAY, _LOCK_RETRY_BASE_DELAY * 2**attempt)
     )
-    # will raise exception if any of the documents are already locked
-    db_session.execute(stmt)
-    return True
 
 
-_NUM_LOCK_ATTEMPTS = 10
-_LOCK_RETRY_DELAY = 30
+def acquire_available_document_locks(
+    db_session: Session, document_ids: list[str]
+) -> list[str]:
+    """Locks the documents which are not locked by another transaction, without waiting
+    for the others (SKIP LOCKED). Returns the ids of the documents which could not be
+    locked. Documents without a row yet have nothing to lock and count as locked.
+    The locks are held until the transaction is finished."""
+    if not document_ids:
+        return []
+
+    locked_ids = set(
+        db_session.execute(
+            select(DbDocument.id)
+            .where(DbDocument.id.in_(document_ids))
+            .order_by(DbDocument.id)
+            .with_for_update(skip_locked=True)
+        ).scalars()
+    )
+    if len(locked_ids) == len(set(document_ids)):
+        return []
+
+    existing_ids = set(
+        db_session.execute(
+            select(DbDocument.id).where(DbDocument.id.in_(document_ids))
+        ).scalars()
+    )
+    return [
+        document_id
+        for document_id in document_ids
+        if document_id in existing_ids and document_id not in locked_ids
+    ]
 
 
-def prepare_to_modify_documents(db_session: Session, document_ids: list[str]) -> None:
-    """Try and acquire locks for the documents to prevent other jobs from
-    modifying them at the same time (e.g. avoid race conditions). This should be
-    called ahead of any modification to Vespa. Locks should be released by the
-    caller as soon as updates are complete by finishing the transaction."""
-    lock_acquired = False
-    for _ in range(_NUM_LOCK_ATTEMPTS):
-        try:
-            lock_acquired = acquire_document_locks(
-                db_session=db_session, document_ids=document_ids
+def modify_documents_with_locks(
+    db_session: Session,
+    document_ids: list[str],
+    modify_fn: Callable[[list[str]], None],
+    max_wait_secs: float = DOCUMENT_LOCK_MAX_WAIT_SECS,
+) -> None:
+    """Calls modify_fn with the ids of the documents it can lock right away, holding their
+    locks to prevent other jobs from modifying them at the same time (e.g. avoid race
+    conditions), and commits to release them. The documents locked by another job are
+    deferred to later rounds with a jittered backoff instead of stalling the whole batch.
+    Raises a RuntimeError if documents are still locked by another job after max_wait_secs,
+    the changes made to the documents locked before then are already committed.
+    """
+    remaining_ids = list(dict.fromkeys(document_ids))
+    num_deferred = 0
+    wait_secs = 0.0
+    attempt = 0
+    while True:
+        deferred_ids = acquire_available_document_locks(
+            db_session=db_session, document_ids=remaining_ids
+        )
+        deferred_id_set = set(deferred_ids)
+        locked_ids = [
+            document_id
+            for document_id in remaining_ids
+            if document_id not in deferred_id_set
+        ]
+        if locked_ids:
+            modify_fn(locked_ids)
+        db_session.commit()
+
+        if attempt == 0:
+            num_deferred = len(deferred_ids)
+        if not deferred_ids:
+            _record_lock_wait(attempt + 1, num_deferred, 0, wait_secs)
+            if num_deferred:
+                logger.info(
+                    f"Waited {wait_secs:.1f}s for {num_deferred} documents locked "
+                    "by another job"
+                )
+            return
+
+        if wait_secs >= max_wait_secs:
+            _record_lock_wait(attempt + 1, num_deferred, len(deferred_ids), wait_secs)
+            raise RuntimeError(
+                f"Failed to acquire locks after waiting {wait_secs:.1f}s "
+                f"for documents: {deferred_ids}"
             )
-        except Exception as e:
-            logger.info(f"Failed to acquire locks for documents, retrying. Error: {e}")
-            time.sleep(_LOCK_RETRY_DELAY)
-
-    if not lock_acquired:
-        raise RuntimeError(
-            f"Failed to acquire locks after {_NUM_LOCK_ATTEMPTS} attempts "
-            f"for documents: {document_ids}"
+
+        delay = min(_lock_retry_delay(attempt), max_wait_secs - wait_secs)
+        logger.info(
+            f"{len(deferred_ids)} documents are locked by another job, "
+            f"retrying them in {delay:.1f}s"
         )
+        time.sleep(delay)
+        wait_secs += delay
+        remaining_ids = deferred_ids
+        attempt += 1
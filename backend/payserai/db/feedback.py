@@ -12,6 +12,7 @@ from payserai.db.chat import get_chat_message
 from payserai.db.models import ChatMessageFeedback
 from payserai.db.models import Document as DbDocument
 from payserai.db.models import DocumentRetrievalFeedback
+from payserai.db.search_cache import record_search_cache_invalidations
 from payserai.document_index.interfaces import DocumentIndex
 from payserai.document_index.interfaces import UpdateRequest
 
@@ -58,6 +59,7 @@ def update_document_boost(
     )
 
     document_index.update([update])
+    record_search_cache_invalidations([document_id], db_session)
 
     db_session.commit()
 
@@ -78,6 +80,7 @@ def update_document_hidden(
     )
 
     document_index.update([update])
+    record_search_cache_invalidations([document_id], db_session)
 
     db_session.commit()
 
@@ -124,6 +127,7 @@ def create_doc_retrieval_feedback(
         )
         # Updates are generally batched for efficiency, this case only 1 doc/value is updated
         document_index.update([update])
+        record_search_cache_invalidations([document_id], db_session)
 
     db_session.add(retrieval_feedback)
     db_session.commit()
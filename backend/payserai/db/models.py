@@ -11,6 +11,7 @@ from uuid import UUID
 from fastapi_users.db import SQLAlchemyBaseOAuthAccountTableUUID
 from fastapi_users.db import SQLAlchemyBaseUserTableUUID
 from fastapi_users_db_sqlalchemy.access_token import SQLAlchemyBaseAccessTokenTableUUID
+from sqlalchemy import BigInteger
 from sqlalchemy import Boolean
 from sqlalchemy import DateTime
 from sqlalchemy import Enum
@@ -436,6 +437,20 @@ class DocumentByConnectorCredentialPair(Base):
     )
 
 
+class SearchCacheInvalidation(Base):
+    """Log of documents changed in the document index. The API servers poll it to drop
+    their cached search results which contain these documents"""
+
+    __tablename__ = "search_cache_invalidation"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # Not a foreign key since deleted documents are logged as well
+    document_id: Mapped[str] = mapped_column(String)
+    time_created: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True
+    )
+
+
 """
 Messages Tables
 """
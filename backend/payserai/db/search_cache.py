@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import timedelta
+
+from sqlalchemy import delete
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from payserai.db.models import SearchCacheInvalidation
+
+# Rows are only visible once their transaction commits, so a row may show up after rows
+# with a later time_created were already read. Each poll re-reads this far back to catch
+# those, it needs to cover the time between logging an invalidation and the commit.
+_INVALIDATION_LOOKBACK = timedelta(seconds=30)
+
+
+@dataclass
+class SearchCacheInvalidationCursor:
+    # Database time of the previous poll
+    polled_at: datetime
+    # Invalidations within the lookback window which were already returned
+    seen_ids: set[int]
+
+
+def record_search_cache_invalidations(
+    document_ids: list[str], db_session: Session
+) -> None:
+    """To be called along with every document index write which changes what a search
+    returns for these documents.
+    NOTE: does not commit transaction so that this can be used as part of a
+    larger transaction block."""
+    if not document_ids:
+        return
+
+    db_session.add_all(
+        [
+            # The time of the insert rather than the start of the transaction, which
+            # may be long before the commit
+            SearchCacheInvalidation(
+                document_id=document_id, time_created=func.clock_timestamp()
+            )
+            for document_id in set(document_ids)
+        ]
+    )
+
+
+def advance_search_cache_invalidation_cursor(
+    cursor: SearchCacheInvalidationCursor | None,
+    rows: list[tuple[int, str, datetime]],
+    polled_at: datetime,
+) -> tuple[SearchCacheInvalidationCursor, set[str]]:
+    """Takes the (id, document id, time created) rows from the lookback window before
+    the previous poll. Without a previous poll only later changes are relevant."""
+    document_ids = (
+        {
+            document_id
+            for row_id, document_id, _ in rows
+            if row_id not in cursor.seen_ids
+        }
+        if cursor is not None
+        else set()
+    )
+    next_cursor = SearchCacheInvalidationCursor(
+        polled_at=polled_at,
+        seen_ids={
+            row_id
+            for row_id, _, time_created in rows
+            if time_created > polled_at - _INVALIDATION_LOOKBACK
+        },
+    )
+    return next_cursor, document_ids
+
+
+def fetch_search_cache_invalidations(
+    cursor: SearchCacheInvalidationCursor | None, db_session: Session
+) -> tuple[SearchCacheInvalidationCursor, set[str]]:
+    """Returns the documents invalidated since the previous poll and the cursor to poll
+    with next"""
+    polled_at: datetime = db_session.execute(select(func.now())).scalar_one()
+    last_polled_at = cursor.polled_at if cursor is not None else polled_at
+    rows = db_session.execute(
+        select(
+            SearchCacheInvalidation.id,
+            SearchCacheInvalidation.document_id,
+            SearchCacheInvalidation.time_created,
+        ).where(
+            SearchCacheInvalidation.time_created
+            > last_polled_at - _INVALIDATION_LOOKBACK
+        )
+    ).all()
+    return advance_search_cache_invalidation_cursor(
+        cursor, [tuple(row) for row in rows], polled_at
+    )
+
+
+def delete_old_search_cache_invalidations(
+    max_age: timedelta, db_session: Session
+) -> None:
+    db_session.execute(
+        delete(SearchCacheInvalidation).where(
+            SearchCacheInvalidation.time_created < func.now() - max_age
+        )
+    )
+    db_session.commit()
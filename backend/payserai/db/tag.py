@@ -1,6 +1,11 @@
+from collections.abc import Iterable
+from collections.abc import Mapping
+
 from sqlalchemy import delete
 from sqlalchemy import func
 from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
 from payserai.configs.constants import DocumentSource
@@ -75,6 +80,57 @@ def create_or_add_document_tag_list(
     return all_tags
 
 
+def create_or_add_document_tags_bulk(
+    document_tags: Mapping[str, Iterable[tuple[str, str, DocumentSource]]],
+    db_session: Session,
+) -> None:
+    """Attaches the (tag_key, tag_value, source) tags to each document id, creating the
+    missing Tags. Set based with a single commit, unlike the functions above.
+    NOTE: this function is Postgres specific, it relies on the ON CONFLICT clause"""
+    links = {
+        (document_id, tag)
+        for document_id, tags in document_tags.items()
+        for tag in tags
+    }
+    if not links:
+        return
+
+    # Sorted so that concurrent batches lock the shared Tags in the same order
+    unique_tags = sorted({tag for _, tag in links})
+    db_session.execute(
+        insert(Tag)
+        .values(
+            [
+                {"tag_key": tag_key, "tag_value": tag_value, "source": source}
+                for tag_key, tag_value, source in unique_tags
+            ]
+        )
+        .on_conflict_do_nothing(constraint="_tag_key_value_source_uc")
+    )
+
+    # ON CONFLICT DO NOTHING does not return the ids of the Tags which already existed
+    tag_ids = {
+        (tag_key, tag_value, source): tag_id
+        for tag_id, tag_key, tag_value, source in db_session.execute(
+            select(Tag.id, Tag.tag_key, Tag.tag_value, Tag.source).where(
+                tuple_(Tag.tag_key, Tag.tag_value, Tag.source).in_(unique_tags)
+            )
+        )
+    }
+
+    db_session.execute(
+        insert(Document__Tag)
+        .values(
+            [
+                {"document_id": document_id, "tag_id": tag_ids[tag]}
+                for document_id, tag in sorted(links)
+            ]
+        )
+        .on_conflict_do_nothing()
+    )
+    db_session.commit()
+
+
 def get_tags_by_value_prefix_for_source_types(
     tag_value_prefix: str | None,
     sources: list[DocumentSource] | None,
@@ -1,7 +1,12 @@
+from payserai.configs.app_configs import DOCUMENT_INDEX_TYPE
+from payserai.configs.constants import DocumentIndexType
 from payserai.document_index.interfaces import DocumentIndex
+from payserai.document_index.local.index import LocalIndex
 from payserai.document_index.vespa.index import VespaIndex
 
 
 def get_default_document_index() -> DocumentIndex:
-    # Currently only supporting Vespa
+    if DOCUMENT_INDEX_TYPE == DocumentIndexType.LOCAL.value:
+        return LocalIndex()
+    # Otherwise Vespa, the split Typesense + Qdrant setup is no longer supported
     return VespaIndex()
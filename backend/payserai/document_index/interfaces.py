@@ -1,4 +1,5 @@
 import abc
+import asyncio
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Any
@@ -7,6 +8,14 @@ from payserai.access.models import DocumentAccess
 from payserai.indexing.models import DocMetadataAwareIndexChunk
 from payserai.indexing.models import InferenceChunk
 from payserai.search.models import IndexFilters
+from payserai.search.models import NearestNeighborSettings
+from payserai.search.models import SearchQuery
+from payserai.search.models import SearchType
+from payserai.utils.logger import setup_logger
+from payserai.utils.threadpool_concurrency import gather_with_limit
+from payserai.utils.threadpool_concurrency import run_functions_tuples_in_parallel
+
+logger = setup_logger()
 
 
 @dataclass(frozen=True)
@@ -77,6 +86,17 @@ class Updatable(abc.ABC):
         raise NotImplementedError
 
 
+def _chunks_in_range(
+    chunks: list[InferenceChunk], chunk_range: tuple[int, int] | None
+) -> list[InferenceChunk]:
+    if chunk_range is None:
+        return chunks
+    first_chunk_ind, last_chunk_ind = chunk_range
+    return [
+        chunk for chunk in chunks if first_chunk_ind <= chunk.chunk_id <= last_chunk_ind
+    ]
+
+
 class IdRetrievalCapable(abc.ABC):
     @abc.abstractmethod
     def id_based_retrieval(
@@ -87,6 +107,72 @@ class IdRetrievalCapable(abc.ABC):
     ) -> list[InferenceChunk]:
         raise NotImplementedError
 
+    async def aid_based_retrieval(
+        self,
+        document_id: str,
+        chunk_ind: int | None,
+        filters: IndexFilters,
+    ) -> list[InferenceChunk]:
+        """The async retrieval methods default to running the blocking version in a
+        worker thread, indices with an async client should override them"""
+        return await asyncio.to_thread(
+            self.id_based_retrieval, document_id, chunk_ind, filters
+        )
+
+    def multi_id_based_retrieval(
+        self,
+        document_ids: list[str],
+        filters: IndexFilters,
+        max_in_flight: int | None = None,
+        chunk_ranges: dict[str, tuple[int, int]] | None = None,
+    ) -> list[list[InferenceChunk]]:
+        """All chunks of each of the documents, in the order of document_ids. Documents
+        that fail to be fetched come back without chunks. chunk_ranges limits documents
+        to the chunks from the first to the last (inclusive) chunk id given for them.
+        By default the documents are fetched one by one on threads, indices should
+        override this if they can share connections or batch the lookups"""
+        results = run_functions_tuples_in_parallel(
+            [
+                (self.id_based_retrieval, (document_id, None, filters))
+                for document_id in document_ids
+            ],
+            allow_failures=True,
+            max_workers=max_in_flight,
+        )
+        return [
+            _chunks_in_range(chunks or [], chunk_ranges.get(document_id))
+            if chunk_ranges
+            else chunks or []
+            for document_id, chunks in zip(document_ids, results)
+        ]
+
+    async def amulti_id_based_retrieval(
+        self,
+        document_ids: list[str],
+        filters: IndexFilters,
+        max_in_flight: int | None = None,
+        chunk_ranges: dict[str, tuple[int, int]] | None = None,
+    ) -> list[list[InferenceChunk]]:
+        results = await gather_with_limit(
+            [
+                self.aid_based_retrieval(document_id, None, filters)
+                for document_id in document_ids
+            ],
+            max_in_flight=max_in_flight,
+            return_exceptions=True,
+        )
+
+        documents_chunks: list[list[InferenceChunk]] = []
+        for document_id, result in zip(document_ids, results):
+            # Same as the blocking version, failures to retrieve are left empty
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to retrieve document {document_id}: {result}")
+                result = []
+            if chunk_ranges:
+                result = _chunks_in_range(result, chunk_ranges.get(document_id))
+            documents_chunks.append(result)
+        return documents_chunks
+
 
 class KeywordCapable(abc.ABC):
     @abc.abstractmethod
@@ -99,6 +185,21 @@ class KeywordCapable(abc.ABC):
     ) -> list[InferenceChunk]:
         raise NotImplementedError
 
+    async def akeyword_retrieval(
+        self,
+        query: str,
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int,
+    ) -> list[InferenceChunk]:
+        return await asyncio.to_thread(
+            self.keyword_retrieval,
+            query,
+            filters,
+            time_decay_multiplier,
+            num_to_retrieve,
+        )
+
 
 class VectorCapable(abc.ABC):
     @abc.abstractmethod
@@ -108,9 +209,30 @@ class VectorCapable(abc.ABC):
         filters: IndexFilters,
         time_decay_multiplier: float,
         num_to_retrieve: int,
+        *,
+        nearest_neighbor: NearestNeighborSettings | None = None,
     ) -> list[InferenceChunk]:
+        """nearest_neighbor defaults to the configured approximate search settings"""
         raise NotImplementedError
 
+    async def asemantic_retrieval(
+        self,
+        query: str,
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int,
+        *,
+        nearest_neighbor: NearestNeighborSettings | None = None,
+    ) -> list[InferenceChunk]:
+        return await asyncio.to_thread(
+            self.semantic_retrieval,
+            query,
+            filters,
+            time_decay_multiplier,
+            num_to_retrieve,
+            nearest_neighbor=nearest_neighbor,
+        )
+
 
 class HybridCapable(abc.ABC):
     @abc.abstractmethod
@@ -121,9 +243,32 @@ class HybridCapable(abc.ABC):
         time_decay_multiplier: float,
         num_to_retrieve: int,
         hybrid_alpha: float | None = None,
+        *,
+        nearest_neighbor: NearestNeighborSettings | None = None,
     ) -> list[InferenceChunk]:
+        """nearest_neighbor defaults to the configured approximate search settings"""
         raise NotImplementedError
 
+    async def ahybrid_retrieval(
+        self,
+        query: str,
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int,
+        hybrid_alpha: float | None = None,
+        *,
+        nearest_neighbor: NearestNeighborSettings | None = None,
+    ) -> list[InferenceChunk]:
+        return await asyncio.to_thread(
+            self.hybrid_retrieval,
+            query,
+            filters,
+            time_decay_multiplier,
+            num_to_retrieve,
+            hybrid_alpha,
+            nearest_neighbor=nearest_neighbor,
+        )
+
 
 class AdminCapable(abc.ABC):
     @abc.abstractmethod
@@ -163,4 +308,92 @@ class VectorIndex(VectorCapable, BaseIndex, abc.ABC):
 
 
 class DocumentIndex(KeywordCapable, VectorCapable, HybridCapable, BaseIndex, abc.ABC):
-    pass
+    def query_retrieval(
+        self, query: SearchQuery, hybrid_alpha: float | None = None
+    ) -> list[InferenceChunk]:
+        """Uses the retrieval approach of the search type of the query"""
+        if query.search_type == SearchType.KEYWORD:
+            return self.keyword_retrieval(
+                query=query.query,
+                filters=query.filters,
+                time_decay_multiplier=query.recency_bias_multiplier,
+                num_to_retrieve=query.num_hits,
+            )
+
+        if query.search_type == SearchType.SEMANTIC:
+            return self.semantic_retrieval(
+                query=query.query,
+                filters=query.filters,
+                time_decay_multiplier=query.recency_bias_multiplier,
+                num_to_retrieve=query.num_hits,
+                nearest_neighbor=query.nearest_neighbor,
+            )
+
+        if query.search_type == SearchType.HYBRID:
+            return self.hybrid_retrieval(
+                query=query.query,
+                filters=query.filters,
+                time_decay_multiplier=query.recency_bias_multiplier,
+                num_to_retrieve=query.num_hits,
+                hybrid_alpha=hybrid_alpha,
+                nearest_neighbor=query.nearest_neighbor,
+            )
+
+        raise RuntimeError("Invalid Search Flow")
+
+    async def aquery_retrieval(
+        self, query: SearchQuery, hybrid_alpha: float | None = None
+    ) -> list[InferenceChunk]:
+        if query.search_type == SearchType.KEYWORD:
+            return await self.akeyword_retrieval(
+                query=query.query,
+                filters=query.filters,
+                time_decay_multiplier=query.recency_bias_multiplier,
+                num_to_retrieve=query.num_hits,
+            )
+
+        if query.search_type == SearchType.SEMANTIC:
+            return await self.asemantic_retrieval(
+                query=query.query,
+                filters=query.filters,
+                time_decay_multiplier=query.recency_bias_multiplier,
+                num_to_retrieve=query.num_hits,
+                nearest_neighbor=query.nearest_neighbor,
+            )
+
+        if query.search_type == SearchType.HYBRID:
+            return await self.ahybrid_retrieval(
+                query=query.query,
+                filters=query.filters,
+                time_decay_multiplier=query.recency_bias_multiplier,
+                num_to_retrieve=query.num_hits,
+                hybrid_alpha=hybrid_alpha,
+                nearest_neighbor=query.nearest_neighbor,
+            )
+
+        raise RuntimeError("Invalid Search Flow")
+
+    def multi_query_retrieval(
+        self,
+        queries: list[SearchQuery],
+        hybrid_alpha: float | None = None,
+        max_in_flight: int | None = None,
+    ) -> list[list[InferenceChunk]]:
+        """Runs several searches at once, the results are in the order of the queries. By
+        default every search runs on its own thread, indices should override this if they
+        can share connections or batch work across the searches"""
+        return run_functions_tuples_in_parallel(
+            [(self.query_retrieval, (query, hybrid_alpha)) for query in queries],
+            max_workers=max_in_flight,
+        )
+
+    async def amulti_query_retrieval(
+        self,
+        queries: list[SearchQuery],
+        hybrid_alpha: float | None = None,
+        max_in_flight: int | None = None,
+    ) -> list[list[InferenceChunk]]:
+        return await gather_with_limit(
+            [self.aquery_retrieval(query, hybrid_alpha) for query in queries],
+            max_in_flight=max_in_flight,
+        )
@@ -0,0 +1,275 @@
+import time
+
+import numpy as np
+
+from payserai.configs.app_configs import LOCAL_DOCUMENT_INDEX_DIR
+from payserai.configs.chat_configs import DOC_TIME_DECAY
+from payserai.configs.chat_configs import EDIT_KEYWORD_QUERY
+from payserai.configs.chat_configs import HYBRID_ALPHA
+from payserai.configs.chat_configs import NUM_RETURNED_HITS
+from payserai.configs.chat_configs import TITLE_CONTENT_RATIO
+from payserai.configs.constants import ACCESS_CONTROL_LIST
+from payserai.configs.constants import BOOST
+from payserai.configs.constants import DOCUMENT_SETS
+from payserai.configs.constants import HIDDEN
+from payserai.connectors.cross_connector_utils.miscellaneous_utils import (
+    get_experts_stores_representations,
+)
+from payserai.document_index.interfaces import DocumentIndex
+from payserai.document_index.interfaces import DocumentInsertionRecord
+from payserai.document_index.interfaces import UpdateRequest
+from payserai.document_index.local.retrieval import admin_hits
+from payserai.document_index.local.retrieval import hit_to_inference_chunk
+from payserai.document_index.local.retrieval import hybrid_hits
+from payserai.document_index.local.retrieval import id_hits
+from payserai.document_index.local.retrieval import keyword_hits
+from payserai.document_index.local.retrieval import semantic_hits
+from payserai.document_index.local.store import get_local_index_store
+from payserai.document_index.local.store import StoredChunk
+from payserai.indexing.models import DocMetadataAwareIndexChunk
+from payserai.indexing.models import InferenceChunk
+from payserai.search.models import IndexFilters
+from payserai.search.models import NearestNeighborSettings
+from payserai.search.search_runner import embed_query
+from payserai.search.search_runner import query_processing
+from payserai.search.search_runner import remove_stop_words_and_punctuation
+from payserai.utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _to_stored_chunk(chunk: DocMetadataAwareIndexChunk) -> StoredChunk:
+    document = chunk.source_document
+    return StoredChunk(
+        document_id=document.id,
+        chunk_id=chunk.chunk_id,
+        blurb=chunk.blurb,
+        content=chunk.content,
+        title=document.get_title_for_document_index(),
+        source_type=str(document.source.value),
+        source_links=chunk.source_links,
+        semantic_identifier=document.semantic_identifier,
+        section_continuation=chunk.section_continuation,
+        metadata=document.metadata,
+        metadata_list=document.get_metadata_str_attributes() or [],
+        primary_owners=get_experts_stores_representations(document.primary_owners),
+        secondary_owners=get_experts_stores_representations(document.secondary_owners),
+        doc_updated_at=int(document.doc_updated_at.timestamp())
+        if document.doc_updated_at
+        else None,
+        boost=chunk.boost,
+        hidden=False,
+        access_control_list=sorted(chunk.access.to_acl()),
+        document_sets=sorted(chunk.document_sets),
+        token_count=chunk.token_count,
+    )
+
+
+class LocalIndex(DocumentIndex):
+    """In-process index for single node deployments and offline retrieval evaluation,
+    persisted to a directory. Keyword search is BM25 over word tokens rather than the
+    n-grams Vespa matches on, vector search is exact."""
+
+    def __init__(self, index_dir: str = LOCAL_DOCUMENT_INDEX_DIR) -> None:
+        self.index_dir = index_dir
+        self.store = get_local_index_store(index_dir)
+
+    def ensure_indices_exist(self) -> None:
+        self.store.ensure_exists()
+
+    def index(
+        self,
+        chunks: list[DocMetadataAwareIndexChunk],
+    ) -> set[DocumentInsertionRecord]:
+        """Same as for Vespa, the chunks of a document must all be in one call, any
+        previously indexed chunks of the document are removed"""
+        if not chunks:
+            return set()
+
+        dim = len(chunks[0].embeddings.full_embedding)
+        title_embeddings = np.zeros((len(chunks), dim), dtype=np.float32)
+        has_title = np.zeros(len(chunks), dtype=bool)
+        mini_embeddings = []
+        mini_owners = []
+        for row, chunk in enumerate(chunks):
+            if chunk.title_embedding is not None:
+                title_embeddings[row] = chunk.title_embedding
+                has_title[row] = True
+            for mini_embedding in chunk.embeddings.mini_chunk_embeddings or []:
+                mini_embeddings.append(mini_embedding)
+                mini_owners.append(row)
+
+        existing_docs = self.store.add_chunks(
+            chunks=[_to_stored_chunk(chunk) for chunk in chunks],
+            embeddings=_normalize(
+                np.array(
+                    [chunk.embeddings.full_embedding for chunk in chunks],
+                    dtype=np.float32,
+                )
+            ),
+            title_embeddings=_normalize(title_embeddings),
+            has_title=has_title,
+            mini_embeddings=_normalize(
+                np.array(mini_embeddings, dtype=np.float32).reshape(-1, dim)
+            ),
+            mini_owners=np.array(mini_owners, dtype=np.int32),
+        )
+
+        return {
+            DocumentInsertionRecord(
+                document_id=document_id,
+                already_existed=document_id in existing_docs,
+            )
+            for document_id in {chunk.source_document.id for chunk in chunks}
+        }
+
+    def update(self, update_requests: list[UpdateRequest]) -> None:
+        logger.info(f"Updating {len(update_requests)} documents in the local index")
+        start = time.time()
+
+        updates: dict[str, dict] = {}
+        for update_request in update_requests:
+            fields: dict = {}
+            if update_request.boost is not None:
+                fields[BOOST] = update_request.boost
+            if update_request.document_sets is not None:
+                fields[DOCUMENT_SETS] = sorted(update_request.document_sets)
+            if update_request.access is not None:
+                fields[ACCESS_CONTROL_LIST] = sorted(update_request.access.to_acl())
+            if update_request.hidden is not None:
+                fields[HIDDEN] = update_request.hidden
+
+            if not fields:
+                logger.error("Update request received but nothing to update")
+                continue
+
+            for document_id in update_request.document_ids:
+                updates.setdefault(document_id, {}).update(fields)
+
+        self.store.update_documents(updates)
+        logger.info(
+            "Finished updating local index documents in %s seconds",
+            time.time() - start,
+        )
+
+    def delete(self, doc_ids: list[str]) -> None:
+        logger.info(f"Deleting {len(doc_ids)} documents from the local index")
+        self.store.delete_documents(doc_ids)
+
+    def id_based_retrieval(
+        self, document_id: str, chunk_ind: int | None, filters: IndexFilters
+    ) -> list[InferenceChunk]:
+        hits = id_hits(self.store.views(), document_id, chunk_ind, filters)
+        return [hit_to_inference_chunk(hit, highlight_query=None) for hit in hits]
+
+    def keyword_retrieval(
+        self,
+        query: str,
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int = NUM_RETURNED_HITS,
+        edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
+    ) -> list[InferenceChunk]:
+        if not query.strip():
+            raise ValueError("No/empty query received")
+
+        final_query = query_processing(query) if edit_keyword_query else query
+        hits = keyword_hits(
+            self.store.views(),
+            query=final_query,
+            filters=filters,
+            decay_factor=DOC_TIME_DECAY * time_decay_multiplier,
+            num_to_retrieve=num_to_retrieve,
+        )
+        return [
+            hit_to_inference_chunk(hit, highlight_query=final_query) for hit in hits
+        ]
+
+    def semantic_retrieval(
+        self,
+        query: str,
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int = NUM_RETURNED_HITS,
+        edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
+        nearest_neighbor: NearestNeighborSettings | None = None,
+    ) -> list[InferenceChunk]:
+        # The vectors are always searched exactly, nearest_neighbor does not apply
+        if not query.strip():
+            raise ValueError("No/empty query received")
+
+        query_keywords = (
+            " ".join(remove_stop_words_and_punctuation(query))
+            if edit_keyword_query
+            else query
+        )
+        hits = semantic_hits(
+            self.store.views(),
+            query_embedding=_normalize(np.array(embed_query(query), dtype=np.float32)),
+            filters=filters,
+            decay_factor=DOC_TIME_DECAY * time_decay_multiplier,
+            num_to_retrieve=num_to_retrieve,
+        )
+        return [
+            hit_to_inference_chunk(hit, highlight_query=query_keywords) for hit in hits
+        ]
+
+    def hybrid_retrieval(
+        self,
+        query: str,
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int,
+        hybrid_alpha: float | None = HYBRID_ALPHA,
+        title_content_ratio: float | None = TITLE_CONTENT_RATIO,
+        edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
+        nearest_neighbor: NearestNeighborSettings | None = None,
+    ) -> list[InferenceChunk]:
+        # Same as semantic_retrieval, the vectors are always searched exactly
+        if not query.strip():
+            raise ValueError("No/empty query received")
+
+        query_keywords = (
+            " ".join(remove_stop_words_and_punctuation(query))
+            if edit_keyword_query
+            else query
+        )
+        hits = hybrid_hits(
+            self.store.views(),
+            query=query_keywords,
+            query_embedding=_normalize(np.array(embed_query(query), dtype=np.float32)),
+            filters=filters,
+            decay_factor=DOC_TIME_DECAY * time_decay_multiplier,
+            num_to_retrieve=num_to_retrieve,
+            hybrid_alpha=hybrid_alpha if hybrid_alpha is not None else HYBRID_ALPHA,
+            title_content_ratio=title_content_ratio
+            if title_content_ratio is not None
+            else TITLE_CONTENT_RATIO,
+            # Same number of nearest neighbors as asked of Vespa
+            target_hits=max(10 * num_to_retrieve, 1000),
+        )
+        return [
+            hit_to_inference_chunk(hit, highlight_query=query_keywords) for hit in hits
+        ]
+
+    def admin_retrieval(
+        self,
+        query: str,
+        filters: IndexFilters,
+        num_to_retrieve: int = NUM_RETURNED_HITS,
+    ) -> list[InferenceChunk]:
+        if not query.strip():
+            raise ValueError("No/empty query received")
+
+        hits = admin_hits(
+            self.store.views(),
+            query=query,
+            filters=filters,
+            num_to_retrieve=num_to_retrieve,
+        )
+        return [hit_to_inference_chunk(hit, highlight_query=query) for hit in hits]
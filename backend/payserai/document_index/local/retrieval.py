@@ -0,0 +1,465 @@
+"""Query time scoring of the local document index, mirroring the rank profiles in
+vespa/app_config/schemas/payserai_chunk.sd. All chunks passing the filters are scored
+exactly, there is no approximate nearest neighbor search."""
+import math
+import re
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import numpy as np
+
+from payserai.configs.constants import ACCESS_CONTROL_LIST
+from payserai.configs.constants import CONTENT
+from payserai.configs.constants import DocumentSource
+from payserai.configs.constants import DOCUMENT_SETS
+from payserai.configs.constants import INDEX_SEPARATOR
+from payserai.configs.constants import METADATA_LIST
+from payserai.configs.constants import SOURCE_TYPE
+from payserai.configs.constants import TITLE
+from payserai.configs.constants import TITLE_SEPARATOR
+from payserai.document_index.local.store import KEYWORD_FIELDS
+from payserai.document_index.local.store import SegmentView
+from payserai.document_index.local.store import tokenize
+from payserai.indexing.models import InferenceChunk
+from payserai.search.models import IndexFilters
+from payserai.search.scoring import rank_descending
+
+# Vespa's defaults for the bm25 rank feature
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+# Documents without an update time are treated as ~3 months old for the time decay
+_UNTIMED_DOC_AGE_SECS = 7890000
+_SECS_PER_YEAR = 31536000
+# Same ratio of title to content keyword score as the admin_search rank profile
+_ADMIN_TITLE_WEIGHT = 5
+
+
+@dataclass
+class Hit:
+    view: SegmentView
+    row: int
+    score: float
+    recency_bias: float
+
+
+@dataclass
+class _Candidates:
+    """The chunks of every segment that passed the filters, flattened"""
+
+    views: list[SegmentView]
+    rows: list[np.ndarray]
+
+    def __iter__(self) -> Iterator[tuple[SegmentView, np.ndarray]]:
+        return iter(zip(self.views, self.rows))
+
+    def concat(self, per_view: list[np.ndarray]) -> np.ndarray:
+        return np.concatenate(per_view) if per_view else np.zeros(0, dtype=np.float64)
+
+    def hits(
+        self, scores: np.ndarray, recency: np.ndarray, matched: np.ndarray, num: int
+    ) -> list[Hit]:
+        view_inds = self.concat(
+            [
+                np.full(len(rows), ind, dtype=np.int64)
+                for ind, rows in enumerate(self.rows)
+            ]
+        ).astype(np.int64)
+        all_rows = self.concat(self.rows).astype(np.int64)
+
+        matched_inds = np.flatnonzero(matched)
+        top = matched_inds[rank_descending(scores[matched_inds], top_k=num)]
+        return [
+            Hit(
+                view=self.views[view_inds[ind]],
+                row=int(all_rows[ind]),
+                score=float(scores[ind]),
+                recency_bias=float(recency[ind]),
+            )
+            for ind in top
+        ]
+
+
+def _filter_mask(
+    view: SegmentView,
+    filters: IndexFilters,
+    include_hidden: bool,
+    # Slightly over 3 Months, approximately 1 fiscal quarter
+    untimed_doc_cutoff: timedelta = timedelta(days=92),
+) -> np.ndarray:
+    mask = view.live.copy()
+    if not include_hidden:
+        mask &= ~view.hidden
+
+    if filters.access_control_list is not None:
+        # Unlike the other filters, no valid ACL entries means no access at all
+        mask &= view.rows_with_any(
+            ACCESS_CONTROL_LIST, [acl for acl in filters.access_control_list if acl]
+        )
+
+    value_filters = [
+        (
+            SOURCE_TYPE,
+            [source.value for source in filters.source_type]
+            if filters.source_type
+            else None,
+        ),
+        (
+            METADATA_LIST,
+            [tag.tag_key + INDEX_SEPARATOR + tag.tag_value for tag in filters.tags]
+            if filters.tags
+            else None,
+        ),
+        (DOCUMENT_SETS, filters.document_set),
+    ]
+    for attribute, values in value_filters:
+        valid_values = [value for value in values or [] if value]
+        if valid_values:
+            mask &= view.rows_with_any(attribute, valid_values)
+
+    if filters.time_cutoff:
+        cutoff_secs = int(filters.time_cutoff.timestamp())
+        # Documents without an update time only pass filters for older documents
+        include_untimed = (
+            datetime.now(timezone.utc) - untimed_doc_cutoff > filters.time_cutoff
+        )
+        with np.errstate(invalid="ignore"):
+            if include_untimed:
+                mask &= ~(view.updated_at < cutoff_secs)
+            else:
+                mask &= view.updated_at >= cutoff_secs
+
+    return mask
+
+
+def _filter(
+    views: tuple[SegmentView, ...], filters: IndexFilters, include_hidden: bool
+) -> _Candidates:
+    return _Candidates(
+        views=list(views),
+        rows=[
+            np.flatnonzero(_filter_mask(view, filters, include_hidden))
+            for view in views
+        ],
+    )
+
+
+def _document_boost(boost: np.ndarray) -> np.ndarray:
+    # Same as translate_boost_count_to_multiplier, 0.5x to 2x
+    sigmoid = 1 / (1 + np.exp(-boost / 3))
+    return np.where(boost < 0, 0.5 + sigmoid, 2 * sigmoid)
+
+
+def _recency_bias(
+    view: SegmentView, rows: np.ndarray, decay_factor: float
+) -> np.ndarray:
+    updated_at = view.updated_at[rows]
+    age_secs = np.where(
+        np.isnan(updated_at), _UNTIMED_DOC_AGE_SECS, time.time() - updated_at
+    )
+    doc_age_years = np.maximum(age_secs / _SECS_PER_YEAR, 0)
+    return np.maximum(1 / (1 + decay_factor * doc_age_years), 0.5)
+
+
+class _BM25:
+    """BM25 with the term statistics of all segments. Deleted chunks still count until
+    their segment is merged, like in most inverted indices."""
+
+    def __init__(self, views: tuple[SegmentView, ...], query: str) -> None:
+        self.terms = list(dict.fromkeys(tokenize(query)))
+        num_chunks = sum(len(view.chunks) for view in views)
+        self.avg_lengths: dict[str, float] = {}
+        self.idfs: dict[str, list[float]] = {}
+        for field_name in KEYWORD_FIELDS:
+            total_length = sum(
+                float(view.segment.postings[field_name].field_lengths.sum())
+                for view in views
+            )
+            self.avg_lengths[field_name] = max(total_length / max(num_chunks, 1), 1.0)
+            self.idfs[field_name] = []
+            for term in self.terms:
+                doc_freq = sum(
+                    view.segment.postings[field_name].doc_freq(term) for view in views
+                )
+                self.idfs[field_name].append(
+                    math.log(1 + (num_chunks - doc_freq + 0.5) / (doc_freq + 0.5))
+                )
+
+    def score(self, view: SegmentView, rows: np.ndarray, field_name: str) -> np.ndarray:
+        postings = view.segment.postings[field_name]
+        length_norm = _BM25_K1 * (
+            1
+            - _BM25_B
+            + _BM25_B * postings.field_lengths / self.avg_lengths[field_name]
+        )
+        scores = np.zeros(len(view.chunks), dtype=np.float64)
+        for term, idf in zip(self.terms, self.idfs[field_name]):
+            found = postings.lookup(term)
+            if found is None:
+                continue
+            term_rows, term_freqs = found
+            scores[term_rows] += (
+                idf
+                * term_freqs
+                * (_BM25_K1 + 1)
+                / (term_freqs + length_norm[term_rows])
+            )
+        return scores[rows]
+
+
+def _closeness(
+    view: SegmentView, rows: np.ndarray, query_embedding: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Vespa's closeness for the angular distance metric, 1 / (1 + angle), for the
+    content (best of the chunk and mini chunk embeddings) and the title embeddings"""
+    segment = view.segment
+    content_similarity = np.asarray(segment.embeddings @ query_embedding)
+    if len(segment.mini_embeddings):
+        np.maximum.at(
+            content_similarity,
+            segment.mini_owners,
+            segment.mini_embeddings @ query_embedding,
+        )
+    title_similarity = np.asarray(segment.title_embeddings[rows] @ query_embedding)
+
+    def _to_closeness(similarity: np.ndarray) -> np.ndarray:
+        return 1 / (1 + np.arccos(np.clip(similarity, -1, 1)))
+
+    return (
+        _to_closeness(content_similarity[rows]),
+        np.where(segment.has_title[rows], _to_closeness(title_similarity), 0),
+    )
+
+
+def _normalize_linear(scores: np.ndarray) -> np.ndarray:
+    if not len(scores):
+        return scores
+    score_range = scores.max() - scores.min()
+    if score_range == 0:
+        return np.zeros_like(scores)
+    return (scores - scores.min()) / score_range
+
+
+def keyword_hits(
+    views: tuple[SegmentView, ...],
+    query: str,
+    filters: IndexFilters,
+    decay_factor: float,
+    num_to_retrieve: int,
+) -> list[Hit]:
+    candidates = _filter(views, filters, include_hidden=False)
+    bm25 = _BM25(views, query)
+    content_scores = candidates.concat(
+        [bm25.score(view, rows, CONTENT) for view, rows in candidates]
+    )
+    title_scores = candidates.concat(
+        [bm25.score(view, rows, TITLE) for view, rows in candidates]
+    )
+    boosts = candidates.concat(
+        [_document_boost(view.boost[rows]) for view, rows in candidates]
+    )
+    recency = candidates.concat(
+        [_recency_bias(view, rows, decay_factor) for view, rows in candidates]
+    )
+    return candidates.hits(
+        scores=content_scores * boosts * recency,
+        recency=recency,
+        matched=(content_scores + title_scores) > 0,
+        num=num_to_retrieve,
+    )
+
+
+def semantic_hits(
+    views: tuple[SegmentView, ...],
+    query_embedding: np.ndarray,
+    filters: IndexFilters,
+    decay_factor: float,
+    num_to_retrieve: int,
+) -> list[Hit]:
+    candidates = _filter(views, filters, include_hidden=False)
+    content_closeness = candidates.concat(
+        [_closeness(view, rows, query_embedding)[0] for view, rows in candidates]
+    )
+    recency = candidates.concat(
+        [_recency_bias(view, rows, decay_factor) for view, rows in candidates]
+    )
+    return candidates.hits(
+        scores=content_closeness,
+        recency=recency,
+        matched=np.ones(len(content_closeness), dtype=bool),
+        num=num_to_retrieve,
+    )
+
+
+def hybrid_hits(
+    views: tuple[SegmentView, ...],
+    query: str,
+    query_embedding: np.ndarray,
+    filters: IndexFilters,
+    decay_factor: float,
+    num_to_retrieve: int,
+    hybrid_alpha: float,
+    title_content_ratio: float,
+    target_hits: int,
+) -> list[Hit]:
+    candidates = _filter(views, filters, include_hidden=False)
+    bm25 = _BM25(views, query)
+
+    closeness = [_closeness(view, rows, query_embedding) for view, rows in candidates]
+    content_closeness = candidates.concat([content for content, _ in closeness])
+    title_closeness = candidates.concat([title for _, title in closeness])
+    content_bm25 = candidates.concat(
+        [bm25.score(view, rows, CONTENT) for view, rows in candidates]
+    )
+    title_bm25 = candidates.concat(
+        [bm25.score(view, rows, TITLE) for view, rows in candidates]
+    )
+    boosts = candidates.concat(
+        [_document_boost(view.boost[rows]) for view, rows in candidates]
+    )
+    recency = candidates.concat(
+        [_recency_bias(view, rows, decay_factor) for view, rows in candidates]
+    )
+
+    # Matches are the nearest neighbors of either embedding plus the keyword matches
+    matched = (content_bm25 + title_bm25) > 0
+    matched[rank_descending(content_closeness, top_k=target_hits)] = True
+    top_title_inds = rank_descending(title_closeness, top_k=target_hits)
+    # Chunks without a title have no title embedding to be a neighbor of
+    matched[top_title_inds[title_closeness[top_title_inds] > 0]] = True
+
+    vector_scores = (
+        title_content_ratio * title_closeness
+        + (1 - title_content_ratio) * content_closeness
+    )
+    keyword_scores = (
+        title_content_ratio * title_bm25 + (1 - title_content_ratio) * content_bm25
+    )
+    # Normalized over the matches, like the global-phase of the hybrid_search profile
+    normalized_vector_scores = np.zeros(len(matched))
+    normalized_vector_scores[matched] = _normalize_linear(vector_scores[matched])
+    normalized_keyword_scores = np.zeros(len(matched))
+    normalized_keyword_scores[matched] = _normalize_linear(keyword_scores[matched])
+
+    scores = (
+        (
+            hybrid_alpha * normalized_vector_scores
+            + (1 - hybrid_alpha) * normalized_keyword_scores
+        )
+        * boosts
+        * recency
+    )
+    return candidates.hits(
+        scores=scores, recency=recency, matched=matched, num=num_to_retrieve
+    )
+
+
+def admin_hits(
+    views: tuple[SegmentView, ...],
+    query: str,
+    filters: IndexFilters,
+    num_to_retrieve: int,
+) -> list[Hit]:
+    candidates = _filter(views, filters, include_hidden=True)
+    bm25 = _BM25(views, query)
+    scores = candidates.concat(
+        [
+            bm25.score(view, rows, CONTENT)
+            + _ADMIN_TITLE_WEIGHT * bm25.score(view, rows, TITLE)
+            for view, rows in candidates
+        ]
+    )
+    return candidates.hits(
+        scores=scores,
+        recency=np.ones(len(scores)),
+        matched=scores > 0,
+        num=num_to_retrieve,
+    )
+
+
+def id_hits(
+    views: tuple[SegmentView, ...],
+    document_id: str,
+    chunk_ind: int | None,
+    filters: IndexFilters,
+) -> list[Hit]:
+    hits: list[Hit] = []
+    for view in views:
+        doc_rows = view.segment.doc_rows.get(document_id)
+        if not doc_rows:
+            continue
+        mask = _filter_mask(view, filters, include_hidden=True)
+        hits.extend(
+            Hit(view=view, row=row, score=0.0, recency_bias=1.0)
+            for row in doc_rows
+            if mask[row]
+            and (chunk_ind is None or view.chunks[row].chunk_id == chunk_ind)
+        )
+    hits.sort(key=lambda hit: hit.view.chunks[hit.row].chunk_id)
+    return hits
+
+
+def _match_highlights(content: str, query: str, max_length: int = 400) -> list[str]:
+    """Sentences containing query terms with the terms wrapped in <hi> tags, in the
+    same format as Vespa's dynamic summaries"""
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    term_pattern = re.compile(
+        r"\b(" + "|".join(re.escape(term) for term in set(terms)) + r")\b",
+        re.IGNORECASE,
+    )
+    highlights: list[str] = []
+    current_length = 0
+    for sentence in re.split(r"(?<=[.!?\n])\s+", content):
+        if not term_pattern.search(sentence):
+            continue
+        if current_length + len(sentence) >= max_length:
+            # Break at the last word that still fits
+            truncated = sentence[: max_length - current_length].rsplit(" ", 1)[0]
+            if truncated and term_pattern.search(truncated):
+                highlights.append(term_pattern.sub(r"<hi>\1</hi>", truncated) + "...")
+            break
+        highlights.append(term_pattern.sub(r"<hi>\1</hi>", sentence))
+        current_length += len(sentence)
+    return highlights
+
+
+def hit_to_inference_chunk(hit: Hit, highlight_query: str | None) -> InferenceChunk:
+    chunk = hit.view.chunks[hit.row]
+
+    # Remove the title from the first chunk as every chunk already included
+    # its semantic identifier for LLM
+    content = chunk.content
+    if chunk.chunk_id == 0:
+        parts = content.split(TITLE_SEPARATOR, maxsplit=1)
+        content = parts[1] if len(parts) > 1 and "\n" not in parts[0] else content
+
+    return InferenceChunk(
+        chunk_id=chunk.chunk_id,
+        blurb=chunk.blurb,
+        content=content,
+        source_links=chunk.source_links,
+        section_continuation=chunk.section_continuation,
+        document_id=chunk.document_id,
+        source_type=DocumentSource(chunk.source_type),
+        semantic_identifier=chunk.semantic_identifier,
+        boost=int(chunk.boost),
+        recency_bias=hit.recency_bias,
+        score=hit.score,
+        hidden=chunk.hidden,
+        primary_owners=chunk.primary_owners,
+        secondary_owners=chunk.secondary_owners,
+        token_count=chunk.token_count,
+        metadata=chunk.metadata,
+        match_highlights=_match_highlights(chunk.content, highlight_query)
+        if highlight_query
+        else [],
+        updated_at=datetime.fromtimestamp(chunk.doc_updated_at, tz=timezone.utc)
+        if chunk.doc_updated_at is not None
+        else None,
+    )
@@ -0,0 +1,672 @@
+"""On-disk storage of the local document index
+
+    <index dir>/
+        manifest.json               live segments, deleted rows and metadata updates
+        .lock                       held while writing, writers may be in other processes
+        segment-<id>.pkl            chunk fields and keyword postings
+        segment-<id>.<name>.npy     embedding matrices, memory mapped when loaded
+
+Segments are never modified once written. Indexing adds a segment, deleting only records
+the deleted rows and metadata updates (boost, hidden, access, document sets) are kept per
+document in the manifest, so every write only persists what changed. Segments of a
+similar size are merged once there are enough of them, so a chunk is only rewritten a
+logarithmic number of times. Readers notice that the manifest was replaced and only load
+the segments they don't have yet.
+"""
+import dataclasses
+import fcntl
+import json
+import math
+import os
+import pickle
+import re
+import threading
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+import numpy as np
+
+from payserai.configs.constants import ACCESS_CONTROL_LIST
+from payserai.configs.constants import CONTENT
+from payserai.configs.constants import DOCUMENT_SETS
+from payserai.configs.constants import METADATA_LIST
+from payserai.configs.constants import SOURCE_TYPE
+from payserai.configs.constants import TITLE
+from payserai.utils.logger import setup_logger
+
+logger = setup_logger()
+
+KEYWORD_FIELDS = (CONTENT, TITLE)
+# Attributes that queries can filter on by value
+_SET_ATTRIBUTES = (ACCESS_CONTROL_LIST, DOCUMENT_SETS, SOURCE_TYPE, METADATA_LIST)
+
+_MANIFEST_FILE = "manifest.json"
+_LOCK_FILE = ".lock"
+_EMBEDDING_ARRAYS = ("embeddings", "title_embeddings", "mini_embeddings")
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+@dataclass
+class StoredChunk:
+    document_id: str
+    chunk_id: int
+    blurb: str
+    content: str
+    title: str | None
+    source_type: str
+    source_links: dict[int, str] | None
+    semantic_identifier: str
+    section_continuation: bool
+    metadata: dict[str, str | list[str]]
+    metadata_list: list[str]
+    primary_owners: list[str] | None
+    secondary_owners: list[str] | None
+    # Seconds since epoch
+    doc_updated_at: int | None
+    boost: float
+    hidden: bool
+    access_control_list: list[str]
+    document_sets: list[str]
+    # Segments written before token counts were stored don't have it
+    token_count: int | None = None
+
+    def attribute_values(self, name: str) -> list[str]:
+        if name == SOURCE_TYPE:
+            return [self.source_type]
+        return getattr(self, name)
+
+
+_CHUNK_FIELDS = [chunk_field.name for chunk_field in dataclasses.fields(StoredChunk)]
+
+
+@dataclass
+class Postings:
+    """Term -> (rows, term frequencies) of one text field, stored in CSR layout"""
+
+    term_ids: dict[str, int]
+    indptr: np.ndarray
+    rows: np.ndarray
+    term_freqs: np.ndarray
+    # Number of tokens of the field, per row
+    field_lengths: np.ndarray
+
+    @classmethod
+    def build(cls, texts: list[str]) -> "Postings":
+        term_rows: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        field_lengths = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            field_lengths[row] = len(tokens)
+            counts: dict[str, int] = defaultdict(int)
+            for token in tokens:
+                counts[token] += 1
+            for token, count in counts.items():
+                term_rows[token].append((row, count))
+
+        term_ids: dict[str, int] = {}
+        indptr = [0]
+        rows: list[int] = []
+        term_freqs: list[int] = []
+        for term_id, (term, entries) in enumerate(term_rows.items()):
+            term_ids[term] = term_id
+            rows.extend(row for row, _ in entries)
+            term_freqs.extend(count for _, count in entries)
+            indptr.append(len(rows))
+
+        return cls(
+            term_ids=term_ids,
+            indptr=np.array(indptr, dtype=np.int64),
+            rows=np.array(rows, dtype=np.int32),
+            term_freqs=np.array(term_freqs, dtype=np.float32),
+            field_lengths=field_lengths,
+        )
+
+    def lookup(self, term: str) -> tuple[np.ndarray, np.ndarray] | None:
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return None
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.rows[start:end], self.term_freqs[start:end]
+
+    def doc_freq(self, term: str) -> int:
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return 0
+        return int(self.indptr[term_id + 1] - self.indptr[term_id])
+
+
+@dataclass
+class Segment:
+    segment_id: int
+    chunks: list[StoredChunk]
+    postings: dict[str, Postings]
+    # Normalized, (num chunks, dim)
+    embeddings: np.ndarray
+    # Zero for the chunks without a title
+    title_embeddings: np.ndarray
+    has_title: np.ndarray
+    # Normalized mini chunk embeddings and the row of the chunk each one belongs to
+    mini_embeddings: np.ndarray
+    mini_owners: np.ndarray
+    doc_rows: dict[str, list[int]] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        if not self.doc_rows:
+            for row, chunk in enumerate(self.chunks):
+                self.doc_rows.setdefault(chunk.document_id, []).append(row)
+
+    @classmethod
+    def build(
+        cls,
+        segment_id: int,
+        chunks: list[StoredChunk],
+        embeddings: np.ndarray,
+        title_embeddings: np.ndarray,
+        has_title: np.ndarray,
+        mini_embeddings: np.ndarray,
+        mini_owners: np.ndarray,
+    ) -> "Segment":
+        return cls(
+            segment_id=segment_id,
+            chunks=chunks,
+            postings={
+                CONTENT: Postings.build([chunk.content for chunk in chunks]),
+                TITLE: Postings.build([chunk.title or "" for chunk in chunks]),
+            },
+            embeddings=embeddings,
+            title_embeddings=title_embeddings,
+            has_title=has_title,
+            mini_embeddings=mini_embeddings,
+            mini_owners=mini_owners,
+        )
+
+    def save(self, index_dir: str) -> None:
+        prefix = os.path.join(index_dir, f"segment-{self.segment_id}")
+        for name in _EMBEDDING_ARRAYS:
+            with open(f"{prefix}.{name}.npy", "wb") as f:
+                np.save(f, getattr(self, name))
+        # Written last, a segment without it is incomplete and never referenced
+        _atomic_write(
+            f"{prefix}.pkl",
+            pickle.dumps(
+                {
+                    "chunks": [
+                        tuple(getattr(chunk, name) for name in _CHUNK_FIELDS)
+                        for chunk in self.chunks
+                    ],
+                    "postings": {
+                        name: vars(postings) for name, postings in self.postings.items()
+                    },
+                    "has_title": self.has_title,
+                    "mini_owners": self.mini_owners,
+                },
+                protocol=pickle.HIGHEST_PROTOCOL,
+            ),
+        )
+
+    @classmethod
+    def load(cls, index_dir: str, segment_id: int) -> "Segment":
+        prefix = os.path.join(index_dir, f"segment-{segment_id}")
+        with open(f"{prefix}.pkl", "rb") as f:
+            data = pickle.load(f)
+        arrays = {
+            name: np.load(f"{prefix}.{name}.npy", mmap_mode="r")
+            for name in _EMBEDDING_ARRAYS
+        }
+        return cls(
+            segment_id=segment_id,
+            chunks=[StoredChunk(*values) for values in data["chunks"]],
+            postings={
+                name: Postings(**postings)
+                for name, postings in data["postings"].items()
+            },
+            has_title=data["has_title"],
+            mini_owners=data["mini_owners"],
+            **arrays,
+        )
+
+    @staticmethod
+    def remove_files(index_dir: str, segment_id: int) -> None:
+        prefix = os.path.join(index_dir, f"segment-{segment_id}")
+        for path in [f"{prefix}.pkl"] + [
+            f"{prefix}.{name}.npy" for name in _EMBEDDING_ARRAYS
+        ]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+@dataclass
+class Manifest:
+    version: int = 0
+    next_segment_id: int = 0
+    segment_ids: list[int] = field(default_factory=list)
+    deleted_rows: dict[int, list[int]] = field(default_factory=dict)
+    # Document id -> updated attribute values, overriding the indexed ones
+    document_updates: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "version": self.version,
+                "next_segment_id": self.next_segment_id,
+                "segment_ids": self.segment_ids,
+                "deleted_rows": {
+                    str(segment_id): rows
+                    for segment_id, rows in self.deleted_rows.items()
+                },
+                "document_updates": self.document_updates,
+            }
+        )
+
+    @classmethod
+    def from_json(cls, data: str) -> "Manifest":
+        parsed = json.loads(data)
+        return cls(
+            version=parsed["version"],
+            next_segment_id=parsed["next_segment_id"],
+            segment_ids=parsed["segment_ids"],
+            deleted_rows={
+                int(segment_id): rows
+                for segment_id, rows in parsed["deleted_rows"].items()
+            },
+            document_updates=parsed["document_updates"],
+        )
+
+
+@dataclass(frozen=True)
+class SegmentView:
+    """A segment along with the current state of its chunks. Replaced as a whole when
+    that state changes so that queries never see a partially applied write."""
+
+    segment: Segment
+    # With the document updates applied
+    chunks: list[StoredChunk]
+    live: np.ndarray
+    boost: np.ndarray
+    hidden: np.ndarray
+    # NaN for the chunks without an update time
+    updated_at: np.ndarray
+    # Attribute -> value -> rows having that value
+    attribute_rows: dict[str, dict[str, np.ndarray]]
+
+    @classmethod
+    def build(
+        cls,
+        segment: Segment,
+        deleted_rows: list[int],
+        document_updates: dict[str, dict[str, Any]],
+    ) -> "SegmentView":
+        chunks = [
+            dataclasses.replace(chunk, **document_updates[chunk.document_id])
+            if chunk.document_id in document_updates
+            else chunk
+            for chunk in segment.chunks
+        ]
+        live = np.ones(len(chunks), dtype=bool)
+        live[deleted_rows] = False
+
+        attribute_rows: dict[str, dict[str, np.ndarray]] = {}
+        for attribute in _SET_ATTRIBUTES:
+            value_rows: dict[str, list[int]] = defaultdict(list)
+            for row, chunk in enumerate(chunks):
+                for value in chunk.attribute_values(attribute):
+                    value_rows[value].append(row)
+            attribute_rows[attribute] = {
+                value: np.array(rows, dtype=np.int64)
+                for value, rows in value_rows.items()
+            }
+
+        return cls(
+            segment=segment,
+            chunks=chunks,
+            live=live,
+            boost=np.array([chunk.boost for chunk in chunks], dtype=np.float64),
+            hidden=np.array([chunk.hidden for chunk in chunks], dtype=bool),
+            updated_at=np.array(
+                [
+                    chunk.doc_updated_at if chunk.doc_updated_at is not None else np.nan
+                    for chunk in chunks
+                ],
+                dtype=np.float64,
+            ),
+            attribute_rows=attribute_rows,
+        )
+
+    def rows_with_any(self, attribute: str, values: list[str]) -> np.ndarray:
+        mask = np.zeros(len(self.live), dtype=bool)
+        value_rows = self.attribute_rows[attribute]
+        for value in values:
+            rows = value_rows.get(value)
+            if rows is not None:
+                mask[rows] = True
+        return mask
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class LocalIndexStore:
+    def __init__(self, index_dir: str, merge_factor: int = 8) -> None:
+        self.index_dir = index_dir
+        # Segments are merged once there are this many of a similar size
+        self.merge_factor = merge_factor
+        self._lock = threading.RLock()
+        self._manifest = Manifest()
+        self._manifest_stat: tuple[int, int] | None = None
+        self._views: tuple[SegmentView, ...] = ()
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.index_dir, _MANIFEST_FILE)
+
+    def ensure_exists(self) -> None:
+        os.makedirs(self.index_dir, exist_ok=True)
+        with self._write_lock():
+            if not os.path.exists(self._manifest_path):
+                _atomic_write(self._manifest_path, Manifest().to_json().encode())
+
+    def views(self) -> tuple[SegmentView, ...]:
+        """The current segments, picking up writes done by other processes"""
+        self._refresh()
+        return self._views
+
+    def _refresh(self) -> None:
+        try:
+            stat = os.stat(self._manifest_path)
+        except FileNotFoundError:
+            return
+        # The manifest is always replaced, never modified in place
+        if (stat.st_ino, stat.st_mtime_ns) == self._manifest_stat:
+            return
+
+        with self._lock:
+            with open(self._manifest_path) as f:
+                manifest = Manifest.from_json(f.read())
+            self._apply_manifest(manifest)
+            self._manifest_stat = (stat.st_ino, stat.st_mtime_ns)
+
+    def _apply_manifest(self, manifest: Manifest) -> None:
+        if manifest.version == self._manifest.version and self._views:
+            return
+
+        old_views = {view.segment.segment_id: view for view in self._views}
+        changed_docs = {
+            document_id
+            for document_id in set(manifest.document_updates)
+            | set(self._manifest.document_updates)
+            if manifest.document_updates.get(document_id)
+            != self._manifest.document_updates.get(document_id)
+        }
+
+        views = []
+        for segment_id in manifest.segment_ids:
+            old_view = old_views.get(segment_id)
+            deleted_rows = manifest.deleted_rows.get(segment_id, [])
+            if (
+                old_view is not None
+                and deleted_rows == self._manifest.deleted_rows.get(segment_id, [])
+                and not any(
+                    document_id in old_view.segment.doc_rows
+                    for document_id in changed_docs
+                )
+            ):
+                views.append(old_view)
+                continue
+
+            segment = (
+                old_view.segment
+                if old_view is not None
+                else Segment.load(self.index_dir, segment_id)
+            )
+            segment_updates = {
+                document_id: updates
+                for document_id, updates in manifest.document_updates.items()
+                if document_id in segment.doc_rows
+            }
+            views.append(SegmentView.build(segment, deleted_rows, segment_updates))
+
+        self._views = tuple(views)
+        self._manifest = manifest
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        os.makedirs(self.index_dir, exist_ok=True)
+        with self._lock, open(os.path.join(self.index_dir, _LOCK_FILE), "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def _write(self) -> Iterator[Manifest]:
+        """Yields a copy of the latest manifest to modify, it is persisted and applied
+        once the block exits without an error"""
+        with self._write_lock():
+            self._manifest_stat = None
+            self._refresh()
+            manifest = Manifest.from_json(self._manifest.to_json())
+            yield manifest
+
+            manifest.version += 1
+            removed_segment_ids = set(self._manifest.segment_ids) - set(
+                manifest.segment_ids
+            )
+            _atomic_write(self._manifest_path, manifest.to_json().encode())
+            self._manifest_stat = None
+            self._refresh()
+
+            # Other processes may still be reading these, which is fine as long as they
+            # have them open already. Ones that don't will see the new manifest instead.
+            for segment_id in removed_segment_ids:
+                Segment.remove_files(self.index_dir, segment_id)
+
+    def _live_document_rows(self, document_ids: set[str]) -> dict[int, list[int]]:
+        segment_rows: dict[int, list[int]] = defaultdict(list)
+        for view in self._views:
+            for document_id in document_ids:
+                for row in view.segment.doc_rows.get(document_id, []):
+                    if view.live[row]:
+                        segment_rows[view.segment.segment_id].append(row)
+        return segment_rows
+
+    @staticmethod
+    def _mark_deleted(manifest: Manifest, segment_rows: dict[int, list[int]]) -> None:
+        for segment_id, rows in segment_rows.items():
+            manifest.deleted_rows[segment_id] = sorted(
+                set(manifest.deleted_rows.get(segment_id, [])) | set(rows)
+            )
+
+    def add_chunks(
+        self,
+        chunks: list[StoredChunk],
+        embeddings: np.ndarray,
+        title_embeddings: np.ndarray,
+        has_title: np.ndarray,
+        mini_embeddings: np.ndarray,
+        mini_owners: np.ndarray,
+    ) -> set[str]:
+        """Replaces all previously indexed chunks of the documents of these chunks.
+        Returns the ids of the documents that were already in the index."""
+        document_ids = {chunk.document_id for chunk in chunks}
+        with self._write() as manifest:
+            existing_rows = self._live_document_rows(document_ids)
+            existing_docs = {
+                view.segment.chunks[row].document_id
+                for view in self._views
+                for row in existing_rows.get(view.segment.segment_id, [])
+            }
+            self._mark_deleted(manifest, existing_rows)
+            for document_id in document_ids:
+                manifest.document_updates.pop(document_id, None)
+
+            segment = Segment.build(
+                segment_id=manifest.next_segment_id,
+                chunks=chunks,
+                embeddings=embeddings,
+                title_embeddings=title_embeddings,
+                has_title=has_title,
+                mini_embeddings=mini_embeddings,
+                mini_owners=mini_owners,
+            )
+            segment.save(self.index_dir)
+            manifest.next_segment_id += 1
+            manifest.segment_ids.append(segment.segment_id)
+
+            self._merge_similar_segments(manifest, new_segment=segment)
+
+        return existing_docs
+
+    def update_documents(self, updates: dict[str, dict[str, Any]]) -> None:
+        with self._write() as manifest:
+            for document_id, fields in updates.items():
+                manifest.document_updates.setdefault(document_id, {}).update(fields)
+
+    def delete_documents(self, document_ids: list[str]) -> None:
+        with self._write() as manifest:
+            self._mark_deleted(manifest, self._live_document_rows(set(document_ids)))
+            for document_id in document_ids:
+                manifest.document_updates.pop(document_id, None)
+            self._merge_similar_segments(manifest)
+
+    def _tier(self, num_live_chunks: int) -> int:
+        return int(math.log(max(num_live_chunks, 1), self.merge_factor))
+
+    def _merge_similar_segments(
+        self, manifest: Manifest, new_segment: Segment | None = None
+    ) -> None:
+        """Size tiered merging: segments are grouped by the order of magnitude (in base
+        merge_factor) of their live chunk count, and a full group is merged into one
+        segment of the next tier. Every chunk is rewritten once per tier, so indexing N
+        chunks costs O(N log N) and there are O(merge_factor * log N) segments."""
+        segments = {view.segment.segment_id: view.segment for view in self._views}
+        if new_segment is not None:
+            segments[new_segment.segment_id] = new_segment
+
+        while True:
+            live_counts = {
+                segment_id: len(segments[segment_id].chunks)
+                - len(manifest.deleted_rows.get(segment_id, []))
+                for segment_id in manifest.segment_ids
+            }
+            # Segments without any live chunks are dropped right away
+            empty_segment_ids = [
+                segment_id for segment_id, count in live_counts.items() if count == 0
+            ]
+            for segment_id in empty_segment_ids:
+                manifest.segment_ids.remove(segment_id)
+                manifest.deleted_rows.pop(segment_id, None)
+
+            tiers: dict[int, list[int]] = defaultdict(list)
+            for segment_id in manifest.segment_ids:
+                tiers[self._tier(live_counts[segment_id])].append(segment_id)
+            full_tiers = [
+                tier
+                for tier, segment_ids in tiers.items()
+                if len(segment_ids) >= self.merge_factor
+            ]
+            if not full_tiers:
+                return
+
+            merged = self._merge_segments(
+                manifest,
+                [segments[segment_id] for segment_id in tiers[min(full_tiers)]],
+            )
+            segments[merged.segment_id] = merged
+
+    def _merge_segments(self, manifest: Manifest, segments: list[Segment]) -> Segment:
+        """Rewrites the live chunks of the segments into a single segment, with the
+        document updates applied to them. It takes the place of the first one."""
+        views = [
+            SegmentView.build(
+                segment,
+                manifest.deleted_rows.get(segment.segment_id, []),
+                {
+                    document_id: updates
+                    for document_id, updates in manifest.document_updates.items()
+                    if document_id in segment.doc_rows
+                },
+            )
+            for segment in segments
+        ]
+
+        chunks: list[StoredChunk] = []
+        embeddings = []
+        title_embeddings = []
+        has_title = []
+        mini_embeddings = []
+        mini_owners = []
+        for view in views:
+            live_rows = np.flatnonzero(view.live)
+            segment = view.segment
+            chunks.extend(view.chunks[row] for row in live_rows)
+            embeddings.append(segment.embeddings[live_rows])
+            title_embeddings.append(segment.title_embeddings[live_rows])
+            has_title.append(segment.has_title[live_rows])
+
+            # Map the owners of the kept mini chunks to their new rows
+            new_rows = np.full(len(view.live), -1, dtype=np.int64)
+            new_rows[live_rows] = np.arange(len(live_rows)) + (
+                len(chunks) - len(live_rows)
+            )
+            kept_minis = view.live[segment.mini_owners]
+            mini_embeddings.append(segment.mini_embeddings[kept_minis])
+            mini_owners.append(new_rows[segment.mini_owners[kept_minis]])
+
+        merged = Segment.build(
+            segment_id=manifest.next_segment_id,
+            chunks=chunks,
+            embeddings=np.concatenate(embeddings),
+            title_embeddings=np.concatenate(title_embeddings),
+            has_title=np.concatenate(has_title),
+            mini_embeddings=np.concatenate(mini_embeddings),
+            mini_owners=np.concatenate(mini_owners).astype(np.int32),
+        )
+        merged.save(self.index_dir)
+        manifest.next_segment_id += 1
+
+        old_segment_ids = [segment.segment_id for segment in segments]
+        manifest.segment_ids[
+            manifest.segment_ids.index(old_segment_ids[0])
+        ] = merged.segment_id
+        for segment_id in old_segment_ids:
+            if segment_id != old_segment_ids[0]:
+                manifest.segment_ids.remove(segment_id)
+            manifest.deleted_rows.pop(segment_id, None)
+        # The updates are part of the merged chunks now
+        for document_id in merged.doc_rows:
+            manifest.document_updates.pop(document_id, None)
+
+        logger.info(
+            f"Merged local index segments {old_segment_ids} into "
+            f"{merged.segment_id} with {len(chunks)} chunks"
+        )
+        return merged
+
+
+_STORES: dict[str, LocalIndexStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_local_index_store(index_dir: str) -> LocalIndexStore:
+    """One store per directory and process, so that segments are only loaded once"""
+    with _STORES_LOCK:
+        if index_dir not in _STORES:
+            _STORES[index_dir] = LocalIndexStore(index_dir)
+        return _STORES[index_dir]
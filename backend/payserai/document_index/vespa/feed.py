@@ -0,0 +1,165 @@
+import asyncio
+import os
+import random
+import threading
+from collections.abc import Coroutine
+from dataclasses import dataclass
+from typing import Any
+from typing import TypeVar
+
+import httpx
+
+from payserai.configs.app_configs import VESPA_FEED_MAX_IN_FLIGHT
+from payserai.utils.http_client import get_shared_async_http_client
+from payserai.utils.http_client import HttpClientConfig
+from payserai.utils.logger import setup_logger
+
+logger = setup_logger()
+
+R = TypeVar("R")
+
+# Vespa signals that it is overloaded with 429 / 503, these are safe to retry
+_RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+_FEED_CLIENT_NAME = "vespa_feed"
+# Retries are done per operation, see _send_operation
+_FEED_CLIENT_CONFIG = HttpClientConfig(
+    pool_size=VESPA_FEED_MAX_IN_FLIGHT, timeout_secs=60.0, retries=0
+)
+
+# The shared async client is bound to an event loop, so all feeding goes through one
+# long lived loop per process instead of a new loop (and client) per call
+_FEED_LOOP: tuple[int, asyncio.AbstractEventLoop] | None = None
+_FEED_LOOP_LOCK = threading.Lock()
+
+
+@dataclass
+class VespaFeedOperation:
+    # The Payserai document the chunk belongs to, failures are reported per document
+    document_id: str
+    method: str
+    url: str
+    body: dict[str, Any] | None = None
+
+
+class VespaFeedError(RuntimeError):
+    def __init__(self, failures: dict[str, str]) -> None:
+        self.failures = failures
+        failure_strs = [f"'{doc_id}': {error}" for doc_id, error in failures.items()]
+        super().__init__(
+            f"Failed to write {len(failures)} documents to Vespa: "
+            + "; ".join(failure_strs[:10])
+            + ("; ..." if len(failure_strs) > 10 else "")
+        )
+
+
+async def _send_operation(
+    client: httpx.AsyncClient,
+    operation: VespaFeedOperation,
+    retries: int,
+    backoff_secs: float,
+) -> str | None:
+    """Returns the error if the operation could not be applied"""
+    for attempt in range(retries + 1):
+        try:
+            response = await client.request(
+                operation.method, operation.url, json=operation.body
+            )
+            # Deleting a chunk that is already gone is not an error
+            if response.is_success or (
+                operation.method == "DELETE" and response.status_code == 404
+            ):
+                return None
+            error = f"status {response.status_code}: {response.text}"
+            if response.status_code not in _RETRYABLE_STATUS_CODES:
+                return error
+        except httpx.TransportError as e:
+            error = repr(e)
+
+        if attempt < retries:
+            await asyncio.sleep(
+                backoff_secs * (2**attempt) * random.uniform(0.5, 1.5)
+            )
+
+    return error
+
+
+async def _afeed(
+    operations: list[VespaFeedOperation],
+    max_in_flight: int,
+    retries: int,
+    backoff_secs: float,
+) -> list[str | None]:
+    errors: list[str | None] = [None] * len(operations)
+    # Shared by all workers, each worker picks the next operation once it is done with
+    # its previous one so that at most `max_in_flight` requests are outstanding
+    pending = iter(enumerate(operations))
+
+    client = get_shared_async_http_client(_FEED_CLIENT_NAME, _FEED_CLIENT_CONFIG)
+
+    async def _worker() -> None:
+        for ind, operation in pending:
+            errors[ind] = await _send_operation(
+                client, operation, retries=retries, backoff_secs=backoff_secs
+            )
+
+    await asyncio.gather(
+        *(_worker() for _ in range(min(max_in_flight, len(operations))))
+    )
+
+    return errors
+
+
+def _get_feed_loop() -> asyncio.AbstractEventLoop:
+    global _FEED_LOOP
+
+    pid = os.getpid()
+    with _FEED_LOOP_LOCK:
+        # The loop's thread does not survive a fork
+        if _FEED_LOOP is None or _FEED_LOOP[0] != pid:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="vespa-feed", daemon=True
+            ).start()
+            _FEED_LOOP = (pid, loop)
+        return _FEED_LOOP[1]
+
+
+def _run_coroutine(coroutine: Coroutine[Any, Any, R]) -> R:
+    """Runs the coroutine on the feed loop, this also works for callers which are already
+    inside of an event loop, which can't be nested"""
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_feed_loop()).result()
+
+
+def feed_operations(
+    operations: list[VespaFeedOperation],
+    max_in_flight: int = VESPA_FEED_MAX_IN_FLIGHT,
+    retries: int = 3,
+    backoff_secs: float = 0.5,
+) -> dict[str, str]:
+    """Pipelines the operations to the Vespa document API over a pool of keep-alive
+    connections with a bounded number of requests in flight. Vespa has no endpoint
+    accepting multiple documents in one request, its own feed client works the same way.
+
+    Returns the first error of each Payserai document that had an operation fail, an
+    empty dict if everything was applied."""
+    if not operations:
+        return {}
+
+    errors = _run_coroutine(
+        _afeed(
+            operations,
+            max_in_flight=max_in_flight,
+            retries=retries,
+            backoff_secs=backoff_secs,
+        )
+    )
+
+    failures: dict[str, str] = {}
+    for operation, error in zip(operations, errors):
+        if error is not None and operation.document_id not in failures:
+            logger.error(
+                f"Failed to {operation.method} '{operation.url}' for document "
+                f"'{operation.document_id}': {error}"
+            )
+            failures[operation.document_id] = error
+    return failures
@@ -1,8 +1,12 @@
-import concurrent.futures
+import hashlib
+import io
+import itertools
 import json
 import string
 import time
+import zipfile
 from collections.abc import Callable
+from collections.abc import Iterable
 from collections.abc import Mapping
 from dataclasses import dataclass
 from datetime import datetime
@@ -18,8 +22,10 @@ from retry import retry
 from payserai.configs.app_configs import DOCUMENT_INDEX_NAME
 from payserai.configs.app_configs import LOG_VESPA_TIMING_INFORMATION
 from payserai.configs.app_configs import VESPA_DEPLOYMENT_ZIP
+from payserai.configs.app_configs import VESPA_INCREMENTAL_REINDEX
 from payserai.configs.app_configs import VESPA_HOST
 from payserai.configs.app_configs import VESPA_PORT
+from payserai.configs.app_configs import VESPA_QUERY_MAX_IN_FLIGHT
 from payserai.configs.app_configs import VESPA_TENANT_PORT
 from payserai.configs.chat_configs import DOC_TIME_DECAY
 from payserai.configs.chat_configs import EDIT_KEYWORD_QUERY
@@ -34,6 +40,7 @@ from payserai.configs.constants import CONTENT
 from payserai.configs.constants import DOC_UPDATED_AT
 from payserai.configs.constants import DOCUMENT_ID
 from payserai.configs.constants import DOCUMENT_SETS
+from payserai.configs.constants import EmbeddingPrecision
 from payserai.configs.constants import EMBEDDINGS
 from payserai.configs.constants import HIDDEN
 from payserai.configs.constants import INDEX_SEPARATOR
@@ -49,6 +56,9 @@ from payserai.configs.constants import SOURCE_TYPE
 from payserai.configs.constants import TITLE
 from payserai.configs.constants import TITLE_EMBEDDING
 from payserai.configs.constants import TITLE_SEPARATOR
+from payserai.configs.constants import TOKEN_COUNT
+from payserai.configs.model_configs import DOCUMENT_ENCODER_MODEL
+from payserai.configs.model_configs import EMBEDDING_PRECISION
 from payserai.configs.model_configs import SEARCH_DISTANCE_CUTOFF
 from payserai.connectors.cross_connector_utils.miscellaneous_utils import (
     get_experts_stores_representations,
@@ -57,15 +67,32 @@ from payserai.document_index.document_index_utils import get_uuid_from_chunk
 from payserai.document_index.interfaces import DocumentIndex
 from payserai.document_index.interfaces import DocumentInsertionRecord
 from payserai.document_index.interfaces import UpdateRequest
+from payserai.document_index.vespa.feed import feed_operations
+from payserai.document_index.vespa.feed import VespaFeedError
+from payserai.document_index.vespa.feed import VespaFeedOperation
 from payserai.document_index.vespa.utils import remove_invalid_unicode_chars
 from payserai.indexing.models import DocMetadataAwareIndexChunk
 from payserai.indexing.models import InferenceChunk
+from payserai.indexing.quantization import quantize_embedding
 from payserai.search.models import IndexFilters
+from payserai.search.models import NearestNeighborSettings
+from payserai.search.models import SearchQuery
+from payserai.search.models import SearchType
+from payserai.search.search_runner import aembed_queries
+from payserai.search.search_runner import aembed_query
+from payserai.search.search_runner import embed_queries
 from payserai.search.search_runner import embed_query
 from payserai.search.search_runner import query_processing
 from payserai.search.search_runner import remove_stop_words_and_punctuation
 from payserai.utils.batching import batch_generator
+from payserai.utils.http_client import asend_with_retries
+from payserai.utils.http_client import get_shared_async_http_client
+from payserai.utils.http_client import get_shared_http_client
+from payserai.utils.http_client import HttpClientConfig
+from payserai.utils.http_client import send_with_retries
 from payserai.utils.logger import setup_logger
+from payserai.utils.threadpool_concurrency import ExecutorName
+from payserai.utils.threadpool_concurrency import gather_with_limit
 from payserai.utils.threadpool_concurrency import run_functions_tuples_in_parallel
 
 logger = setup_logger()
@@ -80,22 +107,32 @@ DOCUMENT_ID_ENDPOINT = (
 )
 SEARCH_ENDPOINT = f"{VESPA_APP_CONTAINER_URL}/search/"
 _BATCH_SIZE = 100  # Specific to Vespa
-_NUM_THREADS = (
-    16  # since Vespa doesn't allow batching of inserts / updates, we use threads
-)
+# Documents matched by one query when retrieving documents by id, and the hits fetched
+# per page of such a query, 400 is the max Vespa returns by default
+_ID_RETRIEVAL_DOCUMENTS_PER_QUERY = 50
+_ID_RETRIEVAL_HITS_PER_PAGE = 400
+# Documents updated per round of chunk id lookups and partial updates
+_UPDATE_DOCUMENTS_PER_BATCH = 1000
 # up from 500ms for now, since we've seen quite a few timeouts
 # in the long term, we are looking to improve the performance of Vespa
 # so that we can bring this back to default
 _VESPA_TIMEOUT = "3s"
 # Specific to Vespa, needed for highlighting matching keywords / section
 CONTENT_SUMMARY = "content_summary"
-
-
-@dataclass
-class _VespaUpdateRequest:
-    document_id: str
-    url: str
-    update_request: dict[str, dict]
+# Specific to Vespa, used to tell which chunks changed when re-indexing a document
+CONTENT_HASH = "content_hash"
+# Fields that may change without the rest of the chunk changing, re-indexed chunks with only
+# these changed are updated in place like in VespaIndex.update
+_METADATA_FIELDS = [ACCESS_CONTROL_LIST, BOOST, DOCUMENT_SETS]
+# The embeddings follow from the content and the embedding model, which is hashed instead.
+# Re-embedding the same content does not always give the exact same floats.
+_UNHASHED_FIELDS = {*_METADATA_FIELDS, EMBEDDINGS, TITLE_EMBEDDING}
+# Keep-alive client shared by all reads from Vespa, blocking and async. The queries are
+# retried with the same backoff as the previous @retry(tries=3, delay=1, backoff=2)
+_VESPA_QUERY_CLIENT_NAME = "vespa_query"
+_VESPA_QUERY_HTTP_CONFIG = HttpClientConfig(
+    pool_size=64, retries=2, backoff_secs=1.0, http2=False
+)
 
 
 @retry(tries=3, delay=1, backoff=2)
@@ -128,116 +165,117 @@ def _vespa_get_updated_at_attribute(t: datetime | None) -> int | None:
     return int(t.timestamp())
 
 
-def _get_vespa_chunk_ids_by_document_id(
-    document_id: str,
-    hits_per_page: int = _BATCH_SIZE,
-    index_filters: IndexFilters | None = None,
-) -> list[str]:
-    filters_str = (
-        _build_vespa_filters(filters=index_filters, include_hidden=True)
-        if index_filters is not None
-        else ""
-    )
+def _chunk_ids_from_hits(hits: list[dict[str, Any]]) -> list[str]:
+    return [hit["fields"]["documentid"].split("::", 1)[-1] for hit in hits]
 
-    offset = 0
-    doc_chunk_ids = []
-    params: dict[str, int | str] = {
-        "yql": f"select documentid from {DOCUMENT_INDEX_NAME} where {filters_str}document_id contains '{document_id}'",
+
+def _get_documents_hits_batch(
+    document_ids: list[str], selected_fields: list[str]
+) -> list[dict[str, Any]]:
+    selected_fields = ["documentid", DOCUMENT_ID, *selected_fields]
+    document_clauses = " or ".join(
+        f"{DOCUMENT_ID} contains '{document_id}'" for document_id in document_ids
+    )
+    params: dict[str, Any] = {
+        "yql": f"select {', '.join(selected_fields)} "
+        f"from {DOCUMENT_INDEX_NAME} where {document_clauses} "
+        # Stable order for the pagination
+        f"order by {DOCUMENT_ID} asc, {CHUNK_ID} asc",
+        "ranking.profile": "unranked",
         "timeout": "10s",
-        "offset": offset,
-        "hits": hits_per_page,
     }
+    document_id_set = set(document_ids)
+    hits: list[dict[str, Any]] = []
+    offset = 0
     while True:
-        results = requests.get(SEARCH_ENDPOINT, params=params).json()
-        hits = results["root"].get("children", [])
-
-        doc_chunk_ids.extend(
-            [hit["fields"]["documentid"].split("::", 1)[-1] for hit in hits]
+        response = _get_from_vespa(
+            SEARCH_ENDPOINT,
+            params={**params, "hits": _ID_RETRIEVAL_HITS_PER_PAGE, "offset": offset},
         )
-        params["offset"] += hits_per_page  # type: ignore
-
-        if len(hits) < hits_per_page:
-            break
-    return doc_chunk_ids
-
+        page_hits = response.json()["root"].get("children", [])
+        # Matching on string attributes is case insensitive
+        hits.extend(
+            hit for hit in page_hits if hit["fields"][DOCUMENT_ID] in document_id_set
+        )
+        if len(page_hits) < _ID_RETRIEVAL_HITS_PER_PAGE:
+            return hits
+        offset += _ID_RETRIEVAL_HITS_PER_PAGE
+
+
+def _get_documents_hits(
+    document_ids: list[str], selected_fields: list[str]
+) -> list[dict[str, Any]]:
+    """The hits for all chunks of the documents with the Vespa chunk id, document id and
+    selected_fields, looked up with one query per _ID_RETRIEVAL_DOCUMENTS_PER_QUERY
+    documents"""
+    functions_with_args: list[tuple[Callable, tuple]] = [
+        (_get_documents_hits_batch, (document_batch, selected_fields))
+        for document_batch in batch_generator(
+            document_ids, _ID_RETRIEVAL_DOCUMENTS_PER_QUERY
+        )
+    ]
+    return list(
+        itertools.chain.from_iterable(
+            run_functions_tuples_in_parallel(
+                functions_with_args,
+                max_workers=VESPA_QUERY_MAX_IN_FLIGHT,
+                executor_name=ExecutorName.VESPA_WRITE,
+            )
+        )
+    )
 
-@retry(tries=3, delay=1, backoff=2)
-def _delete_vespa_doc_chunks(document_id: str, http_client: httpx.Client) -> None:
-    doc_chunk_ids = _get_vespa_chunk_ids_by_document_id(document_id)
 
-    for chunk_id in doc_chunk_ids:
-        res = http_client.delete(f"{DOCUMENT_ID_ENDPOINT}/{chunk_id}")
-        res.raise_for_status()
+def _get_vespa_chunk_ids_by_document_ids(
+    document_ids: list[str],
+) -> dict[str, list[str]]:
+    chunk_ids_by_document: dict[str, list[str]] = {
+        document_id: [] for document_id in document_ids
+    }
+    hits = _get_documents_hits(document_ids, selected_fields=[])
+    for vespa_chunk_id, hit in zip(_chunk_ids_from_hits(hits), hits):
+        chunk_ids_by_document[hit["fields"][DOCUMENT_ID]].append(vespa_chunk_id)
+    return chunk_ids_by_document
 
 
-def _delete_vespa_docs(
-    document_ids: list[str],
-    http_client: httpx.Client,
-    executor: concurrent.futures.ThreadPoolExecutor | None = None,
-) -> None:
-    external_executor = True
-
-    if not executor:
-        external_executor = False
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=_NUM_THREADS)
-
-    try:
-        doc_deletion_future = {
-            executor.submit(_delete_vespa_doc_chunks, doc_id, http_client): doc_id
-            for doc_id in document_ids
-        }
-        for future in concurrent.futures.as_completed(doc_deletion_future):
-            # Will raise exception if the deletion raised an exception
-            future.result()
+def _delete_vespa_docs(document_ids: list[str]) -> None:
+    delete_operations = [
+        VespaFeedOperation(
+            document_id=doc_id,
+            method="DELETE",
+            url=f"{DOCUMENT_ID_ENDPOINT}/{chunk_id}",
+        )
+        for doc_id, chunk_ids in _get_vespa_chunk_ids_by_document_ids(
+            document_ids
+        ).items()
+        for chunk_id in chunk_ids
+    ]
 
-    finally:
-        if not external_executor:
-            executor.shutdown(wait=True)
+    failures = feed_operations(delete_operations)
+    if failures:
+        raise VespaFeedError(failures)
 
 
 def _get_existing_documents_from_chunks(
     chunks: list[DocMetadataAwareIndexChunk],
     http_client: httpx.Client,
-    executor: concurrent.futures.ThreadPoolExecutor | None = None,
 ) -> set[str]:
-    external_executor = True
-
-    if not executor:
-        external_executor = False
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=_NUM_THREADS)
-
-    document_ids: set[str] = set()
-    try:
-        chunk_existence_future = {
-            executor.submit(
-                _does_document_exist, str(get_uuid_from_chunk(chunk)), http_client
-            ): chunk
-            for chunk in chunks
-        }
-        for future in concurrent.futures.as_completed(chunk_existence_future):
-            chunk = chunk_existence_future[future]
-            chunk_already_existed = future.result()
-            if chunk_already_existed:
-                document_ids.add(chunk.source_document.id)
-
-    finally:
-        if not external_executor:
-            executor.shutdown(wait=True)
+    functions_with_args: list[tuple[Callable, tuple]] = [
+        (_does_document_exist, (str(get_uuid_from_chunk(chunk)), http_client))
+        for chunk in chunks
+    ]
+    chunks_already_existed = run_functions_tuples_in_parallel(
+        functions_with_args, executor_name=ExecutorName.VESPA_WRITE
+    )
 
-    return document_ids
+    return {
+        chunk.source_document.id
+        for chunk, chunk_already_existed in zip(chunks, chunks_already_existed)
+        if chunk_already_existed
+    }
 
 
-@retry(tries=3, delay=1, backoff=2)
-def _index_vespa_chunk(
-    chunk: DocMetadataAwareIndexChunk, http_client: httpx.Client
-) -> None:
-    json_header = {
-        "Content-Type": "application/json",
-    }
+def _vespa_chunk_fields(chunk: DocMetadataAwareIndexChunk) -> dict[str, Any]:
     document = chunk.source_document
-    # No minichunk documents in vespa, minichunk vectors are stored in the chunk itself
-    vespa_chunk_id = str(get_uuid_from_chunk(chunk))
-
     embeddings = chunk.embeddings
     embeddings_name_vector_map = {"full_chunk": embeddings.full_embedding}
     if embeddings.mini_chunk_embeddings:
@@ -267,49 +305,42 @@ def _index_vespa_chunk(
         DOC_UPDATED_AT: _vespa_get_updated_at_attribute(document.doc_updated_at),
         PRIMARY_OWNERS: get_experts_stores_representations(document.primary_owners),
         SECONDARY_OWNERS: get_experts_stores_representations(document.secondary_owners),
+        TOKEN_COUNT: chunk.token_count,
         # the only `set` vespa has is `weightedset`, so we have to give each
         # element an arbitrary weight
         ACCESS_CONTROL_LIST: {acl_entry: 1 for acl_entry in chunk.access.to_acl()},
         DOCUMENT_SETS: {document_set: 1 for document_set in chunk.document_sets},
     }
+    vespa_document_fields[CONTENT_HASH] = _content_hash(vespa_document_fields)
+    return vespa_document_fields
 
-    vespa_url = f"{DOCUMENT_ID_ENDPOINT}/{vespa_chunk_id}"
-    logger.debug(f'Indexing to URL "{vespa_url}"')
-    res = http_client.post(
-        vespa_url, headers=json_header, json={"fields": vespa_document_fields}
-    )
-    try:
-        res.raise_for_status()
-    except Exception as e:
-        logger.exception(
-            f"Failed to index document: '{document.id}'. Got response: '{res.text}'"
-        )
-        raise e
-
-
-def _batch_index_vespa_chunks(
-    chunks: list[DocMetadataAwareIndexChunk],
-    http_client: httpx.Client,
-    executor: concurrent.futures.ThreadPoolExecutor | None = None,
-) -> None:
-    external_executor = True
-
-    if not executor:
-        external_executor = False
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=_NUM_THREADS)
-
-    try:
-        chunk_index_future = {
-            executor.submit(_index_vespa_chunk, chunk, http_client): chunk
-            for chunk in chunks
-        }
-        for future in concurrent.futures.as_completed(chunk_index_future):
-            # Will raise exception if any indexing raised an exception
-            future.result()
 
-    finally:
-        if not external_executor:
-            executor.shutdown(wait=True)
+def _content_hash(vespa_document_fields: dict[str, Any]) -> str:
+    hashed_fields = {
+        field: value
+        for field, value in vespa_document_fields.items()
+        if field not in _UNHASHED_FIELDS
+    }
+    # Mini chunks may be turned on or off without the content changing
+    hashed_fields[EMBEDDINGS] = sorted(vespa_document_fields[EMBEDDINGS])
+    hashed_fields["embedding_model"] = DOCUMENT_ENCODER_MODEL
+    return hashlib.sha256(
+        json.dumps(hashed_fields, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def _vespa_chunk_to_feed_operation(
+    chunk: DocMetadataAwareIndexChunk,
+    vespa_document_fields: dict[str, Any] | None = None,
+) -> VespaFeedOperation:
+    # No minichunk documents in vespa, minichunk vectors are stored in the chunk itself
+    vespa_chunk_id = str(get_uuid_from_chunk(chunk))
+    return VespaFeedOperation(
+        document_id=chunk.source_document.id,
+        method="POST",
+        url=f"{DOCUMENT_ID_ENDPOINT}/{vespa_chunk_id}",
+        body={"fields": vespa_document_fields or _vespa_chunk_fields(chunk)},
+    )
 
 
 def _clear_and_index_vespa_chunks(
@@ -323,32 +354,143 @@ def _clear_and_index_vespa_chunks(
 
     # NOTE: using `httpx` here since `requests` doesn't support HTTP2. This is beneficient for
     # indexing / updates / deletes since we have to make a large volume of requests.
-    with (
-        concurrent.futures.ThreadPoolExecutor(max_workers=_NUM_THREADS) as executor,
-        httpx.Client(http2=True) as http_client,
-    ):
+    with httpx.Client(http2=True) as http_client:
         # Check for existing documents, existing documents need to have all of their chunks deleted
         # prior to indexing as the document size (num chunks) may have shrunk
         first_chunks = [chunk for chunk in chunks if chunk.chunk_id == 0]
         for chunk_batch in batch_generator(first_chunks, _BATCH_SIZE):
             existing_docs.update(
                 _get_existing_documents_from_chunks(
-                    chunks=chunk_batch, http_client=http_client, executor=executor
+                    chunks=chunk_batch, http_client=http_client
                 )
             )
 
-        for doc_id_batch in batch_generator(existing_docs, _BATCH_SIZE):
-            _delete_vespa_docs(
-                document_ids=doc_id_batch, http_client=http_client, executor=executor
+        _delete_vespa_docs(document_ids=list(existing_docs))
+
+    failures = feed_operations(
+        [_vespa_chunk_to_feed_operation(chunk) for chunk in chunks]
+    )
+    if failures:
+        raise VespaFeedError(failures)
+
+    all_doc_ids = {chunk.source_document.id for chunk in chunks}
+
+    return {
+        DocumentInsertionRecord(
+            document_id=doc_id,
+            already_existed=doc_id in existing_docs,
+        )
+        for doc_id in all_doc_ids
+    }
+
+
+@dataclass
+class _StoredChunk:
+    document_id: str
+    content_hash: str | None
+    # The _METADATA_FIELDS in the same format as they are fed
+    metadata_fields: dict[str, Any]
+
+
+def _weighted_set_to_feed_format(weighted_set: Any) -> dict[str, int]:
+    # Depending on the renderer settings, weighted sets are returned as maps or as
+    # lists of items with weights
+    if isinstance(weighted_set, dict):
+        return weighted_set
+    return {entry["item"]: entry["weight"] for entry in weighted_set or []}
+
+
+def _get_stored_chunks(document_ids: list[str]) -> dict[str, _StoredChunk]:
+    """The chunks currently in the index for the documents, by Vespa chunk id"""
+    hits = _get_documents_hits(
+        document_ids, selected_fields=[CONTENT_HASH, *_METADATA_FIELDS]
+    )
+    return {
+        vespa_chunk_id: _StoredChunk(
+            document_id=hit["fields"][DOCUMENT_ID],
+            content_hash=hit["fields"].get(CONTENT_HASH),
+            metadata_fields={
+                ACCESS_CONTROL_LIST: _weighted_set_to_feed_format(
+                    hit["fields"].get(ACCESS_CONTROL_LIST)
+                ),
+                BOOST: hit["fields"].get(BOOST),
+                DOCUMENT_SETS: _weighted_set_to_feed_format(
+                    hit["fields"].get(DOCUMENT_SETS)
+                ),
+            },
+        )
+        for vespa_chunk_id, hit in zip(_chunk_ids_from_hits(hits), hits)
+    }
+
+
+def _diff_index_vespa_chunks(
+    chunks: list[DocMetadataAwareIndexChunk],
+) -> set[DocumentInsertionRecord]:
+    """Same as _clear_and_index_vespa_chunks but only the chunks which differ from what is
+    already in the index are written. Chunks indexed before the content hash was stored
+    count as changed."""
+    all_doc_ids = list(dict.fromkeys(chunk.source_document.id for chunk in chunks))
+    stored_chunks = _get_stored_chunks(all_doc_ids)
+
+    feed_ops: list[VespaFeedOperation] = []
+    num_updated = 0
+    new_vespa_chunk_ids: set[str] = set()
+    for chunk in chunks:
+        vespa_chunk_id = str(get_uuid_from_chunk(chunk))
+        new_vespa_chunk_ids.add(vespa_chunk_id)
+        vespa_document_fields = _vespa_chunk_fields(chunk)
+
+        stored_chunk = stored_chunks.get(vespa_chunk_id)
+        if (
+            stored_chunk is None
+            or stored_chunk.content_hash != vespa_document_fields[CONTENT_HASH]
+        ):
+            feed_ops.append(
+                _vespa_chunk_to_feed_operation(chunk, vespa_document_fields)
             )
+            continue
 
-        for chunk_batch in batch_generator(chunks, _BATCH_SIZE):
-            _batch_index_vespa_chunks(
-                chunks=chunk_batch, http_client=http_client, executor=executor
+        changed_metadata = {
+            field: {"assign": vespa_document_fields[field]}
+            for field in _METADATA_FIELDS
+            if stored_chunk.metadata_fields[field] != vespa_document_fields[field]
+        }
+        if changed_metadata:
+            num_updated += 1
+            feed_ops.append(
+                VespaFeedOperation(
+                    document_id=chunk.source_document.id,
+                    method="PUT",
+                    url=f"{DOCUMENT_ID_ENDPOINT}/{vespa_chunk_id}",
+                    body={"fields": changed_metadata},
+                )
             )
 
-    all_doc_ids = {chunk.source_document.id for chunk in chunks}
+    # Chunks left over from a previous, longer version of the document
+    feed_ops.extend(
+        VespaFeedOperation(
+            document_id=stored_chunk.document_id,
+            method="DELETE",
+            url=f"{DOCUMENT_ID_ENDPOINT}/{vespa_chunk_id}",
+        )
+        for vespa_chunk_id, stored_chunk in stored_chunks.items()
+        if vespa_chunk_id not in new_vespa_chunk_ids
+    )
+
+    num_deleted = sum(feed_op.method == "DELETE" for feed_op in feed_ops)
+    logger.info(
+        f"Re-indexing {len(chunks)} chunks: {len(feed_ops) - num_updated - num_deleted} "
+        f"written, {num_updated} updated in place, {num_deleted} deleted, "
+        f"{len(chunks) + num_deleted - len(feed_ops)} unchanged"
+    )
+
+    failures = feed_operations(feed_ops)
+    if failures:
+        raise VespaFeedError(failures)
 
+    existing_docs = {
+        stored_chunk.document_id for stored_chunk in stored_chunks.values()
+    }
     return {
         DocumentInsertionRecord(
             document_id=doc_id,
@@ -417,6 +559,21 @@ def _build_vespa_filters(filters: IndexFilters, include_hidden: bool = False) ->
     return filter_str
 
 
+def _nearest_neighbor_annotation(
+    target_hits: int, nearest_neighbor: NearestNeighborSettings | None
+) -> str:
+    nearest_neighbor = nearest_neighbor or NearestNeighborSettings()
+    annotation = (
+        f"targetHits: {target_hits}, "
+        f"approximate: {str(nearest_neighbor.approximate).lower()}"
+    )
+    if nearest_neighbor.approximate and nearest_neighbor.explore_additional_hits:
+        annotation += (
+            f", hnsw.exploreAdditionalHits: {nearest_neighbor.explore_additional_hits}"
+        )
+    return f"{{{annotation}}}"
+
+
 def _process_dynamic_summary(
     dynamic_summary: str, max_summary_length: int = 400
 ) -> list[str]:
@@ -514,31 +671,77 @@ def _vespa_hit_to_inference_chunk(hit: dict[str, Any]) -> InferenceChunk:
         hidden=fields.get(HIDDEN, False),
         primary_owners=fields.get(PRIMARY_OWNERS),
         secondary_owners=fields.get(SECONDARY_OWNERS),
+        # Missing for the chunks indexed before token counts were stored
+        token_count=fields.get(TOKEN_COUNT),
         metadata=metadata,
         match_highlights=match_highlights,
         updated_at=updated_at,
     )
 
 
-@retry(tries=3, delay=1, backoff=2)
-def _query_vespa(query_params: Mapping[str, str | int | float]) -> list[InferenceChunk]:
-    if "query" in query_params and not cast(str, query_params["query"]).strip():
-        raise ValueError("No/empty query received")
+def _get_from_vespa(
+    url: str, params: Mapping[str, Any] | None = None
+) -> httpx.Response:
+    response = send_with_retries(
+        get_shared_http_client(_VESPA_QUERY_CLIENT_NAME, _VESPA_QUERY_HTTP_CONFIG),
+        _VESPA_QUERY_HTTP_CONFIG,
+        "GET",
+        url,
+        params=params,
+    )
+    response.raise_for_status()
+    return response
 
-    response = requests.get(
-        SEARCH_ENDPOINT,
-        params=dict(
-            **query_params,
-            **{
-                "presentation.timing": True,
-            }
-            if LOG_VESPA_TIMING_INFORMATION
-            else {},
+
+async def _aget_from_vespa(
+    url: str, params: Mapping[str, Any] | None = None
+) -> httpx.Response:
+    response = await asend_with_retries(
+        get_shared_async_http_client(
+            _VESPA_QUERY_CLIENT_NAME, _VESPA_QUERY_HTTP_CONFIG
         ),
+        _VESPA_QUERY_HTTP_CONFIG,
+        "GET",
+        url,
+        params=params,
     )
     response.raise_for_status()
+    return response
+
+
+def _search_params(
+    query_params: Mapping[str, str | int | float]
+) -> dict[str, str | int | float]:
+    if "query" in query_params and not cast(str, query_params["query"]).strip():
+        raise ValueError("No/empty query received")
+
+    return dict(
+        **query_params,
+        **{
+            "presentation.timing": True,
+        }
+        if LOG_VESPA_TIMING_INFORMATION
+        else {},
+    )
+
+
+def _query_vespa(query_params: Mapping[str, str | int | float]) -> list[InferenceChunk]:
+    response = _get_from_vespa(SEARCH_ENDPOINT, params=_search_params(query_params))
+    return _search_response_to_inference_chunks(response.json())
+
+
+async def _aquery_vespa(
+    query_params: Mapping[str, str | int | float]
+) -> list[InferenceChunk]:
+    response = await _aget_from_vespa(
+        SEARCH_ENDPOINT, params=_search_params(query_params)
+    )
+    return _search_response_to_inference_chunks(response.json())
+
 
-    response_json: dict[str, Any] = response.json()
+def _search_response_to_inference_chunks(
+    response_json: dict[str, Any]
+) -> list[InferenceChunk]:
     if LOG_VESPA_TIMING_INFORMATION:
         logger.info("Vespa timing info: %s", response_json.get("timing"))
     hits = response_json["root"].get("children", [])
@@ -558,12 +761,98 @@ def _query_vespa(query_params: Mapping[str, str | int | float]) -> list[Inferenc
     return inference_chunks
 
 
-@retry(tries=3, delay=1, backoff=2)
-def _inference_chunk_by_vespa_id(vespa_id: str) -> InferenceChunk:
-    res = requests.get(f"{DOCUMENT_ID_ENDPOINT}/{vespa_id}")
-    res.raise_for_status()
+def _query_vespa_all_pages(
+    query_params: Mapping[str, str | int | float],
+    hits_per_page: int = _ID_RETRIEVAL_HITS_PER_PAGE,
+) -> list[InferenceChunk]:
+    """For queries matching a bounded set of chunks, such as all chunks of some documents"""
+    search_params = _search_params(query_params)
+    inference_chunks: list[InferenceChunk] = []
+    offset = 0
+    while True:
+        params: dict[str, Any] = {
+            **search_params,
+            "hits": hits_per_page,
+            "offset": offset,
+        }
+        response_json = _get_from_vespa(SEARCH_ENDPOINT, params=params).json()
+        inference_chunks.extend(_search_response_to_inference_chunks(response_json))
+        if len(response_json["root"].get("children", [])) < hits_per_page:
+            return inference_chunks
+        offset += hits_per_page
+
+
+async def _aquery_vespa_all_pages(
+    query_params: Mapping[str, str | int | float],
+    hits_per_page: int = _ID_RETRIEVAL_HITS_PER_PAGE,
+) -> list[InferenceChunk]:
+    search_params = _search_params(query_params)
+    inference_chunks: list[InferenceChunk] = []
+    offset = 0
+    while True:
+        params: dict[str, Any] = {
+            **search_params,
+            "hits": hits_per_page,
+            "offset": offset,
+        }
+        response_json = (await _aget_from_vespa(SEARCH_ENDPOINT, params=params)).json()
+        inference_chunks.extend(_search_response_to_inference_chunks(response_json))
+        if len(response_json["root"].get("children", [])) < hits_per_page:
+            return inference_chunks
+        offset += hits_per_page
+
+
+def _group_chunks_by_document(
+    document_ids: list[str], inference_chunks: Iterable[InferenceChunk]
+) -> list[list[InferenceChunk]]:
+    chunks_by_document: dict[str, list[InferenceChunk]] = {
+        document_id: [] for document_id in document_ids
+    }
+    for chunk in inference_chunks:
+        if chunk.document_id in chunks_by_document:
+            chunks_by_document[chunk.document_id].append(chunk)
+
+    for document_chunks in chunks_by_document.values():
+        document_chunks.sort(key=lambda chunk: chunk.chunk_id)
+    return [chunks_by_document[document_id] for document_id in document_ids]
+
+
+def _build_deployment_zip(
+    deployment_zip: str, embedding_precision: str, allow_field_type_change: bool
+) -> bytes:
+    """The app zip with the embedding tensors in the schema switched to the cell type of
+    embedding_precision"""
+    if embedding_precision not in {precision.value for precision in EmbeddingPrecision}:
+        raise ValueError(f"Unknown embedding precision '{embedding_precision}'")
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(deployment_zip) as app_zip, zipfile.ZipFile(
+        output, "w", zipfile.ZIP_DEFLATED
+    ) as deployed_zip:
+        for item in app_zip.infolist():
+            data = app_zip.read(item)
+            if item.filename.endswith(".sd"):
+                # The only tensors in the schema are the embeddings and query embeddings
+                data = (
+                    data.decode()
+                    .replace("tensor<float>(", f"tensor<{embedding_precision}>(")
+                    .encode()
+                )
+            deployed_zip.writestr(item, data)
+
+        if allow_field_type_change:
+            # Vespa allows overrides for at most 30 days, it is only needed for this deploy
+            until = (datetime.now(timezone.utc) + timedelta(days=1)).strftime(
+                "%Y-%m-%d"
+            )
+            deployed_zip.writestr(
+                "validation-overrides.xml",
+                "<validation-overrides>\n"
+                f'    <allow until="{until}">field-type-change</allow>\n'
+                "</validation-overrides>\n",
+            )
 
-    return _vespa_hit_to_inference_chunk(res.json())
+    return output.getvalue()
 
 
 class VespaIndex(DocumentIndex):
@@ -583,6 +872,7 @@ class VespaIndex(DocumentIndex):
         f"{DOC_UPDATED_AT}, "
         f"{PRIMARY_OWNERS}, "
         f"{SECONDARY_OWNERS}, "
+        f"{TOKEN_COUNT}, "
         f"{METADATA}, "
         f"{CONTENT_SUMMARY} "
         f"from {DOCUMENT_INDEX_NAME} where "
@@ -593,164 +883,357 @@ class VespaIndex(DocumentIndex):
         # to be updated + zipped + deployed, not supporting the option for simplicity
         self.deployment_zip = deployment_zip
 
-    def ensure_indices_exist(self) -> None:
+    def ensure_indices_exist(self, allow_embedding_type_change: bool = False) -> None:
         """Verifying indices is more involved as there is no good way to
         verify the deployed app against the zip locally. But deploying the latest app.zip will ensure that
         the index is up-to-date with the expected schema and this does not erase the existing index.
         If the changes cannot be applied without conflict with existing data, it will fail with a non 200
+
+        The embeddings are deployed with the cell type of EMBEDDING_PRECISION. Changing it for an
+        existing index is only allowed with allow_embedding_type_change, the embeddings then have
+        to be fed again, see scripts/migrate_vespa_embedding_precision.py
         """
         deploy_url = f"{VESPA_APPLICATION_ENDPOINT}/tenant/default/prepareandactivate"
         logger.debug(f"Sending Vespa zip to {deploy_url}")
         headers = {"Content-Type": "application/zip"}
-        with open(self.deployment_zip, "rb") as f:
-            response = requests.post(deploy_url, headers=headers, data=f)
-            if response.status_code != 200:
+        response = requests.post(
+            deploy_url,
+            headers=headers,
+            data=_build_deployment_zip(
+                self.deployment_zip,
+                embedding_precision=EMBEDDING_PRECISION,
+                allow_field_type_change=allow_embedding_type_change,
+            ),
+        )
+        if response.status_code != 200:
+            if "field-type-change" in response.text:
                 raise RuntimeError(
-                    f"Failed to prepare Vespa Payserai Index. Response: {response.text}"
+                    "Failed to prepare Vespa Payserai Index, the embedding precision "
+                    "differs from the deployed one. Run "
+                    "scripts/migrate_vespa_embedding_precision.py to switch it. "
+                    f"Response: {response.text}"
                 )
+            raise RuntimeError(
+                f"Failed to prepare Vespa Payserai Index. Response: {response.text}"
+            )
 
     def index(
         self,
         chunks: list[DocMetadataAwareIndexChunk],
     ) -> set[DocumentInsertionRecord]:
+        if VESPA_INCREMENTAL_REINDEX:
+            return _diff_index_vespa_chunks(chunks=chunks)
         return _clear_and_index_vespa_chunks(chunks=chunks)
 
-    @staticmethod
-    def _apply_updates_batched(
-        updates: list[_VespaUpdateRequest],
-        batch_size: int = _BATCH_SIZE,
-    ) -> None:
-        """Runs a batch of updates in parallel via the ThreadPoolExecutor."""
-
-        def _update_chunk(
-            update: _VespaUpdateRequest, http_client: httpx.Client
-        ) -> httpx.Response:
-            logger.debug(
-                f"Updating with request to {update.url} with body {update.update_request}"
-            )
-            return http_client.put(
-                update.url,
-                headers={"Content-Type": "application/json"},
-                json=update.update_request,
-            )
-
-        # NOTE: using `httpx` here since `requests` doesn't support HTTP2. This is beneficient for
-        # indexing / updates / deletes since we have to make a large volume of requests.
-        with (
-            concurrent.futures.ThreadPoolExecutor(max_workers=_NUM_THREADS) as executor,
-            httpx.Client(http2=True) as http_client,
-        ):
-            for update_batch in batch_generator(updates, batch_size):
-                future_to_document_id = {
-                    executor.submit(
-                        _update_chunk,
-                        update,
-                        http_client,
-                    ): update.document_id
-                    for update in update_batch
-                }
-                for future in concurrent.futures.as_completed(future_to_document_id):
-                    res = future.result()
-                    try:
-                        res.raise_for_status()
-                    except requests.HTTPError as e:
-                        failure_msg = f"Failed to update document: {future_to_document_id[future]}"
-                        raise requests.HTTPError(failure_msg) from e
-
     def update(self, update_requests: list[UpdateRequest]) -> None:
         logger.info(f"Updating {len(update_requests)} documents in Vespa")
         start = time.time()
 
-        processed_updates_requests: list[_VespaUpdateRequest] = []
+        # Merged per document, every chunk gets a single partial update with all of the
+        # changes requested for its document
+        update_fields_by_document: dict[str, dict[str, dict]] = {}
         for update_request in update_requests:
-            update_dict: dict[str, dict] = {"fields": {}}
+            update_fields: dict[str, dict] = {}
             if update_request.boost is not None:
-                update_dict["fields"][BOOST] = {"assign": update_request.boost}
+                update_fields[BOOST] = {"assign": update_request.boost}
             if update_request.document_sets is not None:
-                update_dict["fields"][DOCUMENT_SETS] = {
+                update_fields[DOCUMENT_SETS] = {
                     "assign": {
                         document_set: 1 for document_set in update_request.document_sets
                     }
                 }
             if update_request.access is not None:
-                update_dict["fields"][ACCESS_CONTROL_LIST] = {
+                update_fields[ACCESS_CONTROL_LIST] = {
                     "assign": {
                         acl_entry: 1 for acl_entry in update_request.access.to_acl()
                     }
                 }
             if update_request.hidden is not None:
-                update_dict["fields"][HIDDEN] = {"assign": update_request.hidden}
+                update_fields[HIDDEN] = {"assign": update_request.hidden}
 
-            if not update_dict["fields"]:
+            if not update_fields:
                 logger.error("Update request received but nothing to update")
                 continue
 
             for document_id in update_request.document_ids:
-                for doc_chunk_id in _get_vespa_chunk_ids_by_document_id(document_id):
-                    processed_updates_requests.append(
-                        _VespaUpdateRequest(
-                            document_id=document_id,
-                            url=f"{DOCUMENT_ID_ENDPOINT}/{doc_chunk_id}",
-                            update_request=update_dict,
-                        )
-                    )
-
-        self._apply_updates_batched(processed_updates_requests)
+                update_fields_by_document.setdefault(document_id, {}).update(
+                    update_fields
+                )
+
+        # The chunk ids are resolved in bulk, batched to bound the number of operations
+        # held in memory when syncing e.g. a large document set
+        for document_batch in batch_generator(
+            list(update_fields_by_document), _UPDATE_DOCUMENTS_PER_BATCH
+        ):
+            update_operations = [
+                VespaFeedOperation(
+                    document_id=document_id,
+                    method="PUT",
+                    url=f"{DOCUMENT_ID_ENDPOINT}/{doc_chunk_id}",
+                    body={"fields": update_fields_by_document[document_id]},
+                )
+                for document_id, doc_chunk_ids in _get_vespa_chunk_ids_by_document_ids(
+                    document_batch
+                ).items()
+                for doc_chunk_id in doc_chunk_ids
+            ]
+            failures = feed_operations(update_operations)
+            if failures:
+                raise VespaFeedError(failures)
+
         logger.info(
             "Finished updating Vespa documents in %s seconds", time.time() - start
         )
 
     def delete(self, doc_ids: list[str]) -> None:
         logger.info(f"Deleting {len(doc_ids)} documents from Vespa")
+        _delete_vespa_docs(document_ids=doc_ids)
+
+    @staticmethod
+    def _chunk_by_index_yql(
+        document_id: str, chunk_ind: int, filters: IndexFilters
+    ) -> str:
+        filters_str = _build_vespa_filters(filters=filters, include_hidden=True)
+        return (
+            VespaIndex.yql_base
+            + filters_str
+            + f"({DOCUMENT_ID} contains '{document_id}' and {CHUNK_ID} contains '{chunk_ind}')"
+        )
+
+    @staticmethod
+    def _documents_yql(
+        document_ids: list[str],
+        filters: IndexFilters,
+        chunk_ranges: dict[str, tuple[int, int]] | None,
+    ) -> str:
+        document_clauses = []
+        for document_id in document_ids:
+            document_clause = f"{DOCUMENT_ID} contains '{document_id}'"
+            chunk_range = chunk_ranges.get(document_id) if chunk_ranges else None
+            if chunk_range is not None:
+                first_chunk_ind, last_chunk_ind = chunk_range
+                document_clause += (
+                    f" and {CHUNK_ID} >= {first_chunk_ind}"
+                    f" and {CHUNK_ID} <= {last_chunk_ind}"
+                )
+            document_clauses.append(f"({document_clause})")
 
-        # NOTE: using `httpx` here since `requests` doesn't support HTTP2. This is beneficient for
-        # indexing / updates / deletes since we have to make a large volume of requests.
-        with httpx.Client(http2=True) as http_client:
-            _delete_vespa_docs(document_ids=doc_ids, http_client=http_client)
+        filters_str = _build_vespa_filters(filters=filters, include_hidden=True)
+        return (
+            VespaIndex.yql_base
+            + filters_str
+            + f"({' or '.join(document_clauses)}) "
+            # Stable order for the pagination
+            + f"order by {DOCUMENT_ID} asc, {CHUNK_ID} asc"
+        )
+
+    def _documents_query_params(
+        self,
+        document_ids: list[str],
+        filters: IndexFilters,
+        chunk_ranges: dict[str, tuple[int, int]] | None,
+    ) -> list[dict[str, str | int | float]]:
+        """One paginated query per batch of documents"""
+        return [
+            {
+                "yql": self._documents_yql(document_batch, filters, chunk_ranges),
+                "ranking.profile": "unranked",
+                "timeout": "10s",
+            }
+            for document_batch in batch_generator(
+                document_ids, _ID_RETRIEVAL_DOCUMENTS_PER_QUERY
+            )
+        ]
 
     def id_based_retrieval(
         self, document_id: str, chunk_ind: int | None, filters: IndexFilters
     ) -> list[InferenceChunk]:
-        if chunk_ind is None:
-            vespa_chunk_ids = _get_vespa_chunk_ids_by_document_id(
-                document_id=document_id, index_filters=filters
+        if chunk_ind is not None:
+            return _query_vespa(
+                {"yql": self._chunk_by_index_yql(document_id, chunk_ind, filters)}
             )
 
-            if not vespa_chunk_ids:
-                return []
+        return self.multi_id_based_retrieval([document_id], filters)[0]
 
-            functions_with_args: list[tuple[Callable, tuple]] = [
-                (_inference_chunk_by_vespa_id, (vespa_chunk_id,))
-                for vespa_chunk_id in vespa_chunk_ids
-            ]
+    async def aid_based_retrieval(
+        self, document_id: str, chunk_ind: int | None, filters: IndexFilters
+    ) -> list[InferenceChunk]:
+        if chunk_ind is not None:
+            return await _aquery_vespa(
+                {"yql": self._chunk_by_index_yql(document_id, chunk_ind, filters)}
+            )
+
+        return (await self.amulti_id_based_retrieval([document_id], filters))[0]
+
+    def multi_id_based_retrieval(
+        self,
+        document_ids: list[str],
+        filters: IndexFilters,
+        max_in_flight: int | None = None,
+        chunk_ranges: dict[str, tuple[int, int]] | None = None,
+    ) -> list[list[InferenceChunk]]:
+        """The documents are matched by a single query per
+        _ID_RETRIEVAL_DOCUMENTS_PER_QUERY documents, rather than looking up the chunk ids
+        of every document and fetching the chunks one by one"""
+        results = run_functions_tuples_in_parallel(
+            [
+                (_query_vespa_all_pages, (query_params,))
+                for query_params in self._documents_query_params(
+                    document_ids, filters, chunk_ranges
+                )
+            ],
+            allow_failures=True,
+            max_workers=max_in_flight or VESPA_QUERY_MAX_IN_FLIGHT,
+        )
+        # The documents of a failed query come back without chunks
+        return _group_chunks_by_document(
+            document_ids,
+            itertools.chain.from_iterable(
+                results_batch or [] for results_batch in results
+            ),
+        )
+
+    async def amulti_id_based_retrieval(
+        self,
+        document_ids: list[str],
+        filters: IndexFilters,
+        max_in_flight: int | None = None,
+        chunk_ranges: dict[str, tuple[int, int]] | None = None,
+    ) -> list[list[InferenceChunk]]:
+        query_params_list = self._documents_query_params(
+            document_ids, filters, chunk_ranges
+        )
+        results = await gather_with_limit(
+            [
+                _aquery_vespa_all_pages(query_params)
+                for query_params in query_params_list
+            ],
+            max_in_flight=max_in_flight or VESPA_QUERY_MAX_IN_FLIGHT,
+            return_exceptions=True,
+        )
 
-            logger.debug(
-                "Running LLM usefulness eval in parallel (following logging may be out of order)"
+        inference_chunks: list[InferenceChunk] = []
+        for result in results:
+            # Same as the blocking version, the documents of a failed query are left empty
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to retrieve documents by id: {result}")
+                continue
+            inference_chunks.extend(result)
+        return _group_chunks_by_document(document_ids, inference_chunks)
+
+    def _query_params(
+        self,
+        query: SearchQuery,
+        query_embedding: list[float] | None,
+        hybrid_alpha: float | None,
+    ) -> dict[str, str | int | float]:
+        if query.search_type == SearchType.KEYWORD:
+            return dict(
+                self._keyword_params(
+                    query.query,
+                    query.filters,
+                    query.recency_bias_multiplier,
+                    query.num_hits,
+                    EDIT_KEYWORD_QUERY,
+                )
             )
-            inference_chunks = run_functions_tuples_in_parallel(
-                functions_with_args, allow_failures=True
+
+        if query_embedding is None:
+            raise ValueError("Semantic and hybrid searches need a query embedding")
+
+        if query.search_type == SearchType.SEMANTIC:
+            return dict(
+                self._semantic_params(
+                    query.query,
+                    query_embedding,
+                    query.filters,
+                    query.recency_bias_multiplier,
+                    query.num_hits,
+                    EDIT_KEYWORD_QUERY,
+                    query.nearest_neighbor,
+                )
             )
-            inference_chunks.sort(key=lambda chunk: chunk.chunk_id)
-            return inference_chunks
 
-        else:
-            filters_str = _build_vespa_filters(filters=filters, include_hidden=True)
-            yql = (
-                VespaIndex.yql_base
-                + filters_str
-                + f"({DOCUMENT_ID} contains '{document_id}' and {CHUNK_ID} contains '{chunk_ind}')"
+        if query.search_type == SearchType.HYBRID:
+            return self._hybrid_params(
+                query.query,
+                query_embedding,
+                query.filters,
+                query.recency_bias_multiplier,
+                query.num_hits,
+                hybrid_alpha,
+                TITLE_CONTENT_RATIO,
+                EDIT_KEYWORD_QUERY,
+                query.nearest_neighbor,
             )
-        return _query_vespa({"yql": yql})
 
-    def keyword_retrieval(
+        raise RuntimeError("Invalid Search Flow")
+
+    @staticmethod
+    def _embedded_queries(queries: list[SearchQuery]) -> list[str]:
+        return [
+            query.query for query in queries if query.search_type != SearchType.KEYWORD
+        ]
+
+    def _multi_query_params(
+        self,
+        queries: list[SearchQuery],
+        query_embeddings: list[list[float]],
+        hybrid_alpha: float | None,
+    ) -> list[dict[str, str | int | float]]:
+        """query_embeddings are for the queries which are not keyword searches, in order"""
+        embeddings_iter = iter(query_embeddings)
+        return [
+            self._query_params(
+                query,
+                next(embeddings_iter)
+                if query.search_type != SearchType.KEYWORD
+                else None,
+                hybrid_alpha,
+            )
+            for query in queries
+        ]
+
+    def multi_query_retrieval(
+        self,
+        queries: list[SearchQuery],
+        hybrid_alpha: float | None = None,
+        max_in_flight: int | None = None,
+    ) -> list[list[InferenceChunk]]:
+        """The query embeddings are computed in one batch, then the searches are sent
+        together over the shared connection pool"""
+        query_params = self._multi_query_params(
+            queries, embed_queries(self._embedded_queries(queries)), hybrid_alpha
+        )
+        return run_functions_tuples_in_parallel(
+            [(_query_vespa, (params,)) for params in query_params],
+            max_workers=max_in_flight or VESPA_QUERY_MAX_IN_FLIGHT,
+        )
+
+    async def amulti_query_retrieval(
         self,
+        queries: list[SearchQuery],
+        hybrid_alpha: float | None = None,
+        max_in_flight: int | None = None,
+    ) -> list[list[InferenceChunk]]:
+        query_params = self._multi_query_params(
+            queries,
+            await aembed_queries(self._embedded_queries(queries)),
+            hybrid_alpha,
+        )
+        return await gather_with_limit(
+            [_aquery_vespa(params) for params in query_params],
+            max_in_flight=max_in_flight or VESPA_QUERY_MAX_IN_FLIGHT,
+        )
+
+    @staticmethod
+    def _keyword_params(
         query: str,
         filters: IndexFilters,
         time_decay_multiplier: float,
-        num_to_retrieve: int = NUM_RETURNED_HITS,
-        edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
-    ) -> list[InferenceChunk]:
-        # IMPORTANT: THIS FUNCTION IS NOT UP TO DATE, DOES NOT WORK CORRECTLY
+        num_to_retrieve: int,
+        edit_keyword_query: bool,
+    ) -> dict[str, str | int]:
         vespa_where_clauses = _build_vespa_filters(filters)
         yql = (
             VespaIndex.yql_base
@@ -764,7 +1247,7 @@ class VespaIndex(DocumentIndex):
 
         final_query = query_processing(query) if edit_keyword_query else query
 
-        params: dict[str, str | int] = {
+        return {
             "yql": yql,
             "query": final_query,
             "input.query(decay_factor)": str(DOC_TIME_DECAY * time_decay_multiplier),
@@ -774,41 +1257,77 @@ class VespaIndex(DocumentIndex):
             "timeout": _VESPA_TIMEOUT,
         }
 
-        return _query_vespa(params)
-
-    def semantic_retrieval(
+    def keyword_retrieval(
         self,
         query: str,
         filters: IndexFilters,
         time_decay_multiplier: float,
         num_to_retrieve: int = NUM_RETURNED_HITS,
-        distance_cutoff: float | None = SEARCH_DISTANCE_CUTOFF,
         edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
     ) -> list[InferenceChunk]:
         # IMPORTANT: THIS FUNCTION IS NOT UP TO DATE, DOES NOT WORK CORRECTLY
+        return _query_vespa(
+            self._keyword_params(
+                query,
+                filters,
+                time_decay_multiplier,
+                num_to_retrieve,
+                edit_keyword_query,
+            )
+        )
+
+    async def akeyword_retrieval(
+        self,
+        query: str,
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int = NUM_RETURNED_HITS,
+        edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
+    ) -> list[InferenceChunk]:
+        return await _aquery_vespa(
+            self._keyword_params(
+                query,
+                filters,
+                time_decay_multiplier,
+                num_to_retrieve,
+                edit_keyword_query,
+            )
+        )
+
+    @staticmethod
+    def _semantic_params(
+        query: str,
+        query_embedding: list[float],
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int,
+        edit_keyword_query: bool,
+        nearest_neighbor: NearestNeighborSettings | None = None,
+    ) -> dict[str, str | int]:
         vespa_where_clauses = _build_vespa_filters(filters)
+        nn_annotation = _nearest_neighbor_annotation(
+            10 * num_to_retrieve, nearest_neighbor
+        )
         yql = (
             VespaIndex.yql_base
             + vespa_where_clauses
-            + f"(({{targetHits: {10 * num_to_retrieve}}}nearestNeighbor(embeddings, query_embedding)) "
+            + f"(({nn_annotation}nearestNeighbor(embeddings, query_embedding)) "
             # `({defaultIndex: "content_summary"}userInput(@query))` section is
             # needed for highlighting while the N-gram highlighting is broken /
             # not working as desired
             + f'or ({{defaultIndex: "{CONTENT_SUMMARY}"}}userInput(@query)))'
         )
 
-        query_embedding = embed_query(query)
-
         query_keywords = (
             " ".join(remove_stop_words_and_punctuation(query))
             if edit_keyword_query
             else query
         )
 
-        params: dict[str, str | int] = {
+        return {
             "yql": yql,
             "query": query_keywords,  # Needed for highlighting
-            "input.query(query_embedding)": str(query_embedding),
+            "input.query(query_embedding)": str(quantize_embedding(query_embedding)),
             "input.query(decay_factor)": str(DOC_TIME_DECAY * time_decay_multiplier),
             "hits": num_to_retrieve,
             "offset": 0,
@@ -816,43 +1335,86 @@ class VespaIndex(DocumentIndex):
             "timeout": _VESPA_TIMEOUT,
         }
 
-        return _query_vespa(params)
+    def semantic_retrieval(
+        self,
+        query: str,
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int = NUM_RETURNED_HITS,
+        distance_cutoff: float | None = SEARCH_DISTANCE_CUTOFF,
+        edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
+        nearest_neighbor: NearestNeighborSettings | None = None,
+    ) -> list[InferenceChunk]:
+        # IMPORTANT: THIS FUNCTION IS NOT UP TO DATE, DOES NOT WORK CORRECTLY
+        return _query_vespa(
+            self._semantic_params(
+                query,
+                embed_query(query),
+                filters,
+                time_decay_multiplier,
+                num_to_retrieve,
+                edit_keyword_query,
+                nearest_neighbor,
+            )
+        )
 
-    def hybrid_retrieval(
+    async def asemantic_retrieval(
         self,
         query: str,
         filters: IndexFilters,
         time_decay_multiplier: float,
-        num_to_retrieve: int,
-        hybrid_alpha: float | None = HYBRID_ALPHA,
-        title_content_ratio: float | None = TITLE_CONTENT_RATIO,
+        num_to_retrieve: int = NUM_RETURNED_HITS,
         distance_cutoff: float | None = SEARCH_DISTANCE_CUTOFF,
         edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
+        nearest_neighbor: NearestNeighborSettings | None = None,
     ) -> list[InferenceChunk]:
+        return await _aquery_vespa(
+            self._semantic_params(
+                query,
+                await aembed_query(query),
+                filters,
+                time_decay_multiplier,
+                num_to_retrieve,
+                edit_keyword_query,
+                nearest_neighbor,
+            )
+        )
+
+    @staticmethod
+    def _hybrid_params(
+        query: str,
+        query_embedding: list[float],
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int,
+        hybrid_alpha: float | None,
+        title_content_ratio: float | None,
+        edit_keyword_query: bool,
+        nearest_neighbor: NearestNeighborSettings | None = None,
+    ) -> dict[str, str | int | float]:
         vespa_where_clauses = _build_vespa_filters(filters)
         # Needs to be at least as much as the value set in Vespa schema config
         target_hits = max(10 * num_to_retrieve, 1000)
+        nn_annotation = _nearest_neighbor_annotation(target_hits, nearest_neighbor)
         yql = (
             VespaIndex.yql_base
             + vespa_where_clauses
-            + f"(({{targetHits: {target_hits}}}nearestNeighbor(embeddings, query_embedding)) "
-            + f"or ({{targetHits: {target_hits}}}nearestNeighbor(title_embedding, query_embedding)) "
+            + f"(({nn_annotation}nearestNeighbor(embeddings, query_embedding)) "
+            + f"or ({nn_annotation}nearestNeighbor(title_embedding, query_embedding)) "
             + 'or ({grammar: "weakAnd"}userInput(@query)) '
             + f'or ({{defaultIndex: "{CONTENT_SUMMARY}"}}userInput(@query)))'
         )
 
-        query_embedding = embed_query(query)
-
         query_keywords = (
             " ".join(remove_stop_words_and_punctuation(query))
             if edit_keyword_query
             else query
         )
 
-        params: dict[str, str | int | float] = {
+        return {
             "yql": yql,
             "query": query_keywords,
-            "input.query(query_embedding)": str(query_embedding),
+            "input.query(query_embedding)": str(quantize_embedding(query_embedding)),
             "input.query(decay_factor)": str(DOC_TIME_DECAY * time_decay_multiplier),
             "input.query(alpha)": hybrid_alpha
             if hybrid_alpha is not None
@@ -866,7 +1428,57 @@ class VespaIndex(DocumentIndex):
             "timeout": _VESPA_TIMEOUT,
         }
 
-        return _query_vespa(params)
+    def hybrid_retrieval(
+        self,
+        query: str,
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int,
+        hybrid_alpha: float | None = HYBRID_ALPHA,
+        title_content_ratio: float | None = TITLE_CONTENT_RATIO,
+        distance_cutoff: float | None = SEARCH_DISTANCE_CUTOFF,
+        edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
+        nearest_neighbor: NearestNeighborSettings | None = None,
+    ) -> list[InferenceChunk]:
+        return _query_vespa(
+            self._hybrid_params(
+                query,
+                embed_query(query),
+                filters,
+                time_decay_multiplier,
+                num_to_retrieve,
+                hybrid_alpha,
+                title_content_ratio,
+                edit_keyword_query,
+                nearest_neighbor,
+            )
+        )
+
+    async def ahybrid_retrieval(
+        self,
+        query: str,
+        filters: IndexFilters,
+        time_decay_multiplier: float,
+        num_to_retrieve: int,
+        hybrid_alpha: float | None = HYBRID_ALPHA,
+        title_content_ratio: float | None = TITLE_CONTENT_RATIO,
+        distance_cutoff: float | None = SEARCH_DISTANCE_CUTOFF,
+        edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
+        nearest_neighbor: NearestNeighborSettings | None = None,
+    ) -> list[InferenceChunk]:
+        return await _aquery_vespa(
+            self._hybrid_params(
+                query,
+                await aembed_query(query),
+                filters,
+                time_decay_multiplier,
+                num_to_retrieve,
+                hybrid_alpha,
+                title_content_ratio,
+                edit_keyword_query,
+                nearest_neighbor,
+            )
+        )
 
     def admin_retrieval(
         self,
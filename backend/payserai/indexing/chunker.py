@@ -1,7 +1,12 @@
 import abc
 from collections.abc import Callable
+from functools import lru_cache
+from itertools import chain
 
 from llama_index.text_splitter import SentenceSplitter
+from tokenizers.pre_tokenizers import BertPreTokenizer  # type:ignore
+from tokenizers.pre_tokenizers import Whitespace  # type:ignore
+from tokenizers.pre_tokenizers import WhitespaceSplit  # type:ignore
 from transformers import AutoTokenizer  # type:ignore
 
 from payserai.configs.app_configs import BLURB_SIZE
@@ -19,10 +24,31 @@ from payserai.utils.text_processing import shared_precompare_cleanup
 ChunkFunc = Callable[[Document], list[DocAwareChunk]]
 
 
+@lru_cache(maxsize=16)
+def _get_sentence_splitter(
+    tokenizer: AutoTokenizer, chunk_size: int, chunk_overlap: int
+) -> SentenceSplitter:
+    return SentenceSplitter(
+        tokenizer=tokenizer.tokenize, chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+
+
+def _is_whitespace_additive(tokenizer: AutoTokenizer) -> bool:
+    """Whether the tokens of `a + whitespace + b` are always the tokens of `a` followed by
+    the tokens of `b`. Holds for tokenizers that split on whitespace before anything else,
+    like the BERT style WordPiece tokenizers of the default embedding models."""
+    backend_tokenizer = getattr(tokenizer, "backend_tokenizer", None)
+    if backend_tokenizer is not None:
+        return isinstance(
+            backend_tokenizer.pre_tokenizer,
+            (BertPreTokenizer, Whitespace, WhitespaceSplit),
+        )
+    return bool(getattr(tokenizer, "do_basic_tokenize", False))
+
+
 def extract_blurb(text: str, blurb_size: int) -> str:
-    token_count_func = get_default_tokenizer().tokenize
-    blurb_splitter = SentenceSplitter(
-        tokenizer=token_count_func, chunk_size=blurb_size, chunk_overlap=0
+    blurb_splitter = _get_sentence_splitter(
+        get_default_tokenizer(), chunk_size=blurb_size, chunk_overlap=0
     )
 
     return blurb_splitter.split_text(text)[0]
@@ -40,8 +66,8 @@ def chunk_large_section(
 ) -> list[DocAwareChunk]:
     blurb = extract_blurb(section_text, blurb_size)
 
-    sentence_aware_splitter = SentenceSplitter(
-        tokenizer=tokenizer.tokenize, chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    sentence_aware_splitter = _get_sentence_splitter(
+        tokenizer, chunk_size=chunk_size, chunk_overlap=chunk_overlap
     )
 
     split_texts = sentence_aware_splitter.split_text(section_text)
@@ -69,17 +95,24 @@ def chunk_document(
     title = document.get_title_for_document_index()
     title_prefix = title.replace("\n", " ") + TITLE_SEPARATOR if title else ""
     tokenizer = get_default_tokenizer()
+    section_separator_tok_length = len(tokenizer.tokenize(SECTION_SEPARATOR))
+    # If possible, the token count and cleaned up length of the chunk being built are
+    # tracked as sections are added instead of processing the whole chunk text again
+    # for every section, which is quadratic in the number of sections
+    track_tok_length = _is_whitespace_additive(tokenizer)
 
     chunks: list[DocAwareChunk] = []
     link_offsets: dict[int, str] = {}
     chunk_text = ""
+    current_tok_length = 0
+    curr_offset_len = 0
     for ind, section in enumerate(document.sections):
         section_text = title_prefix + section.text if ind == 0 else section.text
         section_link_text = section.link or ""
 
         section_tok_length = len(tokenizer.tokenize(section_text))
-        current_tok_length = len(tokenizer.tokenize(chunk_text))
-        curr_offset_len = len(shared_precompare_cleanup(chunk_text))
+        if not track_tok_length:
+            current_tok_length = len(tokenizer.tokenize(chunk_text))
 
         # Large sections are considered self-contained/unique therefore they start a new chunk and are not concatenated
         # at the end by other sections
@@ -97,6 +130,8 @@ def chunk_document(
                 )
                 link_offsets = {}
                 chunk_text = ""
+                current_tok_length = 0
+                curr_offset_len = 0
 
             large_section_chunks = chunk_large_section(
                 section_text=section_text,
@@ -113,9 +148,7 @@ def chunk_document(
 
         # In the case where the whole section is shorter than a chunk, either adding to chunk or start a new one
         if (
-            current_tok_length
-            + len(tokenizer.tokenize(SECTION_SEPARATOR))
-            + section_tok_length
+            current_tok_length + section_separator_tok_length + section_tok_length
             <= chunk_tok_size
         ):
             chunk_text += (
@@ -135,6 +168,13 @@ def chunk_document(
             )
             link_offsets = {0: section_link_text}
             chunk_text = section_text
+            current_tok_length = 0
+            curr_offset_len = 0
+
+        # The separator is whitespace, which contributes no tokens and is dropped by
+        # the cleanup, so both can be accumulated per section
+        current_tok_length += section_tok_length
+        curr_offset_len += len(shared_precompare_cleanup(section_text))
 
     # Once we hit the end, if we're still in the process of building a chunk, add what we have
     if chunk_text:
@@ -154,9 +194,8 @@ def chunk_document(
 def split_chunk_text_into_mini_chunks(
     chunk_text: str, mini_chunk_size: int = MINI_CHUNK_SIZE
 ) -> list[str]:
-    token_count_func = get_default_tokenizer().tokenize
-    sentence_aware_splitter = SentenceSplitter(
-        tokenizer=token_count_func, chunk_size=mini_chunk_size, chunk_overlap=0
+    sentence_aware_splitter = _get_sentence_splitter(
+        get_default_tokenizer(), chunk_size=mini_chunk_size, chunk_overlap=0
     )
 
     return sentence_aware_splitter.split_text(chunk_text)
@@ -167,6 +206,9 @@ class Chunker:
     def chunk(self, document: Document) -> list[DocAwareChunk]:
         raise NotImplementedError
 
+    def chunk_batch(self, documents: list[Document]) -> list[DocAwareChunk]:
+        return list(chain(*[self.chunk(document=document) for document in documents]))
+
 
 class DefaultChunker(Chunker):
     def chunk(self, document: Document) -> list[DocAwareChunk]:
@@ -1,12 +1,15 @@
-from sentence_transformers import SentenceTransformer  # type: ignore
-
 from payserai.configs.app_configs import ENABLE_MINI_CHUNK
 from payserai.configs.model_configs import ASYM_PASSAGE_PREFIX
 from payserai.configs.model_configs import BATCH_SIZE_ENCODE_CHUNKS
 from payserai.indexing.chunker import split_chunk_text_into_mini_chunks
+from payserai.indexing.embedding_cache import chunk_embedding_cache_key
+from payserai.indexing.embedding_cache import ChunkEmbeddingCache
+from payserai.indexing.embedding_cache import get_chunk_embedding_cache
 from payserai.indexing.models import ChunkEmbedding
 from payserai.indexing.models import DocAwareChunk
+from payserai.indexing.models import Embedding
 from payserai.indexing.models import IndexChunk
+from payserai.indexing.quantization import quantize_embedding
 from payserai.search.models import Embedder
 from payserai.search.search_nlp_models import EmbeddingModel
 from payserai.utils.logger import setup_logger
@@ -14,16 +17,64 @@ from payserai.utils.logger import setup_logger
 logger = setup_logger()
 
 
+def _embed_texts(
+    texts: list[str],
+    embedding_model: EmbeddingModel,
+    batch_size: int,
+    prefix: str,
+    embedding_cache: ChunkEmbeddingCache | None,
+) -> list[Embedding]:
+    """Only texts which are not found in the cache are sent to the model, identical
+    texts are embedded once"""
+    keys = [
+        chunk_embedding_cache_key(embedding_model.model_name, prefix, text)
+        for text in texts
+    ]
+    embeddings_by_key = (
+        embedding_cache.get_many(keys) if embedding_cache is not None else {}
+    )
+
+    texts_to_embed = {
+        key: prefix + text
+        for key, text in zip(keys, texts)
+        if key not in embeddings_by_key
+    }
+    keys_to_embed = list(texts_to_embed.keys())
+    text_batches = [
+        [texts_to_embed[key] for key in keys_to_embed[i : i + batch_size]]
+        for i in range(0, len(keys_to_embed), batch_size)
+    ]
+    if embedding_cache is not None:
+        logger.debug(
+            f"Found {len(texts) - len(keys_to_embed)} of {len(texts)} embeddings in cache"
+        )
+
+    new_embeddings: list[Embedding] = []
+    len_text_batches = len(text_batches)
+    for idx, text_batch in enumerate(text_batches, start=1):
+        logger.debug(f"Embedding text batch {idx} of {len_text_batches}")
+        # Normalize embeddings is only configured via model_configs.py, be sure to use right value for the set loss
+        new_embeddings.extend(embedding_model.encode(text_batch))
+
+        # Replace line above with the line below for easy debugging of indexing flow, skipping the actual model
+        # new_embeddings.extend([[0.0] * 384 for _ in range(len(text_batch))])
+
+    new_embeddings_by_key = dict(zip(keys_to_embed, new_embeddings))
+    if embedding_cache is not None:
+        embedding_cache.set_many(new_embeddings_by_key)
+    embeddings_by_key.update(new_embeddings_by_key)
+
+    return [embeddings_by_key[key] for key in keys]
+
+
 def embed_chunks(
     chunks: list[DocAwareChunk],
-    embedding_model: SentenceTransformer | None = None,
+    embedding_model: EmbeddingModel | None = None,
     batch_size: int = BATCH_SIZE_ENCODE_CHUNKS,
     enable_mini_chunk: bool = ENABLE_MINI_CHUNK,
     passage_prefix: str = ASYM_PASSAGE_PREFIX,
+    embedding_cache: ChunkEmbeddingCache | None = None,
 ) -> list[IndexChunk]:
-    # Cache the Title embeddings to only have to do it once
-    title_embed_dict: dict[str, list[float]] = {}
-
     embedded_chunks: list[IndexChunk] = []
     if embedding_model is None:
         embedding_model = EmbeddingModel()
@@ -31,29 +82,43 @@ def embed_chunks(
     chunk_texts = []
     chunk_mini_chunks_count = {}
     for chunk_ind, chunk in enumerate(chunks):
-        chunk_texts.append(passage_prefix + chunk.content)
+        chunk_texts.append(chunk.content)
         mini_chunk_texts = (
             split_chunk_text_into_mini_chunks(chunk.content)
             if enable_mini_chunk
             else []
         )
-        prefixed_mini_chunk_texts = [passage_prefix + text for text in mini_chunk_texts]
-        chunk_texts.extend(prefixed_mini_chunk_texts)
-        chunk_mini_chunks_count[chunk_ind] = 1 + len(prefixed_mini_chunk_texts)
-
-    text_batches = [
-        chunk_texts[i : i + batch_size] for i in range(0, len(chunk_texts), batch_size)
-    ]
-
-    embeddings: list[list[float]] = []
-    len_text_batches = len(text_batches)
-    for idx, text_batch in enumerate(text_batches, start=1):
-        logger.debug(f"Embedding text batch {idx} of {len_text_batches}")
-        # Normalize embeddings is only configured via model_configs.py, be sure to use right value for the set loss
-        embeddings.extend(embedding_model.encode(text_batch))
-
-        # Replace line above with the line below for easy debugging of indexing flow, skipping the actual model
-        # embeddings.extend([[0.0] * 384 for _ in range(len(text_batch))])
+        chunk_texts.extend(mini_chunk_texts)
+        chunk_mini_chunks_count[chunk_ind] = 1 + len(mini_chunk_texts)
+
+    embeddings = _embed_texts(
+        chunk_texts,
+        embedding_model=embedding_model,
+        batch_size=batch_size,
+        prefix=passage_prefix,
+        embedding_cache=embedding_cache,
+    )
+
+    # Titles are shared by all chunks of a document, so only embed each one once
+    titles = list(
+        {
+            title: None
+            for chunk in chunks
+            if (title := chunk.source_document.get_title_for_document_index())
+        }
+    )
+    title_embed_dict = dict(
+        zip(
+            titles,
+            _embed_texts(
+                titles,
+                embedding_model=embedding_model,
+                batch_size=batch_size,
+                prefix="",
+                embedding_cache=embedding_cache,
+            ),
+        )
+    )
 
     embedding_ind_start = 0
     for chunk_ind, chunk in enumerate(chunks):
@@ -63,22 +128,21 @@ def embed_chunks(
         ]
 
         title = chunk.source_document.get_title_for_document_index()
+        title_embedding = title_embed_dict[title] if title else None
 
-        title_embedding = None
-        if title:
-            if title in title_embed_dict:
-                title_embedding = title_embed_dict[title]
-            else:
-                title_embedding = embedding_model.encode([title])[0]
-                title_embed_dict[title] = title_embedding
-
+        # The cache keeps the full precision embeddings, so that changing the precision
+        # does not require re-embedding
         new_embedded_chunk = IndexChunk(
             **{k: getattr(chunk, k) for k in chunk.__dataclass_fields__},
             embeddings=ChunkEmbedding(
-                full_embedding=chunk_embeddings[0],
-                mini_chunk_embeddings=chunk_embeddings[1:],
+                full_embedding=quantize_embedding(chunk_embeddings[0]),
+                mini_chunk_embeddings=[
+                    quantize_embedding(embedding) for embedding in chunk_embeddings[1:]
+                ],
             ),
-            title_embedding=title_embedding,
+            title_embedding=quantize_embedding(title_embedding)
+            if title_embedding is not None
+            else None,
         )
         embedded_chunks.append(new_embedded_chunk)
         embedding_ind_start += num_embeddings
@@ -88,4 +152,4 @@ def embed_chunks(
 
 class DefaultEmbedder(Embedder):
     def embed(self, chunks: list[DocAwareChunk]) -> list[IndexChunk]:
-        return embed_chunks(chunks)
+        return embed_chunks(chunks, embedding_cache=get_chunk_embedding_cache())
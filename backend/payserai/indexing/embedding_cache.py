@@ -0,0 +1,89 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+from payserai.configs.model_configs import CHUNK_EMBEDDING_CACHE_MAX_AGE_DAYS
+from payserai.configs.model_configs import CHUNK_EMBEDDING_CACHE_MAX_ENTRIES
+from payserai.configs.model_configs import CHUNK_EMBEDDING_CACHE_PATH
+from payserai.indexing.models import Embedding
+from payserai.utils.cache import CacheStats
+from payserai.utils.cache import SqliteCacheBacking
+from payserai.utils.logger import setup_logger
+
+logger = setup_logger()
+
+# Eviction scans the whole table, no need to run it on every write
+_EVICTION_INTERVAL_SECS = 10 * 60
+
+
+def chunk_embedding_cache_key(model_name: str, prefix: str, text: str) -> str:
+    return hashlib.sha256(
+        "\x1f".join([model_name, prefix, text]).encode("utf-8")
+    ).hexdigest()
+
+
+class ChunkEmbeddingCache:
+    """Persistent content addressed store of passage embeddings. Documents that are
+    re-indexed after a small edit only need the changed chunks to be embedded again.
+    Failures of the underlying store are logged and treated as cache misses."""
+
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: int = CHUNK_EMBEDDING_CACHE_MAX_ENTRIES,
+        max_age_secs: float = CHUNK_EMBEDDING_CACHE_MAX_AGE_DAYS * 24 * 60 * 60,
+    ) -> None:
+        self.backing = SqliteCacheBacking(db_path, table_name="chunk_embeddings")
+        self.max_entries = max_entries
+        self.max_age_secs = max_age_secs
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._last_evicted_at: float | None = None
+
+    def get_many(self, keys: list[str]) -> dict[str, Embedding]:
+        try:
+            found = self.backing.get_many(keys, max_age_secs=self.max_age_secs)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read from chunk embedding cache: {e}")
+            found = {}
+
+        with self._lock:
+            self._hits += len(found)
+            self._misses += len(set(keys)) - len(found)
+        return found
+
+    def set_many(self, items: dict[str, Embedding]) -> None:
+        try:
+            self.backing.set_many(items)
+            self._maybe_evict()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write to chunk embedding cache: {e}")
+
+    def _maybe_evict(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self._last_evicted_at is not None
+                and now - self._last_evicted_at < _EVICTION_INTERVAL_SECS
+            ):
+                return
+            self._last_evicted_at = now
+
+        self.backing.evict(max_entries=self.max_entries, max_age_secs=self.max_age_secs)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(hits=self._hits, misses=self._misses)
+
+
+_CHUNK_EMBEDDING_CACHE: ChunkEmbeddingCache | None = None
+
+
+def get_chunk_embedding_cache() -> ChunkEmbeddingCache | None:
+    global _CHUNK_EMBEDDING_CACHE
+    if _CHUNK_EMBEDDING_CACHE is None and CHUNK_EMBEDDING_CACHE_PATH:
+        _CHUNK_EMBEDDING_CACHE = ChunkEmbeddingCache(CHUNK_EMBEDDING_CACHE_PATH)
+    return _CHUNK_EMBEDDING_CACHE
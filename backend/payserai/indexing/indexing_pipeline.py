@@ -1,24 +1,31 @@
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from dataclasses import dataclass
+from dataclasses import field
 from functools import partial
-from itertools import chain
+from typing import Any
 from typing import Protocol
 
 from sqlalchemy.orm import Session
 
 from payserai.access.access import get_access_for_documents
+from payserai.configs.app_configs import INDEXING_PIPELINE_QUEUE_SIZE
 from payserai.configs.constants import DEFAULT_BOOST
+from payserai.configs.constants import TITLE_SEPARATOR
 from payserai.connectors.cross_connector_utils.miscellaneous_utils import (
     get_experts_stores_representations,
 )
 from payserai.connectors.models import Document
 from payserai.connectors.models import IndexAttemptMetadata
 from payserai.db.document import get_documents_by_ids
-from payserai.db.document import prepare_to_modify_documents
+from payserai.db.document import modify_documents_with_locks
 from payserai.db.document import update_docs_updated_at
 from payserai.db.document import upsert_documents_complete
 from payserai.db.document_set import fetch_document_sets_for_documents
 from payserai.db.engine import get_sqlalchemy_engine
-from payserai.db.tag import create_or_add_document_tag
-from payserai.db.tag import create_or_add_document_tag_list
+from payserai.db.search_cache import record_search_cache_invalidations
+from payserai.db.tag import create_or_add_document_tags_bulk
 from payserai.document_index.factory import get_default_document_index
 from payserai.document_index.interfaces import DocumentIndex
 from payserai.document_index.interfaces import DocumentMetadata
@@ -27,8 +34,12 @@ from payserai.indexing.chunker import DefaultChunker
 from payserai.indexing.embedder import DefaultEmbedder
 from payserai.indexing.models import DocAwareChunk
 from payserai.indexing.models import DocMetadataAwareIndexChunk
+from payserai.indexing.models import IndexChunk
+from payserai.llm.utils import check_number_of_tokens
+from payserai.llm.utils import get_default_llm_token_encode
 from payserai.search.models import Embedder
 from payserai.utils.logger import setup_logger
+from payserai.utils.threadpool_concurrency import run_in_pipelined_stages
 from payserai.utils.timing import log_function_time
 
 logger = setup_logger()
@@ -41,6 +52,22 @@ class IndexingPipelineProtocol(Protocol):
         ...
 
 
+@dataclass
+class IndexedDocBatch:
+    documents: list[Document]
+    # Number of new documents and number of chunks, same as IndexingPipelineProtocol
+    counts: tuple[int, int]
+
+
+class StreamingIndexingPipelineProtocol(Protocol):
+    def __call__(
+        self,
+        document_batches: Iterable[list[Document]],
+        index_attempt_metadata: IndexAttemptMetadata,
+    ) -> Iterator[IndexedDocBatch]:
+        ...
+
+
 def upsert_documents_in_db(
     documents: list[Document],
     index_attempt_metadata: IndexAttemptMetadata,
@@ -69,40 +96,38 @@ def upsert_documents_in_db(
         document_metadata_batch=doc_m_batch,
     )
 
-    # Insert document content metadata
-    for doc in documents:
-        for k, v in doc.metadata.items():
-            if isinstance(v, list):
-                create_or_add_document_tag_list(
-                    tag_key=k,
-                    tag_values=v,
-                    source=doc.source,
-                    document_id=doc.id,
-                    db_session=db_session,
-                )
-            else:
-                create_or_add_document_tag(
-                    tag_key=k,
-                    tag_value=v,
-                    source=doc.source,
-                    document_id=doc.id,
-                    db_session=db_session,
-                )
+    # Insert document content metadata, a single commit for all the tags of the batch
+    create_or_add_document_tags_bulk(
+        document_tags={
+            doc.id: [
+                (k, tag_value, doc.source)
+                for k, v in doc.metadata.items()
+                for tag_value in (v if isinstance(v, list) else [v])
+            ]
+            for doc in documents
+        },
+        db_session=db_session,
+    )
 
 
-@log_function_time()
-def index_doc_batch(
+@dataclass
+class _DocBatchInProgress:
+    """State of a document batch as it moves through the indexing stages"""
+
+    documents: list[Document]
+    updatable_docs: list[Document]
+    id_to_boost: dict[str, int]
+    chunks: list[DocAwareChunk]
+    chunks_with_embeddings: list[IndexChunk] = field(default_factory=list)
+
+
+def _prepare_and_chunk_doc_batch(
+    documents: list[Document],
     *,
     chunker: Chunker,
-    embedder: Embedder,
-    document_index: DocumentIndex,
-    documents: list[Document],
     index_attempt_metadata: IndexAttemptMetadata,
-    ignore_time_skip: bool = False,
-) -> tuple[int, int]:
-    """Takes different pieces of the indexing pipeline and applies it to a batch of documents
-    Note that the documents should already be batched at this point so that it does not inflate the
-    memory requirements"""
+    ignore_time_skip: bool,
+) -> _DocBatchInProgress:
     with Session(get_sqlalchemy_engine()) as db_session:
         document_ids = [document.id for document in documents]
 
@@ -112,7 +137,7 @@ def index_doc_batch(
             document_ids=document_ids,
             db_session=db_session,
         )
-        id_to_db_doc_map = {doc.id: doc for doc in db_docs}
+        id_to_boost = {doc.id: doc.boost for doc in db_docs}
         id_update_time_map = {
             doc.id: doc.doc_updated_at for doc in db_docs if doc.doc_updated_at
         }
@@ -132,27 +157,63 @@ def index_doc_batch(
 
         updatable_ids = [doc.id for doc in updatable_docs]
 
-        # Acquires a lock on the documents so that no other process can modify them
-        prepare_to_modify_documents(db_session=db_session, document_ids=updatable_ids)
+        def _upsert_locked_documents(locked_ids: list[str]) -> None:
+            # Create records in the source of truth about these documents, does not
+            # include doc_updated_at which is also used to indicate a successful update
+            locked_id_set = set(locked_ids)
+            upsert_documents_in_db(
+                documents=[doc for doc in updatable_docs if doc.id in locked_id_set],
+                index_attempt_metadata=index_attempt_metadata,
+                db_session=db_session,
+            )
 
-        # Create records in the source of truth about these documents,
-        # does not include doc_updated_at which is also used to indicate a successful update
-        upsert_documents_in_db(
-            documents=updatable_docs,
-            index_attempt_metadata=index_attempt_metadata,
+        # Locks the documents so that no other process can modify them, documents
+        # locked by another process are upserted once it releases them. If that takes
+        # too long the batch fails, the documents upserted until then have no
+        # doc_updated_at yet so they are picked up again by the next run
+        modify_documents_with_locks(
             db_session=db_session,
+            document_ids=updatable_ids,
+            modify_fn=_upsert_locked_documents,
         )
 
-        logger.debug("Starting chunking")
+    logger.debug("Starting chunking")
+
+    # The first chunk additionally contains the Title of the Document
+    chunks: list[DocAwareChunk] = chunker.chunk_batch(documents=updatable_docs)
+
+    return _DocBatchInProgress(
+        documents=documents,
+        updatable_docs=updatable_docs,
+        id_to_boost=id_to_boost,
+        chunks=chunks,
+    )
+
+
+def _embed_doc_batch(
+    doc_batch: _DocBatchInProgress, *, embedder: Embedder
+) -> _DocBatchInProgress:
+    logger.debug("Starting embedding")
+    doc_batch.chunks_with_embeddings = embedder.embed(chunks=doc_batch.chunks)
+    return doc_batch
 
-        # The first chunk additionally contains the Title of the Document
-        chunks: list[DocAwareChunk] = list(
-            chain(*[chunker.chunk(document=document) for document in updatable_docs])
-        )
 
-        logger.debug("Starting embedding")
-        chunks_with_embeddings = embedder.embed(chunks=chunks)
+def _chunk_token_count(chunk: IndexChunk, encode_fn: Callable[[str], list]) -> int:
+    """Counted on the content as it is passed to the LLM, the title prefix of the first
+    chunk is removed at query time"""
+    content = chunk.content
+    title = chunk.source_document.get_title_for_document_index()
+    if chunk.chunk_id == 0 and title:
+        content = content.removeprefix(title.replace("\n", " ") + TITLE_SEPARATOR)
+    return check_number_of_tokens(content, encode_fn=encode_fn)
 
+
+def _write_doc_batch(
+    doc_batch: _DocBatchInProgress, *, document_index: DocumentIndex
+) -> tuple[int, int]:
+    updatable_ids = [doc.id for doc in doc_batch.updatable_docs]
+    llm_token_encode = get_default_llm_token_encode()
+    with Session(get_sqlalchemy_engine()) as db_session:
         # Attach the latest status from Postgres (source of truth for access) to each
         # chunk. This access status will be attached to each chunk in the document index
         # TODO: attach document sets to the chunk based on the status of Postgres as well
@@ -172,17 +233,16 @@ def index_doc_batch(
                 document_sets=set(
                     document_id_to_document_set.get(chunk.source_document.id, [])
                 ),
-                boost=(
-                    id_to_db_doc_map[chunk.source_document.id].boost
-                    if chunk.source_document.id in id_to_db_doc_map
-                    else DEFAULT_BOOST
+                boost=doc_batch.id_to_boost.get(
+                    chunk.source_document.id, DEFAULT_BOOST
                 ),
+                token_count=_chunk_token_count(chunk, llm_token_encode),
             )
-            for chunk in chunks_with_embeddings
+            for chunk in doc_batch.chunks_with_embeddings
         ]
 
         logger.debug(
-            f"Indexing the following chunks: {[chunk.to_short_descriptor() for chunk in chunks]}"
+            f"Indexing the following chunks: {[chunk.to_short_descriptor() for chunk in doc_batch.chunks]}"
         )
         # A document will not be spread across different batches, so all the
         # documents with chunks in this set, are fully represented by the chunks
@@ -192,8 +252,10 @@ def index_doc_batch(
         )
 
         successful_doc_ids = [record.document_id for record in insertion_records]
+        # Committed along with the updated at times below
+        record_search_cache_invalidations(successful_doc_ids, db_session)
         successful_docs = [
-            doc for doc in updatable_docs if doc.id in successful_doc_ids
+            doc for doc in doc_batch.updatable_docs if doc.id in successful_doc_ids
         ]
 
         # Update the time of latest version of the doc successfully indexed
@@ -208,7 +270,70 @@ def index_doc_batch(
         )
 
     return len([r for r in insertion_records if r.already_existed is False]), len(
-        chunks
+        doc_batch.chunks
+    )
+
+
+@log_function_time()
+def index_doc_batch(
+    *,
+    chunker: Chunker,
+    embedder: Embedder,
+    document_index: DocumentIndex,
+    documents: list[Document],
+    index_attempt_metadata: IndexAttemptMetadata,
+    ignore_time_skip: bool = False,
+) -> tuple[int, int]:
+    """Takes different pieces of the indexing pipeline and applies it to a batch of documents
+    Note that the documents should already be batched at this point so that it does not inflate the
+    memory requirements"""
+    doc_batch = _prepare_and_chunk_doc_batch(
+        documents,
+        chunker=chunker,
+        index_attempt_metadata=index_attempt_metadata,
+        ignore_time_skip=ignore_time_skip,
+    )
+    doc_batch = _embed_doc_batch(doc_batch, embedder=embedder)
+    return _write_doc_batch(doc_batch, document_index=document_index)
+
+
+def index_doc_batches_pipelined(
+    *,
+    chunker: Chunker,
+    embedder: Embedder,
+    document_index: DocumentIndex,
+    document_batches: Iterable[list[Document]],
+    index_attempt_metadata: IndexAttemptMetadata,
+    ignore_time_skip: bool = False,
+    max_queue_size: int = INDEXING_PIPELINE_QUEUE_SIZE,
+) -> Iterator[IndexedDocBatch]:
+    """Same as `index_doc_batch` applied to each batch, except that the Postgres upsert +
+    chunking, the embedding and the document index write + Postgres commit stages each
+    run in their own thread. So while batch N is written to the document index, batch
+    N + 1 is embedded and batch N + 2 is chunked. Every stage handles the batches one at
+    a time and in order, so the Postgres commits of the batches stay ordered as well.
+    Document batches are pulled and results are yielded in the calling thread."""
+    stages: list[tuple[str, Callable[[Any], Any]]] = [
+        (
+            "prepare_and_chunk",
+            partial(
+                _prepare_and_chunk_doc_batch,
+                chunker=chunker,
+                index_attempt_metadata=index_attempt_metadata,
+                ignore_time_skip=ignore_time_skip,
+            ),
+        ),
+        ("embed", partial(_embed_doc_batch, embedder=embedder)),
+        (
+            "write",
+            lambda doc_batch: IndexedDocBatch(
+                documents=doc_batch.documents,
+                counts=_write_doc_batch(doc_batch, document_index=document_index),
+            ),
+        ),
+    ]
+    yield from run_in_pipelined_stages(
+        document_batches, stages=stages, max_queue_size=max_queue_size
     )
 
 
@@ -233,3 +358,27 @@ def build_indexing_pipeline(
         document_index=document_index,
         ignore_time_skip=ignore_time_skip,
     )
+
+
+def build_streaming_indexing_pipeline(
+    *,
+    chunker: Chunker | None = None,
+    embedder: Embedder | None = None,
+    document_index: DocumentIndex | None = None,
+    ignore_time_skip: bool = False,
+) -> StreamingIndexingPipelineProtocol:
+    """Builds a pipeline which takes in a stream of document batches and indexes them
+    with the indexing stages overlapping across batches."""
+    chunker = chunker or DefaultChunker()
+
+    embedder = embedder or DefaultEmbedder()
+
+    document_index = document_index or get_default_document_index()
+
+    return partial(
+        index_doc_batches_pipelined,
+        chunker=chunker,
+        embedder=embedder,
+        document_index=document_index,
+        ignore_time_skip=ignore_time_skip,
+    )
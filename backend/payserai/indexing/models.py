@@ -61,11 +61,14 @@ class DocMetadataAwareIndexChunk(IndexChunk):
                    of. This is used for filtering / passists.
     boost: influences the ranking of this chunk at query time. Positive -> ranked higher,
            negative -> ranked lower.
+    token_count: number of LLM tokens in the chunk content as it is returned at query
+                 time, so that it does not need to be tokenized again for every query.
     """
 
     access: "DocumentAccess"
     document_sets: set[str]
     boost: int
+    token_count: int
 
     @classmethod
     def from_index_chunk(
@@ -74,6 +77,7 @@ class DocMetadataAwareIndexChunk(IndexChunk):
         access: "DocumentAccess",
         document_sets: set[str],
         boost: int,
+        token_count: int,
     ) -> "DocMetadataAwareIndexChunk":
         return cls(
             **{
@@ -83,6 +87,7 @@ class DocMetadataAwareIndexChunk(IndexChunk):
             access=access,
             document_sets=document_sets,
             boost=boost,
+            token_count=token_count,
         )
 
 
@@ -104,6 +109,8 @@ class InferenceChunk(BaseChunk):
     updated_at: datetime | None
     primary_owners: list[str] | None = None
     secondary_owners: list[str] | None = None
+    # None for chunks indexed before the token counts were stored
+    token_count: int | None = None
 
     @property
     def unique_id(self) -> str:
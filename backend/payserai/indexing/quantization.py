@@ -0,0 +1,50 @@
+import numpy as np
+
+from payserai.configs.constants import EmbeddingPrecision
+from payserai.configs.model_configs import EMBEDDING_PRECISION
+from payserai.indexing.models import Embedding
+
+INT8_MAX = 127
+
+
+def _round_to_bfloat16(vector: np.ndarray) -> np.ndarray:
+    # bfloat16 is the upper half of a float32, round to nearest even on the dropped bits
+    bits = vector.astype(np.float32).view(np.uint32)
+    rounding_bias = 0x7FFF + ((bits >> 16) & 1)
+    return ((bits + rounding_bias) & 0xFFFF0000).astype(np.uint32).view(np.float32)
+
+
+def _scale_to_int8(vector: np.ndarray) -> np.ndarray:
+    # Every vector gets its own scale, fine for the angular distance which ignores length
+    max_abs = np.abs(vector).max(initial=0.0)
+    if max_abs == 0:
+        return np.zeros_like(vector, dtype=np.float32)
+    return np.round(vector * (INT8_MAX / max_abs)).astype(np.float32)
+
+
+def quantize_embedding(
+    embedding: Embedding, precision: str = EMBEDDING_PRECISION
+) -> Embedding:
+    """Rounds the embedding to the values the document index stores, so that documents
+    and queries are compared at the same precision. int8 values are kept as floats"""
+    if precision == EmbeddingPrecision.FLOAT:
+        return embedding
+
+    vector = np.asarray(embedding, dtype=np.float32)
+    if precision == EmbeddingPrecision.BFLOAT16:
+        return _round_to_bfloat16(vector).tolist()
+    if precision == EmbeddingPrecision.INT8:
+        return _scale_to_int8(vector).tolist()
+
+    raise ValueError(f"Unknown embedding precision '{precision}'")
+
+
+def bytes_per_embedding_cell(precision: str = EMBEDDING_PRECISION) -> int:
+    if precision == EmbeddingPrecision.FLOAT:
+        return 4
+    if precision == EmbeddingPrecision.BFLOAT16:
+        return 2
+    if precision == EmbeddingPrecision.INT8:
+        return 1
+
+    raise ValueError(f"Unknown embedding precision '{precision}'")
@@ -1,4 +1,5 @@
 import abc
+from collections.abc import AsyncIterator
 from collections.abc import Iterator
 
 import litellm  # type:ignore
@@ -15,6 +16,7 @@ from payserai.configs.model_configs import GEN_AI_MODEL_PROVIDER
 from payserai.configs.model_configs import GEN_AI_MODEL_VERSION
 from payserai.configs.model_configs import GEN_AI_TEMPERATURE
 from payserai.llm.interfaces import LLM
+from payserai.llm.utils import amessage_generator_to_string_generator
 from payserai.llm.utils import message_generator_to_string_generator
 from payserai.llm.utils import should_be_verbose
 from payserai.utils.logger import setup_logger
@@ -78,6 +80,21 @@ class LangChainChatLLM(LLM, abc.ABC):
         if LOG_ALL_MODEL_INTERACTIONS:
             logger.debug(f"Raw Model Output:\n{full_output}")
 
+    async def astream(self, prompt: LanguageModelInput) -> AsyncIterator[str]:
+        if LOG_ALL_MODEL_INTERACTIONS:
+            self._log_prompt(prompt)
+
+        output_tokens = []
+        async for token in amessage_generator_to_string_generator(
+            self.llm.astream(prompt)
+        ):
+            output_tokens.append(token)
+            yield token
+
+        full_output = "".join(output_tokens)
+        if LOG_ALL_MODEL_INTERACTIONS:
+            logger.debug(f"Raw Model Output:\n{full_output}")
+
 
 def _get_model_str(
     model_provider: str | None,
@@ -1,9 +1,11 @@
 import abc
+from collections.abc import AsyncIterator
 from collections.abc import Iterator
 
 from langchain.schema.language_model import LanguageModelInput
 
 from payserai.utils.logger import setup_logger
+from payserai.utils.threadpool_concurrency import aiterate_in_thread
 
 
 logger = setup_logger()
@@ -33,3 +35,9 @@ class LLM(abc.ABC):
     @abc.abstractmethod
     def stream(self, prompt: LanguageModelInput) -> Iterator[str]:
         raise NotImplementedError
+
+    async def astream(self, prompt: LanguageModelInput) -> AsyncIterator[str]:
+        """Models without an async client stream from a worker thread, the event loop
+        is only blocked for handing over the tokens"""
+        async for token in aiterate_in_thread(iter(self.stream(prompt))):
+            yield token
@@ -1,5 +1,8 @@
+import hashlib
+from collections.abc import AsyncIterator
 from collections.abc import Callable
 from collections.abc import Iterator
+from collections.abc import Sequence
 from copy import copy
 from typing import Any
 from typing import cast
@@ -16,7 +19,9 @@ from langchain.schema.messages import HumanMessage
 from langchain.schema.messages import SystemMessage
 from tiktoken.core import Encoding
 
+from payserai.chat.models import LlmDoc
 from payserai.configs.app_configs import LOG_LEVEL
+from payserai.configs.chat_configs import CHUNK_TOKEN_COUNT_CACHE_SIZE
 from payserai.configs.constants import GEN_AI_API_KEY_STORAGE_KEY
 from payserai.configs.constants import MessageType
 from payserai.configs.model_configs import DOC_EMBEDDING_CONTEXT_SIZE
@@ -26,12 +31,15 @@ from payserai.dynamic_configs import get_dynamic_config_store
 from payserai.dynamic_configs.interface import ConfigNotFoundError
 from payserai.indexing.models import InferenceChunk
 from payserai.llm.interfaces import LLM
+from payserai.utils.cache import register_cache
+from payserai.utils.cache import TTLLRUCache
 from payserai.utils.logger import setup_logger
 
 logger = setup_logger()
 
 _LLM_TOKENIZER: Any = None
 _LLM_TOKENIZER_ENCODE: Callable[[str], Any] | None = None
+_CHUNK_TOKEN_COUNT_CACHE: TTLLRUCache[int] | None = None
 
 
 def get_default_llm_tokenizer() -> Any:
@@ -149,6 +157,16 @@ def message_generator_to_string_generator(
         yield message.content
 
 
+async def amessage_generator_to_string_generator(
+    messages: AsyncIterator[BaseMessageChunk],
+) -> AsyncIterator[str]:
+    async for message in messages:
+        if not isinstance(message.content, str):
+            raise RuntimeError("LLM message not in expected format.")
+
+        yield message.content
+
+
 def should_be_verbose() -> bool:
     return LOG_LEVEL == "debug"
 
@@ -167,6 +185,60 @@ def check_number_of_tokens(
     return len(encode_fn(text))
 
 
+def _get_chunk_token_count_cache() -> TTLLRUCache[int]:
+    global _CHUNK_TOKEN_COUNT_CACHE
+    if _CHUNK_TOKEN_COUNT_CACHE is None:
+        _CHUNK_TOKEN_COUNT_CACHE = TTLLRUCache(max_size=CHUNK_TOKEN_COUNT_CACHE_SIZE)
+        register_cache("chunk_token_count", _CHUNK_TOKEN_COUNT_CACHE)
+    return _CHUNK_TOKEN_COUNT_CACHE
+
+
+def get_chunk_token_count(chunk: InferenceChunk | LlmDoc) -> int:
+    """Uses the token count stored with the chunk at indexing time. Chunks indexed before
+    that are tokenized here, their counts are cached as the same chunks keep being
+    retrieved."""
+    if chunk.token_count is not None:
+        return chunk.token_count
+
+    cache = _get_chunk_token_count_cache()
+    cache_key = hashlib.sha256(chunk.content.encode()).hexdigest()
+    token_count = cache.get(cache_key)
+    if token_count is None:
+        token_count = check_number_of_tokens(
+            chunk.content, encode_fn=get_default_llm_token_encode()
+        )
+        cache.set(cache_key, token_count)
+    return token_count
+
+
+def count_prompt_tokens(
+    prompt: str,
+    counted_texts: Sequence[tuple[str, int]],
+    encode_fn: Callable[[str], list],
+) -> int:
+    """Number of tokens in a prompt built around texts with known token counts, such as
+    the context documents. The texts are matched in order and only the rest of the prompt
+    is tokenized. Tokens may merge across the boundaries of the texts, so this can be off
+    by a few tokens."""
+    token_count = 0
+    prompt_parts: list[str] = []
+    position = 0
+    for text, text_token_count in counted_texts:
+        text_start = prompt.find(text, position) if text else -1
+        if text_start == -1:
+            # Left for the tokenizer as part of the rest of the prompt
+            continue
+
+        prompt_parts.append(prompt[position:text_start])
+        token_count += text_token_count
+        position = text_start + len(text)
+    prompt_parts.append(prompt[position:])
+
+    return token_count + sum(
+        len(encode_fn(prompt_part)) for prompt_part in prompt_parts if prompt_part
+    )
+
+
 def get_gen_ai_api_key() -> str | None:
     # first check if the key has been provided by the UI
     try:
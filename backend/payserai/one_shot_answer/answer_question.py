@@ -1,10 +1,16 @@
+import asyncio
+from collections.abc import AsyncIterator
 from collections.abc import Callable
 from collections.abc import Iterator
 from typing import cast
+from uuid import UUID
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from payserai.chat.chat_utils import get_chunks_for_qa
+from payserai.chat.chat_utils import llm_relevance_filter_response
+from payserai.chat.chat_utils import select_llm_chunks
+from payserai.chat.chat_utils import StreamedAnswer
 from payserai.chat.models import PayseraiAnswerPiece
 from payserai.chat.models import PayseraiQuotes
 from payserai.chat.models import LLMMetricsContainer
@@ -12,6 +18,7 @@ from payserai.chat.models import LLMRelevanceFilterResponse
 from payserai.chat.models import QADocsResponse
 from payserai.chat.models import StreamingError
 from payserai.configs.chat_configs import DEFAULT_NUM_CHUNKS_FED_TO_CHAT
+from payserai.configs.chat_configs import ENABLE_SPECULATIVE_RETRIEVAL
 from payserai.configs.chat_configs import QA_TIMEOUT
 from payserai.configs.constants import MessageType
 from payserai.configs.model_configs import CHUNK_SIZE
@@ -21,22 +28,37 @@ from payserai.db.chat import get_or_create_root_message
 from payserai.db.chat import get_passist_by_id
 from payserai.db.chat import get_prompt_by_id
 from payserai.db.chat import translate_db_message_to_chat_message_detail
+from payserai.db.models import ChatMessage
+from payserai.db.models import ChatSession
+from payserai.db.models import Prompt
 from payserai.db.models import User
 from payserai.document_index.factory import get_default_document_index
 from payserai.indexing.models import InferenceChunk
+from payserai.llm.utils import count_prompt_tokens
+from payserai.llm.utils import get_chunk_token_count
 from payserai.llm.utils import get_default_llm_token_encode
 from payserai.one_shot_answer.factory import get_question_answer_model
+from payserai.one_shot_answer.interfaces import QAModel
 from payserai.one_shot_answer.models import DirectQARequest
 from payserai.one_shot_answer.models import OneShotQAResponse
 from payserai.one_shot_answer.models import QueryRephrase
+from payserai.one_shot_answer.qa_block import ano_gen_ai_response
 from payserai.one_shot_answer.qa_block import no_gen_ai_response
 from payserai.one_shot_answer.qa_utils import combine_message_thread
+from payserai.search.models import QueryFlow
 from payserai.search.models import RerankMetricsContainer
 from payserai.search.models import RetrievalMetricsContainer
 from payserai.search.models import SavedSearchDoc
+from payserai.search.models import SearchQuery
+from payserai.search.models import SearchType
+from payserai.search.request_preprocessing import aretrieval_preprocessing
 from payserai.search.request_preprocessing import retrieval_preprocessing
+from payserai.search.search_runner import afull_chunk_search_generator
 from payserai.search.search_runner import chunks_to_search_docs
 from payserai.search.search_runner import full_chunk_search_generator
+from payserai.search.speculative_retrieval import AsyncSpeculativeRetrieval
+from payserai.search.speculative_retrieval import build_speculative_query
+from payserai.search.speculative_retrieval import SpeculativeRetrieval
 from payserai.secondary_llm_flows.answer_validation import get_answer_validity
 from payserai.secondary_llm_flows.query_expansion import thread_based_query_rephrase
 from payserai.server.query_and_chat.models import ChatMessageDetail
@@ -47,6 +69,132 @@ from payserai.utils.timing import log_generator_function_time
 logger = setup_logger()
 
 
+def _qa_docs_response(
+    top_chunks: list[InferenceChunk],
+    retrieval_request: SearchQuery,
+    predicted_search_type: SearchType | None,
+    predicted_flow: QueryFlow | None,
+) -> QADocsResponse:
+    top_docs = chunks_to_search_docs(top_chunks)
+    fake_saved_docs = [SavedSearchDoc.from_search_doc(doc) for doc in top_docs]
+
+    # Since this is in the one shot answer flow, we don't need to actually save the docs to DB
+    return QADocsResponse(
+        top_documents=fake_saved_docs,
+        predicted_flow=predicted_flow,
+        predicted_search=predicted_search_type,
+        applied_source_filters=retrieval_request.filters.source_type,
+        applied_time_cutoff=retrieval_request.filters.time_cutoff,
+        recency_bias_multiplier=retrieval_request.recency_bias_multiplier,
+    )
+
+
+def _get_prompt_and_llm_override(
+    query_req: DirectQARequest, user_id: UUID | None, db_session: Session
+) -> tuple[Prompt | None, str | None]:
+    if query_req.prompt_id is None:
+        return None, None
+
+    prompt = get_prompt_by_id(
+        prompt_id=query_req.prompt_id, user_id=user_id, db_session=db_session
+    )
+    passist = get_passist_by_id(
+        passist_id=query_req.passist_id, user_id=user_id, db_session=db_session
+    )
+    return prompt, passist.llm_model_version_override
+
+
+def _build_full_prompt(
+    qa_model: QAModel | None,
+    query: str,
+    history_str: str,
+    llm_chunks: list[InferenceChunk],
+) -> str:
+    return (
+        qa_model.build_prompt(
+            query=query, history_str=history_str, context_chunks=llm_chunks
+        )
+        if qa_model is not None
+        else "Gen AI Disabled"
+    )
+
+
+def _full_prompt_token_count(
+    full_prompt_str: str, llm_chunks: list[InferenceChunk], llm_tokenizer: Callable
+) -> int:
+    # The chunks make up most of the prompt, their token counts are already known
+    return count_prompt_tokens(
+        full_prompt_str,
+        counted_texts=[
+            (chunk.content.strip(), get_chunk_token_count(chunk))
+            for chunk in llm_chunks
+        ],
+        encode_fn=llm_tokenizer,
+    )
+
+
+def _create_one_shot_chat_session(
+    query_req: DirectQARequest, user_id: UUID | None, db_session: Session
+) -> tuple[ChatSession, ChatMessage]:
+    chat_session = create_chat_session(
+        db_session=db_session,
+        description="",  # One shot queries don't need naming as it's never displayed
+        user_id=user_id,
+        passist_id=query_req.passist_id,
+        one_shot=True,
+    )
+    root_message = get_or_create_root_message(
+        chat_session_id=chat_session.id, db_session=db_session
+    )
+    # Relationships can't be lazy loaded once back on the event loop
+    chat_session.passist.document_sets
+    return chat_session, root_message
+
+
+def _save_user_message(
+    chat_session: ChatSession,
+    root_message: ChatMessage,
+    query_req: DirectQARequest,
+    full_prompt_str: str,
+    llm_chunks: list[InferenceChunk],
+    llm_tokenizer: Callable,
+    db_session: Session,
+) -> ChatMessage:
+    return create_new_chat_message(
+        chat_session_id=chat_session.id,
+        parent_message=root_message,
+        prompt_id=query_req.prompt_id,
+        message=full_prompt_str,
+        token_count=_full_prompt_token_count(
+            full_prompt_str, llm_chunks, llm_tokenizer
+        ),
+        message_type=MessageType.USER,
+        db_session=db_session,
+        commit=True,
+    )
+
+
+def _save_gen_ai_response(
+    new_user_message: ChatMessage,
+    streamed_answer: StreamedAnswer,
+    llm_tokenizer: Callable,
+    db_session: Session,
+) -> ChatMessageDetail:
+    gen_ai_response_message = create_new_chat_message(
+        chat_session_id=new_user_message.chat_session_id,
+        parent_message=new_user_message,
+        prompt_id=new_user_message.prompt_id,
+        message=streamed_answer.answer,
+        token_count=len(llm_tokenizer(streamed_answer.answer)),
+        message_type=MessageType.ASSISTANT,
+        error=streamed_answer.error,
+        reference_docs=None,  # Don't need to save reference docs for one shot flow
+        db_session=db_session,
+        commit=True,
+    )
+    return translate_db_message_to_chat_message_detail(gen_ai_response_message)
+
+
 def stream_answer_objects(
     query_req: DirectQARequest,
     user: User | None,
@@ -60,6 +208,7 @@ def stream_answer_objects(
     | None = None,
     rerank_metrics_callback: Callable[[RerankMetricsContainer], None] | None = None,
     llm_metrics_callback: Callable[[LLMMetricsContainer], None] | None = None,
+    enable_speculative_retrieval: bool = ENABLE_SPECULATIVE_RETRIEVAL,
 ) -> Iterator[
     QueryRephrase
     | QADocsResponse
@@ -80,20 +229,30 @@ def stream_answer_objects(
     query_msg = query_req.messages[-1]
     history = query_req.messages[:-1]
 
-    chat_session = create_chat_session(
-        db_session=db_session,
-        description="",  # One shot queries don't need naming as it's never displayed
-        user_id=user_id,
-        passist_id=query_req.passist_id,
-        one_shot=True,
+    # Create a chat session which will just store the root message, the query, and the AI response
+    chat_session, root_message = _create_one_shot_chat_session(
+        query_req, user_id=user_id, db_session=db_session
     )
 
     llm_tokenizer = get_default_llm_token_encode()
     document_index = get_default_document_index()
 
-    # Create a chat session which will just store the root message, the query, and the AI response
-    root_message = get_or_create_root_message(
-        chat_session_id=chat_session.id, db_session=db_session
+    # Search on the raw query while the rephrasing, filter extraction and intent run,
+    # often none of them change what is retrieved
+    speculative_retrieval = (
+        SpeculativeRetrieval(
+            speculative_query=build_speculative_query(
+                query=query_msg.message,
+                retrieval_details=query_req.retrieval_options,
+                passist=chat_session.passist,
+                user=user,
+                db_session=db_session,
+                bypass_acl=bypass_acl,
+            ),
+            document_index=document_index,
+        )
+        if enable_speculative_retrieval
+        else None
     )
 
     history_str = combine_message_thread(history)
@@ -122,69 +281,38 @@ def stream_answer_objects(
         document_index=document_index,
         retrieval_metrics_callback=retrieval_metrics_callback,
         rerank_metrics_callback=rerank_metrics_callback,
+        retrieved_chunks=speculative_retrieval.retrieved_chunks(
+            retrieval_request, retrieval_metrics_callback
+        )
+        if speculative_retrieval is not None
+        else None,
     )
-    applied_time_cutoff = retrieval_request.filters.time_cutoff
-    recency_bias_multiplier = retrieval_request.recency_bias_multiplier
-    run_llm_chunk_filter = not retrieval_request.skip_llm_chunk_filter
 
     # First fetch and return the top chunks so the user can immediately see some results
     top_chunks = cast(list[InferenceChunk], next(documents_generator))
-
-    top_docs = chunks_to_search_docs(top_chunks)
-    fake_saved_docs = [SavedSearchDoc.from_search_doc(doc) for doc in top_docs]
-
-    # Since this is in the one shot answer flow, we don't need to actually save the docs to DB
-    initial_response = QADocsResponse(
-        top_documents=fake_saved_docs,
-        predicted_flow=predicted_flow,
-        predicted_search=predicted_search_type,
-        applied_source_filters=retrieval_request.filters.source_type,
-        applied_time_cutoff=applied_time_cutoff,
-        recency_bias_multiplier=recency_bias_multiplier,
+    yield _qa_docs_response(
+        top_chunks, retrieval_request, predicted_search_type, predicted_flow
     )
-    yield initial_response
 
     # Get the final ordering of chunks for the LLM call
     llm_chunk_selection = cast(list[bool], next(documents_generator))
 
     # Yield the list of LLM selected chunks for showing the LLM selected icons in the UI
-    llm_relevance_filtering_response = LLMRelevanceFilterResponse(
-        relevant_chunk_indices=[
-            index for index, value in enumerate(llm_chunk_selection) if value
-        ]
-        if run_llm_chunk_filter
-        else []
-    )
-    yield llm_relevance_filtering_response
+    yield llm_relevance_filter_response(llm_chunk_selection, retrieval_request)
 
     # Prep chunks to pass to LLM
-    num_llm_chunks = (
-        chat_session.passist.num_chunks
-        if chat_session.passist.num_chunks is not None
-        else default_num_chunks
-    )
-    llm_chunks_indices = get_chunks_for_qa(
-        chunks=top_chunks,
-        llm_chunk_selection=llm_chunk_selection,
-        token_limit=num_llm_chunks * default_chunk_size,
+    llm_chunks = select_llm_chunks(
+        top_chunks,
+        llm_chunk_selection,
+        passist=chat_session.passist,
+        default_num_chunks=default_num_chunks,
+        default_chunk_size=default_chunk_size,
     )
-    llm_chunks = [top_chunks[i] for i in llm_chunks_indices]
 
-    logger.debug(
-        f"Chunks fed to LLM: {[chunk.semantic_identifier for chunk in llm_chunks]}"
+    prompt, llm_override = _get_prompt_and_llm_override(
+        query_req, user_id=user_id, db_session=db_session
     )
 
-    prompt = None
-    llm_override = None
-    if query_req.prompt_id is not None:
-        prompt = get_prompt_by_id(
-            prompt_id=query_req.prompt_id, user_id=user_id, db_session=db_session
-        )
-        passist = get_passist_by_id(
-            passist_id=query_req.passist_id, user_id=user_id, db_session=db_session
-        )
-        llm_override = passist.llm_model_version_override
-
     qa_model = get_question_answer_model(
         prompt=prompt,
         timeout=timeout,
@@ -192,24 +320,19 @@ def stream_answer_objects(
         llm_version=llm_override,
     )
 
-    full_prompt_str = (
-        qa_model.build_prompt(
-            query=query_msg.message, history_str=history_str, context_chunks=llm_chunks
-        )
-        if qa_model is not None
-        else "Gen AI Disabled"
+    full_prompt_str = _build_full_prompt(
+        qa_model, query_msg.message, history_str, llm_chunks
     )
 
     # Create the first User query message
-    new_user_message = create_new_chat_message(
-        chat_session_id=chat_session.id,
-        parent_message=root_message,
-        prompt_id=query_req.prompt_id,
-        message=full_prompt_str,
-        token_count=len(llm_tokenizer(full_prompt_str)),
-        message_type=MessageType.USER,
+    new_user_message = _save_user_message(
+        chat_session,
+        root_message,
+        query_req,
+        full_prompt_str=full_prompt_str,
+        llm_chunks=llm_chunks,
+        llm_tokenizer=llm_tokenizer,
         db_session=db_session,
-        commit=True,
     )
 
     response_packets = (
@@ -223,40 +346,17 @@ def stream_answer_objects(
     )
 
     # Capture outputs and errors
-    llm_output = ""
-    error: str | None = None
+    streamed_answer = StreamedAnswer()
     for packet in response_packets:
         logger.debug(packet)
-
-        if isinstance(packet, PayseraiAnswerPiece):
-            token = packet.answer_piece
-            if token:
-                llm_output += token
-        elif isinstance(packet, StreamingError):
-            error = packet.error
-
+        streamed_answer.add(packet)
         yield packet
 
     # Saving Gen AI answer and responding with message info
-    gen_ai_response_message = create_new_chat_message(
-        chat_session_id=chat_session.id,
-        parent_message=new_user_message,
-        prompt_id=query_req.prompt_id,
-        message=llm_output,
-        token_count=len(llm_tokenizer(llm_output)),
-        message_type=MessageType.ASSISTANT,
-        error=error,
-        reference_docs=None,  # Don't need to save reference docs for one shot flow
-        db_session=db_session,
-        commit=True,
-    )
-
-    msg_detail_response = translate_db_message_to_chat_message_detail(
-        gen_ai_response_message
+    yield _save_gen_ai_response(
+        new_user_message, streamed_answer, llm_tokenizer, db_session=db_session
     )
 
-    yield msg_detail_response
-
 
 @log_generator_function_time()
 def stream_search_answer(
@@ -271,6 +371,187 @@ def stream_search_answer(
         yield get_json_line(obj.dict())
 
 
+async def astream_answer_objects(
+    query_req: DirectQARequest,
+    user: User | None,
+    db_session: AsyncSession,
+    # Needed to translate passist num_chunks to tokens to the LLM
+    default_num_chunks: float = DEFAULT_NUM_CHUNKS_FED_TO_CHAT,
+    default_chunk_size: int = CHUNK_SIZE,
+    timeout: int = QA_TIMEOUT,
+    bypass_acl: bool = False,
+    retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None]
+    | None = None,
+    rerank_metrics_callback: Callable[[RerankMetricsContainer], None] | None = None,
+    llm_metrics_callback: Callable[[LLMMetricsContainer], None] | None = None,
+    enable_speculative_retrieval: bool = ENABLE_SPECULATIVE_RETRIEVAL,
+) -> AsyncIterator[
+    QueryRephrase
+    | QADocsResponse
+    | LLMRelevanceFilterResponse
+    | PayseraiAnswerPiece
+    | PayseraiQuotes
+    | StreamingError
+    | ChatMessageDetail
+]:
+    """Same stream as stream_answer_objects without holding a thread for the duration of
+    the request. The DB calls reuse the blocking functions through the async session,
+    the secondary LLM flows which don't have an async client run in worker threads."""
+    user_id = user.id if user is not None else None
+    query_msg = query_req.messages[-1]
+    history = query_req.messages[:-1]
+
+    chat_session, root_message = await db_session.run_sync(
+        lambda session: _create_one_shot_chat_session(
+            query_req, user_id=user_id, db_session=session
+        )
+    )
+
+    llm_tokenizer = get_default_llm_token_encode()
+    document_index = get_default_document_index()
+
+    speculative_retrieval = None
+    if enable_speculative_retrieval:
+        speculative_query = await db_session.run_sync(
+            lambda session: build_speculative_query(
+                query=query_msg.message,
+                retrieval_details=query_req.retrieval_options,
+                passist=chat_session.passist,
+                user=user,
+                db_session=session,
+                bypass_acl=bypass_acl,
+            )
+        )
+        speculative_retrieval = AsyncSpeculativeRetrieval(
+            speculative_query=speculative_query, document_index=document_index
+        )
+
+    try:
+        history_str = combine_message_thread(history)
+
+        rephrased_query = await asyncio.to_thread(
+            thread_based_query_rephrase,
+            user_query=query_msg.message,
+            history_str=history_str,
+        )
+        yield QueryRephrase(rephrased_query=rephrased_query)
+
+        (
+            retrieval_request,
+            predicted_search_type,
+            predicted_flow,
+        ) = await aretrieval_preprocessing(
+            query=rephrased_query,
+            retrieval_details=query_req.retrieval_options,
+            passist=chat_session.passist,
+            user=user,
+            bypass_acl=bypass_acl,
+        )
+
+        retrieved_chunks = (
+            await speculative_retrieval.retrieved_chunks(
+                retrieval_request, retrieval_metrics_callback
+            )
+            if speculative_retrieval is not None
+            else None
+        )
+    finally:
+        # Nothing is left running if the flow fails or the client goes away
+        if speculative_retrieval is not None:
+            speculative_retrieval.cancel()
+
+    documents_generator = afull_chunk_search_generator(
+        search_query=retrieval_request,
+        document_index=document_index,
+        retrieval_metrics_callback=retrieval_metrics_callback,
+        rerank_metrics_callback=rerank_metrics_callback,
+        retrieved_chunks=retrieved_chunks,
+    )
+
+    try:
+        top_chunks = cast(list[InferenceChunk], await anext(documents_generator))
+        yield _qa_docs_response(
+            top_chunks, retrieval_request, predicted_search_type, predicted_flow
+        )
+
+        llm_chunk_selection = cast(list[bool], await anext(documents_generator))
+        yield llm_relevance_filter_response(llm_chunk_selection, retrieval_request)
+    finally:
+        await documents_generator.aclose()
+
+    llm_chunks = select_llm_chunks(
+        top_chunks,
+        llm_chunk_selection,
+        passist=chat_session.passist,
+        default_num_chunks=default_num_chunks,
+        default_chunk_size=default_chunk_size,
+    )
+
+    prompt, llm_override = await db_session.run_sync(
+        lambda session: _get_prompt_and_llm_override(
+            query_req, user_id=user_id, db_session=session
+        )
+    )
+
+    qa_model = get_question_answer_model(
+        prompt=prompt,
+        timeout=timeout,
+        chain_of_thought=query_req.chain_of_thought,
+        llm_version=llm_override,
+    )
+
+    full_prompt_str = _build_full_prompt(
+        qa_model, query_msg.message, history_str, llm_chunks
+    )
+
+    new_user_message = await db_session.run_sync(
+        lambda session: _save_user_message(
+            chat_session,
+            root_message,
+            query_req,
+            full_prompt_str=full_prompt_str,
+            llm_chunks=llm_chunks,
+            llm_tokenizer=llm_tokenizer,
+            db_session=session,
+        )
+    )
+
+    response_packets = (
+        qa_model.aanswer_question_stream(
+            prompt=full_prompt_str,
+            llm_context_docs=llm_chunks,
+            metrics_callback=llm_metrics_callback,
+        )
+        if qa_model is not None
+        else ano_gen_ai_response()
+    )
+
+    streamed_answer = StreamedAnswer()
+    async for packet in response_packets:
+        logger.debug(packet)
+        streamed_answer.add(packet)
+        yield packet
+
+    yield await db_session.run_sync(
+        lambda session: _save_gen_ai_response(
+            new_user_message, streamed_answer, llm_tokenizer, db_session=session
+        )
+    )
+
+
+@log_generator_function_time()
+async def astream_search_answer(
+    query_req: DirectQARequest,
+    user: User | None,
+    db_session: AsyncSession,
+) -> AsyncIterator[str]:
+    objects = astream_answer_objects(
+        query_req=query_req, user=user, db_session=db_session
+    )
+    async for obj in objects:
+        yield get_json_line(obj.dict())
+
+
 def get_search_answer(
     query_req: DirectQARequest,
     user: User | None,
@@ -1,6 +1,7 @@
 import abc
 from collections.abc import Callable
 
+from payserai.chat.models import AnswerQuestionAsyncStreamReturn
 from payserai.chat.models import AnswerQuestionStreamReturn
 from payserai.chat.models import LLMMetricsContainer
 from payserai.indexing.models import InferenceChunk
@@ -24,3 +25,12 @@ class QAModel:
         metrics_callback: Callable[[LLMMetricsContainer], None] | None = None,
     ) -> AnswerQuestionStreamReturn:
         raise NotImplementedError
+
+    @abc.abstractmethod
+    def aanswer_question_stream(
+        self,
+        prompt: str,
+        llm_context_docs: list[InferenceChunk],
+        metrics_callback: Callable[[LLMMetricsContainer], None] | None = None,
+    ) -> AnswerQuestionAsyncStreamReturn:
+        raise NotImplementedError
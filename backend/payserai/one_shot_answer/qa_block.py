@@ -1,10 +1,12 @@
 import abc
 import re
+from collections.abc import AsyncIterator
 from collections.abc import Callable
 from collections.abc import Iterator
 from typing import cast
 
 from payserai.chat.chat_utils import build_context_str
+from payserai.chat.models import AnswerQuestionAsyncStreamReturn
 from payserai.chat.models import AnswerQuestionStreamReturn
 from payserai.chat.models import PayseraiAnswer
 from payserai.chat.models import PayseraiAnswerPiece
@@ -19,6 +21,7 @@ from payserai.llm.interfaces import LLM
 from payserai.llm.utils import check_number_of_tokens
 from payserai.llm.utils import get_default_llm_token_encode
 from payserai.one_shot_answer.interfaces import QAModel
+from payserai.one_shot_answer.qa_utils import aprocess_model_tokens
 from payserai.one_shot_answer.qa_utils import process_answer
 from payserai.one_shot_answer.qa_utils import process_model_tokens
 from payserai.prompts.direct_qa_prompts import CONTEXT_BLOCK
@@ -68,6 +71,16 @@ class QAHandler(abc.ABC):
             is_json_prompt=self.is_json_output,
         )
 
+    async def aprocess_llm_token_stream(
+        self, tokens: AsyncIterator[str], context_chunks: list[InferenceChunk]
+    ) -> AnswerQuestionAsyncStreamReturn:
+        async for answer_piece in aprocess_model_tokens(
+            tokens=tokens,
+            context_docs=context_chunks,
+            is_json_prompt=self.is_json_output,
+        ):
+            yield answer_piece
+
 
 class WeakLLMQAHandler(QAHandler):
     """Since Payserai supports a variety of LLMs, this less demanding prompt is provided
@@ -234,6 +247,13 @@ class SingleMessageScratchpadHandler(QAHandler):
             "This Scratchpad approach is not suitable for real time uses like streaming"
         )
 
+    def aprocess_llm_token_stream(
+        self, tokens: AsyncIterator[str], context_chunks: list[InferenceChunk]
+    ) -> AnswerQuestionAsyncStreamReturn:
+        raise ValueError(
+            "This Scratchpad approach is not suitable for real time uses like streaming"
+        )
+
 
 def build_dummy_prompt(
     system_prompt: str, task_prompt: str, retrieval_disabled: bool
@@ -257,6 +277,10 @@ def no_gen_ai_response() -> Iterator[PayseraiAnswerPiece]:
     yield PayseraiAnswerPiece(answer_piece=DISABLED_GEN_AI_MSG)
 
 
+async def ano_gen_ai_response() -> AsyncIterator[PayseraiAnswerPiece]:
+    yield PayseraiAnswerPiece(answer_piece=DISABLED_GEN_AI_MSG)
+
+
 class QABlock(QAModel):
     def __init__(self, llm: LLM, qa_handler: QAHandler) -> None:
         self._llm = llm
@@ -298,16 +322,49 @@ class QABlock(QAModel):
             yield StreamingError(error=str(e))
 
         if metrics_callback is not None:
-            prompt_tokens = check_number_of_tokens(
-                text=str(prompt), encode_fn=get_default_llm_token_encode()
-            )
+            _report_llm_metrics(metrics_callback, prompt, captured_tokens)
 
-            response_tokens = check_number_of_tokens(
-                text="".join(captured_tokens), encode_fn=get_default_llm_token_encode()
-            )
+    async def aanswer_question_stream(
+        self,
+        prompt: str,
+        llm_context_docs: list[InferenceChunk],
+        metrics_callback: Callable[[LLMMetricsContainer], None] | None = None,
+    ) -> AnswerQuestionAsyncStreamReturn:
+        captured_tokens = []
 
-            metrics_callback(
-                LLMMetricsContainer(
-                    prompt_tokens=prompt_tokens, response_tokens=response_tokens
-                )
-            )
+        try:
+            async for answer_piece in self._qa_handler.aprocess_llm_token_stream(
+                self._llm.astream(prompt), llm_context_docs
+            ):
+                if (
+                    isinstance(answer_piece, PayseraiAnswerPiece)
+                    and answer_piece.answer_piece
+                ):
+                    captured_tokens.append(answer_piece.answer_piece)
+                yield answer_piece
+
+        except Exception as e:
+            yield StreamingError(error=str(e))
+
+        if metrics_callback is not None:
+            _report_llm_metrics(metrics_callback, prompt, captured_tokens)
+
+
+def _report_llm_metrics(
+    metrics_callback: Callable[[LLMMetricsContainer], None],
+    prompt: str,
+    captured_tokens: list[str],
+) -> None:
+    prompt_tokens = check_number_of_tokens(
+        text=str(prompt), encode_fn=get_default_llm_token_encode()
+    )
+
+    response_tokens = check_number_of_tokens(
+        text="".join(captured_tokens), encode_fn=get_default_llm_token_encode()
+    )
+
+    metrics_callback(
+        LLMMetricsContainer(
+            prompt_tokens=prompt_tokens, response_tokens=response_tokens
+        )
+    )
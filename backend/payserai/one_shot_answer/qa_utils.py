@@ -1,5 +1,6 @@
 import math
 import re
+from collections.abc import AsyncIterator
 from collections.abc import Callable
 from collections.abc import Generator
 from collections.abc import Iterator
@@ -209,6 +210,74 @@ def _extract_quotes_from_completed_token_stream(
     return quotes
 
 
+class _ModelTokenStreamProcessor:
+    """Splits the streamed model output into Answer pieces, fed one token at a time so
+    that both blocking and async token streams can be processed the same way. When the
+    Answer section ends, an empty answer piece is emitted. The Quotes are extracted from
+    the complete model output at the end."""
+
+    def __init__(self, is_json_prompt: bool) -> None:
+        self.is_json_prompt = is_json_prompt
+        self.quote_pat = f"\n{QUOTE_PAT}"
+        # Sometimes worse model outputs new line instead of :
+        self.quote_loose = f"\n{self.quote_pat[:-1]}\n"
+        # Sometime model outputs two newlines before quote section
+        self.quote_pat_full = f"\n{self.quote_pat}"
+        self.model_output = ""
+        self.found_answer_start = False if is_json_prompt else True
+        self.found_answer_end = False
+        self.hold_quote = ""
+
+    def process_token(self, token: str) -> list[PayseraiAnswerPiece]:
+        model_previous = self.model_output
+        self.model_output += token
+
+        if not self.found_answer_start and '{"answer":"' in re.sub(
+            r"\s", "", self.model_output
+        ):
+            # Note, if the token that completes the pattern has additional text, for example if the token is "?
+            # Then the chars after " will not be streamed, but this is ok as it prevents streaming the ? in the
+            # event that the model outputs the UNCERTAINTY_PAT
+            self.found_answer_start = True
+
+            # Prevent heavy cases of hallucinations where model is not even providing a json until later
+            if self.is_json_prompt and len(self.model_output) > 40:
+                logger.warning("LLM did not produce json as prompted")
+                self.found_answer_end = True
+
+            return []
+
+        if not self.found_answer_start or self.found_answer_end:
+            return []
+
+        if self.is_json_prompt and _stream_json_answer_end(model_previous, token):
+            self.found_answer_end = True
+            return [PayseraiAnswerPiece(answer_piece=None)]
+        elif not self.is_json_prompt:
+            if (
+                self.quote_pat in self.hold_quote + token
+                or self.quote_loose in self.hold_quote + token
+            ):
+                self.found_answer_end = True
+                return [PayseraiAnswerPiece(answer_piece=None)]
+            if self.hold_quote + token in self.quote_pat_full:
+                self.hold_quote += token
+                return []
+
+        answer_piece = PayseraiAnswerPiece(answer_piece=self.hold_quote + token)
+        self.hold_quote = ""
+        return [answer_piece]
+
+    def finish(self, context_docs: list[InferenceChunk]) -> PayseraiQuotes:
+        logger.debug(f"Raw Model QnA Output: {self.model_output}")
+
+        return _extract_quotes_from_completed_token_stream(
+            model_output=self.model_output,
+            context_chunks=context_docs,
+            is_json_prompt=self.is_json_prompt,
+        )
+
+
 def process_model_tokens(
     tokens: Iterator[str],
     context_docs: list[InferenceChunk],
@@ -220,55 +289,25 @@ def process_model_tokens(
     Yields Answer tokens back out in a dict for streaming to frontend
     When Answer section ends, yields dict with answer_finished key
     Collects all the tokens at the end to form the complete model output"""
-    quote_pat = f"\n{QUOTE_PAT}"
-    # Sometimes worse model outputs new line instead of :
-    quote_loose = f"\n{quote_pat[:-1]}\n"
-    # Sometime model outputs two newlines before quote section
-    quote_pat_full = f"\n{quote_pat}"
-    model_output: str = ""
-    found_answer_start = False if is_json_prompt else True
-    found_answer_end = False
-    hold_quote = ""
+    processor = _ModelTokenStreamProcessor(is_json_prompt)
     for token in tokens:
-        model_previous = model_output
-        model_output += token
-
-        if not found_answer_start and '{"answer":"' in re.sub(r"\s", "", model_output):
-            # Note, if the token that completes the pattern has additional text, for example if the token is "?
-            # Then the chars after " will not be streamed, but this is ok as it prevents streaming the ? in the
-            # event that the model outputs the UNCERTAINTY_PAT
-            found_answer_start = True
-
-            # Prevent heavy cases of hallucinations where model is not even providing a json until later
-            if is_json_prompt and len(model_output) > 40:
-                logger.warning("LLM did not produce json as prompted")
-                found_answer_end = True
+        yield from processor.process_token(token)
 
-            continue
+    yield processor.finish(context_docs)
 
-        if found_answer_start and not found_answer_end:
-            if is_json_prompt and _stream_json_answer_end(model_previous, token):
-                found_answer_end = True
-                yield PayseraiAnswerPiece(answer_piece=None)
-                continue
-            elif not is_json_prompt:
-                if quote_pat in hold_quote + token or quote_loose in hold_quote + token:
-                    found_answer_end = True
-                    yield PayseraiAnswerPiece(answer_piece=None)
-                    continue
-                if hold_quote + token in quote_pat_full:
-                    hold_quote += token
-                    continue
-            yield PayseraiAnswerPiece(answer_piece=hold_quote + token)
-            hold_quote = ""
 
-    logger.debug(f"Raw Model QnA Output: {model_output}")
-
-    yield _extract_quotes_from_completed_token_stream(
-        model_output=model_output,
-        context_chunks=context_docs,
-        is_json_prompt=is_json_prompt,
-    )
+async def aprocess_model_tokens(
+    tokens: AsyncIterator[str],
+    context_docs: list[InferenceChunk],
+    is_json_prompt: bool = True,
+) -> AsyncIterator[PayseraiAnswerPiece | PayseraiQuotes]:
+    """Same as process_model_tokens, for async token streams"""
+    processor = _ModelTokenStreamProcessor(is_json_prompt)
+    async for token in tokens:
+        for answer_piece in processor.process_token(token):
+            yield answer_piece
+
+    yield processor.finish(context_docs)
 
 
 def simulate_streaming_response(model_out: str) -> Generator[str, None, None]:
@@ -25,6 +25,35 @@ Respond with EXACTLY AND ONLY: "{USEFUL_PAT}" or "{NONUSEFUL_PAT}"
 """.strip()
 
 
+# Same as above, but for several sections in one prompt, to use fewer LLM calls per search
+BATCH_CHUNK_FILTER_PROMPT = f"""
+For each reference section below, determine if it is USEFUL for answering the user query.
+It is NOT enough for a section to be related to the query, \
+it must contain information that is USEFUL for answering the query.
+If a section contains ANY useful information, that is good enough, \
+it does not need to fully answer the every part of the user query.
+
+{{sections}}
+
+User Query:
+```
+{{user_query}}
+```
+
+Respond with EXACTLY one line per section, in order, formatted as \
+"<section number>: {USEFUL_PAT}" or "<section number>: {NONUSEFUL_PAT}"
+""".strip()
+
+BATCH_CHUNK_FILTER_SECTION = """
+Reference Section {section_number}:
+```
+{chunk_text}
+```
+""".strip()
+
+
 # Use the following for easy viewing of prompts
 if __name__ == "__main__":
     print(CHUNK_FILTER_PROMPT)
+    print("\n\n")
+    print(BATCH_CHUNK_FILTER_PROMPT)
@@ -7,6 +7,8 @@ from pydantic import BaseModel
 from payserai.configs.chat_configs import DISABLE_LLM_CHUNK_FILTER
 from payserai.configs.chat_configs import NUM_RERANKED_RESULTS
 from payserai.configs.chat_configs import NUM_RETURNED_HITS
+from payserai.configs.chat_configs import VECTOR_SEARCH_APPROXIMATE
+from payserai.configs.chat_configs import VECTOR_SEARCH_EXPLORE_ADDITIONAL_HITS
 from payserai.configs.constants import DocumentSource
 from payserai.configs.model_configs import ENABLE_RERANKING_REAL_TIME_FLOW
 from payserai.indexing.models import DocAwareChunk
@@ -71,6 +73,18 @@ class ChunkMetric(BaseModel):
     score: float
 
 
+class NearestNeighborSettings(BaseModel):
+    """How the vector part of a search is run, indices without an approximate nearest
+    neighbor index always search exactly"""
+
+    approximate: bool = VECTOR_SEARCH_APPROXIMATE
+    # Only used if approximate
+    explore_additional_hits: int = VECTOR_SEARCH_EXPLORE_ADDITIONAL_HITS
+
+    class Config:
+        frozen = True
+
+
 class SearchQuery(BaseModel):
     query: str
     filters: IndexFilters
@@ -83,6 +97,7 @@ class SearchQuery(BaseModel):
     skip_llm_chunk_filter: bool = DISABLE_LLM_CHUNK_FILTER
     # Only used if not skip_llm_chunk_filter
     max_llm_filter_chunks: int = NUM_RERANKED_RESULTS
+    nearest_neighbor: NearestNeighborSettings = NearestNeighborSettings()
 
     class Config:
         frozen = True
@@ -1,3 +1,5 @@
+import asyncio
+
 from sqlalchemy.orm import Session
 
 from payserai.configs.chat_configs import DISABLE_LLM_CHUNK_FILTER
@@ -5,6 +7,7 @@ from payserai.configs.chat_configs import DISABLE_LLM_FILTER_EXTRACTION
 from payserai.configs.chat_configs import FAVOR_RECENT_DECAY_MULTIPLIER
 from payserai.configs.model_configs import ENABLE_RERANKING_ASYNC_FLOW
 from payserai.configs.model_configs import ENABLE_RERANKING_REAL_TIME_FLOW
+from payserai.db.engine import get_sqlalchemy_engine
 from payserai.db.models import Passist
 from payserai.db.models import User
 from payserai.search.access_filters import build_access_filters_for_user
@@ -19,6 +22,7 @@ from payserai.search.models import SearchType
 from payserai.secondary_llm_flows.source_filter import extract_source_filter
 from payserai.secondary_llm_flows.time_filter import extract_time_filter
 from payserai.utils.threadpool_concurrency import FunctionCall
+from payserai.utils.threadpool_concurrency import ExecutorName
 from payserai.utils.threadpool_concurrency import run_functions_in_parallel
 
 
@@ -98,7 +102,9 @@ def retrieval_preprocessing(
         ]
         if filter_fn
     ]
-    parallel_results = run_functions_in_parallel(functions_to_run)
+    parallel_results = run_functions_in_parallel(
+        functions_to_run, executor_name=ExecutorName.LLM
+    )
 
     predicted_time_cutoff, predicted_favor_recent = (
         parallel_results[run_time_filters.result_id]
@@ -161,3 +167,28 @@ def retrieval_preprocessing(
         predicted_search_type,
         predicted_flow,
     )
+
+
+async def aretrieval_preprocessing(
+    query: str,
+    retrieval_details: RetrievalDetails,
+    passist: Passist,
+    user: User | None,
+    bypass_acl: bool = False,
+) -> tuple[SearchQuery, SearchType | None, QueryFlow | None]:
+    """The filter extraction and intent model calls are blocking so the preprocessing
+    runs in a worker thread with its own session. The passist document sets must already
+    be loaded by the caller."""
+
+    def _preprocess() -> tuple[SearchQuery, SearchType | None, QueryFlow | None]:
+        with Session(get_sqlalchemy_engine(), expire_on_commit=False) as db_session:
+            return retrieval_preprocessing(
+                query=query,
+                retrieval_details=retrieval_details,
+                passist=passist,
+                user=user,
+                db_session=db_session,
+                bypass_acl=bypass_acl,
+            )
+
+    return await asyncio.to_thread(_preprocess)
@@ -0,0 +1,108 @@
+"""Score post-processing for retrieved chunks done on whole arrays of scores.
+
+These produce exactly the same numbers and order as computing the scores one chunk at a
+time: the arithmetic is done in the same order and with the same dtypes, and ties keep
+the retrieval order like a stable Python sort does."""
+from collections.abc import Sequence
+
+import numpy as np
+
+from payserai.document_index.document_index_utils import (
+    translate_boost_count_to_multiplier,
+)
+
+
+def boost_multipliers(boosts: Sequence[int]) -> np.ndarray:
+    # Only a few distinct boost values exist, mapping those keeps math.exp's exact results
+    unique_boosts, inverse = np.unique(
+        np.asarray(boosts, dtype=np.int64), return_inverse=True
+    )
+    multipliers = np.array(
+        [translate_boost_count_to_multiplier(int(boost)) for boost in unique_boosts],
+        dtype=np.float64,
+    )
+    return multipliers[inverse]
+
+
+def rank_descending(scores: np.ndarray, top_k: int | None = None) -> np.ndarray:
+    """Indices of the `top_k` (or all) highest scores, best first. Equal scores keep
+    their original relative order."""
+    neg_scores = -scores
+    if top_k is None or top_k >= len(scores):
+        return np.argsort(neg_scores, kind="stable")
+    if top_k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    # Everything scoring better than the k-th best is in the top k, of the chunks tied
+    # with it the earliest ones are kept
+    kth_best = neg_scores[np.argpartition(neg_scores, top_k - 1)[top_k - 1]]
+    candidates = np.flatnonzero(neg_scores <= kth_best)
+    return candidates[np.argsort(neg_scores[candidates], kind="stable")][:top_k]
+
+
+def legacy_boosted_scores(
+    scores: np.ndarray,
+    multipliers: np.ndarray,
+    norm_min: float,
+    norm_max: float,
+) -> np.ndarray:
+    score_min = scores.min()
+    score_max = scores.max()
+    score_range = score_max - score_min
+
+    if score_range != 0:
+        boosted_scores = ((scores - score_min) / score_range) * multipliers
+        unnormed_boosted_scores = boosted_scores * score_range + score_min
+    else:
+        unnormed_boosted_scores = scores * multipliers
+
+    norm_min = min(norm_min, score_min)
+    norm_max = max(norm_max, score_max)
+    # This should never be 0 unless user has done some weird/wrong settings
+    norm_range = norm_max - norm_min
+
+    # For score display purposes
+    if norm_range != 0:
+        return (unnormed_boosted_scores - norm_min) / norm_range
+    return unnormed_boosted_scores
+
+
+def boosted_scores(
+    scores: np.ndarray,
+    multipliers: np.ndarray,
+    recency_multipliers: np.ndarray,
+    norm_cutoff: int,
+    norm_min: float,
+    norm_max: float,
+) -> np.ndarray:
+    norm_min = min(norm_min, scores[:norm_cutoff].min())
+    norm_max = max(norm_max, scores[:norm_cutoff].max())
+    # This should never be 0 unless user has done some weird/wrong settings
+    norm_range = norm_max - norm_min
+
+    return np.maximum(
+        0, (scores - norm_min) * multipliers * recency_multipliers / norm_range
+    )
+
+
+def reranked_scores(
+    sim_scores: np.ndarray,
+    multipliers: np.ndarray,
+    recency_multipliers: np.ndarray,
+    model_min: float,
+    model_max: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Takes the (num ensemble models, num chunks) cross encoder scores and returns the
+    boosted scores normalized to the expected model range along with the raw averaged
+    ensemble scores"""
+    num_models = len(sim_scores)
+    raw_sim_scores = sum(sim_scores) / num_models
+
+    cross_models_min = np.min(sim_scores)
+    shifted_sim_scores = sum(sim_scores - cross_models_min) / num_models
+
+    boosted_sim_scores = shifted_sim_scores * multipliers * recency_multipliers
+    normalized_b_s_scores = (boosted_sim_scores + cross_models_min - model_min) / (
+        model_max - model_min
+    )
+    return normalized_b_s_scores, raw_sim_scores
@@ -1,28 +1,49 @@
+import asyncio
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
 
+import httpx
 import numpy as np
-import requests
 import tensorflow as tf  # type: ignore
+import torch
+from pydantic import BaseModel
 from sentence_transformers import CrossEncoder  # type: ignore
 from sentence_transformers import SentenceTransformer  # type: ignore
 from transformers import AutoTokenizer  # type: ignore
+from transformers import BatchEncoding  # type: ignore
 from transformers import TFDistilBertForSequenceClassification  # type: ignore
 
 from payserai.configs.app_configs import CURRENT_PROCESS_IS_AN_INDEXING_JOB
 from payserai.configs.app_configs import INDEXING_MODEL_SERVER_HOST
+from payserai.configs.app_configs import MODEL_SERVER_BINARY_TRANSPORT
 from payserai.configs.app_configs import MODEL_SERVER_HOST
+from payserai.configs.app_configs import MODEL_SERVER_POOL_SIZE
 from payserai.configs.app_configs import MODEL_SERVER_PORT
+from payserai.configs.app_configs import MODEL_SERVER_RETRIES
+from payserai.configs.app_configs import MODEL_SERVER_RETRY_BACKOFF_SECS
+from payserai.configs.app_configs import MODEL_SERVER_TIMEOUT_SECS
 from payserai.configs.model_configs import CROSS_EMBED_CONTEXT_SIZE
+from payserai.configs.model_configs import CROSS_ENCODER_BATCH_SIZE
+from payserai.configs.model_configs import CROSS_ENCODER_CONCURRENT_ENSEMBLE
+from payserai.configs.model_configs import CROSS_ENCODER_EARLY_CUTOFF_SCORE
 from payserai.configs.model_configs import CROSS_ENCODER_MODEL_ENSEMBLE
 from payserai.configs.model_configs import DOC_EMBEDDING_CONTEXT_SIZE
 from payserai.configs.model_configs import DOCUMENT_ENCODER_MODEL
 from payserai.configs.model_configs import INTENT_MODEL_VERSION
 from payserai.configs.model_configs import NORMALIZE_EMBEDDINGS
 from payserai.configs.model_configs import QUERY_MAX_CONTEXT_SIZE
+from payserai.utils.http_client import asend_with_retries
+from payserai.utils.http_client import get_shared_async_http_client
+from payserai.utils.http_client import get_shared_http_client
+from payserai.utils.http_client import HttpClientConfig
+from payserai.utils.http_client import send_with_retries
 from payserai.utils.logger import setup_logger
+from shared_models.model_server_models import deserialize_float_matrix
 from shared_models.model_server_models import EmbedRequest
 from shared_models.model_server_models import EmbedResponse
+from shared_models.model_server_models import FLOAT_MATRIX_CONTENT_TYPE
 from shared_models.model_server_models import IntentRequest
 from shared_models.model_server_models import IntentResponse
 from shared_models.model_server_models import RerankRequest
@@ -36,6 +57,7 @@ logging.getLogger("transformers").setLevel(logging.ERROR)
 _TOKENIZER: None | AutoTokenizer = None
 _EMBED_MODEL: None | SentenceTransformer = None
 _RERANK_MODELS: None | list[CrossEncoder] = None
+_RERANK_SCORER: "None | CrossEncoderEnsembleScorer" = None
 _INTENT_TOKENIZER: None | AutoTokenizer = None
 _INTENT_MODEL: None | TFDistilBertForSequenceClassification = None
 
@@ -49,6 +71,29 @@ def get_default_tokenizer() -> AutoTokenizer:
     return _TOKENIZER
 
 
+_LOWERCASES_INPUT: dict[str, bool] = {}
+
+
+def tokenizer_lowercases_input(model_name: str = DOCUMENT_ENCODER_MODEL) -> bool:
+    """Whether the tokenizer of the model lowercases its input, in which case texts
+    differing only in casing get the same embedding. Unknown models count as cased."""
+    if model_name not in _LOWERCASES_INPUT:
+        try:
+            tokenizer = (
+                get_default_tokenizer()
+                if model_name == DOCUMENT_ENCODER_MODEL
+                else AutoTokenizer.from_pretrained(model_name)
+            )
+            _LOWERCASES_INPUT[model_name] = bool(
+                getattr(tokenizer, "do_lower_case", False)
+            )
+        except Exception as e:
+            logger.warning(f"Could not load the tokenizer of {model_name}: {e}")
+            # Not retried, the cache keys of a model must not change over time
+            _LOWERCASES_INPUT[model_name] = False
+    return _LOWERCASES_INPUT[model_name]
+
+
 def get_local_embedding_model(
     model_name: str = DOCUMENT_ENCODER_MODEL,
     max_context_length: int = DOC_EMBEDDING_CONTEXT_SIZE,
@@ -76,6 +121,164 @@ def get_local_reranking_model_ensemble(
     return _RERANK_MODELS
 
 
+def _tokenizer_signature(cross_encoder: CrossEncoder) -> tuple[Any, ...]:
+    """Cross encoders fine-tuned from the same base model tokenize the same way, e.g. both
+    models of the default ensemble use the bert-base-uncased vocabulary"""
+    tokenizer = cross_encoder.tokenizer
+    return (
+        type(tokenizer).__name__,
+        cross_encoder.max_length,
+        getattr(tokenizer, "do_lower_case", None),
+        tuple(tokenizer.model_input_names),
+        hash(frozenset(tokenizer.get_vocab().items())),
+    )
+
+
+class CrossEncoderEnsembleScorer:
+    """Scores (query, passage) pairs with every model of a cross encoder ensemble. Gives
+    the same scores as calling CrossEncoder.predict per model, but the pairs are tokenized
+    only once for models sharing a tokenizer and the models run at the same time (torch
+    releases the GIL during the forward pass).
+
+    With an early cutoff score, the first model scores every passage and the rest of the
+    ensemble only scores the passages at or above the cutoff. Skipped passages keep the
+    first model's score for the other models, so they still average out to the bottom of
+    the ranking."""
+
+    def __init__(
+        self,
+        cross_encoders: list[CrossEncoder],
+        batch_size: int = CROSS_ENCODER_BATCH_SIZE,
+        run_concurrently: bool = CROSS_ENCODER_CONCURRENT_ENSEMBLE,
+        early_cutoff_score: float | None = CROSS_ENCODER_EARLY_CUTOFF_SCORE,
+    ) -> None:
+        self.cross_encoders = cross_encoders
+        self.batch_size = batch_size
+        self.early_cutoff_score = early_cutoff_score
+
+        self._tokenizer_signatures = [
+            _tokenizer_signature(cross_encoder) for cross_encoder in cross_encoders
+        ]
+        for cross_encoder in cross_encoders:
+            cross_encoder.model.eval()
+            cross_encoder.model.to(cross_encoder._target_device)
+
+        self._executor = (
+            ThreadPoolExecutor(
+                max_workers=len(cross_encoders), thread_name_prefix="cross-encoder"
+            )
+            if run_concurrently and len(cross_encoders) > 1
+            else None
+        )
+
+    def _tokenize(
+        self, cross_encoder: CrossEncoder, query: str, passages: list[str]
+    ) -> list[BatchEncoding]:
+        # Same preprocessing as CrossEncoder.smart_batching_collate_text_only
+        query = query.strip()
+        batches = []
+        for start in range(0, len(passages), self.batch_size):
+            batch = [
+                passage.strip() for passage in passages[start : start + self.batch_size]
+            ]
+            features = cross_encoder.tokenizer(
+                [query] * len(batch),
+                batch,
+                padding=True,
+                truncation="longest_first",
+                return_tensors="pt",
+                max_length=cross_encoder.max_length,
+            )
+            batches.append(features.to(cross_encoder._target_device))
+        return batches
+
+    @staticmethod
+    def _run_model(
+        cross_encoder: CrossEncoder, batches: list[BatchEncoding]
+    ) -> np.ndarray:
+        scores = []
+        with torch.no_grad():
+            for features in batches:
+                logits = cross_encoder.default_activation_function(
+                    cross_encoder.model(**features, return_dict=True).logits
+                )
+                if cross_encoder.config.num_labels == 1:
+                    logits = logits[:, 0]
+                scores.append(logits.cpu().numpy())
+        return np.concatenate(scores)
+
+    def _score(
+        self, model_inds: list[int], query: str, passages: list[str]
+    ) -> dict[int, np.ndarray]:
+        features_by_signature: dict[tuple[Any, ...], list[BatchEncoding]] = {}
+        for ind in model_inds:
+            signature = self._tokenizer_signatures[ind]
+            if signature not in features_by_signature:
+                features_by_signature[signature] = self._tokenize(
+                    self.cross_encoders[ind], query, passages
+                )
+
+        if self._executor is None or len(model_inds) < 2:
+            return {
+                ind: self._run_model(
+                    self.cross_encoders[ind],
+                    features_by_signature[self._tokenizer_signatures[ind]],
+                )
+                for ind in model_inds
+            }
+
+        futures = {
+            ind: self._executor.submit(
+                self._run_model,
+                self.cross_encoders[ind],
+                features_by_signature[self._tokenizer_signatures[ind]],
+            )
+            for ind in model_inds
+        }
+        return {ind: future.result() for ind, future in futures.items()}
+
+    def predict(self, query: str, passages: list[str]) -> np.ndarray:
+        """Returns a (num ensemble models, len(passages)) float32 matrix of scores"""
+        num_models = len(self.cross_encoders)
+        if not passages:
+            return np.zeros((num_models, 0), dtype=np.float32)
+
+        if self.early_cutoff_score is None or num_models < 2:
+            scores = self._score(list(range(num_models)), query, passages)
+            return np.stack([scores[ind] for ind in range(num_models)])
+
+        first_model_scores = self._score([0], query, passages)[0]
+        kept_inds = np.flatnonzero(first_model_scores >= self.early_cutoff_score)
+        all_scores = np.tile(first_model_scores, (num_models, 1))
+        if len(kept_inds):
+            rest_scores = self._score(
+                list(range(1, num_models)),
+                query,
+                [passages[ind] for ind in kept_inds],
+            )
+            for model_ind, model_scores in rest_scores.items():
+                all_scores[model_ind, kept_inds] = model_scores
+
+        logger.debug(
+            f"Early cutoff skipped {len(passages) - len(kept_inds)} of {len(passages)} "
+            "passages for the rest of the reranking ensemble"
+        )
+        return all_scores
+
+
+def get_local_reranking_scorer(
+    model_names: list[str] = CROSS_ENCODER_MODEL_ENSEMBLE,
+    max_context_length: int = CROSS_EMBED_CONTEXT_SIZE,
+) -> CrossEncoderEnsembleScorer:
+    global _RERANK_SCORER
+    cross_encoders = get_local_reranking_model_ensemble(
+        model_names=model_names, max_context_length=max_context_length
+    )
+    if _RERANK_SCORER is None or _RERANK_SCORER.cross_encoders is not cross_encoders:
+        _RERANK_SCORER = CrossEncoderEnsembleScorer(cross_encoders)
+    return _RERANK_SCORER
+
+
 def get_intent_model_tokenizer(model_name: str = INTENT_MODEL_VERSION) -> AutoTokenizer:
     global _INTENT_TOKENIZER
     if _INTENT_TOKENIZER is None:
@@ -113,6 +316,58 @@ def build_model_server_url(
     return f"http://{model_server_url}"
 
 
+_MODEL_SERVER_CLIENT_NAME = "model_server"
+_MODEL_SERVER_HTTP_CONFIG = HttpClientConfig(
+    pool_size=MODEL_SERVER_POOL_SIZE,
+    timeout_secs=MODEL_SERVER_TIMEOUT_SECS,
+    retries=MODEL_SERVER_RETRIES,
+    backoff_secs=MODEL_SERVER_RETRY_BACKOFF_SECS,
+)
+
+
+def _float_matrix_request_headers(binary_transport: bool) -> dict[str, str] | None:
+    return {"Accept": FLOAT_MATRIX_CONTENT_TYPE} if binary_transport else None
+
+
+def _is_float_matrix_response(response: httpx.Response) -> bool:
+    return response.headers.get("Content-Type", "").startswith(
+        FLOAT_MATRIX_CONTENT_TYPE
+    )
+
+
+def _post_to_model_server(
+    endpoint: str, request: BaseModel, binary_transport: bool = False
+) -> httpx.Response:
+    """Uses a keep-alive connection pool shared by all model clients of the process"""
+    response = send_with_retries(
+        get_shared_http_client(_MODEL_SERVER_CLIENT_NAME, _MODEL_SERVER_HTTP_CONFIG),
+        _MODEL_SERVER_HTTP_CONFIG,
+        "POST",
+        endpoint,
+        json=request.dict(),
+        headers=_float_matrix_request_headers(binary_transport),
+    )
+    response.raise_for_status()
+    return response
+
+
+async def _apost_to_model_server(
+    endpoint: str, request: BaseModel, binary_transport: bool = False
+) -> httpx.Response:
+    response = await asend_with_retries(
+        get_shared_async_http_client(
+            _MODEL_SERVER_CLIENT_NAME, _MODEL_SERVER_HTTP_CONFIG
+        ),
+        _MODEL_SERVER_HTTP_CONFIG,
+        "POST",
+        endpoint,
+        json=request.dict(),
+        headers=_float_matrix_request_headers(binary_transport),
+    )
+    response.raise_for_status()
+    return response
+
+
 class EmbeddingModel:
     def __init__(
         self,
@@ -122,9 +377,11 @@ class EmbeddingModel:
         indexing_model_server_host: str | None = INDEXING_MODEL_SERVER_HOST,
         model_server_port: int = MODEL_SERVER_PORT,
         is_indexing: bool = CURRENT_PROCESS_IS_AN_INDEXING_JOB,
+        binary_transport: bool = MODEL_SERVER_BINARY_TRANSPORT,
     ) -> None:
         self.model_name = model_name
         self.max_seq_length = max_seq_length
+        self.binary_transport = binary_transport
 
         used_model_server_host = (
             indexing_model_server_host if is_indexing else model_server_host
@@ -145,32 +402,80 @@ class EmbeddingModel:
             model_name=self.model_name, max_context_length=self.max_seq_length
         )
 
-    def encode(
+    @staticmethod
+    def _parse_embed_response(response: httpx.Response) -> np.ndarray:
+        # Older model servers ignore the Accept header and always respond with JSON
+        if _is_float_matrix_response(response):
+            return deserialize_float_matrix(response.content)
+        return np.array(EmbedResponse(**response.json()).embeddings, dtype=np.float32)
+
+    def _encode_locally(
+        self, texts: list[str], normalize_embeddings: bool
+    ) -> np.ndarray:
+        local_model = self.load_model()
+
+        if local_model is None:
+            raise RuntimeError("Failed to load local Embedding Model")
+
+        return np.asarray(
+            local_model.encode(texts, normalize_embeddings=normalize_embeddings),
+            dtype=np.float32,
+        )
+
+    def encode_as_array(
         self, texts: list[str], normalize_embeddings: bool = NORMALIZE_EMBEDDINGS
-    ) -> list[list[float]]:
+    ) -> np.ndarray:
+        """Returns a (len(texts), embedding dim) float32 matrix"""
         if self.embed_server_endpoint:
-            embed_request = EmbedRequest(texts=texts)
-
             try:
-                response = requests.post(
-                    self.embed_server_endpoint, json=embed_request.dict()
+                response = _post_to_model_server(
+                    self.embed_server_endpoint,
+                    EmbedRequest(texts=texts),
+                    binary_transport=self.binary_transport,
                 )
-                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.exception(f"Failed to get Embedding: {e}")
+                raise
+
+            return self._parse_embed_response(response)
 
-                return EmbedResponse(**response.json()).embeddings
-            except requests.RequestException as e:
+        return self._encode_locally(texts, normalize_embeddings)
+
+    async def aencode_as_array(
+        self, texts: list[str], normalize_embeddings: bool = NORMALIZE_EMBEDDINGS
+    ) -> np.ndarray:
+        if self.embed_server_endpoint:
+            try:
+                response = await _apost_to_model_server(
+                    self.embed_server_endpoint,
+                    EmbedRequest(texts=texts),
+                    binary_transport=self.binary_transport,
+                )
+            except httpx.HTTPError as e:
                 logger.exception(f"Failed to get Embedding: {e}")
                 raise
 
-        local_model = self.load_model()
+            return self._parse_embed_response(response)
 
-        if local_model is None:
-            raise RuntimeError("Failed to load local Embedding Model")
+        return await asyncio.to_thread(
+            self._encode_locally, texts, normalize_embeddings
+        )
 
-        return local_model.encode(
+    def encode(
+        self, texts: list[str], normalize_embeddings: bool = NORMALIZE_EMBEDDINGS
+    ) -> list[list[float]]:
+        return self.encode_as_array(
             texts, normalize_embeddings=normalize_embeddings
         ).tolist()
 
+    async def aencode(
+        self, texts: list[str], normalize_embeddings: bool = NORMALIZE_EMBEDDINGS
+    ) -> list[list[float]]:
+        embeddings = await self.aencode_as_array(
+            texts, normalize_embeddings=normalize_embeddings
+        )
+        return embeddings.tolist()
+
 
 class CrossEncoderEnsembleModel:
     def __init__(
@@ -179,9 +484,11 @@ class CrossEncoderEnsembleModel:
         max_seq_length: int = CROSS_EMBED_CONTEXT_SIZE,
         model_server_host: str | None = MODEL_SERVER_HOST,
         model_server_port: int = MODEL_SERVER_PORT,
+        binary_transport: bool = MODEL_SERVER_BINARY_TRANSPORT,
     ) -> None:
         self.model_names = model_names
         self.max_seq_length = max_seq_length
+        self.binary_transport = binary_transport
 
         model_server_url = build_model_server_url(model_server_host, model_server_port)
         self.rerank_server_endpoint = (
@@ -190,40 +497,67 @@ class CrossEncoderEnsembleModel:
             else None
         )
 
-    def load_model(self) -> list[CrossEncoder] | None:
+    def load_model(self) -> CrossEncoderEnsembleScorer | None:
         if self.rerank_server_endpoint:
             return None
 
-        return get_local_reranking_model_ensemble(
+        return get_local_reranking_scorer(
             model_names=self.model_names, max_context_length=self.max_seq_length
         )
 
-    def predict(self, query: str, passages: list[str]) -> list[list[float]]:
-        if self.rerank_server_endpoint:
-            rerank_request = RerankRequest(query=query, documents=passages)
+    @staticmethod
+    def _parse_rerank_response(response: httpx.Response) -> np.ndarray:
+        if _is_float_matrix_response(response):
+            return deserialize_float_matrix(response.content)
+        return np.array(RerankResponse(**response.json()).scores)
+
+    def _predict_locally(self, query: str, passages: list[str]) -> np.ndarray:
+        scorer = self.load_model()
+
+        if scorer is None:
+            raise RuntimeError("Failed to load local Reranking Model Ensemble")
 
+        return scorer.predict(query=query, passages=passages)
+
+    def predict_as_array(self, query: str, passages: list[str]) -> np.ndarray:
+        """Returns a (num ensemble models, len(passages)) matrix of scores"""
+        if self.rerank_server_endpoint:
             try:
-                response = requests.post(
-                    self.rerank_server_endpoint, json=rerank_request.dict()
+                response = _post_to_model_server(
+                    self.rerank_server_endpoint,
+                    RerankRequest(query=query, documents=passages),
+                    binary_transport=self.binary_transport,
                 )
-                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.exception(f"Failed to get Reranking Scores: {e}")
+                raise
 
-                return RerankResponse(**response.json()).scores
-            except requests.RequestException as e:
+            return self._parse_rerank_response(response)
+
+        return self._predict_locally(query, passages)
+
+    async def apredict_as_array(self, query: str, passages: list[str]) -> np.ndarray:
+        if self.rerank_server_endpoint:
+            try:
+                response = await _apost_to_model_server(
+                    self.rerank_server_endpoint,
+                    RerankRequest(query=query, documents=passages),
+                    binary_transport=self.binary_transport,
+                )
+            except httpx.HTTPError as e:
                 logger.exception(f"Failed to get Reranking Scores: {e}")
                 raise
 
-        local_models = self.load_model()
+            return self._parse_rerank_response(response)
 
-        if local_models is None:
-            raise RuntimeError("Failed to load local Reranking Model Ensemble")
+        return await asyncio.to_thread(self._predict_locally, query, passages)
 
-        scores = [
-            cross_encoder.predict([(query, passage) for passage in passages]).tolist()  # type: ignore
-            for cross_encoder in local_models
-        ]
+    def predict(self, query: str, passages: list[str]) -> list[list[float]]:
+        return self.predict_as_array(query=query, passages=passages).tolist()
 
-        return scores
+    async def apredict(self, query: str, passages: list[str]) -> list[list[float]]:
+        scores = await self.apredict_as_array(query=query, passages=passages)
+        return scores.tolist()
 
 
 class IntentModel:
@@ -250,24 +584,7 @@ class IntentModel:
             model_name=self.model_name, max_context_length=self.max_seq_length
         )
 
-    def predict(
-        self,
-        query: str,
-    ) -> list[float]:
-        if self.intent_server_endpoint:
-            intent_request = IntentRequest(query=query)
-
-            try:
-                response = requests.post(
-                    self.intent_server_endpoint, json=intent_request.dict()
-                )
-                response.raise_for_status()
-
-                return IntentResponse(**response.json()).class_probs
-            except requests.RequestException as e:
-                logger.exception(f"Failed to get Embedding: {e}")
-                raise
-
+    def _predict_locally(self, query: str) -> list[float]:
         tokenizer = get_intent_model_tokenizer()
         local_model = self.load_model()
 
@@ -285,6 +602,40 @@ class IntentModel:
 
         return list(class_percentages.tolist()[0])
 
+    def predict(
+        self,
+        query: str,
+    ) -> list[float]:
+        if self.intent_server_endpoint:
+            try:
+                response = _post_to_model_server(
+                    self.intent_server_endpoint, IntentRequest(query=query)
+                )
+            except httpx.HTTPError as e:
+                logger.exception(f"Failed to get Intent: {e}")
+                raise
+
+            return IntentResponse(**response.json()).class_probs
+
+        return self._predict_locally(query)
+
+    async def apredict(
+        self,
+        query: str,
+    ) -> list[float]:
+        if self.intent_server_endpoint:
+            try:
+                response = await _apost_to_model_server(
+                    self.intent_server_endpoint, IntentRequest(query=query)
+                )
+            except httpx.HTTPError as e:
+                logger.exception(f"Failed to get Intent: {e}")
+                raise
+
+            return IntentResponse(**response.json()).class_probs
+
+        return await asyncio.to_thread(self._predict_locally, query)
+
 
 def warm_up_models(
     skip_cross_encoders: bool = False,
@@ -1,4 +1,7 @@
+import asyncio
 import string
+import threading
+from collections.abc import AsyncGenerator
 from collections.abc import Callable
 from collections.abc import Iterator
 from typing import cast
@@ -7,19 +10,27 @@ import numpy
 from nltk.corpus import stopwords  # type:ignore
 from nltk.stem import WordNetLemmatizer  # type:ignore
 from nltk.tokenize import word_tokenize  # type:ignore
+from sqlalchemy.orm import Session
 
 from payserai.chat.models import LlmDoc
 from payserai.configs.chat_configs import HYBRID_ALPHA
 from payserai.configs.chat_configs import MULTILINGUAL_QUERY_EXPANSION
 from payserai.configs.chat_configs import NUM_RERANKED_RESULTS
+from payserai.configs.chat_configs import SEMANTIC_SEARCH_CACHE_SIMILARITY_THRESHOLD
+from payserai.configs.chat_configs import SEMANTIC_SEARCH_CACHE_SIZE
+from payserai.configs.chat_configs import SEMANTIC_SEARCH_CACHE_TTL_SECS
 from payserai.configs.model_configs import ASYM_QUERY_PREFIX
 from payserai.configs.model_configs import CROSS_ENCODER_RANGE_MAX
 from payserai.configs.model_configs import CROSS_ENCODER_RANGE_MIN
+from payserai.configs.model_configs import DOCUMENT_ENCODER_MODEL
+from payserai.configs.model_configs import QUERY_EMBEDDING_CACHE_PATH
+from payserai.configs.model_configs import QUERY_EMBEDDING_CACHE_SIZE
+from payserai.configs.model_configs import QUERY_EMBEDDING_CACHE_TTL_SECS
 from payserai.configs.model_configs import SIM_SCORE_RANGE_HIGH
 from payserai.configs.model_configs import SIM_SCORE_RANGE_LOW
-from payserai.document_index.document_index_utils import (
-    translate_boost_count_to_multiplier,
-)
+from payserai.db.engine import get_sqlalchemy_engine
+from payserai.db.search_cache import fetch_search_cache_invalidations
+from payserai.db.search_cache import SearchCacheInvalidationCursor
 from payserai.document_index.interfaces import DocumentIndex
 from payserai.indexing.models import InferenceChunk
 from payserai.search.models import ChunkMetric
@@ -30,19 +41,33 @@ from payserai.search.models import RetrievalMetricsContainer
 from payserai.search.models import SearchDoc
 from payserai.search.models import SearchQuery
 from payserai.search.models import SearchType
+from payserai.search.scoring import boost_multipliers
+from payserai.search.scoring import boosted_scores
+from payserai.search.scoring import legacy_boosted_scores
+from payserai.search.scoring import rank_descending
+from payserai.search.scoring import reranked_scores
 from payserai.search.search_nlp_models import CrossEncoderEnsembleModel
 from payserai.search.search_nlp_models import EmbeddingModel
+from payserai.search.search_nlp_models import tokenizer_lowercases_input
+from payserai.search.semantic_cache import search_signature
+from payserai.search.semantic_cache import SemanticSearchCache
 from payserai.secondary_llm_flows.chunk_usefulness import llm_batch_eval_chunks
 from payserai.secondary_llm_flows.query_expansion import multilingual_query_expansion
+from payserai.utils.cache import register_cache
+from payserai.utils.cache import SqliteCacheBacking
+from payserai.utils.cache import TTLLRUCache
 from payserai.utils.logger import setup_logger
 from payserai.utils.threadpool_concurrency import FunctionCall
 from payserai.utils.threadpool_concurrency import run_functions_in_parallel
-from payserai.utils.threadpool_concurrency import run_functions_tuples_in_parallel
 from payserai.utils.timing import log_function_time
 
 
 logger = setup_logger()
 
+_QUERY_EMBEDDING_CACHE: TTLLRUCache[list[float]] | None = None
+_SEMANTIC_SEARCH_CACHE: SemanticSearchCache | None = None
+_SEMANTIC_SEARCH_CACHE_LOCK = threading.Lock()
+
 
 def _log_top_chunk_links(search_flow: str, chunks: list[InferenceChunk]) -> None:
     top_links = [
@@ -76,12 +101,145 @@ def query_processing(
     return query
 
 
+def _get_query_embedding_cache() -> TTLLRUCache[list[float]] | None:
+    global _QUERY_EMBEDDING_CACHE
+    if _QUERY_EMBEDDING_CACHE is None and QUERY_EMBEDDING_CACHE_SIZE > 0:
+        _QUERY_EMBEDDING_CACHE = TTLLRUCache(
+            max_size=QUERY_EMBEDDING_CACHE_SIZE,
+            ttl_secs=QUERY_EMBEDDING_CACHE_TTL_SECS,
+            backing=SqliteCacheBacking(
+                QUERY_EMBEDDING_CACHE_PATH, table_name="query_embeddings"
+            )
+            if QUERY_EMBEDDING_CACHE_PATH
+            else None,
+        )
+        register_cache("query_embedding", _QUERY_EMBEDDING_CACHE)
+    return _QUERY_EMBEDDING_CACHE
+
+
+def _fetch_search_cache_invalidations(
+    cursor: SearchCacheInvalidationCursor | None,
+) -> tuple[SearchCacheInvalidationCursor, set[str]]:
+    with Session(get_sqlalchemy_engine()) as db_session:
+        return fetch_search_cache_invalidations(cursor, db_session)
+
+
+def _get_semantic_search_cache() -> SemanticSearchCache | None:
+    global _SEMANTIC_SEARCH_CACHE
+    if _SEMANTIC_SEARCH_CACHE is not None or SEMANTIC_SEARCH_CACHE_SIZE <= 0:
+        return _SEMANTIC_SEARCH_CACHE
+
+    with _SEMANTIC_SEARCH_CACHE_LOCK:
+        if _SEMANTIC_SEARCH_CACHE is None:
+            search_cache = SemanticSearchCache(
+                max_size=SEMANTIC_SEARCH_CACHE_SIZE,
+                ttl_secs=SEMANTIC_SEARCH_CACHE_TTL_SECS,
+                similarity_threshold=SEMANTIC_SEARCH_CACHE_SIMILARITY_THRESHOLD,
+                fetch_invalidations=_fetch_search_cache_invalidations,
+            )
+            # The invalidations are pulled from Postgres in the background, lookups
+            # from the async search path must not block the event loop on it
+            search_cache.start_polling()
+            register_cache("semantic_search", search_cache)
+            _SEMANTIC_SEARCH_CACHE = search_cache
+    return _SEMANTIC_SEARCH_CACHE
+
+
+def _query_embedding_cache_key(query: str, prefix: str, model_name: str) -> str:
+    # Whitespace never changes the embedding, casing only does for cased models
+    normalized_query = " ".join(query.split())
+    if tokenizer_lowercases_input(model_name):
+        normalized_query = normalized_query.lower()
+    return "\x1f".join([model_name, prefix, normalized_query])
+
+
+def _cached_query_embeddings(
+    queries: list[str], prefix: str, model_name: str
+) -> tuple[list[list[float] | None], list[str]]:
+    """The embeddings found in the cache, None for the misses, and the cache keys"""
+    cache = _get_query_embedding_cache()
+    cache_keys = [
+        _query_embedding_cache_key(query, prefix, model_name) for query in queries
+    ]
+    if cache is None:
+        return [None] * len(queries), cache_keys
+    return [cache.get(cache_key) for cache_key in cache_keys], cache_keys
+
+
+def _fill_query_embeddings(
+    embeddings: list[list[float] | None],
+    cache_keys: list[str],
+    missing_inds: list[int],
+    missing_embeddings: list[list[float]],
+) -> list[list[float]]:
+    cache = _get_query_embedding_cache()
+    for ind, embedding in zip(missing_inds, missing_embeddings):
+        embeddings[ind] = embedding
+        if cache is not None:
+            cache.set(cache_keys[ind], embedding)
+    return cast(list[list[float]], embeddings)
+
+
+def embed_queries(
+    queries: list[str],
+    prefix: str = ASYM_QUERY_PREFIX,
+    model_name: str = DOCUMENT_ENCODER_MODEL,
+) -> list[list[float]]:
+    """The queries which are not cached are encoded in a single model call"""
+    embeddings, cache_keys = _cached_query_embeddings(queries, prefix, model_name)
+    missing_inds = [
+        ind for ind, embedding in enumerate(embeddings) if embedding is None
+    ]
+    missing_embeddings = (
+        EmbeddingModel(model_name=model_name).encode(
+            [prefix + queries[ind] for ind in missing_inds]
+        )
+        if missing_inds
+        else []
+    )
+    return _fill_query_embeddings(
+        embeddings, cache_keys, missing_inds, missing_embeddings
+    )
+
+
+async def aembed_queries(
+    queries: list[str],
+    prefix: str = ASYM_QUERY_PREFIX,
+    model_name: str = DOCUMENT_ENCODER_MODEL,
+) -> list[list[float]]:
+    # The cache may be backed by SQLite, so it is not touched from the event loop
+    embeddings, cache_keys = await asyncio.to_thread(
+        _cached_query_embeddings, queries, prefix, model_name
+    )
+    missing_inds = [
+        ind for ind, embedding in enumerate(embeddings) if embedding is None
+    ]
+    missing_embeddings = (
+        await EmbeddingModel(model_name=model_name).aencode(
+            [prefix + queries[ind] for ind in missing_inds]
+        )
+        if missing_inds
+        else []
+    )
+    return await asyncio.to_thread(
+        _fill_query_embeddings, embeddings, cache_keys, missing_inds, missing_embeddings
+    )
+
+
 def embed_query(
     query: str,
     prefix: str = ASYM_QUERY_PREFIX,
+    model_name: str = DOCUMENT_ENCODER_MODEL,
 ) -> list[float]:
-    prefixed_query = prefix + query
-    return EmbeddingModel().encode([prefixed_query])[0]
+    return embed_queries([query], prefix=prefix, model_name=model_name)[0]
+
+
+async def aembed_query(
+    query: str,
+    prefix: str = ASYM_QUERY_PREFIX,
+    model_name: str = DOCUMENT_ENCODER_MODEL,
+) -> list[float]:
+    return (await aembed_queries([query], prefix=prefix, model_name=model_name))[0]
 
 
 def chunks_to_search_docs(chunks: list[InferenceChunk] | None) -> list[SearchDoc]:
@@ -141,35 +299,16 @@ def doc_index_retrieval(
     document_index: DocumentIndex,
     hybrid_alpha: float = HYBRID_ALPHA,
 ) -> list[InferenceChunk]:
-    if query.search_type == SearchType.KEYWORD:
-        top_chunks = document_index.keyword_retrieval(
-            query=query.query,
-            filters=query.filters,
-            time_decay_multiplier=query.recency_bias_multiplier,
-            num_to_retrieve=query.num_hits,
-        )
-
-    elif query.search_type == SearchType.SEMANTIC:
-        top_chunks = document_index.semantic_retrieval(
-            query=query.query,
-            filters=query.filters,
-            time_decay_multiplier=query.recency_bias_multiplier,
-            num_to_retrieve=query.num_hits,
-        )
+    return document_index.query_retrieval(query, hybrid_alpha=hybrid_alpha)
 
-    elif query.search_type == SearchType.HYBRID:
-        top_chunks = document_index.hybrid_retrieval(
-            query=query.query,
-            filters=query.filters,
-            time_decay_multiplier=query.recency_bias_multiplier,
-            num_to_retrieve=query.num_hits,
-            hybrid_alpha=hybrid_alpha,
-        )
-
-    else:
-        raise RuntimeError("Invalid Search Flow")
 
-    return top_chunks
+@log_function_time(print_only=True)
+async def adoc_index_retrieval(
+    query: SearchQuery,
+    document_index: DocumentIndex,
+    hybrid_alpha: float = HYBRID_ALPHA,
+) -> list[InferenceChunk]:
+    return await document_index.aquery_retrieval(query, hybrid_alpha=hybrid_alpha)
 
 
 @log_function_time(print_only=True)
@@ -187,32 +326,50 @@ def semantic_reranking(
     """
     cross_encoders = CrossEncoderEnsembleModel()
     passages = [chunk.content for chunk in chunks]
-    sim_scores_floats = cross_encoders.predict(query=query, passages=passages)
-
-    sim_scores = [numpy.array(scores) for scores in sim_scores_floats]
+    sim_scores = cross_encoders.predict_as_array(query=query, passages=passages)
 
-    raw_sim_scores = cast(numpy.ndarray, sum(sim_scores) / len(sim_scores))
+    return _rank_by_rerank_scores(
+        chunks, sim_scores, rerank_metrics_callback, model_min, model_max
+    )
 
-    cross_models_min = numpy.min(sim_scores)
 
-    shifted_sim_scores = sum(
-        [enc_n_scores - cross_models_min for enc_n_scores in sim_scores]
-    ) / len(sim_scores)
+@log_function_time(print_only=True)
+async def asemantic_reranking(
+    query: str,
+    chunks: list[InferenceChunk],
+    rerank_metrics_callback: Callable[[RerankMetricsContainer], None] | None = None,
+    model_min: int = CROSS_ENCODER_RANGE_MIN,
+    model_max: int = CROSS_ENCODER_RANGE_MAX,
+) -> tuple[list[InferenceChunk], list[int]]:
+    cross_encoders = CrossEncoderEnsembleModel()
+    passages = [chunk.content for chunk in chunks]
+    sim_scores = await cross_encoders.apredict_as_array(query=query, passages=passages)
 
-    boosts = [translate_boost_count_to_multiplier(chunk.boost) for chunk in chunks]
-    recency_multiplier = [chunk.recency_bias for chunk in chunks]
-    boosted_sim_scores = shifted_sim_scores * boosts * recency_multiplier
-    normalized_b_s_scores = (boosted_sim_scores + cross_models_min - model_min) / (
-        model_max - model_min
-    )
-    orig_indices = [i for i in range(len(normalized_b_s_scores))]
-    scored_results = list(
-        zip(normalized_b_s_scores, raw_sim_scores, chunks, orig_indices)
+    return _rank_by_rerank_scores(
+        chunks, sim_scores, rerank_metrics_callback, model_min, model_max
     )
-    scored_results.sort(key=lambda x: x[0], reverse=True)
-    ranked_sim_scores, ranked_raw_scores, ranked_chunks, ranked_indices = zip(
-        *scored_results
+
+
+def _rank_by_rerank_scores(
+    chunks: list[InferenceChunk],
+    sim_scores: numpy.ndarray,
+    rerank_metrics_callback: Callable[[RerankMetricsContainer], None] | None,
+    model_min: int,
+    model_max: int,
+) -> tuple[list[InferenceChunk], list[int]]:
+    normalized_b_s_scores, raw_sim_scores = reranked_scores(
+        sim_scores,
+        multipliers=boost_multipliers([chunk.boost for chunk in chunks]),
+        recency_multipliers=numpy.array(
+            [chunk.recency_bias for chunk in chunks], dtype=numpy.float64
+        ),
+        model_min=model_min,
+        model_max=model_max,
     )
+    ranked_indices = rank_descending(normalized_b_s_scores).tolist()
+    ranked_sim_scores = normalized_b_s_scores[ranked_indices].tolist()
+    ranked_raw_scores = raw_sim_scores[ranked_indices].tolist()
+    ranked_chunks = [chunks[ind] for ind in ranked_indices]
 
     logger.debug(
         f"Reranked (Boosted + Time Weighted) similarity scores: {ranked_sim_scores}"
@@ -239,59 +396,41 @@ def semantic_reranking(
             )
         )
 
-    return list(ranked_chunks), list(ranked_indices)
+    return ranked_chunks, ranked_indices
+
+
+def _set_ranked_scores(
+    chunks: list[InferenceChunk], scores: numpy.ndarray, top_k: int | None
+) -> list[InferenceChunk]:
+    ranked_indices = rank_descending(scores, top_k=top_k).tolist()
+    ranked_chunks = [chunks[ind] for ind in ranked_indices]
+    for chunk, score in zip(ranked_chunks, scores[ranked_indices].tolist()):
+        chunk.score = score
+    return ranked_chunks
 
 
 def apply_boost_legacy(
     chunks: list[InferenceChunk],
     norm_min: float = SIM_SCORE_RANGE_LOW,
     norm_max: float = SIM_SCORE_RANGE_HIGH,
+    top_k: int | None = None,
 ) -> list[InferenceChunk]:
-    scores = [chunk.score or 0 for chunk in chunks]
-    boosts = [translate_boost_count_to_multiplier(chunk.boost) for chunk in chunks]
+    """If top_k is set, only the top_k best chunks are rescored and returned"""
+    scores = numpy.array([chunk.score or 0 for chunk in chunks], dtype=numpy.float64)
 
     logger.debug(f"Raw similarity scores: {scores}")
 
-    score_min = min(scores)
-    score_max = max(scores)
-    score_range = score_max - score_min
-
-    if score_range != 0:
-        boosted_scores = [
-            ((score - score_min) / score_range) * boost
-            for score, boost in zip(scores, boosts)
-        ]
-        unnormed_boosted_scores = [
-            score * score_range + score_min for score in boosted_scores
-        ]
-    else:
-        unnormed_boosted_scores = [
-            score * boost for score, boost in zip(scores, boosts)
-        ]
-
-    norm_min = min(norm_min, min(scores))
-    norm_max = max(norm_max, max(scores))
-    # This should never be 0 unless user has done some weird/wrong settings
-    norm_range = norm_max - norm_min
-
-    # For score display purposes
-    if norm_range != 0:
-        re_normed_scores = [
-            ((score - norm_min) / norm_range) for score in unnormed_boosted_scores
-        ]
-    else:
-        re_normed_scores = unnormed_boosted_scores
-
-    rescored_chunks = list(zip(re_normed_scores, chunks))
-    rescored_chunks.sort(key=lambda x: x[0], reverse=True)
-    sorted_boosted_scores, boost_sorted_chunks = zip(*rescored_chunks)
-
-    final_chunks = list(boost_sorted_chunks)
-    final_scores = list(sorted_boosted_scores)
-    for ind, chunk in enumerate(final_chunks):
-        chunk.score = final_scores[ind]
+    re_normed_scores = legacy_boosted_scores(
+        scores,
+        multipliers=boost_multipliers([chunk.boost for chunk in chunks]),
+        norm_min=norm_min,
+        norm_max=norm_max,
+    )
+    final_chunks = _set_ranked_scores(chunks, re_normed_scores, top_k)
 
-    logger.debug(f"Boost sorted similary scores: {list(final_scores)}")
+    logger.debug(
+        f"Boost sorted similary scores: {[chunk.score for chunk in final_chunks]}"
+    )
 
     return final_chunks
 
@@ -303,34 +442,27 @@ def apply_boost(
     norm_cutoff: int = NUM_RERANKED_RESULTS,
     norm_min: float = SIM_SCORE_RANGE_LOW,
     norm_max: float = SIM_SCORE_RANGE_HIGH,
+    top_k: int | None = None,
 ) -> list[InferenceChunk]:
-    scores = [chunk.score or 0.0 for chunk in chunks]
+    """If top_k is set, only the top_k best chunks are rescored and returned"""
+    scores = numpy.array([chunk.score or 0.0 for chunk in chunks], dtype=numpy.float64)
     logger.debug(f"Raw similarity scores: {scores}")
 
-    boosts = [translate_boost_count_to_multiplier(chunk.boost) for chunk in chunks]
-    recency_multiplier = [chunk.recency_bias for chunk in chunks]
-
-    norm_min = min(norm_min, min(scores[:norm_cutoff]))
-    norm_max = max(norm_max, max(scores[:norm_cutoff]))
-    # This should never be 0 unless user has done some weird/wrong settings
-    norm_range = norm_max - norm_min
-
-    boosted_scores = [
-        max(0, (score - norm_min) * boost * recency / norm_range)
-        for score, boost, recency in zip(scores, boosts, recency_multiplier)
-    ]
-
-    rescored_chunks = list(zip(boosted_scores, chunks))
-    rescored_chunks.sort(key=lambda x: x[0], reverse=True)
-    sorted_boosted_scores, boost_sorted_chunks = zip(*rescored_chunks)
-
-    final_chunks = list(boost_sorted_chunks)
-    final_scores = list(sorted_boosted_scores)
-    for ind, chunk in enumerate(final_chunks):
-        chunk.score = final_scores[ind]
+    final_scores = boosted_scores(
+        scores,
+        multipliers=boost_multipliers([chunk.boost for chunk in chunks]),
+        recency_multipliers=numpy.array(
+            [chunk.recency_bias for chunk in chunks], dtype=numpy.float64
+        ),
+        norm_cutoff=norm_cutoff,
+        norm_min=norm_min,
+        norm_max=norm_max,
+    )
+    final_chunks = _set_ranked_scores(chunks, final_scores, top_k)
 
     logger.debug(
-        f"Boosted + Time Weighted sorted similarity scores: {list(final_scores)}"
+        "Boosted + Time Weighted sorted similarity scores: "
+        f"{[chunk.score for chunk in final_chunks]}"
     )
 
     return final_chunks
@@ -351,36 +483,86 @@ def retrieve_chunks(
     | None = None,
 ) -> list[InferenceChunk]:
     """Returns a list of the best chunks from an initial keyword/semantic/ hybrid search."""
-    # Don't do query expansion on complex queries, rephrasings likely would not work well
-    if not multilingual_expansion_str or "\n" in query.query or "\r" in query.query:
+    if not _should_expand_query(query, multilingual_expansion_str):
         top_chunks = doc_index_retrieval(
             query=query, document_index=document_index, hybrid_alpha=hybrid_alpha
         )
     else:
-        simplified_queries = set()
-        run_queries: list[tuple[Callable, tuple]] = []
-
-        # Currently only uses query expansion on multilingual use cases
-        query_rephrases = multilingual_query_expansion(
-            query.query, multilingual_expansion_str
+        # The rephrasings are searched concurrently, sharing the index connections
+        parallel_search_results = document_index.multi_query_retrieval(
+            _expand_query(query, cast(str, multilingual_expansion_str)),
+            hybrid_alpha=hybrid_alpha,
         )
-        # Just to be extra sure, add the original query.
-        query_rephrases.append(query.query)
-        for rephrase in set(query_rephrases):
-            # Sometimes the model rephrases the query in the same language with minor changes
-            # Avoid doing an extra search with the minor changes as this biases the results
-            simplified_rephrase = _simplify_text(rephrase)
-            if simplified_rephrase in simplified_queries:
-                continue
-            simplified_queries.add(simplified_rephrase)
-
-            q_copy = query.copy(update={"query": rephrase}, deep=True)
-            run_queries.append(
-                (doc_index_retrieval, (q_copy, document_index, hybrid_alpha))
-            )
-        parallel_search_results = run_functions_tuples_in_parallel(run_queries)
         top_chunks = combine_retrieval_results(parallel_search_results)
 
+    return _report_retrieved_chunks(query, top_chunks, retrieval_metrics_callback)
+
+
+async def aretrieve_chunks(
+    query: SearchQuery,
+    document_index: DocumentIndex,
+    hybrid_alpha: float = HYBRID_ALPHA,  # Only applicable to hybrid search
+    multilingual_expansion_str: str | None = MULTILINGUAL_QUERY_EXPANSION,
+    retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None]
+    | None = None,
+) -> list[InferenceChunk]:
+    if not _should_expand_query(query, multilingual_expansion_str):
+        top_chunks = await adoc_index_retrieval(
+            query=query, document_index=document_index, hybrid_alpha=hybrid_alpha
+        )
+    else:
+        # The query expansion is a blocking LLM call
+        expanded_queries = await asyncio.to_thread(
+            _expand_query, query, cast(str, multilingual_expansion_str)
+        )
+        search_results = await document_index.amulti_query_retrieval(
+            expanded_queries, hybrid_alpha=hybrid_alpha
+        )
+        top_chunks = combine_retrieval_results(search_results)
+
+    return _report_retrieved_chunks(query, top_chunks, retrieval_metrics_callback)
+
+
+def _should_expand_query(
+    query: SearchQuery, multilingual_expansion_str: str | None
+) -> bool:
+    # Don't do query expansion on complex queries, rephrasings likely would not work well
+    return bool(
+        multilingual_expansion_str
+        and "\n" not in query.query
+        and "\r" not in query.query
+    )
+
+
+def _expand_query(
+    query: SearchQuery, multilingual_expansion_str: str
+) -> list[SearchQuery]:
+    simplified_queries = set()
+    expanded_queries: list[SearchQuery] = []
+
+    # Currently only uses query expansion on multilingual use cases
+    query_rephrases = multilingual_query_expansion(
+        query.query, multilingual_expansion_str
+    )
+    # Just to be extra sure, add the original query.
+    query_rephrases.append(query.query)
+    for rephrase in set(query_rephrases):
+        # Sometimes the model rephrases the query in the same language with minor changes
+        # Avoid doing an extra search with the minor changes as this biases the results
+        simplified_rephrase = _simplify_text(rephrase)
+        if simplified_rephrase in simplified_queries:
+            continue
+        simplified_queries.add(simplified_rephrase)
+
+        expanded_queries.append(query.copy(update={"query": rephrase}, deep=True))
+    return expanded_queries
+
+
+def _report_retrieved_chunks(
+    query: SearchQuery,
+    top_chunks: list[InferenceChunk],
+    retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None] | None,
+) -> list[InferenceChunk]:
     if not top_chunks:
         logger.info(
             f"{query.search_type.value.capitalize()} search returned no results "
@@ -426,7 +608,25 @@ def rerank_chunks(
         chunks=chunks_to_rerank[: query.num_rerank],
         rerank_metrics_callback=rerank_metrics_callback,
     )
-    lower_chunks = chunks_to_rerank[query.num_rerank :]
+    return _append_unranked_chunks(ranked_chunks, chunks_to_rerank[query.num_rerank :])
+
+
+async def arerank_chunks(
+    query: SearchQuery,
+    chunks_to_rerank: list[InferenceChunk],
+    rerank_metrics_callback: Callable[[RerankMetricsContainer], None] | None = None,
+) -> list[InferenceChunk]:
+    ranked_chunks, _ = await asemantic_reranking(
+        query=query.query,
+        chunks=chunks_to_rerank[: query.num_rerank],
+        rerank_metrics_callback=rerank_metrics_callback,
+    )
+    return _append_unranked_chunks(ranked_chunks, chunks_to_rerank[query.num_rerank :])
+
+
+def _append_unranked_chunks(
+    ranked_chunks: list[InferenceChunk], lower_chunks: list[InferenceChunk]
+) -> list[InferenceChunk]:
     # Scores from rerank cannot be meaningfully combined with scores without rerank
     for lower_chunk in lower_chunks:
         lower_chunk.score = None
@@ -445,6 +645,7 @@ def filter_chunks(
     llm_chunk_selection = llm_batch_eval_chunks(
         query=query.query,
         chunk_contents=[chunk.content for chunk in chunks_to_filter],
+        chunk_ids=[chunk.unique_id for chunk in chunks_to_filter],
     )
     return [
         chunk.unique_id
@@ -491,19 +692,96 @@ def full_chunk_search_generator(
     retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None]
     | None = None,
     rerank_metrics_callback: Callable[[RerankMetricsContainer], None] | None = None,
+    retrieved_chunks: list[InferenceChunk] | None = None,
 ) -> Iterator[list[InferenceChunk] | list[bool]]:
     """Always yields twice. Once with the selected chunks and once with the LLM relevance filter result.
     If LLM filter results are turned off, returns a list of False
+    If retrieved_chunks are passed in, for example from a speculative retrieval, the retrieval
+    step is skipped
     """
-    chunks_yielded = False
+    search_cache = _get_semantic_search_cache()
+    # Keyword searches don't match on meaning, similar embeddings don't imply the same hits
+    if (
+        search_cache is None
+        or retrieved_chunks is not None
+        or search_query.search_type == SearchType.KEYWORD
+    ):
+        yield from _full_chunk_search_generator(
+            search_query=search_query,
+            document_index=document_index,
+            hybrid_alpha=hybrid_alpha,
+            multilingual_expansion_str=multilingual_expansion_str,
+            retrieval_metrics_callback=retrieval_metrics_callback,
+            rerank_metrics_callback=rerank_metrics_callback,
+            retrieved_chunks=retrieved_chunks,
+        )
+        return
 
-    retrieved_chunks = retrieve_chunks(
-        query=search_query,
-        document_index=document_index,
+    # Same embedding as used by the retrieval, so it is served by the embedding cache
+    query_embedding = embed_query(search_query.query)
+    signature = search_signature(
+        search_query,
         hybrid_alpha=hybrid_alpha,
         multilingual_expansion_str=multilingual_expansion_str,
-        retrieval_metrics_callback=retrieval_metrics_callback,
     )
+    cached_search = search_cache.get(query_embedding, signature)
+    if cached_search is not None:
+        logger.info("Semantic search cache hit")
+        cached_chunks, cached_llm_chunk_selection = cached_search
+        yield cached_chunks
+        yield cached_llm_chunk_selection
+        return
+
+    yield from _cache_search_results(
+        _full_chunk_search_generator(
+            search_query=search_query,
+            document_index=document_index,
+            hybrid_alpha=hybrid_alpha,
+            multilingual_expansion_str=multilingual_expansion_str,
+            retrieval_metrics_callback=retrieval_metrics_callback,
+            rerank_metrics_callback=rerank_metrics_callback,
+        ),
+        search_cache=search_cache,
+        query_embedding=query_embedding,
+        signature=signature,
+    )
+
+
+def _cache_search_results(
+    search_results: Iterator[list[InferenceChunk] | list[bool]],
+    search_cache: SemanticSearchCache,
+    query_embedding: list[float],
+    signature: str,
+) -> Iterator[list[InferenceChunk] | list[bool]]:
+    top_chunks = cast(list[InferenceChunk], next(search_results))
+    yield top_chunks
+    llm_chunk_selection = cast(list[bool], next(search_results))
+    yield llm_chunk_selection
+
+    # Empty results are not cached, indexing new documents would not invalidate them
+    if top_chunks:
+        search_cache.set(query_embedding, signature, top_chunks, llm_chunk_selection)
+
+
+def _full_chunk_search_generator(
+    search_query: SearchQuery,
+    document_index: DocumentIndex,
+    hybrid_alpha: float,
+    multilingual_expansion_str: str | None,
+    retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None] | None,
+    rerank_metrics_callback: Callable[[RerankMetricsContainer], None] | None,
+    retrieved_chunks: list[InferenceChunk] | None = None,
+) -> Iterator[list[InferenceChunk] | list[bool]]:
+    chunks_yielded = False
+
+    if retrieved_chunks is None:
+        retrieved_chunks = retrieve_chunks(
+            query=search_query,
+            document_index=document_index,
+            hybrid_alpha=hybrid_alpha,
+            multilingual_expansion_str=multilingual_expansion_str,
+            retrieval_metrics_callback=retrieval_metrics_callback,
+        )
 
     if not retrieved_chunks:
         yield cast(list[InferenceChunk], [])
@@ -576,6 +854,138 @@ def full_chunk_search_generator(
         yield [False for _ in reranked_chunks or retrieved_chunks]
 
 
+async def afull_chunk_search_generator(
+    search_query: SearchQuery,
+    document_index: DocumentIndex,
+    hybrid_alpha: float = HYBRID_ALPHA,  # Only applicable to hybrid search
+    multilingual_expansion_str: str | None = MULTILINGUAL_QUERY_EXPANSION,
+    retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None]
+    | None = None,
+    rerank_metrics_callback: Callable[[RerankMetricsContainer], None] | None = None,
+    retrieved_chunks: list[InferenceChunk] | None = None,
+) -> AsyncGenerator[list[InferenceChunk] | list[bool], None]:
+    """Same as full_chunk_search_generator but the index and model server calls don't
+    block the event loop. The reranked chunks are yielded as soon as they are ready,
+    without waiting for the LLM relevance filter."""
+    search_cache = _get_semantic_search_cache()
+    if (
+        search_cache is None
+        or retrieved_chunks is not None
+        or search_query.search_type == SearchType.KEYWORD
+    ):
+        search_results = _afull_chunk_search_generator(
+            search_query=search_query,
+            document_index=document_index,
+            hybrid_alpha=hybrid_alpha,
+            multilingual_expansion_str=multilingual_expansion_str,
+            retrieval_metrics_callback=retrieval_metrics_callback,
+            rerank_metrics_callback=rerank_metrics_callback,
+            retrieved_chunks=retrieved_chunks,
+        )
+        try:
+            async for search_result in search_results:
+                yield search_result
+        finally:
+            await search_results.aclose()
+        return
+
+    query_embedding = await aembed_query(search_query.query)
+    signature = search_signature(
+        search_query,
+        hybrid_alpha=hybrid_alpha,
+        multilingual_expansion_str=multilingual_expansion_str,
+    )
+    cached_search = search_cache.get(query_embedding, signature)
+    if cached_search is not None:
+        logger.info("Semantic search cache hit")
+        cached_chunks, cached_llm_chunk_selection = cached_search
+        yield cached_chunks
+        yield cached_llm_chunk_selection
+        return
+
+    search_results = _afull_chunk_search_generator(
+        search_query=search_query,
+        document_index=document_index,
+        hybrid_alpha=hybrid_alpha,
+        multilingual_expansion_str=multilingual_expansion_str,
+        retrieval_metrics_callback=retrieval_metrics_callback,
+        rerank_metrics_callback=rerank_metrics_callback,
+    )
+    try:
+        top_chunks = cast(list[InferenceChunk], await anext(search_results))
+        yield top_chunks
+        llm_chunk_selection = cast(list[bool], await anext(search_results))
+        yield llm_chunk_selection
+    finally:
+        # Cancels the reranking and LLM filter tasks if the consumer stops early
+        await search_results.aclose()
+
+    if top_chunks:
+        search_cache.set(query_embedding, signature, top_chunks, llm_chunk_selection)
+
+
+async def _afull_chunk_search_generator(
+    search_query: SearchQuery,
+    document_index: DocumentIndex,
+    hybrid_alpha: float,
+    multilingual_expansion_str: str | None,
+    retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None] | None,
+    rerank_metrics_callback: Callable[[RerankMetricsContainer], None] | None,
+    retrieved_chunks: list[InferenceChunk] | None = None,
+) -> AsyncGenerator[list[InferenceChunk] | list[bool], None]:
+    if retrieved_chunks is None:
+        retrieved_chunks = await aretrieve_chunks(
+            query=search_query,
+            document_index=document_index,
+            hybrid_alpha=hybrid_alpha,
+            multilingual_expansion_str=multilingual_expansion_str,
+            retrieval_metrics_callback=retrieval_metrics_callback,
+        )
+
+    if not retrieved_chunks:
+        yield cast(list[InferenceChunk], [])
+        yield cast(list[bool], [])
+        return
+
+    rerank_task = (
+        asyncio.create_task(
+            arerank_chunks(search_query, retrieved_chunks, rerank_metrics_callback)
+        )
+        if should_rerank(search_query)
+        else None
+    )
+    # The LLM relevance filter is made of blocking LLM calls
+    llm_filter_task = (
+        asyncio.create_task(
+            asyncio.to_thread(
+                filter_chunks,
+                search_query,
+                retrieved_chunks[: search_query.max_llm_filter_chunks],
+            )
+        )
+        if should_apply_llm_based_relevance_filter(search_query)
+        else None
+    )
+
+    try:
+        final_chunks = retrieved_chunks
+        if rerank_task is not None:
+            final_chunks = await rerank_task
+        _log_top_chunk_links(search_query.search_type.value, final_chunks)
+        yield final_chunks
+
+        if llm_filter_task is not None:
+            llm_chunk_selection = await llm_filter_task
+            yield [chunk.unique_id in llm_chunk_selection for chunk in final_chunks]
+        else:
+            yield [False for _ in final_chunks]
+    finally:
+        # If the consumer stops early, nothing is left running in the background
+        for task in [rerank_task, llm_filter_task]:
+            if task is not None and not task.done():
+                task.cancel()
+
+
 def combine_inference_chunks(inf_chunks: list[InferenceChunk]) -> LlmDoc:
     if not inf_chunks:
         raise ValueError("Cannot combine empty list of chunks")
@@ -583,6 +993,9 @@ def combine_inference_chunks(inf_chunks: list[InferenceChunk]) -> LlmDoc:
     # Use the first link of the document
     first_chunk = inf_chunks[0]
     chunk_texts = [chunk.content for chunk in inf_chunks]
+    chunk_token_counts = [
+        chunk.token_count for chunk in inf_chunks if chunk.token_count is not None
+    ]
     return LlmDoc(
         document_id=first_chunk.document_id,
         content="\n".join(chunk_texts),
@@ -590,6 +1003,10 @@ def combine_inference_chunks(inf_chunks: list[InferenceChunk]) -> LlmDoc:
         source_type=first_chunk.source_type,
         updated_at=first_chunk.updated_at,
         link=first_chunk.source_links[0] if first_chunk.source_links else None,
+        # Plus one token per newline joining the chunks
+        token_count=sum(chunk_token_counts) + len(inf_chunks) - 1
+        if len(chunk_token_counts) == len(inf_chunks)
+        else None,
     )
 
 
@@ -603,16 +1020,31 @@ def inference_documents_from_ids(
     # No need for ACL here because the doc ids were validated beforehand
     filters = IndexFilters(access_control_list=None)
 
-    functions_with_args: list[tuple[Callable, tuple]] = [
-        (document_index.id_based_retrieval, (doc_id, None, filters))
-        for doc_id in doc_ids_set
-    ]
+    documents_chunks = document_index.multi_id_based_retrieval(
+        list(doc_ids_set), filters
+    )
+
+    # Documents that failed to be retrieved come back empty
+    inference_chunks_sets = [chunks for chunks in documents_chunks if chunks]
+
+    return [combine_inference_chunks(chunk_set) for chunk_set in inference_chunks_sets]
+
+
+async def ainference_documents_from_ids(
+    doc_identifiers: list[tuple[str, int]],
+    document_index: DocumentIndex,
+) -> list[LlmDoc]:
+    # Currently only fetches whole docs
+    doc_ids_set = set(doc_id for doc_id, chunk_id in doc_identifiers)
+
+    # No need for ACL here because the doc ids were validated beforehand
+    filters = IndexFilters(access_control_list=None)
 
-    parallel_results = run_functions_tuples_in_parallel(
-        functions_with_args, allow_failures=True
+    documents_chunks = await document_index.amulti_id_based_retrieval(
+        list(doc_ids_set), filters
     )
 
-    # Any failures to retrieve would give a None, drop the Nones and empty lists
-    inference_chunks_sets = [res for res in parallel_results if res]
+    # Same as the blocking version, failures to retrieve are dropped
+    inference_chunks_sets = [chunks for chunks in documents_chunks if chunks]
 
     return [combine_inference_chunks(chunk_set) for chunk_set in inference_chunks_sets]
@@ -0,0 +1,257 @@
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+from payserai.indexing.models import InferenceChunk
+from payserai.search.models import SearchQuery
+from payserai.utils.cache import CacheStats
+from payserai.utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+@dataclass
+class _CachedSearch:
+    signature: str
+    embedding: np.ndarray
+    chunks: list[InferenceChunk]
+    llm_chunk_selection: list[bool]
+    document_ids: set[str]
+    expires_at: float
+
+
+def search_signature(search_query: SearchQuery, **search_settings: object) -> str:
+    """Everything apart from the query text that decides which chunks a search returns.
+    Only searches with the same signature may share results."""
+    filters = search_query.filters
+    time_cutoff = filters.time_cutoff
+    signature: dict[str, object] = {
+        "access_control_list": sorted(filters.access_control_list)
+        if filters.access_control_list is not None
+        else None,
+        "source_type": sorted(filters.source_type)
+        if filters.source_type is not None
+        else None,
+        "document_set": sorted(filters.document_set)
+        if filters.document_set is not None
+        else None,
+        "tags": sorted((tag.tag_key, tag.tag_value) for tag in filters.tags or []),
+        # Extracted time filters are relative to now, they would otherwise never repeat
+        "time_cutoff": time_cutoff.replace(minute=0, second=0, microsecond=0)
+        if time_cutoff is not None
+        else None,
+        **search_query.dict(exclude={"query", "filters"}),
+        **search_settings,
+    }
+    return json.dumps(signature, sort_keys=True, default=str)
+
+
+class SemanticSearchCache:
+    """Search results keyed by the search signature plus the query embedding. A lookup is
+    a hit if a cached search with the same signature has a query embedding with a cosine
+    similarity of at least similarity_threshold, so rephrasings of a question share results.
+
+    Cached results are dropped once any of their documents changes in the document index,
+    the changes are pulled with fetch_invalidations every invalidation_poll_secs by a
+    background thread (see start_polling), so lookups never wait on it. It takes the
+    cursor returned by the previous poll (None at first) and returns the next cursor with
+    the changed document ids."""
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_secs: float,
+        similarity_threshold: float,
+        fetch_invalidations: Callable[[Any], tuple[Any, set[str]]] | None = None,
+        invalidation_poll_secs: float = 5.0,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl_secs = ttl_secs
+        self.similarity_threshold = similarity_threshold
+        self.fetch_invalidations = fetch_invalidations
+        self.invalidation_poll_secs = invalidation_poll_secs
+
+        self._entries: OrderedDict[int, _CachedSearch] = OrderedDict()
+        self._entry_ids_by_signature: dict[str, list[int]] = {}
+        self._entry_ids_by_document: dict[str, set[int]] = {}
+        # Stacked query embeddings per signature, rebuilt after the entries change
+        self._embedding_matrices: dict[str, np.ndarray] = {}
+        self._next_entry_id = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        self._poll_lock = threading.Lock()
+        self._last_poll: float | None = None
+        self._invalidation_cursor: Any = None
+        self._poll_thread: threading.Thread | None = None
+        self._stop_polling = threading.Event()
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+
+        self._entry_ids_by_signature[entry.signature].remove(entry_id)
+        if not self._entry_ids_by_signature[entry.signature]:
+            del self._entry_ids_by_signature[entry.signature]
+        self._embedding_matrices.pop(entry.signature, None)
+
+        for document_id in entry.document_ids:
+            document_entry_ids = self._entry_ids_by_document[document_id]
+            document_entry_ids.discard(entry_id)
+            if not document_entry_ids:
+                del self._entry_ids_by_document[document_id]
+
+    def poll_invalidations(self) -> None:
+        if self.fetch_invalidations is None:
+            return
+
+        with self._poll_lock:
+            now = time.monotonic()
+            try:
+                if (
+                    self._last_poll is not None
+                    and now - self._last_poll > self.ttl_secs
+                ):
+                    # Invalidations this old may already be cleaned up, but every entry
+                    # from before the last poll has expired by now anyway
+                    self.clear()
+                self._last_poll = now
+                self._invalidation_cursor, document_ids = self.fetch_invalidations(
+                    self._invalidation_cursor
+                )
+                self.invalidate_documents(document_ids)
+            except Exception as e:
+                logger.warning(f"Failed to fetch search cache invalidations: {e}")
+
+    def _poll_loop(self) -> None:
+        while True:
+            self.poll_invalidations()
+            if self._stop_polling.wait(self.invalidation_poll_secs):
+                return
+
+    def start_polling(self) -> None:
+        """Starts the thread pulling the invalidations, the lookups themselves never
+        query for them so that they stay cheap enough to run on an event loop"""
+        if self.fetch_invalidations is None or self._poll_thread is not None:
+            return
+
+        self._stop_polling.clear()
+        self._poll_thread = threading.Thread(
+            target=self._poll_loop, name="search-cache-invalidations", daemon=True
+        )
+        self._poll_thread.start()
+
+    def stop_polling(self) -> None:
+        self._stop_polling.set()
+        if self._poll_thread is not None:
+            self._poll_thread.join()
+            self._poll_thread = None
+
+    def get(
+        self, query_embedding: list[float], signature: str
+    ) -> tuple[list[InferenceChunk], list[bool]] | None:
+        with self._lock:
+            entry = self._closest_entry(_normalize(query_embedding), signature)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            # Chunk scores are updated in place further down the line
+            return [copy.copy(chunk) for chunk in entry.chunks], list(
+                entry.llm_chunk_selection
+            )
+
+    def _closest_entry(
+        self, embedding: np.ndarray, signature: str
+    ) -> _CachedSearch | None:
+        entry_ids = self._entry_ids_by_signature.get(signature)
+        if not entry_ids:
+            return None
+
+        matrix = self._embedding_matrices.get(signature)
+        if matrix is None:
+            matrix = np.stack(
+                [self._entries[entry_id].embedding for entry_id in entry_ids]
+            )
+            self._embedding_matrices[signature] = matrix
+
+        # The number of entries is bounded, an exact search is cheaper than keeping
+        # an approximate index up to date
+        similarities = matrix @ embedding
+        best_ind = int(np.argmax(similarities))
+        if similarities[best_ind] < self.similarity_threshold:
+            return None
+
+        entry_id = entry_ids[best_ind]
+        entry = self._entries[entry_id]
+        if entry.expires_at < time.monotonic():
+            self._remove(entry_id)
+            return None
+
+        self._entries.move_to_end(entry_id)
+        return entry
+
+    def invalidate_documents(self, document_ids: set[str]) -> None:
+        with self._lock:
+            for document_id in document_ids:
+                for entry_id in list(self._entry_ids_by_document.get(document_id, [])):
+                    self._remove(entry_id)
+
+    def set(
+        self,
+        query_embedding: list[float],
+        signature: str,
+        chunks: list[InferenceChunk],
+        llm_chunk_selection: list[bool],
+    ) -> None:
+        entry = _CachedSearch(
+            signature=signature,
+            embedding=_normalize(query_embedding),
+            chunks=[copy.copy(chunk) for chunk in chunks],
+            llm_chunk_selection=list(llm_chunk_selection),
+            document_ids={chunk.document_id for chunk in chunks},
+            expires_at=time.monotonic() + self.ttl_secs,
+        )
+
+        with self._lock:
+            entry_id = self._next_entry_id
+            self._next_entry_id += 1
+
+            self._entries[entry_id] = entry
+            self._entry_ids_by_signature.setdefault(signature, []).append(entry_id)
+            self._embedding_matrices.pop(signature, None)
+            for document_id in entry.document_ids:
+                self._entry_ids_by_document.setdefault(document_id, set()).add(entry_id)
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._entry_ids_by_signature.clear()
+            self._entry_ids_by_document.clear()
+            self._embedding_matrices.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(hits=self._hits, misses=self._misses, size=len(self))
+
+
+def _normalize(embedding: list[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
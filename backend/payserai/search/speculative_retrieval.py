@@ -0,0 +1,174 @@
+import asyncio
+from collections.abc import Callable
+
+from sqlalchemy.orm import Session
+
+from payserai.configs.chat_configs import HYBRID_ALPHA
+from payserai.configs.chat_configs import MULTILINGUAL_QUERY_EXPANSION
+from payserai.db.models import Passist
+from payserai.db.models import User
+from payserai.document_index.interfaces import DocumentIndex
+from payserai.indexing.models import InferenceChunk
+from payserai.search.models import RetrievalDetails
+from payserai.search.models import RetrievalMetricsContainer
+from payserai.search.models import SearchQuery
+from payserai.search.request_preprocessing import retrieval_preprocessing
+from payserai.search.search_runner import aretrieve_chunks
+from payserai.search.search_runner import retrieve_chunks
+from payserai.utils.logger import setup_logger
+from payserai.utils.threadpool_concurrency import FunctionCall
+from payserai.utils.threadpool_concurrency import run_function_in_background
+
+logger = setup_logger()
+
+# The retrieved chunks only depend on these, reranking and the LLM chunk filter always run
+# with the final query
+_RETRIEVAL_FIELDS = {
+    "query",
+    "filters",
+    "recency_bias_multiplier",
+    "num_hits",
+    "search_type",
+}
+
+
+def build_speculative_query(
+    query: str,
+    retrieval_details: RetrievalDetails,
+    passist: Passist,
+    user: User | None,
+    db_session: Session,
+    bypass_acl: bool = False,
+) -> SearchQuery:
+    """The search query as it is before the LLM extracted filters are known. This is also
+    the final query whenever the rephrasing and filter extraction don't change anything.
+    """
+    search_query, _, _ = retrieval_preprocessing(
+        query=query,
+        retrieval_details=retrieval_details,
+        passist=passist,
+        user=user,
+        db_session=db_session,
+        bypass_acl=bypass_acl,
+        include_query_intent=False,
+        disable_llm_filter_extraction=True,
+    )
+    return search_query
+
+
+def retrieves_same_chunks(
+    speculative_query: SearchQuery, search_query: SearchQuery
+) -> bool:
+    return speculative_query.dict(include=_RETRIEVAL_FIELDS) == search_query.dict(
+        include=_RETRIEVAL_FIELDS
+    )
+
+
+def _forward_retrieval_metrics(
+    retrieval_metrics: list[RetrievalMetricsContainer],
+    retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None] | None,
+) -> None:
+    if retrieval_metrics_callback is None:
+        return
+    for metrics in retrieval_metrics:
+        retrieval_metrics_callback(metrics)
+
+
+class SpeculativeRetrieval:
+    """Retrieval started in the background on a best guess of the final search query.
+    The chunks are only handed out if the final query retrieves the same way."""
+
+    def __init__(
+        self,
+        speculative_query: SearchQuery,
+        document_index: DocumentIndex,
+        hybrid_alpha: float = HYBRID_ALPHA,
+        multilingual_expansion_str: str | None = MULTILINGUAL_QUERY_EXPANSION,
+    ) -> None:
+        self.speculative_query = speculative_query
+        # Only reported if the speculation is used, otherwise the retrieval is counted twice
+        self._retrieval_metrics: list[RetrievalMetricsContainer] = []
+        self._future = run_function_in_background(
+            FunctionCall(
+                retrieve_chunks,
+                kwargs={
+                    "query": speculative_query,
+                    "document_index": document_index,
+                    "hybrid_alpha": hybrid_alpha,
+                    "multilingual_expansion_str": multilingual_expansion_str,
+                    "retrieval_metrics_callback": self._retrieval_metrics.append,
+                },
+            )
+        )
+
+    def retrieved_chunks(
+        self,
+        search_query: SearchQuery,
+        retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None]
+        | None = None,
+    ) -> list[InferenceChunk] | None:
+        """None means the speculation can't be used and the retrieval has to be issued
+        again with the final query"""
+        if not retrieves_same_chunks(self.speculative_query, search_query):
+            logger.info("Speculative retrieval discarded, the final query differs")
+            # Does nothing if the retrieval already started, it then finishes unobserved
+            self._future.cancel()
+            return None
+
+        try:
+            retrieved_chunks = self._future.result()
+        except Exception as e:
+            logger.exception(f"Speculative retrieval failed, retrying: {e}")
+            return None
+
+        logger.info("Speculative retrieval used")
+        _forward_retrieval_metrics(self._retrieval_metrics, retrieval_metrics_callback)
+        return retrieved_chunks
+
+
+class AsyncSpeculativeRetrieval:
+    """Same as SpeculativeRetrieval for the asyncio flows, the retrieval is a task on the
+    running event loop and is cancelled if it can't be used."""
+
+    def __init__(
+        self,
+        speculative_query: SearchQuery,
+        document_index: DocumentIndex,
+        hybrid_alpha: float = HYBRID_ALPHA,
+        multilingual_expansion_str: str | None = MULTILINGUAL_QUERY_EXPANSION,
+    ) -> None:
+        self.speculative_query = speculative_query
+        self._retrieval_metrics: list[RetrievalMetricsContainer] = []
+        self._task = asyncio.create_task(
+            aretrieve_chunks(
+                query=speculative_query,
+                document_index=document_index,
+                hybrid_alpha=hybrid_alpha,
+                multilingual_expansion_str=multilingual_expansion_str,
+                retrieval_metrics_callback=self._retrieval_metrics.append,
+            )
+        )
+
+    def cancel(self) -> None:
+        self._task.cancel()
+
+    async def retrieved_chunks(
+        self,
+        search_query: SearchQuery,
+        retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None]
+        | None = None,
+    ) -> list[InferenceChunk] | None:
+        if not retrieves_same_chunks(self.speculative_query, search_query):
+            logger.info("Speculative retrieval discarded, the final query differs")
+            self.cancel()
+            return None
+
+        try:
+            retrieved_chunks = await self._task
+        except Exception as e:
+            logger.exception(f"Speculative retrieval failed, retrying: {e}")
+            return None
+
+        logger.info("Speculative retrieval used")
+        _forward_retrieval_metrics(self._retrieval_metrics, retrieval_metrics_callback)
+        return retrieved_chunks
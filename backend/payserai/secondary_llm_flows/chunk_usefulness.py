@@ -1,15 +1,78 @@
+import hashlib
+import re
 from collections.abc import Callable
 
+from payserai.configs.app_configs import DISABLE_GENERATIVE_AI
+from payserai.configs.chat_configs import LLM_CHUNK_FILTER_BATCH_SIZE
+from payserai.configs.chat_configs import LLM_CHUNK_FILTER_CACHE_PATH
+from payserai.configs.chat_configs import LLM_CHUNK_FILTER_CACHE_SIZE
+from payserai.configs.chat_configs import LLM_CHUNK_FILTER_CACHE_TTL_SECS
+from payserai.configs.model_configs import FAST_GEN_AI_MODEL_VERSION
+from payserai.configs.model_configs import GEN_AI_MODEL_PROVIDER
 from payserai.llm.exceptions import GenAIDisabledException
 from payserai.llm.factory import get_default_llm
 from payserai.llm.utils import dict_based_prompt_to_langchain_prompt
+from payserai.prompts.llm_chunk_filter import BATCH_CHUNK_FILTER_PROMPT
+from payserai.prompts.llm_chunk_filter import BATCH_CHUNK_FILTER_SECTION
 from payserai.prompts.llm_chunk_filter import CHUNK_FILTER_PROMPT
 from payserai.prompts.llm_chunk_filter import NONUSEFUL_PAT
+from payserai.utils.cache import register_cache
+from payserai.utils.cache import SqliteCacheBacking
+from payserai.utils.cache import TTLLRUCache
 from payserai.utils.logger import setup_logger
+from payserai.utils.threadpool_concurrency import ExecutorName
 from payserai.utils.threadpool_concurrency import run_functions_tuples_in_parallel
 
 logger = setup_logger()
 
+_VERDICT_LINE_PATTERN = re.compile(
+    r"^\W*(?:section\s*)?(\d+)\W*?[:.)\-]\s*(.+)$", re.IGNORECASE
+)
+
+_CHUNK_VERDICT_CACHE: TTLLRUCache[bool] | None = None
+
+
+def _get_chunk_verdict_cache() -> TTLLRUCache[bool] | None:
+    global _CHUNK_VERDICT_CACHE
+    if _CHUNK_VERDICT_CACHE is None and LLM_CHUNK_FILTER_CACHE_SIZE > 0:
+        _CHUNK_VERDICT_CACHE = TTLLRUCache(
+            max_size=LLM_CHUNK_FILTER_CACHE_SIZE,
+            ttl_secs=LLM_CHUNK_FILTER_CACHE_TTL_SECS,
+            backing=SqliteCacheBacking(
+                LLM_CHUNK_FILTER_CACHE_PATH, table_name="chunk_verdicts"
+            )
+            if LLM_CHUNK_FILTER_CACHE_PATH
+            else None,
+        )
+        register_cache("llm_chunk_verdict", _CHUNK_VERDICT_CACHE)
+    return _CHUNK_VERDICT_CACHE
+
+
+def _chunk_verdict_cache_key(
+    query: str, chunk_content: str, chunk_id: str | None
+) -> str:
+    normalized_query = " ".join(query.split()).lower()
+    content_hash = hashlib.sha256(chunk_content.encode()).hexdigest()
+    return hashlib.sha256(
+        "\x1f".join(
+            [
+                GEN_AI_MODEL_PROVIDER,
+                FAST_GEN_AI_MODEL_VERSION,
+                normalized_query,
+                chunk_id or "",
+                content_hash,
+            ]
+        ).encode()
+    ).hexdigest()
+
+
+def _extract_usefulness(model_output: str) -> bool:
+    """Default useful if the LLM doesn't match pattern exactly
+    This is because it's better to trust the (re)ranking if LLM fails"""
+    if model_output.strip().strip('"').lower() == NONUSEFUL_PAT.lower():
+        return False
+    return True
+
 
 def llm_eval_chunk(query: str, chunk_content: str) -> bool:
     def _get_usefulness_messages() -> list[dict[str, str]]:
@@ -24,13 +87,6 @@ def llm_eval_chunk(query: str, chunk_content: str) -> bool:
 
         return messages
 
-    def _extract_usefulness(model_output: str) -> bool:
-        """Default useful if the LLM doesn't match pattern exactly
-        This is because it's better to trust the (re)ranking if LLM fails"""
-        if model_output.strip().strip('"').lower() == NONUSEFUL_PAT.lower():
-            return False
-        return True
-
     # If Gen AI is disabled, none of the messages are more "useful" than any other
     # All are marked not useful (False) so that the icon for Gen AI likes this answer
     # is not shown for any result
@@ -50,25 +106,134 @@ def llm_eval_chunk(query: str, chunk_content: str) -> bool:
     return _extract_usefulness(model_output)
 
 
-def llm_batch_eval_chunks(
-    query: str, chunk_contents: list[str], use_threads: bool = True
-) -> list[bool]:
-    if use_threads:
+def extract_batch_usefulness(model_output: str, num_chunks: int) -> list[bool]:
+    """Sections without a parsable verdict default to useful, same as for a single chunk"""
+    usefulness = [True] * num_chunks
+    for line in model_output.splitlines():
+        match = _VERDICT_LINE_PATTERN.match(line.strip())
+        if match is None:
+            continue
+        section_ind = int(match.group(1)) - 1
+        if 0 <= section_ind < num_chunks:
+            usefulness[section_ind] = _extract_usefulness(match.group(2).strip("*"))
+    return usefulness
+
+
+def llm_eval_chunks_in_one_prompt(query: str, chunk_contents: list[str]) -> list[bool]:
+    def _get_usefulness_messages() -> list[dict[str, str]]:
+        sections = "\n\n".join(
+            BATCH_CHUNK_FILTER_SECTION.format(
+                section_number=ind + 1, chunk_text=chunk_content
+            )
+            for ind, chunk_content in enumerate(chunk_contents)
+        )
+        messages = [
+            {
+                "role": "user",
+                "content": BATCH_CHUNK_FILTER_PROMPT.format(
+                    sections=sections, user_query=query
+                ),
+            },
+        ]
+
+        return messages
+
+    try:
+        # The output grows with the number of chunks, so the timeout does as well
+        llm = get_default_llm(use_fast_llm=True, timeout=5 + len(chunk_contents))
+    except GenAIDisabledException:
+        return [False] * len(chunk_contents)
+
+    messages = _get_usefulness_messages()
+    filled_llm_prompt = dict_based_prompt_to_langchain_prompt(messages)
+    model_output = llm.invoke(filled_llm_prompt)
+    logger.debug(model_output)
+
+    return extract_batch_usefulness(model_output, len(chunk_contents))
+
+
+def _llm_eval_uncached_chunks(
+    query: str, chunk_contents: list[str], use_threads: bool, batch_size: int
+) -> list[bool | None]:
+    """None for the chunks where the LLM call failed"""
+    if batch_size > 1:
+        content_batches = [
+            chunk_contents[ind : ind + batch_size]
+            for ind in range(0, len(chunk_contents), batch_size)
+        ]
         functions_with_args: list[tuple[Callable, tuple]] = [
+            (llm_eval_chunks_in_one_prompt, (query, content_batch))
+            for content_batch in content_batches
+        ]
+        batch_results = (
+            run_functions_tuples_in_parallel(
+                functions_with_args,
+                allow_failures=True,
+                executor_name=ExecutorName.LLM,
+            )
+            if use_threads
+            else [
+                llm_eval_chunks_in_one_prompt(*args) for _, args in functions_with_args
+            ]
+        )
+        return [
+            verdict
+            for content_batch, batch_result in zip(content_batches, batch_results)
+            for verdict in (batch_result or [None] * len(content_batch))
+        ]
+
+    if use_threads:
+        functions_with_args = [
             (llm_eval_chunk, (query, chunk_content)) for chunk_content in chunk_contents
         ]
 
         logger.debug(
             "Running LLM usefulness eval in parallel (following logging may be out of order)"
         )
-        parallel_results = run_functions_tuples_in_parallel(
-            functions_with_args, allow_failures=True
+        return run_functions_tuples_in_parallel(
+            functions_with_args, allow_failures=True, executor_name=ExecutorName.LLM
         )
 
-        # In case of failure/timeout, don't throw out the chunk
-        return [True if item is None else item for item in parallel_results]
+    return [llm_eval_chunk(query, chunk_content) for chunk_content in chunk_contents]
 
-    else:
-        return [
-            llm_eval_chunk(query, chunk_content) for chunk_content in chunk_contents
-        ]
+
+def llm_batch_eval_chunks(
+    query: str,
+    chunk_contents: list[str],
+    use_threads: bool = True,
+    chunk_ids: list[str] | None = None,
+    batch_size: int = LLM_CHUNK_FILTER_BATCH_SIZE,
+    use_cache: bool = True,
+) -> list[bool]:
+    """With a batch_size above 1, that many chunks are evaluated per LLM call.
+    Verdicts from earlier searches with the same query and chunk are reused."""
+    # Same as for the individual evals, but without caching the placeholder verdicts
+    if DISABLE_GENERATIVE_AI:
+        return [False] * len(chunk_contents)
+
+    cache = _get_chunk_verdict_cache() if use_cache else None
+    cache_keys = [
+        _chunk_verdict_cache_key(
+            query, chunk_content, chunk_ids[ind] if chunk_ids else None
+        )
+        for ind, chunk_content in enumerate(chunk_contents)
+    ]
+
+    verdicts: list[bool | None] = [
+        cache.get(cache_key) if cache is not None else None for cache_key in cache_keys
+    ]
+    uncached_inds = [ind for ind, verdict in enumerate(verdicts) if verdict is None]
+    if uncached_inds:
+        uncached_verdicts = _llm_eval_uncached_chunks(
+            query,
+            [chunk_contents[ind] for ind in uncached_inds],
+            use_threads=use_threads,
+            batch_size=batch_size,
+        )
+        for ind, verdict in zip(uncached_inds, uncached_verdicts):
+            verdicts[ind] = verdict
+            if cache is not None and verdict is not None:
+                cache.set(cache_keys[ind], verdict)
+
+    # In case of failure/timeout, don't throw out the chunk
+    return [True if verdict is None else verdict for verdict in verdicts]
@@ -11,6 +11,7 @@ from payserai.prompts.chat_prompts import HISTORY_QUERY_REPHRASE
 from payserai.prompts.miscellaneous_prompts import LANGUAGE_REPHRASE_PROMPT
 from payserai.utils.logger import setup_logger
 from payserai.utils.text_processing import count_punctuation
+from payserai.utils.threadpool_concurrency import ExecutorName
 from payserai.utils.threadpool_concurrency import run_functions_tuples_in_parallel
 
 logger = setup_logger()
@@ -58,7 +59,9 @@ def multilingual_query_expansion(
             for language in languages
         ]
 
-        query_rephrases = run_functions_tuples_in_parallel(functions_with_args)
+        query_rephrases = run_functions_tuples_in_parallel(
+            functions_with_args, executor_name=ExecutorName.LLM
+        )
         return query_rephrases
 
     else:
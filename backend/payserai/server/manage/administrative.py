@@ -28,9 +28,13 @@ from payserai.llm.utils import test_llm
 from payserai.server.documents.models import ConnectorCredentialPairIdentifier
 from payserai.server.manage.models import BoostDoc
 from payserai.server.manage.models import BoostUpdateRequest
+from payserai.server.manage.models import CacheStatsSnapshot
+from payserai.server.manage.models import ExecutorStatsSnapshot
 from payserai.server.manage.models import HiddenUpdateRequest
 from payserai.server.models import ApiKey
+from payserai.utils.cache import get_all_cache_stats
 from payserai.utils.logger import setup_logger
+from payserai.utils.threadpool_concurrency import get_all_executor_stats
 
 router = APIRouter(prefix="/manage")
 logger = setup_logger()
@@ -96,6 +100,42 @@ def document_hidden_update(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get("/admin/cache-stats")
+def get_cache_stats(
+    _: User | None = Depends(current_admin_user),
+) -> list[CacheStatsSnapshot]:
+    """Hit/miss counters of the in-process caches of this API server worker"""
+    return [
+        CacheStatsSnapshot(
+            name=name,
+            hits=stats.hits,
+            misses=stats.misses,
+            hit_rate=stats.hit_rate,
+            size=stats.size,
+        )
+        for name, stats in get_all_cache_stats().items()
+    ]
+
+
+@router.get("/admin/executor-stats")
+def get_executor_stats(
+    _: User | None = Depends(current_admin_user),
+) -> list[ExecutorStatsSnapshot]:
+    """Load of the shared thread pools of this API server worker"""
+    return [
+        ExecutorStatsSnapshot(
+            name=name,
+            max_workers=stats.max_workers,
+            active=stats.active,
+            queued=stats.queued,
+            completed=stats.completed,
+            avg_wait_secs=stats.avg_wait_secs,
+            max_wait_secs=stats.max_wait_secs,
+        )
+        for name, stats in get_all_executor_stats().items()
+    ]
+
+
 @router.head("/admin/genai-api-key/validate")
 def validate_existing_genai_api_key(
     _: User = Depends(current_admin_user),
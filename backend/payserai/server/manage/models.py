@@ -57,5 +57,19 @@ class HiddenUpdateRequest(BaseModel):
     hidden: bool
 
 
-
-
+class CacheStatsSnapshot(BaseModel):
+    name: str
+    hits: int
+    misses: int
+    hit_rate: float
+    size: int
+
+
+class ExecutorStatsSnapshot(BaseModel):
+    name: str
+    max_workers: int
+    active: int
+    queued: int
+    completed: int
+    avg_wait_secs: float
+    max_wait_secs: float
@@ -2,11 +2,12 @@ from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from payserai.auth.users import current_user
 from payserai.chat.chat_utils import create_chat_chain
-from payserai.chat.process_message import stream_chat_message
+from payserai.chat.process_message import astream_chat_message
 from payserai.db.chat import create_chat_session
 from payserai.db.chat import delete_chat_session
 from payserai.db.chat import get_chat_message
@@ -16,6 +17,7 @@ from payserai.db.chat import get_chat_sessions_by_user
 from payserai.db.chat import set_as_latest_chat_message
 from payserai.db.chat import translate_db_message_to_chat_message_detail
 from payserai.db.chat import update_chat_session
+from payserai.db.engine import get_async_session
 from payserai.db.engine import get_session
 from payserai.db.feedback import create_chat_message_feedback
 from payserai.db.feedback import create_doc_retrieval_feedback
@@ -155,10 +157,10 @@ def delete_chat_session_by_id(
 
 
 @router.post("/send-message")
-def handle_new_chat_message(
+async def handle_new_chat_message(
     chat_message_req: CreateChatMessageRequest,
     user: User | None = Depends(current_user),
-    db_session: Session = Depends(get_session),
+    db_session: AsyncSession = Depends(get_async_session),
 ) -> StreamingResponse:
     """This endpoint is both used for all the following purposes:
     - Sending a new message in the session
@@ -172,7 +174,7 @@ def handle_new_chat_message(
     if not chat_message_req.message and chat_message_req.prompt_id is not None:
         raise HTTPException(status_code=400, detail="Empty chat message is invalid")
 
-    packets = stream_chat_message(
+    packets = astream_chat_message(
         new_msg_req=chat_message_req,
         user=user,
         db_session=db_session,
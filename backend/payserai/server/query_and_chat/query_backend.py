@@ -2,18 +2,21 @@ from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from payserai.auth.users import current_admin_user
 from payserai.auth.users import current_user
 from payserai.configs.chat_configs import DISABLE_LLM_CHUNK_FILTER
 from payserai.configs.constants import DocumentSource
+from payserai.db.engine import get_async_session
 from payserai.db.engine import get_session
 from payserai.db.models import User
 from payserai.db.tag import get_tags_by_value_prefix_for_source_types
 from payserai.document_index.factory import get_default_document_index
+from payserai.document_index.local.index import LocalIndex
 from payserai.document_index.vespa.index import VespaIndex
-from payserai.one_shot_answer.answer_question import stream_search_answer
+from payserai.one_shot_answer.answer_question import astream_search_answer
 from payserai.one_shot_answer.models import DirectQARequest
 from payserai.search.access_filters import build_access_filters_for_user
 from payserai.search.payserai_helper import recommend_search_flow
@@ -59,10 +62,10 @@ def admin_search(
         access_control_list=user_acl_filters,
     )
     document_index = get_default_document_index()
-    if not isinstance(document_index, VespaIndex):
+    if not isinstance(document_index, (VespaIndex, LocalIndex)):
         raise HTTPException(
             status_code=400,
-            detail="Cannot use admin-search when using a non-Vespa document index",
+            detail="Cannot use admin-search with this document index",
         )
 
     matching_chunks = document_index.admin_retrieval(query=query, filters=final_filters)
@@ -188,14 +191,14 @@ def handle_search_request(
 
 
 @basic_router.post("/stream-answer-with-quote")
-def get_answer_with_quote(
+async def get_answer_with_quote(
     query_request: DirectQARequest,
     user: User = Depends(current_user),
-    db_session: Session = Depends(get_session),
+    db_session: AsyncSession = Depends(get_async_session),
 ) -> StreamingResponse:
     query = query_request.messages[0].message
     logger.info(f"Received query for one shot answer with quotes: {query}")
-    packets = stream_search_answer(
+    packets = astream_search_answer(
         query_req=query_request, user=user, db_session=db_session
     )
     return StreamingResponse(packets, media_type="application/json")
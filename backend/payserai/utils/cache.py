@@ -0,0 +1,261 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from typing import Generic
+from typing import Protocol
+from typing import TypeVar
+
+from payserai.utils.logger import setup_logger
+
+logger = setup_logger()
+
+V = TypeVar("V")
+
+# Eviction from the backing store scans the whole table, no need to run it on every write
+BACKING_EVICTION_INTERVAL_SECS = 10 * 60
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    size: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class SqliteCacheBacking:
+    """Disk backed key/value store so that cached values can be shared between processes
+    on the same host (e.g. multiple API server workers) and survive restarts.
+    Values must be JSON serializable."""
+
+    def __init__(self, db_path: str, table_name: str = "cache") -> None:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self.table_name = table_name
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table_name} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table_name}_created_at "
+                f"ON {self.table_name} (created_at)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(
+        self, keys: list[str], max_age_secs: float | None = None
+    ) -> dict[str, Any]:
+        if not keys:
+            return {}
+
+        results: dict[str, Any] = {}
+        min_created_at = time.time() - max_age_secs if max_age_secs else 0
+        conn = self._connection()
+        # stay well below the sqlite host parameter limit
+        for start_ind in range(0, len(keys), 500):
+            key_batch = keys[start_ind : start_ind + 500]
+            placeholders = ",".join("?" for _ in key_batch)
+            rows = conn.execute(
+                f"SELECT key, value FROM {self.table_name} "
+                f"WHERE key IN ({placeholders}) AND created_at >= ?",
+                (*key_batch, min_created_at),
+            ).fetchall()
+            results.update({key: json.loads(value) for key, value in rows})
+        return results
+
+    def get(self, key: str, max_age_secs: float | None = None) -> Any | None:
+        return self.get_many([key], max_age_secs=max_age_secs).get(key)
+
+    def set_many(self, items: dict[str, Any]) -> None:
+        if not items:
+            return
+
+        now = time.time()
+        with self._connection() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table_name} (key, value, created_at) "
+                "VALUES (?, ?, ?)",
+                [(key, json.dumps(value), now) for key, value in items.items()],
+            )
+
+    def set(self, key: str, value: Any) -> None:
+        self.set_many({key: value})
+
+    def delete(self, key: str) -> None:
+        with self._connection() as conn:
+            conn.execute(f"DELETE FROM {self.table_name} WHERE key = ?", (key,))
+
+    def evict(
+        self, max_entries: int | None = None, max_age_secs: float | None = None
+    ) -> None:
+        """Drops entries older than max_age_secs and then the oldest entries beyond
+        max_entries"""
+        with self._connection() as conn:
+            if max_age_secs:
+                conn.execute(
+                    f"DELETE FROM {self.table_name} WHERE created_at < ?",
+                    (time.time() - max_age_secs,),
+                )
+            if max_entries is not None:
+                conn.execute(
+                    f"DELETE FROM {self.table_name} WHERE key IN ("
+                    f"SELECT key FROM {self.table_name} "
+                    "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (max_entries,),
+                )
+
+    def __len__(self) -> int:
+        return (
+            self._connection()
+            .execute(f"SELECT COUNT(*) FROM {self.table_name}")
+            .fetchone()[0]
+        )
+
+
+class TTLLRUCache(Generic[V]):
+    """Thread-safe in-process LRU cache with optional time based expiry.
+    If a backing store is provided, in-process misses fall through to it and new values
+    are written through to it. The backing store is periodically pruned to the same
+    size and age limits."""
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_secs: float | None = None,
+        backing: SqliteCacheBacking | None = None,
+        eviction_interval_secs: float = BACKING_EVICTION_INTERVAL_SECS,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl_secs = ttl_secs
+        self.backing = backing
+        self.eviction_interval_secs = eviction_interval_secs
+        self._last_evicted_at: float | None = None
+        self._entries: OrderedDict[str, tuple[float | None, V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _expiry(self) -> float | None:
+        return time.monotonic() + self.ttl_secs if self.ttl_secs else None
+
+    def _get_local(self, key: str) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: V) -> None:
+        self._entries[key] = (self._expiry(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> V | None:
+        with self._lock:
+            value = self._get_local(key)
+            if value is not None:
+                self._hits += 1
+                return value
+
+        if self.backing is not None:
+            try:
+                value = self.backing.get(key, max_age_secs=self.ttl_secs)
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to read from cache backing store: {e}")
+                value = None
+
+        with self._lock:
+            if value is None:
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            self._set_local(key, value)
+            return value
+
+    def set(self, key: str, value: V) -> None:
+        with self._lock:
+            self._set_local(key, value)
+
+        if self.backing is not None:
+            try:
+                self.backing.set(key, value)
+                self._maybe_evict_backing()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to write to cache backing store: {e}")
+
+    def _maybe_evict_backing(self) -> None:
+        if self.backing is None:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self._last_evicted_at is not None
+                and now - self._last_evicted_at < self.eviction_interval_secs
+            ):
+                return
+            self._last_evicted_at = now
+
+        self.backing.evict(max_entries=self.max_size, max_age_secs=self.ttl_secs)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+        if self.backing is not None:
+            self.backing.delete(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(hits=self._hits, misses=self._misses, size=len(self))
+
+
+class _ReportsCacheStats(Protocol):
+    def stats(self) -> CacheStats:
+        ...
+
+
+_CACHE_REGISTRY: dict[str, _ReportsCacheStats] = {}
+
+
+def register_cache(name: str, cache: _ReportsCacheStats) -> None:
+    """Named caches are reported by `get_all_cache_stats` for monitoring"""
+    _CACHE_REGISTRY[name] = cache
+
+
+def get_all_cache_stats() -> dict[str, CacheStats]:
+    return {name: cache.stats() for name, cache in _CACHE_REGISTRY.items()}
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+
+from payserai.utils.logger import setup_logger
+
+logger = setup_logger()
+
+try:
+    import h2  # type: ignore # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+@dataclass(frozen=True)
+class HttpClientConfig:
+    pool_size: int = 20
+    timeout_secs: float | None = 60.0
+    # Connection failures and 5xx responses are retried, 4xx responses are returned as is
+    retries: int = 3
+    backoff_secs: float = 0.5
+    http2: bool = True
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+        )
+
+    def use_http2(self) -> bool:
+        # HTTP/2 is only negotiated over TLS, plain http:// falls back to HTTP/1.1 keep-alive
+        return self.http2 and HTTP2_AVAILABLE
+
+
+_SYNC_CLIENTS: dict[str, tuple[int, httpx.Client]] = {}
+_ASYNC_CLIENTS: dict[
+    str, weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]
+] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_shared_http_client(name: str, config: HttpClientConfig) -> httpx.Client:
+    """Process wide keep-alive client, one per name. Clients are recreated after a fork
+    since connections must not be shared between processes."""
+    pid = os.getpid()
+    with _CLIENTS_LOCK:
+        existing = _SYNC_CLIENTS.get(name)
+        if existing is not None and existing[0] == pid:
+            return existing[1]
+
+        client = httpx.Client(
+            http2=config.use_http2(),
+            limits=config.limits(),
+            timeout=config.timeout_secs,
+        )
+        _SYNC_CLIENTS[name] = (pid, client)
+        return client
+
+
+def get_shared_async_http_client(
+    name: str, config: HttpClientConfig
+) -> httpx.AsyncClient:
+    """Async clients are bound to the event loop they are used in, so one is kept per
+    name per running loop"""
+    loop = asyncio.get_running_loop()
+    with _CLIENTS_LOCK:
+        loop_clients = _ASYNC_CLIENTS.setdefault(name, weakref.WeakKeyDictionary())
+        client = loop_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                http2=config.use_http2(),
+                limits=config.limits(),
+                timeout=config.timeout_secs,
+            )
+            loop_clients[loop] = client
+        return client
+
+
+def _retry_delay(config: HttpClientConfig, attempt: int) -> float:
+    # Exponential backoff with jitter so that retrying clients don't move in lockstep
+    return config.backoff_secs * (2**attempt) * random.uniform(0.5, 1.5)
+
+
+def _should_retry(response: httpx.Response) -> bool:
+    return response.status_code >= 500
+
+
+def send_with_retries(
+    client: httpx.Client,
+    config: HttpClientConfig,
+    method: str,
+    url: str,
+    **kwargs: Any,
+) -> httpx.Response:
+    for attempt in range(config.retries + 1):
+        is_last_attempt = attempt == config.retries
+        try:
+            response = client.request(method, url, **kwargs)
+            if not _should_retry(response) or is_last_attempt:
+                return response
+            logger.warning(
+                f"{method} {url} failed with status {response.status_code}, retrying"
+            )
+        except httpx.TransportError as e:
+            if is_last_attempt:
+                raise
+            logger.warning(f"{method} {url} failed with {e!r}, retrying")
+
+        time.sleep(_retry_delay(config, attempt))
+
+    raise RuntimeError("Unreachable")
+
+
+async def asend_with_retries(
+    client: httpx.AsyncClient,
+    config: HttpClientConfig,
+    method: str,
+    url: str,
+    **kwargs: Any,
+) -> httpx.Response:
+    for attempt in range(config.retries + 1):
+        is_last_attempt = attempt == config.retries
+        try:
+            response = await client.request(method, url, **kwargs)
+            if not _should_retry(response) or is_last_attempt:
+                return response
+            logger.warning(
+                f"{method} {url} failed with status {response.status_code}, retrying"
+            )
+        except httpx.TransportError as e:
+            if is_last_attempt:
+                raise
+            logger.warning(f"{method} {url} failed with {e!r}, retrying")
+
+        await asyncio.sleep(_retry_delay(config, attempt))
+
+    raise RuntimeError("Unreachable")
@@ -1,11 +1,31 @@
+import asyncio
+import contextvars
+import itertools
+import queue
+import threading
+import time
 import uuid
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from collections.abc import Awaitable
 from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
 from concurrent.futures import as_completed
+from concurrent.futures import Future
 from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from dataclasses import replace
+from enum import Enum
+from functools import partial
 from typing import Any
+from typing import cast
 from typing import Generic
 from typing import TypeVar
 
+from payserai.configs.app_configs import LLM_THREADS
+from payserai.configs.app_configs import SEARCH_IO_THREADS
+from payserai.configs.app_configs import VESPA_WRITE_THREADS
 from payserai.utils.logger import setup_logger
 
 logger = setup_logger()
@@ -13,10 +33,150 @@ logger = setup_logger()
 R = TypeVar("R")
 
 
+class ExecutorName(str, Enum):
+    SEARCH_IO = "search_io"
+    LLM = "llm"
+    VESPA_WRITE = "vespa_write"
+
+
+_EXECUTOR_SIZES = {
+    ExecutorName.SEARCH_IO: SEARCH_IO_THREADS,
+    ExecutorName.LLM: LLM_THREADS,
+    ExecutorName.VESPA_WRITE: VESPA_WRITE_THREADS,
+}
+
+
+@dataclass
+class ExecutorStats:
+    max_workers: int
+    active: int = 0
+    # Submitted but not picked up by a worker thread yet
+    queued: int = 0
+    completed: int = 0
+    total_wait_secs: float = 0.0
+    max_wait_secs: float = 0.0
+
+    @property
+    def avg_wait_secs(self) -> float:
+        started = self.active + self.completed
+        return self.total_wait_secs / started if started else 0.0
+
+
+class SharedExecutor:
+    """Process wide thread pool which keeps track of its queue depth and of how long the
+    submitted work waits for a thread. The caller's contextvars are carried over to the
+    worker thread."""
+
+    def __init__(self, name: str, max_workers: int) -> None:
+        self.name = name
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        self._stats = ExecutorStats(max_workers=max_workers)
+        self._lock = threading.Lock()
+
+    def _started(self, submitted_at: float) -> None:
+        wait_secs = time.monotonic() - submitted_at
+        with self._lock:
+            self._stats.queued -= 1
+            self._stats.active += 1
+            self._stats.total_wait_secs += wait_secs
+            self._stats.max_wait_secs = max(self._stats.max_wait_secs, wait_secs)
+
+    def _finished(self) -> None:
+        with self._lock:
+            self._stats.active -= 1
+            self._stats.completed += 1
+
+    def submit(self, func: Callable[..., R], *args: Any, **kwargs: Any) -> Future[R]:
+        context = contextvars.copy_context()
+        submitted_at = time.monotonic()
+
+        def _run() -> R:
+            self._started(submitted_at)
+            try:
+                return context.run(func, *args, **kwargs)
+            finally:
+                self._finished()
+
+        with self._lock:
+            self._stats.queued += 1
+        future = self._executor.submit(_run)
+
+        def _on_done(done_future: Future[R]) -> None:
+            if done_future.cancelled():
+                with self._lock:
+                    self._stats.queued -= 1
+
+        future.add_done_callback(_on_done)
+        return future
+
+    def stats(self) -> ExecutorStats:
+        with self._lock:
+            return replace(self._stats)
+
+
+_EXECUTORS: dict[ExecutorName, SharedExecutor] = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def get_executor(name: ExecutorName) -> SharedExecutor:
+    with _EXECUTORS_LOCK:
+        if name not in _EXECUTORS:
+            _EXECUTORS[name] = SharedExecutor(name.value, _EXECUTOR_SIZES[name])
+        return _EXECUTORS[name]
+
+
+def get_all_executor_stats() -> dict[str, ExecutorStats]:
+    with _EXECUTORS_LOCK:
+        executors = list(_EXECUTORS.values())
+    return {executor.name: executor.stats() for executor in executors}
+
+
+def _run_calls_on_executor(
+    calls: list[Callable[[], Any]],
+    executor_name: ExecutorName,
+    max_workers: int | None,
+    stop_on_failure: bool,
+) -> list[Future]:
+    """The calls are picked up one by one by helper jobs on the shared executor and by the
+    calling thread itself. So the calls always make progress, even if the executor is
+    saturated or if this is called from one of its own threads."""
+    futures: list[Future] = [Future() for _ in calls]
+    # Each call gets its own copy of the caller's context
+    contexts = [contextvars.copy_context() for _ in calls]
+    next_ind = itertools.count()
+    failed = threading.Event()
+
+    def _drain() -> None:
+        # next() on itertools.count is atomic, every call is claimed exactly once
+        while (ind := next(next_ind)) < len(calls):
+            future = futures[ind]
+            if failed.is_set():
+                future.cancel()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(contexts[ind].run(calls[ind]))
+            except BaseException as e:
+                if stop_on_failure:
+                    failed.set()
+                future.set_exception(e)
+
+    num_helpers = min(max_workers or len(calls), len(calls)) - 1
+    executor = get_executor(executor_name)
+    for _ in range(num_helpers):
+        executor.submit(_drain)
+    _drain()
+
+    return futures
+
+
 def run_functions_tuples_in_parallel(
     functions_with_args: list[tuple[Callable, tuple]],
     allow_failures: bool = False,
     max_workers: int | None = None,
+    executor_name: ExecutorName = ExecutorName.SEARCH_IO,
 ) -> list[Any]:
     """
     Executes multiple functions in parallel and returns a list of the results for each function.
@@ -24,40 +184,37 @@ def run_functions_tuples_in_parallel(
     Args:
         functions_with_args: List of tuples each containing the function callable and a tuple of arguments.
         allow_failures: if set to True, then the function result will just be None
-        max_workers: Max number of worker threads
+        max_workers: Max number of functions running at once, including the calling thread
+        executor_name: Shared thread pool to run on, see ExecutorName
 
     Returns:
-        dict: A dictionary mapping function names to their results or error messages.
+        list: The results in the same order as the functions.
     """
-    workers = (
-        min(max_workers, len(functions_with_args))
-        if max_workers is not None
-        else len(functions_with_args)
-    )
-
-    if workers <= 0:
+    if not functions_with_args or (max_workers is not None and max_workers <= 0):
         return []
 
-    results = []
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        future_to_index = {
-            executor.submit(func, *args): i
-            for i, (func, args) in enumerate(functions_with_args)
-        }
+    futures = _run_calls_on_executor(
+        [partial(func, *args) for func, args in functions_with_args],
+        executor_name=executor_name,
+        max_workers=max_workers,
+        stop_on_failure=not allow_failures,
+    )
 
-        for future in as_completed(future_to_index):
-            index = future_to_index[future]
-            try:
-                results.append((index, future.result()))
-            except Exception as e:
-                logger.exception(f"Function at index {index} failed due to {e}")
-                results.append((index, None))
+    results: list[Any] = [None] * len(futures)
+    future_to_index = {future: ind for ind, future in enumerate(futures)}
+    for future in as_completed(future_to_index):
+        index = future_to_index[future]
+        if future.cancelled():
+            continue
+        try:
+            results[index] = future.result()
+        except Exception as e:
+            logger.exception(f"Function at index {index} failed due to {e}")
 
-                if not allow_failures:
-                    raise
+            if not allow_failures:
+                raise
 
-    results.sort(key=lambda x: x[0])
-    return [result for index, result in results]
+    return results
 
 
 class FunctionCall(Generic[R]):
@@ -81,27 +238,225 @@ class FunctionCall(Generic[R]):
 def run_functions_in_parallel(
     function_calls: list[FunctionCall],
     allow_failures: bool = False,
+    executor_name: ExecutorName = ExecutorName.SEARCH_IO,
 ) -> dict[str, Any]:
     """
     Executes a list of FunctionCalls in parallel and stores the results in a dictionary where the keys
     are the result_id of the FunctionCall and the values are the results of the call.
     """
+    if not function_calls:
+        return {}
+
+    futures = _run_calls_on_executor(
+        [func_call.execute for func_call in function_calls],
+        executor_name=executor_name,
+        max_workers=None,
+        stop_on_failure=not allow_failures,
+    )
+
     results = {}
-    with ThreadPoolExecutor(max_workers=len(function_calls)) as executor:
-        future_to_id = {
-            executor.submit(func_call.execute): func_call.result_id
-            for func_call in function_calls
-        }
-
-        for future in as_completed(future_to_id):
-            result_id = future_to_id[future]
-            try:
-                results[result_id] = future.result()
-            except Exception as e:
-                logger.exception(f"Function with ID {result_id} failed due to {e}")
-                results[result_id] = None
+    future_to_id = {
+        future: func_call.result_id
+        for future, func_call in zip(futures, function_calls)
+    }
+    for future in as_completed(future_to_id):
+        result_id = future_to_id[future]
+        if future.cancelled():
+            continue
+        try:
+            results[result_id] = future.result()
+        except Exception as e:
+            logger.exception(f"Function with ID {result_id} failed due to {e}")
+            results[result_id] = None
 
-                if not allow_failures:
-                    raise
+            if not allow_failures:
+                raise
 
     return results
+
+
+def run_function_in_background(
+    func_call: FunctionCall[R], executor_name: ExecutorName = ExecutorName.SEARCH_IO
+) -> Future[R]:
+    """Starts the FunctionCall on a shared executor without waiting on it. The caller may
+    drop the result, the call then finishes on its own."""
+    return get_executor(executor_name).submit(func_call.execute)
+
+
+async def gather_with_limit(
+    awaitables: list[Awaitable[R]],
+    max_in_flight: int | None = None,
+    return_exceptions: bool = False,
+) -> list[Any]:
+    """Same as asyncio.gather, but with at most max_in_flight of the awaitables running
+    at once"""
+    if max_in_flight is None:
+        return list(
+            await asyncio.gather(*awaitables, return_exceptions=return_exceptions)
+        )
+
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def _run_limited(awaitable: Awaitable[R]) -> R:
+        async with semaphore:
+            return await awaitable
+
+    return list(
+        await asyncio.gather(
+            *[_run_limited(awaitable) for awaitable in awaitables],
+            return_exceptions=return_exceptions,
+        )
+    )
+
+
+# Marks the end of an iterator being consumed from a worker thread
+_ITERATION_END = object()
+
+
+async def aiterate_in_thread(iterator: Iterator[R]) -> AsyncIterator[R]:
+    """Consumes a blocking iterator from the event loop, every item is pulled in the
+    default executor so that waiting on it doesn't block other tasks"""
+    while True:
+        item = await asyncio.to_thread(lambda: next(iterator, _ITERATION_END))
+        if item is _ITERATION_END:
+            return
+        yield cast(R, item)
+
+
+class _PipelineFailure:
+    def __init__(self, stage_name: str, error: Exception) -> None:
+        self.stage_name = stage_name
+        self.error = error
+
+
+# Marks the end of the items flowing through the pipeline
+_PIPELINE_END = object()
+_PIPELINE_POLL_INTERVAL = 0.1
+
+
+def _put_unless_stopped(
+    target_queue: queue.Queue, item: Any, stop_event: threading.Event
+) -> bool:
+    while not stop_event.is_set():
+        try:
+            target_queue.put(item, timeout=_PIPELINE_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _run_pipeline_stage(
+    stage_name: str,
+    func: Callable[[Any], Any],
+    in_queue: queue.Queue,
+    out_queue: queue.Queue,
+    busy_secs: dict[str, float],
+    failed_event: threading.Event,
+    stop_event: threading.Event,
+) -> None:
+    failed = False
+    while not stop_event.is_set():
+        try:
+            item = in_queue.get(timeout=_PIPELINE_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+
+        if item is _PIPELINE_END:
+            _put_unless_stopped(out_queue, item, stop_event)
+            return
+
+        # After a failure, keep draining the input so that earlier stages don't block
+        if failed:
+            continue
+
+        if isinstance(item, _PipelineFailure):
+            failed = True
+            _put_unless_stopped(out_queue, item, stop_event)
+            continue
+
+        start_time = time.monotonic()
+        try:
+            result = func(item)
+        except Exception as e:
+            logger.exception(f"Pipeline stage '{stage_name}' failed due to {e}")
+            failed = True
+            failed_event.set()
+            result = _PipelineFailure(stage_name, e)
+        finally:
+            busy_secs[stage_name] += time.monotonic() - start_time
+
+        _put_unless_stopped(out_queue, result, stop_event)
+
+
+def run_in_pipelined_stages(
+    items: Iterable[Any],
+    stages: list[tuple[str, Callable[[Any], Any]]],
+    max_queue_size: int = 2,
+) -> Iterator[Any]:
+    """
+    Passes every item through the (name, function) stages in order. Each stage runs in
+    its own thread so that different stages work on different items at the same time,
+    with at most `max_queue_size` items waiting in front of each stage.
+
+    Items are pulled from `items` and the results are yielded in the calling thread, in
+    the same order as the items. If a stage fails, results of the items ahead of the
+    failing one are still yielded before the error is raised.
+    """
+    stop_event = threading.Event()
+    failed_event = threading.Event()
+    # The output queue is unbounded, the caller is the one consuming it
+    queues: list[queue.Queue] = [
+        queue.Queue(maxsize=max_queue_size) for _ in range(len(stages))
+    ] + [queue.Queue()]
+    busy_secs: dict[str, float] = defaultdict(float)
+
+    for ind, (stage_name, func) in enumerate(stages):
+        threading.Thread(
+            target=_run_pipeline_stage,
+            args=(
+                stage_name,
+                func,
+                queues[ind],
+                queues[ind + 1],
+                busy_secs,
+                failed_event,
+                stop_event,
+            ),
+            name=f"pipeline-{stage_name}",
+            daemon=True,
+        ).start()
+
+    def _unwrap(result: Any) -> Any:
+        if isinstance(result, _PipelineFailure):
+            raise result.error
+        return result
+
+    start_time = time.monotonic()
+    num_items = 0
+    try:
+        for item in items:
+            if failed_event.is_set():
+                break
+            _put_unless_stopped(queues[0], item, stop_event)
+            num_items += 1
+
+            while True:
+                try:
+                    result = queues[-1].get_nowait()
+                except queue.Empty:
+                    break
+                yield _unwrap(result)
+
+        _put_unless_stopped(queues[0], _PIPELINE_END, stop_event)
+        while (result := queues[-1].get()) is not _PIPELINE_END:
+            yield _unwrap(result)
+    finally:
+        stop_event.set()
+        stage_times = ", ".join(
+            f"{stage_name}: {busy_secs[stage_name]:.2f}s" for stage_name, _ in stages
+        )
+        logger.info(
+            f"Pipeline processed {num_items} items in "
+            f"{time.monotonic() - start_time:.2f}s, busy time per stage: {stage_times}"
+        )
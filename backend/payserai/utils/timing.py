@@ -1,4 +1,6 @@
+import inspect
 import time
+from collections.abc import AsyncIterator
 from collections.abc import Callable
 from collections.abc import Generator
 from collections.abc import Iterator
@@ -14,27 +16,44 @@ from payserai.utils.telemetry import RecordType
 logger = setup_logger()
 
 F = TypeVar("F", bound=Callable)
-FG = TypeVar("FG", bound=Callable[..., Generator | Iterator])
+FG = TypeVar("FG", bound=Callable[..., Generator | Iterator | AsyncIterator])
+
+
+def _log_elapsed_time(log_name: str, start_time: float, print_only: bool) -> None:
+    elapsed_time_str = str(time.time() - start_time)
+    logger.info(f"{log_name} took {elapsed_time_str} seconds")
+
+    if not print_only:
+        optional_telemetry(
+            record_type=RecordType.LATENCY,
+            data={"function": log_name, "latency": str(elapsed_time_str)},
+        )
 
 
 def log_function_time(
     func_name: str | None = None, print_only: bool = False
 ) -> Callable[[F], F]:
+    """Also works for coroutine functions, the time until the result is awaited"""
+
     def decorator(func: F) -> F:
+        log_name = func_name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapped_func(*args: Any, **kwargs: Any) -> Any:
+                start_time = time.time()
+                result = await func(*args, **kwargs)
+                _log_elapsed_time(log_name, start_time, print_only)
+                return result
+
+            return cast(F, async_wrapped_func)
+
         @wraps(func)
         def wrapped_func(*args: Any, **kwargs: Any) -> Any:
             start_time = time.time()
             result = func(*args, **kwargs)
-            elapsed_time_str = str(time.time() - start_time)
-            log_name = func_name or func.__name__
-            logger.info(f"{log_name} took {elapsed_time_str} seconds")
-
-            if not print_only:
-                optional_telemetry(
-                    record_type=RecordType.LATENCY,
-                    data={"function": log_name, "latency": str(elapsed_time_str)},
-                )
-
+            _log_elapsed_time(log_name, start_time, print_only)
             return result
 
         return cast(F, wrapped_func)
@@ -45,11 +64,28 @@ def log_function_time(
 def log_generator_function_time(
     func_name: str | None = None, print_only: bool = False
 ) -> Callable[[FG], FG]:
+    """Also works for async generator functions"""
+
     def decorator(func: FG) -> FG:
+        log_name = func_name or func.__name__
+
+        if inspect.isasyncgenfunction(func):
+
+            @wraps(func)
+            async def async_wrapped_func(*args: Any, **kwargs: Any) -> Any:
+                start_time = time.time()
+                try:
+                    async for value in cast(AsyncIterator, func(*args, **kwargs)):
+                        yield value
+                finally:
+                    _log_elapsed_time(log_name, start_time, print_only)
+
+            return cast(FG, async_wrapped_func)
+
         @wraps(func)
         def wrapped_func(*args: Any, **kwargs: Any) -> Any:
             start_time = time.time()
-            gen = func(*args, **kwargs)
+            gen = cast(Iterator, func(*args, **kwargs))
             try:
                 value = next(gen)
                 while True:
@@ -58,14 +94,7 @@ def log_generator_function_time(
             except StopIteration:
                 pass
             finally:
-                elapsed_time_str = str(time.time() - start_time)
-                log_name = func_name or func.__name__
-                logger.info(f"{log_name} took {elapsed_time_str} seconds")
-                if not print_only:
-                    optional_telemetry(
-                        record_type=RecordType.LATENCY,
-                        data={"function": log_name, "latency": str(elapsed_time_str)},
-                    )
+                _log_elapsed_time(log_name, start_time, print_only)
 
         return cast(FG, wrapped_func)
 
@@ -0,0 +1,99 @@
+# This file is purely for development use, not included in any builds
+# Times chunking of long, many-section documents (think large wiki pages) with the running
+# token count against re-tokenizing the accumulated chunk text for every section, which is
+# how chunk_document used to work, and checks that both produce the same chunks.
+#
+#   python scripts/benchmark_chunking.py --num-docs 5 --sections 2000
+import argparse
+import random
+import time
+from unittest import mock
+
+from payserai.configs.constants import DocumentSource
+from payserai.connectors.models import Document
+from payserai.connectors.models import Section
+from payserai.indexing import chunker
+from payserai.indexing.chunker import chunk_document
+from payserai.indexing.models import DocAwareChunk
+
+WORDS = (
+    "payment transfer account card limit refund policy verification document "
+    "customer support onboarding server deployment approval compliance report "
+    "invoice currency exchange rate settlement merchant identity review"
+).split()
+
+
+def _random_sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(5, 25))]
+    return " ".join(words).capitalize() + "."
+
+
+def _build_document(rng: random.Random, doc_ind: int, num_sections: int) -> Document:
+    sections = []
+    for section_ind in range(num_sections):
+        # Mostly short sections, with the occasional one larger than a chunk
+        num_sentences = rng.randint(1, 8) if rng.random() > 0.02 else 120
+        sections.append(
+            Section(
+                link=f"https://wiki.example.com/page-{doc_ind}#section-{section_ind}",
+                text=" ".join(_random_sentence(rng) for _ in range(num_sentences)),
+            )
+        )
+
+    return Document(
+        id=f"benchmark-doc-{doc_ind}",
+        sections=sections,
+        source=DocumentSource.WEB,
+        semantic_identifier=f"Benchmark page {doc_ind}",
+        metadata={},
+    )
+
+
+def _chunk_all(documents: list[Document]) -> tuple[list[DocAwareChunk], float]:
+    start = time.perf_counter()
+    chunks = [chunk for doc in documents for chunk in chunk_document(doc)]
+    return chunks, time.perf_counter() - start
+
+
+def _chunk_signature(chunk: DocAwareChunk) -> tuple:
+    return (
+        chunk.source_document.id,
+        chunk.chunk_id,
+        chunk.blurb,
+        chunk.content,
+        chunk.source_links,
+        chunk.section_continuation,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-docs", type=int, default=5)
+    parser.add_argument("--sections", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = [
+        _build_document(rng, doc_ind, args.sections) for doc_ind in range(args.num_docs)
+    ]
+
+    # Load the tokenizer outside of the timed sections
+    chunk_document(documents[0])
+
+    with mock.patch.object(chunker, "_is_whitespace_additive", return_value=False):
+        retokenized_chunks, retokenized_time = _chunk_all(documents)
+    incremental_chunks, incremental_time = _chunk_all(documents)
+
+    print(
+        f"{args.num_docs} documents x {args.sections} sections -> "
+        f"{len(incremental_chunks)} chunks"
+    )
+    print(f"Re-tokenizing chunk text per section: {retokenized_time:.2f}s")
+    print(f"Running token count:                  {incremental_time:.2f}s")
+
+    if [_chunk_signature(c) for c in retokenized_chunks] != [
+        _chunk_signature(c) for c in incremental_chunks
+    ]:
+        raise RuntimeError("Chunks differ between the two approaches")
+    print("Chunks are identical")
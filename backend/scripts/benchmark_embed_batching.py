@@ -0,0 +1,126 @@
+# This file is purely for development use, not included in any builds
+# Load generator comparing single-query embedding throughput/latency with and without
+# coalescing of concurrent requests (see model_server/batching.py)
+#
+# In-process (loads the embedding model locally, compares both modes in one run):
+#   python scripts/benchmark_embed_batching.py --concurrency 32 --duration 20
+# Against a running model server (run once with ENABLE_EMBED_REQUEST_BATCHING=true and once without):
+#   python scripts/benchmark_embed_batching.py --url http://localhost:9000
+import argparse
+import random
+import statistics
+import threading
+import time
+from collections.abc import Callable
+
+import requests
+
+from model_server.batching import EmbedRequestBatcher
+from model_server.encoders import embed_text
+
+SAMPLE_QUERIES = [
+    "How do I reset my password?",
+    "What is the refund policy for card payments?",
+    "Where can I find the onboarding checklist for new developers?",
+    "Which documents are required for business account verification?",
+    "How long does an international transfer take?",
+    "Who approves production deployments?",
+    "What are the limits for a personal account?",
+    "How to configure the VPN on a new laptop",
+]
+
+
+def _run_load(
+    embed_func: Callable[[list[str]], list[list[float]]],
+    concurrency: int,
+    duration: float,
+) -> list[float]:
+    latencies: list[float] = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def _worker() -> None:
+        local_latencies = []
+        while time.monotonic() < stop_at:
+            query = random.choice(SAMPLE_QUERIES)
+            start = time.monotonic()
+            embed_func([query])
+            local_latencies.append(time.monotonic() - start)
+        with lock:
+            latencies.extend(local_latencies)
+
+    threads = [threading.Thread(target=_worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return latencies
+
+
+def _report(name: str, latencies: list[float], duration: float) -> None:
+    if not latencies:
+        print(f"{name}: no requests completed")
+        return
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name}: {len(latencies)} requests, "
+        f"QPS {len(latencies) / duration:.1f}, "
+        f"p50 {quantiles[49] * 1000:.1f}ms, "
+        f"p99 {quantiles[98] * 1000:.1f}ms"
+    )
+
+
+def _http_embed_func(url: str) -> Callable[[list[str]], list[list[float]]]:
+    endpoint = url.rstrip("/") + "/encoder/bi-encoder-embed"
+    session = requests.Session()
+
+    def _embed(texts: list[str]) -> list[list[float]]:
+        response = session.post(endpoint, json={"texts": texts})
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    return _embed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument(
+        "--url",
+        type=str,
+        default=None,
+        help="If set, load test a running model server instead of comparing in-process",
+    )
+    args = parser.parse_args()
+
+    if args.url:
+        _report(
+            args.url,
+            _run_load(_http_embed_func(args.url), args.concurrency, args.duration),
+            args.duration,
+        )
+    else:
+        # Warm up so model loading does not count towards the first run
+        embed_text(SAMPLE_QUERIES)
+
+        _report(
+            "Without coalescing",
+            _run_load(embed_text, args.concurrency, args.duration),
+            args.duration,
+        )
+
+        batcher = EmbedRequestBatcher(
+            embed_func=embed_text,
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=args.max_wait_ms,
+        )
+        _report(
+            "With coalescing",
+            _run_load(batcher.embed, args.concurrency, args.duration),
+            args.duration,
+        )
@@ -0,0 +1,163 @@
+# This file is purely for development use, not included in any builds
+# Compares the per-chunk LLM usefulness filter against evaluating several chunks in one
+# prompt: LLM calls and latency per search, and how often the verdicts agree with the
+# per-chunk verdicts. Also shows the calls saved by the verdict cache on repeated queries.
+#
+# Requires the configured fast LLM and an indexed document set, the questions default to the
+# answer quality regression set:
+#   python scripts/benchmark_llm_chunk_filter.py --batch-sizes 1 5 10
+import argparse
+import math
+import statistics
+import time
+
+import yaml
+
+from payserai.configs.chat_configs import NUM_RERANKED_RESULTS
+from payserai.document_index.factory import get_default_document_index
+from payserai.search.models import IndexFilters
+from payserai.search.models import SearchQuery
+from payserai.search.search_runner import full_chunk_search
+from payserai.secondary_llm_flows.chunk_usefulness import _get_chunk_verdict_cache
+from payserai.secondary_llm_flows.chunk_usefulness import llm_batch_eval_chunks
+
+
+def _load_questions(questions_path: str) -> list[str]:
+    with open(questions_path, "r") as file:
+        return [sample["question"] for sample in yaml.safe_load(file)["questions"]]
+
+
+def _retrieve_chunk_contents(
+    questions: list[str], num_chunks: int
+) -> list[tuple[str, list[str], list[str]]]:
+    document_index = get_default_document_index()
+    searches = []
+    for question in questions:
+        top_chunks, _ = full_chunk_search(
+            query=SearchQuery(
+                query=question,
+                filters=IndexFilters(access_control_list=None),
+                recency_bias_multiplier=1.0,
+                skip_llm_chunk_filter=True,
+            ),
+            document_index=document_index,
+        )
+        top_chunks = top_chunks[:num_chunks]
+        searches.append(
+            (
+                question,
+                [chunk.content for chunk in top_chunks],
+                [chunk.unique_id for chunk in top_chunks],
+            )
+        )
+    return searches
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(percentile * len(values)))]
+
+
+def _run_mode(
+    searches: list[tuple[str, list[str], list[str]]], batch_size: int, use_cache: bool
+) -> tuple[list[float], list[list[bool]]]:
+    latencies = []
+    verdicts = []
+    for question, chunk_contents, chunk_ids in searches:
+        start = time.perf_counter()
+        verdicts.append(
+            llm_batch_eval_chunks(
+                query=question,
+                chunk_contents=chunk_contents,
+                chunk_ids=chunk_ids,
+                batch_size=batch_size,
+                use_cache=use_cache,
+            )
+        )
+        latencies.append(time.perf_counter() - start)
+    return latencies, verdicts
+
+
+def _report(
+    label: str,
+    llm_calls: float,
+    latencies: list[float],
+    agreement: float | None,
+    useful_rate: float,
+) -> None:
+    agreement_str = f"{agreement:.1%}" if agreement is not None else "-"
+    print(
+        f"{label:>14} | {llm_calls:>9.1f} | {statistics.median(latencies):>7.2f} | "
+        f"{_percentile(latencies, 0.95):>7.2f} | {agreement_str:>9} | "
+        f"{useful_rate:>6.1%}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--questions",
+        type=str,
+        default="./tests/regression/answer_quality/sample_questions.yaml",
+    )
+    parser.add_argument("--num-chunks", type=int, default=NUM_RERANKED_RESULTS)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 5, 10])
+    args = parser.parse_args()
+
+    searches = _retrieve_chunk_contents(
+        _load_questions(args.questions), args.num_chunks
+    )
+    num_chunks = [len(chunk_contents) for _, chunk_contents, _ in searches]
+
+    print(
+        f"{'mode':>14} | {'calls/qry':>9} | {'p50 (s)':>7} | {'p95 (s)':>7} | "
+        f"{'agreement':>9} | {'useful':>6}"
+    )
+    per_chunk_verdicts: list[bool] | None = None
+    for batch_size in sorted(args.batch_sizes):
+        latencies, verdicts = _run_mode(searches, batch_size, use_cache=False)
+        flat_verdicts = [
+            verdict for verdict_list in verdicts for verdict in verdict_list
+        ]
+        if batch_size == 1:
+            per_chunk_verdicts = flat_verdicts
+        agreement = (
+            sum(a == b for a, b in zip(per_chunk_verdicts, flat_verdicts))
+            / len(flat_verdicts)
+            if per_chunk_verdicts is not None and flat_verdicts
+            else None
+        )
+        _report(
+            f"batch={batch_size}",
+            statistics.mean(math.ceil(n / batch_size) for n in num_chunks),
+            latencies,
+            agreement,
+            sum(flat_verdicts) / max(len(flat_verdicts), 1),
+        )
+
+    cache = _get_chunk_verdict_cache()
+    if cache is None:
+        print("Verdict cache disabled, set LLM_CHUNK_FILTER_CACHE_SIZE to compare")
+    else:
+        # First pass fills the cache, the repeated queries are served from it
+        batch_size = max(args.batch_sizes)
+        for label in ["cold cache", "warm cache"]:
+            latencies = []
+            llm_calls = []
+            flat_verdicts = []
+            for search in searches:
+                misses_before = cache.stats().misses
+                search_latencies, verdicts = _run_mode([search], batch_size, True)
+                # The missed chunks are evaluated in prompts of batch_size chunks
+                llm_calls.append(
+                    math.ceil((cache.stats().misses - misses_before) / batch_size)
+                )
+                latencies.extend(search_latencies)
+                flat_verdicts.extend(verdicts[0])
+            _report(
+                label,
+                statistics.mean(llm_calls),
+                latencies,
+                None,
+                sum(flat_verdicts) / max(len(flat_verdicts), 1),
+            )
@@ -0,0 +1,62 @@
+# This file is purely for development use, not included in any builds
+# Compares serialization time and payload size of the JSON and the binary float32 matrix
+# encodings used between the API server / indexing jobs and the model server
+import argparse
+import json
+import time
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+
+from shared_models.model_server_models import deserialize_float_matrix
+from shared_models.model_server_models import EmbedResponse
+from shared_models.model_server_models import serialize_float_matrix
+
+
+def _time_it(func: Callable[[], Any], repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - start) / repeats
+
+
+def _json_round_trip(embeddings: list[list[float]]) -> tuple[float, float, int]:
+    # Mirrors the current path: FastAPI dumps the pydantic model, the client parses the
+    # JSON and validates it through the pydantic model again
+    payload = EmbedResponse(embeddings=embeddings).json()
+    encode_time = _time_it(lambda: EmbedResponse(embeddings=embeddings).json(), 3)
+    decode_time = _time_it(lambda: EmbedResponse(**json.loads(payload)), 3)
+    return encode_time, decode_time, len(payload.encode())
+
+
+def _binary_round_trip(embeddings: list[list[float]]) -> tuple[float, float, int]:
+    payload = serialize_float_matrix(embeddings)
+    encode_time = _time_it(lambda: serialize_float_matrix(embeddings), 3)
+    decode_time = _time_it(lambda: deserialize_float_matrix(payload), 3)
+    return encode_time, decode_time, len(payload)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 8, 128, 1024, 4096]
+    )
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    print(
+        f"{'batch':>6} {'format':>7} {'bytes':>11} {'encode ms':>10} {'decode ms':>10}"
+    )
+    for batch_size in args.batch_sizes:
+        # Model server returns lists of Python floats from the float32 model outputs
+        embeddings = np.random.rand(batch_size, args.dim).astype(np.float32).tolist()
+        for name, round_trip in (
+            ("json", _json_round_trip),
+            ("binary", _binary_round_trip),
+        ):
+            encode_time, decode_time, num_bytes = round_trip(embeddings)
+            print(
+                f"{batch_size:>6} {name:>7} {num_bytes:>11} "
+                f"{encode_time * 1000:>10.2f} {decode_time * 1000:>10.2f}"
+            )
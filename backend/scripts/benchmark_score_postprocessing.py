@@ -0,0 +1,149 @@
+# This file is purely for development use, not included in any builds
+# Times the array based score post-processing of apply_boost / semantic_reranking against
+# the per-chunk Python implementation they replaced, for growing numbers of candidate
+# chunks, and checks that both produce the same scores and order.
+#
+#   python scripts/benchmark_score_postprocessing.py --sizes 1000 5000 10000
+import argparse
+import random
+import time
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+
+from payserai.document_index.document_index_utils import (
+    translate_boost_count_to_multiplier,
+)
+from payserai.search.scoring import boost_multipliers
+from payserai.search.scoring import boosted_scores
+from payserai.search.scoring import rank_descending
+from payserai.search.scoring import reranked_scores
+
+
+def _per_chunk_boost(
+    scores: list[float],
+    boosts: list[int],
+    recency: list[float],
+    norm_cutoff: int,
+) -> tuple[list[float], list[int]]:
+    multipliers = [translate_boost_count_to_multiplier(boost) for boost in boosts]
+    norm_min = min(0.0, min(scores[:norm_cutoff]))
+    norm_max = max(1.0, max(scores[:norm_cutoff]))
+    norm_range = norm_max - norm_min
+    boosted = [
+        max(0, (score - norm_min) * boost * rec / norm_range)
+        for score, boost, rec in zip(scores, multipliers, recency)
+    ]
+    ranked = list(zip(boosted, range(len(boosted))))
+    ranked.sort(key=lambda x: x[0], reverse=True)
+    return [score for score, _ in ranked], [ind for _, ind in ranked]
+
+
+def _array_boost(
+    scores: list[float],
+    boosts: list[int],
+    recency: list[float],
+    norm_cutoff: int,
+    top_k: int | None = None,
+) -> tuple[list[float], list[int]]:
+    final_scores = boosted_scores(
+        np.array(scores, dtype=np.float64),
+        multipliers=boost_multipliers(boosts),
+        recency_multipliers=np.array(recency, dtype=np.float64),
+        norm_cutoff=norm_cutoff,
+        norm_min=0.0,
+        norm_max=1.0,
+    )
+    ranked_indices = rank_descending(final_scores, top_k=top_k).tolist()
+    return final_scores[ranked_indices].tolist(), ranked_indices
+
+
+def _per_chunk_rerank(
+    sim_scores: np.ndarray, boosts: list[int], recency: list[float]
+) -> tuple[list[float], list[int]]:
+    rows = list(sim_scores)
+    models_min = np.min(rows)
+    shifted = sum([row - models_min for row in rows]) / len(rows)
+    multipliers = [translate_boost_count_to_multiplier(boost) for boost in boosts]
+    normalized = (shifted * multipliers * recency + models_min + 12) / 24
+    ranked = list(zip(normalized, range(len(normalized))))
+    ranked.sort(key=lambda x: x[0], reverse=True)
+    return [float(score) for score, _ in ranked], [ind for _, ind in ranked]
+
+
+def _array_rerank(
+    sim_scores: np.ndarray, boosts: list[int], recency: list[float]
+) -> tuple[list[float], list[int]]:
+    normalized, _ = reranked_scores(
+        sim_scores,
+        multipliers=boost_multipliers(boosts),
+        recency_multipliers=np.array(recency, dtype=np.float64),
+        model_min=-12,
+        model_max=12,
+    )
+    ranked_indices = rank_descending(normalized).tolist()
+    return normalized[ranked_indices].tolist(), ranked_indices
+
+
+def _time(func: Callable[..., Any], *args: Any, repeats: int, **kwargs: Any) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func(*args, **kwargs)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 2000, 5000, 10000]
+    )
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(
+        f"{'chunks':>8} | {'boost, per chunk':>16} | {'boost, arrays':>13} | "
+        f"{'boost, top ' + str(args.top_k):>15} | {'rerank, per chunk':>17} | "
+        f"{'rerank, arrays':>14}  (ms)"
+    )
+    for size in args.sizes:
+        scores = [round(rng.uniform(0, 1), 3) for _ in range(size)]
+        boosts = [rng.choice([0, 0, 0, 0, 1, -1, 3, -2]) for _ in range(size)]
+        recency = [rng.uniform(0.5, 1) for _ in range(size)]
+        sim_scores = np.array(
+            [[rng.uniform(-12, 12) for _ in range(size)] for _ in range(2)],
+            dtype=np.float32,
+        )
+
+        if _per_chunk_boost(scores, boosts, recency, 20) != _array_boost(
+            scores, boosts, recency, 20
+        ):
+            raise RuntimeError("Boosted scores differ")
+        if _per_chunk_rerank(sim_scores, boosts, recency) != _array_rerank(
+            sim_scores, boosts, recency
+        ):
+            raise RuntimeError("Reranked scores differ")
+
+        timings = [
+            _time(_per_chunk_boost, scores, boosts, recency, 20, repeats=args.repeats),
+            _time(_array_boost, scores, boosts, recency, 20, repeats=args.repeats),
+            _time(
+                _array_boost,
+                scores,
+                boosts,
+                recency,
+                20,
+                top_k=args.top_k,
+                repeats=args.repeats,
+            ),
+            _time(_per_chunk_rerank, sim_scores, boosts, recency, repeats=args.repeats),
+            _time(_array_rerank, sim_scores, boosts, recency, repeats=args.repeats),
+        ]
+        print(
+            f"{size:>8} | {timings[0]:>16.2f} | {timings[1]:>13.2f} | "
+            f"{timings[2]:>15.2f} | {timings[3]:>17.2f} | {timings[4]:>14.2f}"
+        )
+    print("Scores and order are identical")
@@ -0,0 +1,187 @@
+# This file is purely for development use, not included in any builds
+# Compares how many answer streams the API server can serve at once with the blocking
+# streaming path (every pull of the next token holds a threadpool thread, as Starlette
+# does for sync generators) against the asyncio-native path.
+#
+# Offline, with a fake LLM that waits a fixed time per token:
+#   python scripts/benchmark_streaming_concurrency.py --streams 10 100 400
+#
+# Against a running API server (auth disabled), using the real endpoints:
+#   python scripts/benchmark_streaming_concurrency.py --url http://localhost:8080 \
+#       --streams 10 50 --query "How do I set up the Slack connector?"
+import argparse
+import asyncio
+import statistics
+import time
+from collections.abc import AsyncIterator
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import httpx
+from langchain.schema.language_model import LanguageModelInput
+
+from payserai.chat.chat_utils import aextract_citations_from_stream
+from payserai.chat.chat_utils import extract_citations_from_stream
+from payserai.llm.interfaces import LLM
+
+# Starlette runs sync endpoints and sync generators through AnyIO's default limiter
+_STARLETTE_THREADPOOL_SIZE = 40
+_END = object()
+
+
+class _FakeLLM(LLM):
+    def __init__(self, num_tokens: int, token_delay: float) -> None:
+        self.num_tokens = num_tokens
+        self.token_delay = token_delay
+
+    def log_model_configs(self) -> None:
+        pass
+
+    def invoke(self, prompt: LanguageModelInput) -> str:
+        return "".join(self.stream(prompt))
+
+    def stream(self, prompt: LanguageModelInput) -> Iterator[str]:
+        for ind in range(self.num_tokens):
+            time.sleep(self.token_delay)
+            yield f"token{ind} "
+
+    async def astream(self, prompt: LanguageModelInput) -> AsyncIterator[str]:
+        for ind in range(self.num_tokens):
+            await asyncio.sleep(self.token_delay)
+            yield f"token{ind} "
+
+
+class _StreamStats:
+    def __init__(self) -> None:
+        self.first_token_latencies: list[float] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def started(self) -> None:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def finished(self) -> None:
+        self.in_flight -= 1
+
+
+async def _sync_stream(
+    llm: LLM, executor: ThreadPoolExecutor, stats: _StreamStats, start: float
+) -> None:
+    loop = asyncio.get_running_loop()
+    packets = extract_citations_from_stream(llm.stream("prompt"), [], {})
+    first = True
+    while True:
+        packet = await loop.run_in_executor(executor, next, packets, _END)
+        if packet is _END:
+            break
+        if first:
+            stats.first_token_latencies.append(time.perf_counter() - start)
+            stats.started()
+            first = False
+    stats.finished()
+
+
+async def _async_stream(llm: LLM, stats: _StreamStats, start: float) -> None:
+    first = True
+    async for _ in aextract_citations_from_stream(llm.astream("prompt"), [], {}):
+        if first:
+            stats.first_token_latencies.append(time.perf_counter() - start)
+            stats.started()
+            first = False
+    stats.finished()
+
+
+async def _run_offline(num_streams: int, use_async: bool, llm: LLM) -> _StreamStats:
+    stats = _StreamStats()
+    start = time.perf_counter()
+    if use_async:
+        await asyncio.gather(
+            *[_async_stream(llm, stats, start) for _ in range(num_streams)]
+        )
+    else:
+        with ThreadPoolExecutor(max_workers=_STARLETTE_THREADPOOL_SIZE) as executor:
+            await asyncio.gather(
+                *[_sync_stream(llm, executor, stats, start) for _ in range(num_streams)]
+            )
+    return stats
+
+
+async def _live_stream(
+    client: httpx.AsyncClient,
+    path: str,
+    body: dict[str, Any],
+    stats: _StreamStats,
+    start: float,
+) -> None:
+    first = True
+    async with client.stream("POST", path, json=body) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_lines():
+            if first:
+                stats.first_token_latencies.append(time.perf_counter() - start)
+                stats.started()
+                first = False
+    stats.finished()
+
+
+async def _run_live(url: str, num_streams: int, query: str) -> _StreamStats:
+    body = {
+        "messages": [{"message": query, "sender": None, "role": "user"}],
+        "passist_id": 0,
+        "prompt_id": 0,
+        "retrieval_options": {"run_search": "always", "real_time": True},
+    }
+    stats = _StreamStats()
+    start = time.perf_counter()
+    limits = httpx.Limits(max_connections=num_streams)
+    async with httpx.AsyncClient(base_url=url, timeout=300, limits=limits) as client:
+        await asyncio.gather(
+            *[
+                _live_stream(
+                    client, "/query/stream-answer-with-quote", body, stats, start
+                )
+                for _ in range(num_streams)
+            ]
+        )
+    return stats
+
+
+def _report(
+    label: str, num_streams: int, wall_time: float, stats: _StreamStats
+) -> None:
+    latencies = sorted(stats.first_token_latencies)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    print(
+        f"{label:>6} | {num_streams:>7} | {wall_time:>8.2f} | "
+        f"{statistics.median(latencies):>13.3f} | {p95:>13.3f} | "
+        f"{stats.max_in_flight:>13}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, nargs="+", default=[10, 100, 400])
+    parser.add_argument("--num-tokens", type=int, default=50)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--url", type=str, default=None)
+    parser.add_argument("--query", type=str, default="What is Payserai?")
+    args = parser.parse_args()
+
+    print(
+        f"{'path':>6} | {'streams':>7} | {'wall (s)':>8} | {'p50 first (s)':>13} | "
+        f"{'p95 first (s)':>13} | {'max in flight':>13}"
+    )
+    for num_streams in args.streams:
+        if args.url:
+            start = time.perf_counter()
+            stats = asyncio.run(_run_live(args.url, num_streams, args.query))
+            _report("live", num_streams, time.perf_counter() - start, stats)
+            continue
+
+        fake_llm = _FakeLLM(args.num_tokens, args.token_delay)
+        for label, use_async in [("sync", False), ("async", True)]:
+            start = time.perf_counter()
+            stats = asyncio.run(_run_offline(num_streams, use_async, fake_llm))
+            _report(label, num_streams, time.perf_counter() - start, stats)
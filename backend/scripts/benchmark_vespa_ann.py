@@ -0,0 +1,207 @@
+# This file is purely for development use, not included in any builds
+# Measures recall@k against latency of the approximate (HNSW) nearestNeighbor search in Vespa
+# for a range of hnsw.exploreAdditionalHits values, with the exact search as ground truth.
+#
+# Feeds a synthetic corpus of clustered random embeddings into the running Vespa index. The
+# chunks are marked hidden so that they never show up in regular searches, delete them
+# afterwards with --delete. The graph settings (max-links-per-node,
+# neighbors-to-explore-at-insert) are set in payserai_chunk.sd, redeploy with other values
+# and feed again to compare them:
+#   python scripts/benchmark_vespa_ann.py --num-chunks 1000000 --feed
+#   python scripts/benchmark_vespa_ann.py --explore-additional-hits 0 100 400
+#   python scripts/benchmark_vespa_ann.py --num-chunks 1000000 --delete
+import argparse
+import statistics
+import time
+
+import httpx
+import numpy as np
+
+from payserai.configs.app_configs import DOCUMENT_INDEX_NAME
+from payserai.configs.constants import CHUNK_ID
+from payserai.configs.constants import CONTENT
+from payserai.configs.constants import DOCUMENT_ID
+from payserai.configs.constants import EMBEDDINGS
+from payserai.configs.constants import HIDDEN
+from payserai.document_index.vespa.feed import feed_operations
+from payserai.document_index.vespa.feed import VespaFeedOperation
+from payserai.document_index.vespa.index import _nearest_neighbor_annotation
+from payserai.document_index.vespa.index import DOCUMENT_ID_ENDPOINT
+from payserai.document_index.vespa.index import SEARCH_ENDPOINT
+from payserai.search.models import NearestNeighborSettings
+
+_DOC_ID_PREFIX = "ann_benchmark_"
+_FEED_BATCH_SIZE = 10_000
+# Differs from the seeds of the fed batches, so the queries are not in the corpus
+_QUERY_SEED = 2**32 - 1
+
+
+def _clustered_embeddings(
+    rng: np.random.Generator, centers: np.ndarray, num: int
+) -> np.ndarray:
+    # Real embeddings cluster by topic rather than being spread uniformly
+    vectors = centers[rng.integers(len(centers), size=num)] + 0.5 * rng.normal(
+        size=(num, centers.shape[1])
+    ) / np.sqrt(centers.shape[1])
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _cluster_centers(dim: int, num_clusters: int) -> np.ndarray:
+    centers = np.random.default_rng(0).normal(size=(num_clusters, dim))
+    return centers / np.linalg.norm(centers, axis=1, keepdims=True)
+
+
+def _feed_corpus(num_chunks: int, dim: int, num_clusters: int) -> None:
+    centers = _cluster_centers(dim, num_clusters)
+    start = time.perf_counter()
+    for batch_start in range(0, num_chunks, _FEED_BATCH_SIZE):
+        batch_size = min(_FEED_BATCH_SIZE, num_chunks - batch_start)
+        rng = np.random.default_rng(batch_start + 1)
+        embeddings = _clustered_embeddings(rng, centers, batch_size)
+        failures = feed_operations(
+            [
+                VespaFeedOperation(
+                    document_id=f"{_DOC_ID_PREFIX}{ind}",
+                    method="POST",
+                    url=f"{DOCUMENT_ID_ENDPOINT}/{_DOC_ID_PREFIX}{ind}",
+                    body={
+                        "fields": {
+                            DOCUMENT_ID: f"{_DOC_ID_PREFIX}{ind}",
+                            CHUNK_ID: 0,
+                            CONTENT: "",
+                            HIDDEN: True,
+                            EMBEDDINGS: {"full_chunk": embedding.tolist()},
+                        }
+                    },
+                )
+                for ind, embedding in enumerate(embeddings, start=batch_start)
+            ]
+        )
+        if failures:
+            raise RuntimeError(f"Failed to feed {len(failures)} chunks")
+        print(
+            f"Fed {batch_start + batch_size}/{num_chunks} chunks "
+            f"in {time.perf_counter() - start:.0f}s"
+        )
+
+
+def _delete_corpus(num_chunks: int) -> None:
+    for batch_start in range(0, num_chunks, _FEED_BATCH_SIZE):
+        feed_operations(
+            [
+                VespaFeedOperation(
+                    document_id=f"{_DOC_ID_PREFIX}{ind}",
+                    method="DELETE",
+                    url=f"{DOCUMENT_ID_ENDPOINT}/{_DOC_ID_PREFIX}{ind}",
+                )
+                for ind in range(
+                    batch_start, min(batch_start + _FEED_BATCH_SIZE, num_chunks)
+                )
+            ]
+        )
+
+
+def _search(
+    client: httpx.Client,
+    query_embedding: np.ndarray,
+    k: int,
+    target_hits: int,
+    nearest_neighbor: NearestNeighborSettings,
+) -> tuple[list[str], float]:
+    nn_annotation = _nearest_neighbor_annotation(target_hits, nearest_neighbor)
+    params: dict[str, str | int] = {
+        "yql": f"select documentid from {DOCUMENT_INDEX_NAME} where "
+        f"{nn_annotation}nearestNeighbor(embeddings, query_embedding)",
+        "input.query(query_embedding)": str(query_embedding.tolist()),
+        "ranking.profile": "semantic_search",
+        "hits": k,
+        "timeout": "30s",
+    }
+    start = time.perf_counter()
+    response = client.get(SEARCH_ENDPOINT, params=params)
+    latency = time.perf_counter() - start
+    response.raise_for_status()
+    hits = response.json()["root"].get("children", [])
+    return [hit["id"] for hit in hits], latency
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(percentile * len(values)))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-chunks", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--num-clusters", type=int, default=1000)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    # Hybrid search asks for at least 1000 nearest neighbors
+    parser.add_argument("--target-hits", type=int, default=1000)
+    parser.add_argument(
+        "--explore-additional-hits", type=int, nargs="+", default=[0, 100, 200, 400]
+    )
+    parser.add_argument("--feed", action="store_true")
+    parser.add_argument("--delete", action="store_true")
+    args = parser.parse_args()
+
+    if args.delete:
+        _delete_corpus(args.num_chunks)
+        raise SystemExit(0)
+
+    if args.feed:
+        _feed_corpus(args.num_chunks, args.dim, args.num_clusters)
+
+    query_embeddings = _clustered_embeddings(
+        np.random.default_rng(_QUERY_SEED),
+        _cluster_centers(args.dim, args.num_clusters),
+        args.num_queries,
+    )
+
+    with httpx.Client(timeout=60) as client:
+        exact_results = []
+        exact_latencies = []
+        for query_embedding in query_embeddings:
+            hit_ids, latency = _search(
+                client,
+                query_embedding,
+                args.k,
+                args.target_hits,
+                NearestNeighborSettings(approximate=False),
+            )
+            exact_results.append(set(hit_ids))
+            exact_latencies.append(latency)
+
+        print(
+            f"{'mode':>16} | {f'recall@{args.k}':>9} | {'p50 (ms)':>8} | {'p95 (ms)':>8}"
+        )
+        print(
+            f"{'exact':>16} | {1:>9.3f} | "
+            f"{1000 * statistics.median(exact_latencies):>8.1f} | "
+            f"{1000 * _percentile(exact_latencies, 0.95):>8.1f}"
+        )
+        for explore_additional_hits in args.explore_additional_hits:
+            recalls = []
+            latencies = []
+            for query_embedding, exact_hit_ids in zip(query_embeddings, exact_results):
+                hit_ids, latency = _search(
+                    client,
+                    query_embedding,
+                    args.k,
+                    args.target_hits,
+                    NearestNeighborSettings(
+                        approximate=True,
+                        explore_additional_hits=explore_additional_hits,
+                    ),
+                )
+                recalls.append(
+                    len(exact_hit_ids & set(hit_ids)) / max(len(exact_hit_ids), 1)
+                )
+                latencies.append(latency)
+            print(
+                f"{f'hnsw+{explore_additional_hits}':>16} | "
+                f"{statistics.mean(recalls):>9.3f} | "
+                f"{1000 * statistics.median(latencies):>8.1f} | "
+                f"{1000 * _percentile(latencies, 0.95):>8.1f}"
+            )
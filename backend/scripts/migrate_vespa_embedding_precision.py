@@ -0,0 +1,144 @@
+"""Switches the embeddings of an existing Vespa index to the cell type of EMBEDDING_PRECISION.
+Vespa does not convert the stored tensors when their type changes, so the embeddings are
+exported first, the app is deployed with the new type and the embeddings are fed back
+quantized. Nothing has to be re-embedded or re-indexed from the connectors.
+
+Vector search only returns the chunks which were fed again until the script completes, the
+export file is kept so that a failed run can be resumed with --skip-export:
+    EMBEDDING_PRECISION=bfloat16 python scripts/migrate_vespa_embedding_precision.py"""
+import argparse
+import json
+from collections.abc import Iterator
+from typing import Any
+
+import httpx
+
+from payserai.configs.constants import EMBEDDINGS
+from payserai.configs.constants import TITLE_EMBEDDING
+from payserai.configs.model_configs import EMBEDDING_PRECISION
+from payserai.document_index.vespa.feed import feed_operations
+from payserai.document_index.vespa.feed import VespaFeedOperation
+from payserai.document_index.vespa.index import DOCUMENT_ID_ENDPOINT
+from payserai.document_index.vespa.index import VespaIndex
+from payserai.indexing.quantization import quantize_embedding
+from payserai.utils.batching import batch_generator
+from payserai.utils.logger import setup_logger
+
+logger = setup_logger()
+
+_VISIT_BATCH_SIZE = 500
+_FEED_BATCH_SIZE = 10_000
+
+
+def _tensor_value(tensor: Any) -> Any:
+    # Depending on the Vespa version, the tensors come with or without the type wrapper
+    if isinstance(tensor, dict) and "blocks" in tensor:
+        return tensor["blocks"]
+    if isinstance(tensor, dict) and "values" in tensor:
+        return tensor["values"]
+    return tensor
+
+
+def _visit_embeddings() -> Iterator[dict[str, Any]]:
+    params: dict[str, Any] = {
+        "cluster": "payserai_index",
+        "fieldSet": f"payserai_chunk:{EMBEDDINGS},{TITLE_EMBEDDING}",
+        "wantedDocumentCount": _VISIT_BATCH_SIZE,
+        "format.tensors": "short-value",
+        "timeout": "60s",
+    }
+    with httpx.Client(timeout=120) as client:
+        while True:
+            response = client.get(DOCUMENT_ID_ENDPOINT, params=params)
+            response.raise_for_status()
+            response_json = response.json()
+            for document in response_json.get("documents", []):
+                fields = document.get("fields", {})
+                yield {
+                    "vespa_chunk_id": document["id"].split("::", 1)[-1],
+                    EMBEDDINGS: _tensor_value(fields.get(EMBEDDINGS)),
+                    TITLE_EMBEDDING: _tensor_value(fields.get(TITLE_EMBEDDING)),
+                }
+
+            if "continuation" not in response_json:
+                return
+            params["continuation"] = response_json["continuation"]
+
+
+def export_embeddings(export_file: str) -> int:
+    num_chunks = 0
+    with open(export_file, "w") as file:
+        for chunk_embeddings in _visit_embeddings():
+            file.write(json.dumps(chunk_embeddings) + "\n")
+            num_chunks += 1
+            if num_chunks % 10_000 == 0:
+                logger.info(f"Exported the embeddings of {num_chunks} chunks")
+    return num_chunks
+
+
+def _read_exported_embeddings(export_file: str) -> Iterator[dict[str, Any]]:
+    with open(export_file, "r") as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def _update_operation(chunk_embeddings: dict[str, Any]) -> VespaFeedOperation:
+    update_fields: dict[str, dict] = {}
+    if chunk_embeddings[EMBEDDINGS]:
+        update_fields[EMBEDDINGS] = {
+            "assign": {
+                name: quantize_embedding(embedding, EMBEDDING_PRECISION)
+                for name, embedding in chunk_embeddings[EMBEDDINGS].items()
+            }
+        }
+    if chunk_embeddings[TITLE_EMBEDDING]:
+        update_fields[TITLE_EMBEDDING] = {
+            "assign": quantize_embedding(
+                chunk_embeddings[TITLE_EMBEDDING], EMBEDDING_PRECISION
+            )
+        }
+
+    vespa_chunk_id = chunk_embeddings["vespa_chunk_id"]
+    return VespaFeedOperation(
+        # Only used to report failures
+        document_id=vespa_chunk_id,
+        method="PUT",
+        url=f"{DOCUMENT_ID_ENDPOINT}/{vespa_chunk_id}",
+        body={"fields": update_fields},
+    )
+
+
+def feed_embeddings(export_file: str) -> None:
+    num_chunks = 0
+    num_failed = 0
+    for chunk_batch in batch_generator(
+        _read_exported_embeddings(export_file), _FEED_BATCH_SIZE
+    ):
+        failures = feed_operations(
+            [_update_operation(chunk_embeddings) for chunk_embeddings in chunk_batch]
+        )
+        num_chunks += len(chunk_batch)
+        num_failed += len(failures)
+        logger.info(f"Fed the embeddings of {num_chunks} chunks, {num_failed} failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--export-file", type=str, default="./vespa_embeddings_export.jsonl"
+    )
+    parser.add_argument(
+        "--skip-export",
+        action="store_true",
+        help="Resume from an existing export file, after the export or deploy succeeded",
+    )
+    args = parser.parse_args()
+
+    if not args.skip_export:
+        logger.info(f"Exporting the embeddings to {args.export_file}")
+        logger.info(f"Exported the embeddings of {export_embeddings(args.export_file)}")
+
+    logger.info(f"Deploying the Vespa app with {EMBEDDING_PRECISION} embeddings")
+    VespaIndex().ensure_indices_exist(allow_embedding_type_change=True)
+
+    feed_embeddings(args.export_file)
@@ -1,5 +1,39 @@
+import struct
+
+import numpy as np
 from pydantic import BaseModel
 
+# Opt-in compact encoding for embedding vectors and reranking scores, selected via the
+# Accept header. The body is a little-endian uint32 (rows, cols) shape header followed by
+# rows * cols little-endian float32 values in row-major order
+FLOAT_MATRIX_CONTENT_TYPE = "application/x-payserai-float32-matrix"
+_SHAPE_HEADER = struct.Struct("<II")
+
+
+def serialize_float_matrix(matrix: np.ndarray | list[list[float]]) -> bytes:
+    array = np.asarray(matrix, dtype="<f4")
+    if array.size == 0:
+        array = array.reshape(0, 0)
+    if array.ndim != 2:
+        raise ValueError(f"Expected a 2 dimensional matrix, got {array.ndim} dims")
+    return _SHAPE_HEADER.pack(*array.shape) + np.ascontiguousarray(array).tobytes()
+
+
+def deserialize_float_matrix(data: bytes) -> np.ndarray:
+    if len(data) < _SHAPE_HEADER.size:
+        raise ValueError(
+            f"Float matrix payload of {len(data)} bytes has no shape header"
+        )
+    rows, cols = _SHAPE_HEADER.unpack_from(data)
+    expected_size = _SHAPE_HEADER.size + rows * cols * 4
+    if len(data) != expected_size:
+        raise ValueError(
+            f"Float matrix payload has {len(data)} bytes, expected {expected_size}"
+        )
+    return np.frombuffer(data, dtype="<f4", offset=_SHAPE_HEADER.size).reshape(
+        rows, cols
+    )
+
 
 class EmbedRequest(BaseModel):
     texts: list[str]
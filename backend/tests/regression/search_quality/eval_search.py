@@ -6,9 +6,12 @@ from typing import Any
 from typing import TextIO
 
 from payserai.chat.chat_utils import get_chunks_for_qa
+from payserai.configs.model_configs import DOC_EMBEDDING_DIM
+from payserai.configs.model_configs import EMBEDDING_PRECISION
 from payserai.db.engine import get_sqlalchemy_engine
 from payserai.document_index.factory import get_default_document_index
 from payserai.indexing.models import InferenceChunk
+from payserai.indexing.quantization import bytes_per_embedding_cell
 from payserai.search.models import IndexFilters
 from payserai.search.models import RerankMetricsContainer
 from payserai.search.models import RetrievalMetricsContainer
@@ -155,22 +158,51 @@ def calculate_score(
     return len(matches) / min(len(targets), max_chunks)
 
 
+def calculate_overlap(
+    log_prefix: str, ids: list[str], baseline_ids: list[str], max_chunks: int = 5
+) -> float:
+    top_ids = set(ids[:max_chunks])
+    baseline_top_ids = set(baseline_ids[:max_chunks])
+    overlap = len(top_ids & baseline_top_ids) / max(len(baseline_top_ids), 1)
+    print(f"{log_prefix} Overlap with Baseline: {overlap}", end="\t")
+    return overlap
+
+
+def _print_embedding_memory() -> None:
+    bytes_per_vector = bytes_per_embedding_cell() * DOC_EMBEDDING_DIM
+    float_bytes_per_vector = bytes_per_embedding_cell("float") * DOC_EMBEDDING_DIM
+    print(
+        f"Embedding Precision: {EMBEDDING_PRECISION}, {bytes_per_vector} bytes per vector "
+        f"({bytes_per_vector / float_bytes_per_vector:.0%} of float)\n"
+    )
+
+
 def main(
     questions_json: str,
     output_file: str,
     show_details: bool,
     enable_llm: bool,
     stop_after: int,
+    rankings_file: str | None = None,
+    baseline_rankings_file: str | None = None,
 ) -> None:
     questions_info = read_json(questions_json)
+    baseline_rankings = (
+        read_json(baseline_rankings_file) if baseline_rankings_file else {}
+    )
+    rankings: dict[str, dict[str, list[str]]] = {}
 
     running_retrieval_score = 0.0
     running_rerank_score = 0.0
     running_llm_filter_score = 0.0
+    running_retrieval_overlap = 0.0
+    running_rerank_overlap = 0.0
+    num_compared = 0
 
     with open(output_file, "w") as outfile:
         with redirect_print_to_file(outfile):
             print("Running Document Retrieval Test\n")
+            _print_embedding_memory()
             for ind, (question, targets) in enumerate(questions_info.items()):
                 if ind >= stop_after:
                     break
@@ -202,6 +234,19 @@ def main(
                 running_llm_filter_score += llm_score
                 print(f"Average: {running_llm_filter_score / (ind + 1)}")
 
+                rankings[question] = {"retrieval": retrieval_ids, "rerank": rerank_ids}
+                baseline = baseline_rankings.get(question)
+                if baseline is not None:
+                    num_compared += 1
+                    running_retrieval_overlap += calculate_overlap(
+                        "Retrieval", retrieval_ids, baseline["retrieval"]
+                    )
+                    print(f"Average: {running_retrieval_overlap / num_compared}")
+                    running_rerank_overlap += calculate_overlap(
+                        "Rerank", rerank_ids, baseline["rerank"]
+                    )
+                    print(f"Average: {running_rerank_overlap / num_compared}")
+
                 if show_details:
                     print("\nRetrieval Metrics:")
                     if retrieval_metrics is None:
@@ -215,6 +260,10 @@ def main(
                     else:
                         _print_reranking_metrics(rerank_metrics)
 
+    if rankings_file:
+        with open(rankings_file, "w") as file:
+            json.dump(rankings, file, indent=2)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -249,6 +298,19 @@ if __name__ == "__main__":
         help="Stop processing after this many iterations.",
         default=100,
     )
+    parser.add_argument(
+        "--rankings_file",
+        type=str,
+        help="If set, save the retrieved document ids per question to this JSON file.",
+        default=None,
+    )
+    parser.add_argument(
+        "--baseline_rankings_file",
+        type=str,
+        help="Rankings file of an earlier run, e.g. with float embeddings, to report "
+        "how much the top results changed.",
+        default=None,
+    )
     args = parser.parse_args()
 
     main(
@@ -257,4 +319,6 @@ if __name__ == "__main__":
         args.show_details,
         args.enable_llm,
         args.stop_after,
+        args.rankings_file,
+        args.baseline_rankings_file,
     )
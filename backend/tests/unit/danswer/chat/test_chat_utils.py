@@ -0,0 +1,105 @@
+import unittest
+
+from payserai.chat.chat_utils import get_chunks_for_qa
+from payserai.chat.chat_utils import StreamedAnswer
+from payserai.chat.models import CitationInfo
+from payserai.chat.models import PayseraiAnswerPiece
+from payserai.chat.models import PayseraiQuotes
+from payserai.chat.models import StreamingError
+from payserai.configs.constants import DocumentSource
+from payserai.configs.constants import IGNORE_FOR_QA
+from payserai.indexing.models import InferenceChunk
+from payserai.llm.utils import count_prompt_tokens
+
+
+def _chunk(
+    document_id: str, token_count: int, ignore_for_qa: bool = False
+) -> InferenceChunk:
+    return InferenceChunk(
+        document_id=document_id,
+        chunk_id=0,
+        blurb="blurb",
+        content=f"content of {document_id}",
+        source_links=None,
+        section_continuation=False,
+        source_type=DocumentSource.WEB,
+        semantic_identifier=document_id,
+        boost=0,
+        recency_bias=1.0,
+        score=1.0,
+        hidden=False,
+        metadata={IGNORE_FOR_QA: "True"} if ignore_for_qa else {},
+        match_highlights=[],
+        updated_at=None,
+        token_count=token_count,
+    )
+
+
+def _split_words(text: str) -> list[str]:
+    return text.split()
+
+
+class TestChatUtils(unittest.TestCase):
+    def test_get_chunks_for_qa(self) -> None:
+        chunks = [
+            _chunk("a", 100),
+            _chunk("b", 100),
+            _chunk("c", 100, ignore_for_qa=True),
+            _chunk("d", 100),
+            _chunk("e", 100),
+        ]
+        llm_chunk_selection = [False, True, True, False, True]
+
+        # LLM selected chunks first, 50 tokens of metadata per chunk
+        self.assertEqual(
+            get_chunks_for_qa(chunks, llm_chunk_selection, token_limit=450), [1, 4, 0]
+        )
+        self.assertEqual(
+            get_chunks_for_qa(
+                chunks, llm_chunk_selection, token_limit=300, batch_offset=1
+            ),
+            [0, 3],
+        )
+        # At least one chunk is always used
+        self.assertEqual(
+            get_chunks_for_qa(chunks, llm_chunk_selection, token_limit=10), [1]
+        )
+
+    def test_count_prompt_tokens(self) -> None:
+        prompt = "Context:\nfirst doc text\n\nsecond doc text\nQuestion: why?"
+        self.assertEqual(
+            count_prompt_tokens(
+                prompt,
+                counted_texts=[("first doc text", 100), ("second doc text", 200)],
+                encode_fn=_split_words,
+            ),
+            300 + len(_split_words("Context: Question: why?")),
+        )
+        # Texts which are not in the prompt are tokenized as part of the prompt
+        self.assertEqual(
+            count_prompt_tokens(
+                prompt, counted_texts=[("missing", 100)], encode_fn=_split_words
+            ),
+            len(_split_words(prompt)),
+        )
+
+    def test_streamed_answer(self) -> None:
+        citation = CitationInfo(citation_num=1, document_id="doc")
+        streamed_answer = StreamedAnswer()
+        for packet in [
+            PayseraiAnswerPiece(answer_piece="Refunds take "),
+            PayseraiAnswerPiece(answer_piece=None),
+            citation,
+            PayseraiAnswerPiece(answer_piece="two days"),
+            PayseraiQuotes(quotes=[]),
+            StreamingError(error="timed out"),
+        ]:
+            streamed_answer.add(packet)
+
+        self.assertEqual(streamed_answer.answer, "Refunds take two days")
+        self.assertEqual(streamed_answer.citations, [citation])
+        self.assertEqual(streamed_answer.error, "timed out")
+
+
+if __name__ == "__main__":
+    unittest.main()
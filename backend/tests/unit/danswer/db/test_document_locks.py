@@ -0,0 +1,82 @@
+import unittest
+from typing import Any
+from typing import cast
+from unittest.mock import patch
+
+from sqlalchemy.orm import Session
+
+from payserai.db.document import get_document_lock_stats
+from payserai.db.document import modify_documents_with_locks
+
+
+class _FakeSession:
+    """Documents in held_by_other_job stay locked for the given number of attempts"""
+
+    def __init__(self, held_by_other_job: dict[str, int]) -> None:
+        self.held_by_other_job = held_by_other_job
+        self.commits = 0
+
+    def acquire(self, db_session: Any, document_ids: list[str]) -> list[str]:
+        deferred_ids = []
+        for document_id in document_ids:
+            if self.held_by_other_job.get(document_id, 0) > 0:
+                self.held_by_other_job[document_id] -= 1
+                deferred_ids.append(document_id)
+        return deferred_ids
+
+    def commit(self) -> None:
+        self.commits += 1
+
+
+class TestModifyDocumentsWithLocks(unittest.TestCase):
+    def _run(
+        self, document_ids: list[str], held_by_other_job: dict[str, int], **kwargs: Any
+    ) -> tuple[list[list[str]], _FakeSession, list[float]]:
+        fake_session = _FakeSession(held_by_other_job)
+        rounds: list[list[str]] = []
+        sleeps: list[float] = []
+        with patch(
+            "payserai.db.document.acquire_available_document_locks",
+            side_effect=fake_session.acquire,
+        ), patch("payserai.db.document.time.sleep", side_effect=sleeps.append):
+            modify_documents_with_locks(
+                db_session=cast(Session, fake_session),
+                document_ids=document_ids,
+                modify_fn=rounds.append,
+                **kwargs,
+            )
+        return rounds, fake_session, sleeps
+
+    def test_single_acquisition(self) -> None:
+        rounds, fake_session, sleeps = self._run(["a", "b", "a"], {})
+        self.assertEqual(rounds, [["a", "b"]])
+        self.assertEqual(fake_session.commits, 1)
+        self.assertEqual(sleeps, [])
+
+    def test_locked_documents_are_deferred(self) -> None:
+        stats_before = get_document_lock_stats()
+        rounds, fake_session, sleeps = self._run(["a", "b", "c"], {"b": 2})
+
+        # The batch proceeds without the locked document, which is retried on its own
+        self.assertEqual(rounds, [["a", "c"], ["b"]])
+        self.assertEqual(fake_session.commits, 3)
+        self.assertEqual(len(sleeps), 2)
+
+        stats = get_document_lock_stats()
+        self.assertEqual(stats.acquisitions - stats_before.acquisitions, 3)
+        self.assertEqual(stats.deferred_documents - stats_before.deferred_documents, 1)
+        self.assertAlmostEqual(
+            stats.total_wait_secs - stats_before.total_wait_secs, sum(sleeps)
+        )
+
+    def test_max_wait(self) -> None:
+        with self.assertRaises(RuntimeError):
+            self._run(["a", "b"], {"b": 1000}, max_wait_secs=5)
+
+        # Without any wait, locked documents fail right away
+        with self.assertRaises(RuntimeError):
+            self._run(["a"], {"a": 1}, max_wait_secs=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from payserai.db.search_cache import advance_search_cache_invalidation_cursor
+
+_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _at(secs: float) -> datetime:
+    return _START + timedelta(seconds=secs)
+
+
+class TestSearchCacheInvalidationCursor(unittest.TestCase):
+    def test_first_poll_returns_nothing(self) -> None:
+        cursor, document_ids = advance_search_cache_invalidation_cursor(
+            None, [(1, "a", _at(0))], polled_at=_at(1)
+        )
+        self.assertEqual(document_ids, set())
+        self.assertEqual(cursor.seen_ids, {1})
+
+    def test_late_commit_with_lower_id_not_missed(self) -> None:
+        cursor, _ = advance_search_cache_invalidation_cursor(None, [], polled_at=_at(0))
+
+        # Row 2 is committed first, row 1 was inserted earlier but commits later
+        cursor, document_ids = advance_search_cache_invalidation_cursor(
+            cursor, [(2, "b", _at(3))], polled_at=_at(5)
+        )
+        self.assertEqual(document_ids, {"b"})
+
+        cursor, document_ids = advance_search_cache_invalidation_cursor(
+            cursor, [(1, "a", _at(2)), (2, "b", _at(3))], polled_at=_at(10)
+        )
+        # Row 2 was already returned by the previous poll
+        self.assertEqual(document_ids, {"a"})
+        self.assertEqual(cursor.seen_ids, {1, 2})
+
+    def test_seen_ids_pruned_after_lookback(self) -> None:
+        cursor, _ = advance_search_cache_invalidation_cursor(None, [], polled_at=_at(0))
+        cursor, _ = advance_search_cache_invalidation_cursor(
+            cursor, [(1, "a", _at(1))], polled_at=_at(2)
+        )
+        cursor, document_ids = advance_search_cache_invalidation_cursor(
+            cursor, [(1, "a", _at(1)), (2, "b", _at(100))], polled_at=_at(120)
+        )
+        self.assertEqual(document_ids, {"b"})
+        self.assertEqual(cursor.seen_ids, {2})
+
+
+if __name__ == "__main__":
+    unittest.main()
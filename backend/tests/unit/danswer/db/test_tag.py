@@ -0,0 +1,157 @@
+import unittest
+
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from payserai.configs.constants import DocumentSource
+from payserai.db.engine import get_sqlalchemy_engine
+from payserai.db.models import Base
+from payserai.db.models import Document
+from payserai.db.models import Document__Tag
+from payserai.db.models import Tag
+from payserai.db.tag import create_or_add_document_tags_bulk
+
+_WEB = DocumentSource.WEB
+_FILE = DocumentSource.FILE
+
+
+class TestCreateOrAddDocumentTagsBulk(unittest.TestCase):
+    """Runs against the Postgres configured through the POSTGRES_* env variables, as the
+    bulk upsert relies on ON CONFLICT. Everything happens in a scratch schema inside of a
+    transaction which is rolled back, so the database is left as it was."""
+
+    connection: Connection
+
+    def setUp(self) -> None:
+        try:
+            self.connection = get_sqlalchemy_engine().connect()
+        except OperationalError as e:
+            self.skipTest(f"Postgres is not available: {e}")
+        self.addCleanup(self.connection.close)
+
+        transaction = self.connection.begin()
+        self.addCleanup(transaction.rollback)
+        self.connection.execute(text("CREATE SCHEMA tag_test"))
+        self.connection.execute(text("SET LOCAL search_path TO tag_test"))
+        Base.metadata.create_all(
+            self.connection,
+            tables=[
+                Base.metadata.tables[table]
+                for table in ["document", "tag", "document__tag"]
+            ],
+        )
+
+        # The commits of the tested function only release a savepoint
+        self.db_session = Session(
+            bind=self.connection, join_transaction_mode="create_savepoint"
+        )
+        self.addCleanup(self.db_session.close)
+        self.db_session.add_all(
+            [Document(id=doc_id, semantic_id=doc_id) for doc_id in ["a", "b", "c"]]
+        )
+        self.db_session.commit()
+
+    def _tags(self) -> set[tuple[str, str, DocumentSource]]:
+        return {
+            (tag.tag_key, tag.tag_value, tag.source)
+            for tag in self.db_session.scalars(select(Tag))
+        }
+
+    def _links(self) -> set[tuple[str, tuple[str, str, DocumentSource]]]:
+        return {
+            (document_id, (tag_key, tag_value, source))
+            for document_id, tag_key, tag_value, source in self.db_session.execute(
+                select(
+                    Document__Tag.document_id, Tag.tag_key, Tag.tag_value, Tag.source
+                ).join(Tag, Tag.id == Document__Tag.tag_id)
+            )
+        }
+
+    def test_new_and_existing_tags(self) -> None:
+        self.db_session.add(Tag(tag_key="team", tag_value="payments", source=_WEB))
+        self.db_session.commit()
+        existing_tag_id = self.db_session.scalars(select(Tag.id)).one()
+
+        create_or_add_document_tags_bulk(
+            {
+                "a": [("team", "payments", _WEB), ("type", "policy", _WEB)],
+                "b": [("team", "payments", _WEB)],
+            },
+            db_session=self.db_session,
+        )
+
+        self.assertEqual(
+            self._tags(), {("team", "payments", _WEB), ("type", "policy", _WEB)}
+        )
+        # The existing Tag is reused, not recreated
+        self.assertIn(
+            existing_tag_id,
+            self.db_session.scalars(
+                select(Tag.id).where(Tag.tag_key == "team", Tag.tag_value == "payments")
+            ),
+        )
+        self.assertEqual(
+            self._links(),
+            {
+                ("a", ("team", "payments", _WEB)),
+                ("a", ("type", "policy", _WEB)),
+                ("b", ("team", "payments", _WEB)),
+            },
+        )
+
+    def test_duplicates_within_a_batch(self) -> None:
+        create_or_add_document_tags_bulk(
+            {
+                "a": [("team", "payments", _WEB), ("team", "payments", _WEB)],
+                "b": iter([("team", "payments", _WEB)]),
+            },
+            db_session=self.db_session,
+        )
+
+        self.assertEqual(self._tags(), {("team", "payments", _WEB)})
+        self.assertEqual(
+            self._links(),
+            {("a", ("team", "payments", _WEB)), ("b", ("team", "payments", _WEB))},
+        )
+
+    def test_same_key_and_value_from_two_sources(self) -> None:
+        create_or_add_document_tags_bulk(
+            {"a": [("team", "payments", _WEB)], "b": [("team", "payments", _FILE)]},
+            db_session=self.db_session,
+        )
+
+        self.assertEqual(
+            self._tags(), {("team", "payments", _WEB), ("team", "payments", _FILE)}
+        )
+        self.assertEqual(
+            self._links(),
+            {("a", ("team", "payments", _WEB)), ("b", ("team", "payments", _FILE))},
+        )
+
+    def test_readding_existing_links(self) -> None:
+        document_tags: dict[str, list[tuple[str, str, DocumentSource]]] = {
+            "a": [("team", "payments", _WEB)],
+            "b": [("type", "policy", _WEB)],
+        }
+        create_or_add_document_tags_bulk(document_tags, db_session=self.db_session)
+        links = self._links()
+
+        # Partly overlapping with the links which are already there
+        create_or_add_document_tags_bulk(
+            {**document_tags, "c": [("team", "payments", _WEB)]},
+            db_session=self.db_session,
+        )
+
+        self.assertEqual(self._links(), links | {("c", ("team", "payments", _WEB))})
+        self.assertEqual(len(self._tags()), 2)
+
+    def test_no_tags(self) -> None:
+        create_or_add_document_tags_bulk({"a": []}, db_session=self.db_session)
+        self.assertEqual(self._links(), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,312 @@
+import math
+import tempfile
+import unittest
+from datetime import datetime
+from datetime import timezone
+from unittest.mock import patch
+
+import numpy as np
+
+from payserai.configs.constants import ACCESS_CONTROL_LIST
+from payserai.configs.constants import BOOST
+from payserai.configs.constants import DocumentSource
+from payserai.configs.constants import HIDDEN
+from payserai.document_index.local.retrieval import admin_hits
+from payserai.document_index.local.retrieval import hit_to_inference_chunk
+from payserai.document_index.local.retrieval import hybrid_hits
+from payserai.document_index.local.retrieval import id_hits
+from payserai.document_index.local.retrieval import keyword_hits
+from payserai.document_index.local.retrieval import semantic_hits
+from payserai.document_index.local.store import LocalIndexStore
+from payserai.document_index.local.store import Segment
+from payserai.document_index.local.store import StoredChunk
+from payserai.search.models import IndexFilters
+
+_DIM = 8
+_PUBLIC = ["PUBLIC"]
+
+
+def _chunk(
+    document_id: str,
+    chunk_id: int,
+    content: str,
+    source: DocumentSource = DocumentSource.WEB,
+    acl: list[str] = _PUBLIC,
+    document_sets: list[str] | None = None,
+    updated_at: datetime | None = None,
+) -> StoredChunk:
+    return StoredChunk(
+        document_id=document_id,
+        chunk_id=chunk_id,
+        blurb=content[:20],
+        content=content,
+        title=document_id,
+        source_type=source.value,
+        source_links={0: f"https://{document_id}"},
+        semantic_identifier=document_id,
+        section_continuation=False,
+        metadata={},
+        metadata_list=[],
+        primary_owners=None,
+        secondary_owners=None,
+        doc_updated_at=int(updated_at.timestamp()) if updated_at else None,
+        boost=0,
+        hidden=False,
+        access_control_list=acl,
+        document_sets=document_sets or [],
+    )
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    return (vector / np.linalg.norm(vector, axis=-1, keepdims=True)).astype(np.float32)
+
+
+class TestLocalIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.rng = np.random.default_rng(0)
+        self.store = LocalIndexStore(self.tmp_dir.name, merge_factor=3)
+        self.store.ensure_exists()
+        self.embeddings: dict[str, np.ndarray] = {}
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def _add(
+        self, chunks: list[StoredChunk], store: LocalIndexStore | None = None
+    ) -> set[str]:
+        embeddings = _unit(self.rng.normal(size=(len(chunks), _DIM)))
+        for chunk, embedding in zip(chunks, embeddings):
+            self.embeddings[f"{chunk.document_id}__{chunk.chunk_id}"] = embedding
+        return (store or self.store).add_chunks(
+            chunks=chunks,
+            embeddings=embeddings,
+            title_embeddings=embeddings,
+            has_title=np.ones(len(chunks), dtype=bool),
+            mini_embeddings=np.zeros((0, _DIM), dtype=np.float32),
+            mini_owners=np.zeros(0, dtype=np.int32),
+        )
+
+    def _keyword(
+        self, query: str, filters: IndexFilters | None = None
+    ) -> list[tuple[str, int]]:
+        hits = keyword_hits(
+            self.store.views(),
+            query=query,
+            filters=filters or IndexFilters(access_control_list=_PUBLIC),
+            decay_factor=0.0,
+            num_to_retrieve=10,
+        )
+        return [
+            (hit.view.chunks[hit.row].document_id, hit.view.chunks[hit.row].chunk_id)
+            for hit in hits
+        ]
+
+    def _doc_ids(self, query: str, filters: IndexFilters | None = None) -> set[str]:
+        return {document_id for document_id, _ in self._keyword(query, filters)}
+
+    def test_keyword_ranking(self) -> None:
+        self._add([_chunk("a", 0, "the cat sat on the mat")])
+        self._add([_chunk("b", 0, "cat cat cat, the cat is a cat")])
+        self._add([_chunk("c", 0, "dogs only here")])
+
+        self.assertEqual(self._keyword("cat"), [("b", 0), ("a", 0)])
+        self.assertEqual(self._keyword("dogs"), [("c", 0)])
+        self.assertEqual(self._keyword("giraffe"), [])
+
+    def test_semantic_ranking(self) -> None:
+        self._add([_chunk("a", 0, "first"), _chunk("a", 1, "second")])
+        self._add([_chunk("b", 0, "third")])
+
+        for key, embedding in self.embeddings.items():
+            hits = semantic_hits(
+                self.store.views(),
+                query_embedding=embedding,
+                filters=IndexFilters(access_control_list=_PUBLIC),
+                decay_factor=0.0,
+                num_to_retrieve=3,
+            )
+            top = hits[0].view.chunks[hits[0].row]
+            self.assertEqual(f"{top.document_id}__{top.chunk_id}", key)
+            self.assertAlmostEqual(hits[0].score, 1.0, places=3)
+            self.assertEqual(len(hits), 3)
+
+        hits = hybrid_hits(
+            self.store.views(),
+            query="third",
+            query_embedding=self.embeddings["a__1"],
+            filters=IndexFilters(access_control_list=_PUBLIC),
+            decay_factor=0.0,
+            num_to_retrieve=3,
+            hybrid_alpha=0.0,
+            title_content_ratio=0.0,
+            target_hits=1,
+        )
+        self.assertEqual(
+            [hit.view.chunks[hit.row].document_id for hit in hits], ["b", "a"]
+        )
+
+    def test_filters(self) -> None:
+        self._add(
+            [
+                _chunk(
+                    "public_web",
+                    0,
+                    "shared words",
+                    document_sets=["set1"],
+                    updated_at=datetime(2020, 1, 1, tzinfo=timezone.utc),
+                )
+            ]
+        )
+        self._add(
+            [
+                _chunk(
+                    "private_confluence",
+                    0,
+                    "shared words",
+                    source=DocumentSource.CONFLUENCE,
+                    acl=["user_email:a@b.com"],
+                    updated_at=datetime(2023, 1, 1, tzinfo=timezone.utc),
+                )
+            ]
+        )
+        self._add([_chunk("untimed", 0, "shared words")])
+
+        self.assertEqual(self._doc_ids("shared"), {"public_web", "untimed"})
+        self.assertEqual(
+            self._doc_ids(
+                "shared", IndexFilters(access_control_list=["user_email:a@b.com"])
+            ),
+            {"private_confluence"},
+        )
+        self.assertEqual(
+            self._doc_ids("shared", IndexFilters(access_control_list=[])), set()
+        )
+        self.assertEqual(
+            self._doc_ids(
+                "shared",
+                IndexFilters(
+                    access_control_list=_PUBLIC + ["user_email:a@b.com"],
+                    source_type=[DocumentSource.CONFLUENCE],
+                ),
+            ),
+            {"private_confluence"},
+        )
+        self.assertEqual(
+            self._doc_ids(
+                "shared",
+                IndexFilters(access_control_list=_PUBLIC, document_set=["set1"]),
+            ),
+            {"public_web"},
+        )
+        self.assertEqual(
+            self._doc_ids(
+                "shared",
+                IndexFilters(
+                    access_control_list=_PUBLIC + ["user_email:a@b.com"],
+                    time_cutoff=datetime(2022, 1, 1, tzinfo=timezone.utc),
+                ),
+            ),
+            # Same as Vespa, untimed documents are treated as a few months old
+            {"private_confluence", "untimed"},
+        )
+
+    def test_reindex_update_delete_and_reload(self) -> None:
+        self.assertEqual(
+            self._add([_chunk("a", 0, "apple pie"), _chunk("a", 1, "apple tart")]),
+            set(),
+        )
+        self._add([_chunk("b", 0, "banana bread")])
+        # Reindexing replaces all previous chunks of the document
+        self.assertEqual(self._add([_chunk("a", 0, "cherry pie")]), {"a"})
+        self.assertEqual(self._keyword("apple"), [])
+        self.assertEqual(self._keyword("cherry"), [("a", 0)])
+
+        self.store.update_documents(
+            {"b": {HIDDEN: True}, "a": {BOOST: 2, ACCESS_CONTROL_LIST: ["group:x"]}}
+        )
+        self.assertEqual(self._keyword("banana"), [])
+        self.assertEqual(self._keyword("cherry"), [])
+        hits = admin_hits(
+            self.store.views(),
+            query="banana",
+            filters=IndexFilters(access_control_list=None),
+            num_to_retrieve=10,
+        )
+        self.assertTrue(hit_to_inference_chunk(hits[0], highlight_query=None).hidden)
+
+        self.store.delete_documents(["b"])
+        # A fresh store only sees what was persisted
+        reloaded = LocalIndexStore(self.tmp_dir.name)
+        self.store = reloaded
+        self.assertEqual(
+            self._doc_ids("cherry", IndexFilters(access_control_list=["group:x"])),
+            {"a"},
+        )
+        hits = id_hits(
+            reloaded.views(), "a", None, IndexFilters(access_control_list=None)
+        )
+        self.assertEqual(len(hits), 1)
+        self.assertEqual(hits[0].view.chunks[hits[0].row].boost, 2)
+        self.assertEqual(
+            id_hits(
+                reloaded.views(), "b", None, IndexFilters(access_control_list=None)
+            ),
+            [],
+        )
+
+    def test_segments_are_merged(self) -> None:
+        for ind in range(5):
+            self._add([_chunk(f"doc{ind}", 0, f"word{ind} common")])
+        self.store.update_documents({"doc0": {BOOST: 1}})
+
+        self.assertLessEqual(len(self.store.views()), 3)
+        self.assertEqual(self._doc_ids("common"), {f"doc{ind}" for ind in range(5)})
+        self.assertEqual(self._keyword("common")[0], ("doc0", 0))
+
+        reloaded = LocalIndexStore(self.tmp_dir.name)
+        self.assertEqual(sum(int(view.live.sum()) for view in reloaded.views()), 5)
+
+    def test_merging_is_size_tiered(self) -> None:
+        saved_chunks: list[int] = []
+        save_segment = Segment.save
+
+        def _counting_save(segment: Segment, index_dir: str) -> None:
+            saved_chunks.append(len(segment.chunks))
+            save_segment(segment, index_dir)
+
+        num_docs = 200
+        with patch.object(Segment, "save", _counting_save):
+            for ind in range(num_docs):
+                self._add([_chunk(f"doc{ind}", 0, f"word{ind} common")])
+                # Never more than merge_factor - 1 segments per tier
+                max_tiers = math.floor(math.log(ind + 1, 3)) + 1
+                self.assertLessEqual(len(self.store.views()), 2 * max_tiers)
+
+        # Each chunk is written once when added and then once per tier it moves up,
+        # merging everything every few batches would be quadratic instead
+        self.assertLessEqual(
+            sum(saved_chunks), num_docs * (math.ceil(math.log(num_docs, 3)) + 1)
+        )
+        self.assertEqual(
+            sum(int(view.live.sum()) for view in self.store.views()), num_docs
+        )
+
+        # Deleted chunks don't count towards the size of a segment
+        self.store.delete_documents([f"doc{ind}" for ind in range(num_docs - 1)])
+        self.assertEqual(len(self.store.views()), 1)
+        self.assertEqual(self._doc_ids("common"), {f"doc{num_docs - 1}"})
+
+    def test_inference_chunk_highlights(self) -> None:
+        self._add([_chunk("a", 0, "a\r\n\r\nFirst sentence. Second has the apple.")])
+        hit = id_hits(
+            self.store.views(), "a", 0, IndexFilters(access_control_list=None)
+        )[0]
+        chunk = hit_to_inference_chunk(hit, highlight_query="apple")
+        self.assertEqual(chunk.content, "First sentence. Second has the apple.")
+        self.assertEqual(chunk.match_highlights, ["Second has the <hi>apple</hi>."])
+        self.assertEqual(chunk.source_type, DocumentSource.WEB)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+import unittest
+from typing import Any
+from unittest.mock import patch
+
+from payserai.access.models import DocumentAccess
+from payserai.configs.constants import ACCESS_CONTROL_LIST
+from payserai.configs.constants import BOOST
+from payserai.configs.constants import CONTENT
+from payserai.configs.constants import DOCUMENT_ID
+from payserai.configs.constants import DOCUMENT_SETS
+from payserai.configs.constants import DocumentSource
+from payserai.connectors.models import Document
+from payserai.connectors.models import Section
+from payserai.document_index.document_index_utils import get_uuid_from_chunk
+from payserai.document_index.interfaces import DocumentInsertionRecord
+from payserai.document_index.vespa import index as vespa_index
+from payserai.document_index.vespa.feed import VespaFeedOperation
+from payserai.indexing.models import ChunkEmbedding
+from payserai.indexing.models import DocMetadataAwareIndexChunk
+
+
+def _chunk(
+    document_id: str,
+    chunk_id: int,
+    content: str,
+    is_public: bool = True,
+    document_sets: set[str] | None = None,
+    boost: int = 0,
+) -> DocMetadataAwareIndexChunk:
+    return DocMetadataAwareIndexChunk(
+        chunk_id=chunk_id,
+        blurb=content[:20],
+        content=content,
+        source_links={0: f"https://{document_id}"},
+        section_continuation=False,
+        source_document=Document(
+            id=document_id,
+            sections=[Section(link=f"https://{document_id}", text=content)],
+            source=DocumentSource.WEB,
+            semantic_identifier=document_id,
+            metadata={},
+        ),
+        embeddings=ChunkEmbedding(full_embedding=[0.1, 0.2], mini_chunk_embeddings=[]),
+        title_embedding=None,
+        access=DocumentAccess(user_ids=set(), is_public=is_public),
+        document_sets=document_sets or set(),
+        boost=boost,
+        token_count=len(content.split()),
+    )
+
+
+def _hit(
+    chunk: DocMetadataAwareIndexChunk, fields: dict[str, Any] | None = None
+) -> dict[str, Any]:
+    """The hit Vespa returns for the chunk as it was indexed"""
+    vespa_fields = vespa_index._vespa_chunk_fields(chunk)
+    return {
+        "fields": {
+            "documentid": f"id:default:payserai_chunk::{get_uuid_from_chunk(chunk)}",
+            DOCUMENT_ID: chunk.source_document.id,
+            vespa_index.CONTENT_HASH: vespa_fields[vespa_index.CONTENT_HASH],
+            ACCESS_CONTROL_LIST: vespa_fields[ACCESS_CONTROL_LIST],
+            BOOST: vespa_fields[BOOST],
+            DOCUMENT_SETS: vespa_fields[DOCUMENT_SETS],
+            **(fields or {}),
+        }
+    }
+
+
+def _url(chunk: DocMetadataAwareIndexChunk) -> str:
+    return f"{vespa_index.DOCUMENT_ID_ENDPOINT}/{get_uuid_from_chunk(chunk)}"
+
+
+class TestDiffIndexVespaChunks(unittest.TestCase):
+    def _diff_index(
+        self,
+        chunks: list[DocMetadataAwareIndexChunk],
+        stored_hits: list[dict[str, Any]],
+    ) -> tuple[list[VespaFeedOperation], set[DocumentInsertionRecord]]:
+        with patch.object(
+            vespa_index, "_get_documents_hits", return_value=stored_hits
+        ), patch.object(vespa_index, "feed_operations", return_value={}) as mock_feed:
+            records = vespa_index._diff_index_vespa_chunks(chunks)
+        return mock_feed.call_args.args[0], records
+
+    def test_new_document_written(self) -> None:
+        chunk = _chunk("doc", 0, "some content")
+        feed_ops, records = self._diff_index([chunk], stored_hits=[])
+
+        self.assertEqual(
+            [(op.method, op.url) for op in feed_ops], [("POST", _url(chunk))]
+        )
+        self.assertEqual(
+            records, {DocumentInsertionRecord(document_id="doc", already_existed=False)}
+        )
+
+    def test_unchanged_chunk_skipped(self) -> None:
+        chunk = _chunk("doc", 0, "some content")
+        feed_ops, records = self._diff_index([chunk], stored_hits=[_hit(chunk)])
+
+        self.assertEqual(feed_ops, [])
+        self.assertEqual(
+            records, {DocumentInsertionRecord(document_id="doc", already_existed=True)}
+        )
+
+    def test_changed_content_rewritten(self) -> None:
+        old_chunk = _chunk("doc", 0, "old content")
+        new_chunk = _chunk("doc", 0, "new content")
+        feed_ops, _ = self._diff_index([new_chunk], stored_hits=[_hit(old_chunk)])
+
+        self.assertEqual(len(feed_ops), 1)
+        self.assertEqual(feed_ops[0].method, "POST")
+        self.assertEqual(feed_ops[0].url, _url(new_chunk))
+        assert feed_ops[0].body is not None
+        self.assertEqual(
+            feed_ops[0].body["fields"][CONTENT],
+            "new content",
+        )
+
+    def test_metadata_only_change_updated_in_place(self) -> None:
+        old_chunk = _chunk("doc", 0, "some content")
+        cases: list[tuple[DocMetadataAwareIndexChunk, dict[str, Any]]] = [
+            (
+                _chunk("doc", 0, "some content", is_public=False),
+                {ACCESS_CONTROL_LIST: {"assign": {}}},
+            ),
+            (
+                _chunk("doc", 0, "some content", boost=2),
+                {BOOST: {"assign": 2}},
+            ),
+            (
+                _chunk("doc", 0, "some content", document_sets={"set"}),
+                {DOCUMENT_SETS: {"assign": {"set": 1}}},
+            ),
+        ]
+        for new_chunk, expected_fields in cases:
+            feed_ops, _ = self._diff_index([new_chunk], stored_hits=[_hit(old_chunk)])
+
+            self.assertEqual(len(feed_ops), 1)
+            self.assertEqual(feed_ops[0].method, "PUT")
+            self.assertEqual(feed_ops[0].url, _url(new_chunk))
+            self.assertEqual(feed_ops[0].body, {"fields": expected_fields})
+
+    def test_shrunk_document_deletes_only_removed_chunks(self) -> None:
+        old_chunks = [_chunk("doc", ind, f"content {ind}") for ind in range(3)]
+        new_chunks = [_chunk("doc", 0, "content 0"), _chunk("doc", 1, "changed")]
+        feed_ops, _ = self._diff_index(
+            new_chunks, stored_hits=[_hit(chunk) for chunk in old_chunks]
+        )
+
+        self.assertEqual(
+            sorted((op.method, op.url) for op in feed_ops),
+            sorted([("POST", _url(new_chunks[1])), ("DELETE", _url(old_chunks[2]))]),
+        )
+
+    def test_chunk_without_hash_rewritten(self) -> None:
+        chunk = _chunk("doc", 0, "some content")
+        feed_ops, _ = self._diff_index(
+            [chunk], stored_hits=[_hit(chunk, {vespa_index.CONTENT_HASH: None})]
+        )
+
+        self.assertEqual(
+            [(op.method, op.url) for op in feed_ops], [("POST", _url(chunk))]
+        )
+
+    def test_weighted_sets_in_list_form(self) -> None:
+        chunk = _chunk("doc", 0, "some content", document_sets={"a", "b"})
+        stored_hit = _hit(
+            chunk,
+            {
+                ACCESS_CONTROL_LIST: [{"item": "PUBLIC", "weight": 1}],
+                DOCUMENT_SETS: [
+                    {"item": "b", "weight": 1},
+                    {"item": "a", "weight": 1},
+                ],
+            },
+        )
+        feed_ops, _ = self._diff_index([chunk], stored_hits=[stored_hit])
+
+        self.assertEqual(feed_ops, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import random
+import string
+import unittest
+from unittest.mock import patch
+
+from tokenizers import models  # type:ignore
+from tokenizers import pre_tokenizers  # type:ignore
+from tokenizers import Tokenizer  # type:ignore
+from transformers import PreTrainedTokenizerFast  # type:ignore
+
+from payserai.configs.constants import DocumentSource
+from payserai.configs.constants import SECTION_SEPARATOR
+from payserai.configs.constants import TITLE_SEPARATOR
+from payserai.connectors.models import Document
+from payserai.connectors.models import Section
+from payserai.indexing import chunker
+from payserai.indexing.chunker import chunk_document
+from payserai.indexing.models import DocAwareChunk
+from payserai.utils.text_processing import shared_precompare_cleanup
+
+_WORDS = (
+    "payment transfer account card limit refund policy verification document "
+    "customer support onboarding server deployment approval compliance report"
+).split()
+
+
+def _wordpiece_tokenizer() -> PreTrainedTokenizerFast:
+    """A BERT style tokenizer that splits words into characters, built locally so that
+    the tests don't need to download the embedding model"""
+    characters = string.ascii_letters + string.digits + string.punctuation
+    vocab = {"[UNK]": 0}
+    for character in characters:
+        vocab[character] = len(vocab)
+        vocab[f"##{character}"] = len(vocab)
+    tokenizer = Tokenizer(models.WordPiece(vocab=vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, unk_token="[UNK]")
+
+
+def _document(rng: random.Random, num_sections: int) -> Document:
+    sections = []
+    for section_ind in range(num_sections):
+        # Mostly short sections, with the occasional one larger than a chunk
+        num_words = rng.randint(3, 40) if rng.random() > 0.1 else 600
+        sections.append(
+            Section(
+                link=f"https://wiki.example.com/page#section-{section_ind}",
+                text=" ".join(rng.choice(_WORDS) for _ in range(num_words)) + ".",
+            )
+        )
+    return Document(
+        id="doc",
+        sections=sections,
+        source=DocumentSource.WEB,
+        semantic_identifier="Page\nTitle",
+        metadata={},
+    )
+
+
+def _chunk_signature(chunk: DocAwareChunk) -> tuple:
+    return (
+        chunk.chunk_id,
+        chunk.blurb,
+        chunk.content,
+        chunk.source_links,
+        chunk.section_continuation,
+    )
+
+
+def _retokenized_link_offsets(chunk: DocAwareChunk) -> list[int]:
+    """The link offsets computed from the whole chunk text before each section, which is
+    how chunk_document used to compute them"""
+    section_texts = chunk.content.split(SECTION_SEPARATOR)
+    return [
+        len(shared_precompare_cleanup(SECTION_SEPARATOR.join(section_texts[:ind])))
+        for ind in range(len(section_texts))
+    ]
+
+
+class TestChunkDocument(unittest.TestCase):
+    def setUp(self) -> None:
+        tokenizer_patch = patch.object(
+            chunker, "get_default_tokenizer", return_value=_wordpiece_tokenizer()
+        )
+        tokenizer_patch.start()
+        self.addCleanup(tokenizer_patch.stop)
+
+    def test_tokenizer_is_whitespace_additive(self) -> None:
+        self.assertTrue(chunker._is_whitespace_additive(_wordpiece_tokenizer()))
+
+    def test_running_token_count_matches_retokenizing(self) -> None:
+        rng = random.Random(0)
+        for num_sections in [1, 5, 50, 200]:
+            document = _document(rng, num_sections)
+            for chunk_tok_size in [64, 256]:
+                incremental_chunks = chunk_document(
+                    document, chunk_tok_size=chunk_tok_size, blurb_size=16
+                )
+                with patch.object(
+                    chunker, "_is_whitespace_additive", return_value=False
+                ):
+                    retokenized_chunks = chunk_document(
+                        document, chunk_tok_size=chunk_tok_size, blurb_size=16
+                    )
+
+                self.assertGreater(len(incremental_chunks), 0)
+                for chunk in incremental_chunks:
+                    if chunk.section_continuation or len(chunk.source_links or {}) < 2:
+                        continue
+                    self.assertEqual(
+                        list(chunk.source_links or {}),
+                        _retokenized_link_offsets(chunk),
+                    )
+                self.assertEqual(
+                    [_chunk_signature(chunk) for chunk in incremental_chunks],
+                    [_chunk_signature(chunk) for chunk in retokenized_chunks],
+                )
+
+    def test_link_offsets(self) -> None:
+        document = Document(
+            id="doc",
+            sections=[
+                Section(link="https://a", text="First  section."),
+                Section(link="https://b", text="Second section!"),
+                Section(link="https://c", text="Third"),
+            ],
+            source=DocumentSource.WEB,
+            semantic_identifier="Doc",
+            metadata={},
+        )
+        chunks = chunk_document(document, chunk_tok_size=512, blurb_size=16)
+
+        self.assertEqual(len(chunks), 1)
+        # Offsets are into the text with whitespace and punctuation removed
+        title_and_first = shared_precompare_cleanup(
+            "Doc" + TITLE_SEPARATOR + "First  section."
+        )
+        second = shared_precompare_cleanup("Second section!")
+        self.assertEqual(
+            chunks[0].source_links,
+            {
+                0: "https://a",
+                len(title_and_first): "https://b",
+                len(title_and_first) + len(second): "https://c",
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import time
+import unittest
+
+from payserai.indexing.embedding_cache import chunk_embedding_cache_key
+from payserai.indexing.embedding_cache import ChunkEmbeddingCache
+
+
+class TestChunkEmbeddingCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, "embeddings.sqlite")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_key_depends_on_model_prefix_and_text(self) -> None:
+        key = chunk_embedding_cache_key("model-a", "passage: ", "some text")
+
+        self.assertEqual(
+            key, chunk_embedding_cache_key("model-a", "passage: ", "some text")
+        )
+        self.assertNotEqual(
+            key, chunk_embedding_cache_key("model-b", "passage: ", "some text")
+        )
+        self.assertNotEqual(key, chunk_embedding_cache_key("model-a", "", "some text"))
+        self.assertNotEqual(
+            key, chunk_embedding_cache_key("model-a", "passage: ", "some text!")
+        )
+
+    def test_persists_across_instances(self) -> None:
+        cache = ChunkEmbeddingCache(self.db_path)
+        cache.set_many({"a": [0.1, 0.2], "b": [0.3, 0.4]})
+
+        reopened = ChunkEmbeddingCache(self.db_path)
+        self.assertEqual(
+            reopened.get_many(["a", "b", "c"]), {"a": [0.1, 0.2], "b": [0.3, 0.4]}
+        )
+
+        stats = reopened.stats()
+        self.assertEqual(stats.hits, 2)
+        self.assertEqual(stats.misses, 1)
+
+    def test_evicts_oldest_beyond_max_entries(self) -> None:
+        cache = ChunkEmbeddingCache(self.db_path, max_entries=2)
+        for key in ["a", "b", "c"]:
+            # Reset so that every write is allowed to trigger an eviction
+            cache._last_evicted_at = None
+            cache.set_many({key: [1.0]})
+            time.sleep(0.01)
+
+        self.assertEqual(len(cache.backing), 2)
+        self.assertEqual(set(cache.get_many(["a", "b", "c"])), {"b", "c"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from typing import Any
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from payserai.configs.constants import DocumentSource
+from payserai.connectors.models import Document
+from payserai.connectors.models import IndexAttemptMetadata
+from payserai.connectors.models import Section
+from payserai.indexing import indexing_pipeline
+from payserai.indexing.indexing_pipeline import _prepare_and_chunk_doc_batch
+
+
+def _document(document_id: str) -> Document:
+    return Document(
+        id=document_id,
+        sections=[Section(link=f"https://{document_id}", text="some content")],
+        source=DocumentSource.WEB,
+        semantic_identifier=document_id,
+        metadata={},
+    )
+
+
+class TestPrepareAndChunkDocBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        # Ids of the documents upserted in each round, followed by "commit" markers
+        self.events: list[Any] = []
+        self.locked_by_other_job: set[str] = set()
+        self.chunker = MagicMock()
+        self.chunker.chunk_batch.return_value = []
+
+        db_session = MagicMock()
+        db_session.commit.side_effect = lambda: self.events.append("commit")
+        session = MagicMock()
+        session.__enter__.return_value = db_session
+
+        def _acquire(db_session: Any, document_ids: list[str]) -> list[str]:
+            return [
+                doc_id for doc_id in document_ids if doc_id in self.locked_by_other_job
+            ]
+
+        def _upsert(documents: list[Document], **kwargs: Any) -> None:
+            self.events.append([doc.id for doc in documents])
+
+        patches = [
+            patch.object(indexing_pipeline, "Session", return_value=session),
+            patch.object(indexing_pipeline, "get_sqlalchemy_engine"),
+            patch.object(indexing_pipeline, "get_documents_by_ids", return_value=[]),
+            patch.object(
+                indexing_pipeline, "upsert_documents_in_db", side_effect=_upsert
+            ),
+            patch(
+                "payserai.db.document.acquire_available_document_locks",
+                side_effect=_acquire,
+            ),
+            # A few long waits instead of many short ones until the max wait
+            patch("payserai.db.document._lock_retry_delay", return_value=60.0),
+            patch("payserai.db.document.time.sleep"),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _prepare(self, documents: list[Document]) -> None:
+        _prepare_and_chunk_doc_batch(
+            documents,
+            chunker=self.chunker,
+            index_attempt_metadata=IndexAttemptMetadata(
+                connector_id=1, credential_id=1
+            ),
+            ignore_time_skip=False,
+        )
+
+    def test_documents_locked_right_away(self) -> None:
+        documents = [_document("a"), _document("b")]
+        self._prepare(documents)
+
+        self.assertEqual(self.events, [["a", "b"], "commit"])
+        self.chunker.chunk_batch.assert_called_once_with(documents=documents)
+
+    def test_lock_timeout(self) -> None:
+        self.locked_by_other_job = {"b"}
+        with self.assertRaises(RuntimeError):
+            self._prepare([_document("a"), _document("b")])
+
+        # The document which could be locked is committed before the batch fails, the
+        # batch is not chunked
+        self.assertEqual(self.events[:2], [["a"], "commit"])
+        self.assertEqual([event for event in self.events if event != "commit"], [["a"]])
+        self.chunker.chunk_batch.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from payserai.configs.constants import EmbeddingPrecision
+from payserai.indexing.quantization import quantize_embedding
+
+
+class TestQuantization(unittest.TestCase):
+    def test_float_is_unchanged(self) -> None:
+        embedding = [0.1, -0.2, 0.3]
+        self.assertIs(
+            quantize_embedding(embedding, EmbeddingPrecision.FLOAT), embedding
+        )
+
+    def test_bfloat16(self) -> None:
+        # 1 + 2^-8 is exactly between two bfloat16 values, rounds to the even one
+        quantized = quantize_embedding(
+            [1.0, 1 + 2**-8, 1 + 3 * 2**-8, -0.1], EmbeddingPrecision.BFLOAT16
+        )
+        self.assertEqual(quantized[:3], [1.0, 1.0, 1 + 2**-6])
+        # The lower 16 bits are dropped
+        self.assertEqual(np.float32(quantized[3]).view(np.uint32) & 0xFFFF, 0)
+        self.assertAlmostEqual(quantized[3], -0.1, places=3)
+
+    def test_int8(self) -> None:
+        self.assertEqual(
+            quantize_embedding([0.5, -0.25, 0.0, 0.1], EmbeddingPrecision.INT8),
+            [127.0, -64.0, 0.0, 25.0],
+        )
+        self.assertEqual(
+            quantize_embedding([0.0, 0.0], EmbeddingPrecision.INT8), [0.0, 0.0]
+        )
+
+    def test_quantized_similarity_is_close(self) -> None:
+        rng = np.random.default_rng(0)
+        first, second = rng.normal(size=(2, 384))
+
+        def _cosine(a: list[float], b: list[float]) -> float:
+            return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+        expected = _cosine(first.tolist(), second.tolist())
+        for precision in [EmbeddingPrecision.BFLOAT16, EmbeddingPrecision.INT8]:
+            self.assertAlmostEqual(
+                _cosine(
+                    quantize_embedding(first.tolist(), precision),
+                    quantize_embedding(second.tolist(), precision),
+                ),
+                expected,
+                places=2,
+            )
+
+    def test_unknown_precision(self) -> None:
+        with self.assertRaises(ValueError):
+            quantize_embedding([1.0], "float16")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import string
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import torch
+from sentence_transformers import CrossEncoder  # type: ignore
+from tokenizers import models  # type:ignore
+from tokenizers import normalizers  # type:ignore
+from tokenizers import pre_tokenizers  # type:ignore
+from tokenizers import processors  # type:ignore
+from tokenizers import Tokenizer  # type:ignore
+from transformers import BertConfig  # type:ignore
+from transformers import BertForSequenceClassification  # type:ignore
+from transformers import PreTrainedTokenizerFast  # type:ignore
+
+from payserai.search.search_nlp_models import CrossEncoderEnsembleScorer
+
+_QUERY = "how do I get a refund for my card"
+_PASSAGES = [
+    "Refunds are sent back to the card used for the payment.",
+    "The server deployment needs an approval from compliance.",
+    "  Card limits can be changed in the account settings.  ",
+    "Onboarding documents are verified within two days.",
+    "Contact customer support to dispute a transfer.",
+]
+
+
+def _bert_tokenizer() -> PreTrainedTokenizerFast:
+    """A character level BERT style tokenizer, built locally so that the tests don't need
+    to download any model"""
+    special_tokens = ["[PAD]", "[UNK]", "[CLS]", "[SEP]"]
+    vocab = {token: ind for ind, token in enumerate(special_tokens)}
+    for character in string.ascii_lowercase + string.digits + string.punctuation:
+        vocab[character] = len(vocab)
+        vocab[f"##{character}"] = len(vocab)
+
+    tokenizer = Tokenizer(models.WordPiece(vocab=vocab, unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.BertNormalizer(lowercase=True)
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]",
+        pair="[CLS] $A [SEP] $B:1 [SEP]:1",
+        special_tokens=[("[CLS]", vocab["[CLS]"]), ("[SEP]", vocab["[SEP]"])],
+    )
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        unk_token="[UNK]",
+        pad_token="[PAD]",
+        cls_token="[CLS]",
+        sep_token="[SEP]",
+    )
+
+
+def _save_cross_encoder(model_dir: str, seed: int) -> None:
+    """A randomly initialized single layer cross encoder"""
+    tokenizer = _bert_tokenizer()
+    torch.manual_seed(seed)
+    model = BertForSequenceClassification(
+        BertConfig(
+            vocab_size=len(tokenizer),
+            hidden_size=16,
+            num_hidden_layers=1,
+            num_attention_heads=2,
+            intermediate_size=32,
+            max_position_embeddings=256,
+            num_labels=1,
+        )
+    )
+    model.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+
+
+class TestCrossEncoderEnsembleScorer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.model_dirs = []
+        for seed in range(2):
+            model_dir = os.path.join(cls.temp_dir.name, f"model-{seed}")
+            _save_cross_encoder(model_dir, seed)
+            cls.model_dirs.append(model_dir)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.temp_dir.cleanup()
+
+    def _cross_encoders(self, max_lengths: list[int]) -> list[CrossEncoder]:
+        return [
+            CrossEncoder(model_dir, max_length=max_length, device="cpu")
+            for model_dir, max_length in zip(self.model_dirs, max_lengths)
+        ]
+
+    @staticmethod
+    def _per_model_scores(
+        cross_encoders: list[CrossEncoder], passages: list[str]
+    ) -> np.ndarray:
+        return np.stack(
+            [
+                cross_encoder.predict([(_QUERY, passage) for passage in passages])
+                for cross_encoder in cross_encoders
+            ]
+        )
+
+    def test_same_scores_as_per_model_predict(self) -> None:
+        cross_encoders = self._cross_encoders([64, 64])
+        expected = self._per_model_scores(cross_encoders, _PASSAGES)
+
+        for run_concurrently in [False, True]:
+            scorer = CrossEncoderEnsembleScorer(
+                cross_encoders,
+                batch_size=2,
+                run_concurrently=run_concurrently,
+                early_cutoff_score=None,
+            )
+            scores = scorer.predict(_QUERY, _PASSAGES)
+
+            self.assertEqual(scores.shape, (2, len(_PASSAGES)))
+            np.testing.assert_allclose(scores, expected, atol=1e-5)
+
+        self.assertEqual(scorer.predict(_QUERY, []).shape, (2, 0))
+
+    def test_shared_tokenizer_tokenizes_once(self) -> None:
+        for max_lengths, expected_calls in [([64, 64], 1), ([64, 32], 2)]:
+            scorer = CrossEncoderEnsembleScorer(
+                self._cross_encoders(max_lengths),
+                run_concurrently=False,
+                early_cutoff_score=None,
+            )
+            with patch.object(
+                scorer, "_tokenize", wraps=scorer._tokenize
+            ) as mock_tokenize:
+                scorer.predict(_QUERY, _PASSAGES)
+
+            self.assertEqual(mock_tokenize.call_count, expected_calls)
+
+    def test_early_cutoff_keeps_first_model_score(self) -> None:
+        cross_encoders = self._cross_encoders([64, 64])
+        expected = self._per_model_scores(cross_encoders, _PASSAGES)
+        cutoff = float(np.median(expected[0]))
+        kept = expected[0] >= cutoff
+
+        scorer = CrossEncoderEnsembleScorer(
+            cross_encoders, run_concurrently=False, early_cutoff_score=cutoff
+        )
+        with patch.object(scorer, "_run_model", wraps=scorer._run_model) as mock_run:
+            scores = scorer.predict(_QUERY, _PASSAGES)
+
+        np.testing.assert_allclose(scores[0], expected[0], atol=1e-5)
+        np.testing.assert_allclose(scores[1, kept], expected[1, kept], atol=1e-5)
+        np.testing.assert_allclose(scores[1, ~kept], expected[0, ~kept], atol=1e-5)
+
+        # The second model only ran on the passages above the cutoff
+        second_model_batches = mock_run.call_args_list[1].args[1]
+        self.assertEqual(
+            sum(len(features["input_ids"]) for features in second_model_batches),
+            int(kept.sum()),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
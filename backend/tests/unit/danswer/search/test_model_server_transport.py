@@ -0,0 +1,122 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+
+import httpx
+import numpy as np
+
+from payserai.search import search_nlp_models
+from payserai.search.search_nlp_models import CrossEncoderEnsembleModel
+from payserai.search.search_nlp_models import EmbeddingModel
+from shared_models.model_server_models import FLOAT_MATRIX_CONTENT_TYPE
+from shared_models.model_server_models import serialize_float_matrix
+
+_EMBEDDINGS = [[0.5, -1.0, 2.0], [1.5, 0.25, -0.75]]
+_SCORES = [[0.1, 0.9], [0.2, 0.8]]
+
+
+class _FakeModelServer:
+    """Responds with the binary format only if it is asked for and supported, like a
+    model server from before the binary format would"""
+
+    def __init__(self, supports_binary: bool) -> None:
+        self.supports_binary = supports_binary
+        self.accept_headers: list[str | None] = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        accept = request.headers.get("Accept")
+        self.accept_headers.append(accept)
+        if request.url.path.endswith("/bi-encoder-embed"):
+            texts = json.loads(request.content)["texts"]
+            matrix = _EMBEDDINGS[: len(texts)]
+            json_body: dict = {"embeddings": matrix}
+        else:
+            matrix = _SCORES
+            json_body = {"scores": matrix}
+
+        if self.supports_binary and accept and FLOAT_MATRIX_CONTENT_TYPE in accept:
+            return httpx.Response(
+                200,
+                content=serialize_float_matrix(matrix),
+                headers={"Content-Type": FLOAT_MATRIX_CONTENT_TYPE},
+            )
+        return httpx.Response(200, json=json_body)
+
+
+class TestModelServerTransport(unittest.TestCase):
+    def _patch_clients(self, server: _FakeModelServer) -> None:
+        transport = httpx.MockTransport(server.handle)
+        patches = [
+            patch.object(
+                search_nlp_models,
+                "get_shared_http_client",
+                return_value=httpx.Client(transport=transport),
+            ),
+            patch.object(
+                search_nlp_models,
+                "get_shared_async_http_client",
+                side_effect=lambda *args: httpx.AsyncClient(transport=transport),
+            ),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _models(
+        self, binary_transport: bool
+    ) -> tuple[EmbeddingModel, CrossEncoderEnsembleModel]:
+        return (
+            EmbeddingModel(
+                model_server_host="http://model-server",
+                model_server_port=9000,
+                is_indexing=False,
+                binary_transport=binary_transport,
+            ),
+            CrossEncoderEnsembleModel(
+                model_server_host="http://model-server",
+                model_server_port=9000,
+                binary_transport=binary_transport,
+            ),
+        )
+
+    def _check_results(
+        self, embedding_model: EmbeddingModel, reranker: CrossEncoderEnsembleModel
+    ) -> None:
+        embeddings = embedding_model.encode_as_array(["a", "b"])
+        self.assertEqual(embeddings.dtype, np.float32)
+        self.assertEqual(embeddings.tolist(), _EMBEDDINGS)
+        self.assertEqual(
+            asyncio.run(embedding_model.aencode_as_array(["a", "b"])).tolist(),
+            _EMBEDDINGS,
+        )
+
+        scores = reranker.predict_as_array(query="q", passages=["a", "b"])
+        np.testing.assert_allclose(scores, _SCORES, rtol=1e-6)
+        np.testing.assert_allclose(
+            asyncio.run(reranker.apredict_as_array(query="q", passages=["a", "b"])),
+            _SCORES,
+            rtol=1e-6,
+        )
+
+    def test_binary_transport(self) -> None:
+        server = _FakeModelServer(supports_binary=True)
+        self._patch_clients(server)
+        self._check_results(*self._models(binary_transport=True))
+        self.assertEqual(server.accept_headers, [FLOAT_MATRIX_CONTENT_TYPE] * 4)
+
+    def test_falls_back_to_json_if_server_ignores_binary(self) -> None:
+        server = _FakeModelServer(supports_binary=False)
+        self._patch_clients(server)
+        self._check_results(*self._models(binary_transport=True))
+        self.assertEqual(server.accept_headers, [FLOAT_MATRIX_CONTENT_TYPE] * 4)
+
+    def test_json_transport(self) -> None:
+        server = _FakeModelServer(supports_binary=True)
+        self._patch_clients(server)
+        self._check_results(*self._models(binary_transport=False))
+        self.assertNotIn(FLOAT_MATRIX_CONTENT_TYPE, server.accept_headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import random
+import unittest
+
+import numpy as np
+
+from payserai.document_index.document_index_utils import (
+    translate_boost_count_to_multiplier,
+)
+from payserai.search.scoring import boost_multipliers
+from payserai.search.scoring import boosted_scores
+from payserai.search.scoring import legacy_boosted_scores
+from payserai.search.scoring import rank_descending
+from payserai.search.scoring import reranked_scores
+
+
+def _sorted_desc(scores: list[float]) -> list[int]:
+    ranked = list(zip(scores, range(len(scores))))
+    ranked.sort(key=lambda x: x[0], reverse=True)
+    return [ind for _, ind in ranked]
+
+
+class TestScoring(unittest.TestCase):
+    def setUp(self) -> None:
+        self.rng = random.Random(0)
+        # Rounded so that there are plenty of ties
+        self.scores = [round(self.rng.uniform(0, 1), 2) for _ in range(500)]
+        self.boosts = [self.rng.randint(-5, 5) for _ in range(500)]
+        self.recency = [self.rng.uniform(0.5, 1) for _ in range(500)]
+
+    def test_boost_multipliers(self) -> None:
+        self.assertEqual(
+            boost_multipliers(self.boosts).tolist(),
+            [translate_boost_count_to_multiplier(boost) for boost in self.boosts],
+        )
+
+    def test_rank_descending_matches_stable_sort(self) -> None:
+        expected = _sorted_desc(self.scores)
+        scores = np.array(self.scores)
+
+        self.assertEqual(rank_descending(scores).tolist(), expected)
+        for top_k in [0, 1, 7, 100, 499, 500, 1000]:
+            self.assertEqual(
+                rank_descending(scores, top_k=top_k).tolist(), expected[:top_k]
+            )
+
+    def test_boosted_scores_match_per_chunk(self) -> None:
+        norm_cutoff, norm_min, norm_max = 50, 0.0, 1.0
+        norm_min = min(norm_min, min(self.scores[:norm_cutoff]))
+        norm_max = max(norm_max, max(self.scores[:norm_cutoff]))
+        expected = [
+            max(
+                0,
+                (score - norm_min)
+                * translate_boost_count_to_multiplier(boost)
+                * recency
+                / (norm_max - norm_min),
+            )
+            for score, boost, recency in zip(self.scores, self.boosts, self.recency)
+        ]
+
+        result = boosted_scores(
+            np.array(self.scores),
+            multipliers=boost_multipliers(self.boosts),
+            recency_multipliers=np.array(self.recency),
+            norm_cutoff=norm_cutoff,
+            norm_min=0.0,
+            norm_max=1.0,
+        )
+        self.assertEqual(result.tolist(), expected)
+
+    def test_legacy_boosted_scores_match_per_chunk(self) -> None:
+        scores = [score * 3 - 1 for score in self.scores]
+        score_min, score_max = min(scores), max(scores)
+        score_range = score_max - score_min
+        norm_min, norm_max = min(0.0, score_min), max(1.0, score_max)
+        expected = [
+            (
+                ((score - score_min) / score_range)
+                * translate_boost_count_to_multiplier(boost)
+                * score_range
+                + score_min
+                - norm_min
+            )
+            / (norm_max - norm_min)
+            for score, boost in zip(scores, self.boosts)
+        ]
+
+        result = legacy_boosted_scores(
+            np.array(scores),
+            multipliers=boost_multipliers(self.boosts),
+            norm_min=0.0,
+            norm_max=1.0,
+        )
+        self.assertEqual(result.tolist(), expected)
+
+    def test_reranked_scores_match_per_chunk(self) -> None:
+        sim_scores = np.array(
+            [
+                [self.rng.uniform(-12, 12) for _ in range(len(self.scores))]
+                for _ in range(2)
+            ],
+            dtype=np.float32,
+        )
+        model_min, model_max = -12, 12
+        # The list based implementation semantic_reranking used before
+        sim_score_rows = list(sim_scores)
+        expected_raw = sum(sim_score_rows) / len(sim_score_rows)
+        models_min = np.min(sim_score_rows)
+        shifted = sum([row - models_min for row in sim_score_rows]) / len(
+            sim_score_rows
+        )
+        boosted = (
+            shifted
+            * [translate_boost_count_to_multiplier(boost) for boost in self.boosts]
+            * self.recency
+        )
+        expected = (boosted + models_min - model_min) / (model_max - model_min)
+
+        normalized, raw = reranked_scores(
+            sim_scores,
+            multipliers=boost_multipliers(self.boosts),
+            recency_multipliers=np.array(self.recency),
+            model_min=model_min,
+            model_max=model_max,
+        )
+
+        self.assertTrue(np.array_equal(raw, expected_raw))
+        self.assertTrue(np.array_equal(normalized, expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import time
+import unittest
+
+from payserai.configs.constants import DocumentSource
+from payserai.indexing.models import InferenceChunk
+from payserai.search.models import IndexFilters
+from payserai.search.models import SearchQuery
+from payserai.search.semantic_cache import search_signature
+from payserai.search.semantic_cache import SemanticSearchCache
+
+
+def _chunk(document_id: str, chunk_id: int = 0) -> InferenceChunk:
+    return InferenceChunk(
+        document_id=document_id,
+        chunk_id=chunk_id,
+        blurb="blurb",
+        content="content",
+        source_links={0: f"https://{document_id}"},
+        section_continuation=False,
+        source_type=DocumentSource.WEB,
+        semantic_identifier=document_id,
+        boost=0,
+        recency_bias=1.0,
+        score=1.0,
+        hidden=False,
+        metadata={},
+        match_highlights=[],
+        updated_at=None,
+    )
+
+
+def _signature(query: str = "query", **filters: object) -> str:
+    return search_signature(
+        SearchQuery(
+            query=query,
+            filters=IndexFilters(access_control_list=["PUBLIC"], **filters),
+            recency_bias_multiplier=1.0,
+        ),
+        hybrid_alpha=0.6,
+    )
+
+
+class TestSemanticSearchCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.invalidated: set[str] = set()
+        self.cache = SemanticSearchCache(
+            max_size=2,
+            ttl_secs=60,
+            similarity_threshold=0.95,
+            fetch_invalidations=self._fetch_invalidations,
+            invalidation_poll_secs=0,
+        )
+
+    def _fetch_invalidations(self, after_id: int | None) -> tuple[int, set[str]]:
+        invalidated = self.invalidated
+        self.invalidated = set()
+        return (after_id or 0) + 1, invalidated
+
+    def test_similar_query_hits(self) -> None:
+        self.cache.set([1.0, 0.0], _signature(), [_chunk("a")], [True])
+
+        cached = self.cache.get([0.99, 0.05], _signature("other wording"))
+        assert cached is not None
+        chunks, llm_chunk_selection = cached
+        self.assertEqual([chunk.document_id for chunk in chunks], ["a"])
+        self.assertEqual(llm_chunk_selection, [True])
+
+        self.assertIsNone(self.cache.get([0.0, 1.0], _signature()))
+        self.assertEqual(self.cache.stats().hits, 1)
+        self.assertEqual(self.cache.stats().misses, 1)
+
+    def test_different_filters_miss(self) -> None:
+        self.cache.set(
+            [1.0, 0.0],
+            _signature(source_type=[DocumentSource.WEB, DocumentSource.CONFLUENCE]),
+            [_chunk("a")],
+            [False],
+        )
+
+        self.assertIsNone(
+            self.cache.get([1.0, 0.0], _signature(source_type=[DocumentSource.WEB]))
+        )
+        # Filter order does not matter
+        self.assertIsNotNone(
+            self.cache.get(
+                [1.0, 0.0],
+                _signature(source_type=[DocumentSource.CONFLUENCE, DocumentSource.WEB]),
+            )
+        )
+
+    def test_invalidation(self) -> None:
+        self.cache.set([1.0, 0.0], _signature(), [_chunk("a"), _chunk("b")], [])
+        self.cache.set([0.0, 1.0], _signature(), [_chunk("c")], [])
+
+        self.cache.invalidate_documents({"b"})
+        self.assertIsNone(self.cache.get([1.0, 0.0], _signature()))
+        self.assertIsNotNone(self.cache.get([0.0, 1.0], _signature()))
+
+        # Changes made by other processes are picked up by the next poll
+        self.invalidated = {"c"}
+        self.assertIsNotNone(self.cache.get([0.0, 1.0], _signature()))
+        self.cache.poll_invalidations()
+        self.assertIsNone(self.cache.get([0.0, 1.0], _signature()))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_background_polling(self) -> None:
+        self.cache.invalidation_poll_secs = 0.01
+        self.cache.set([1.0, 0.0], _signature(), [_chunk("a")], [])
+        self.invalidated = {"a"}
+
+        self.cache.start_polling()
+        try:
+            deadline = time.monotonic() + 5
+            while len(self.cache) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            self.cache.stop_polling()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_expiry_and_eviction(self) -> None:
+        self.cache.set([1.0, 0.0], _signature(), [_chunk("a")], [])
+        self.cache.set([0.0, 1.0], _signature(), [_chunk("b")], [])
+        self.cache.get([1.0, 0.0], _signature())
+        # The least recently used entry makes room
+        self.cache.set([1.0, 1.0], _signature(), [_chunk("c")], [])
+        self.assertIsNone(self.cache.get([0.0, 1.0], _signature()))
+        self.assertIsNotNone(self.cache.get([1.0, 0.0], _signature()))
+
+        self.cache.ttl_secs = 0
+        self.cache.set([-1.0, 0.0], _signature(), [_chunk("d")], [])
+        time.sleep(0.01)
+        self.assertIsNone(self.cache.get([-1.0, 0.0], _signature()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,214 @@
+import asyncio
+import unittest
+from collections.abc import Callable
+from concurrent.futures import wait
+from datetime import datetime
+from datetime import timezone
+from typing import Any
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from payserai.configs.constants import DocumentSource
+from payserai.search import search_runner
+from payserai.search import speculative_retrieval
+from payserai.search.models import IndexFilters
+from payserai.search.models import RetrievalMetricsContainer
+from payserai.search.models import SearchQuery
+from payserai.search.models import SearchType
+from payserai.search.search_runner import full_chunk_search_generator
+from payserai.search.speculative_retrieval import AsyncSpeculativeRetrieval
+from payserai.search.speculative_retrieval import retrieves_same_chunks
+from payserai.search.speculative_retrieval import SpeculativeRetrieval
+
+_QUERY = SearchQuery(
+    query="how do I get a refund",
+    filters=IndexFilters(access_control_list=["PUBLIC"]),
+    recency_bias_multiplier=1.0,
+    skip_rerank=True,
+    skip_llm_chunk_filter=True,
+)
+_METRICS = RetrievalMetricsContainer(search_type=SearchType.HYBRID, metrics=[])
+
+
+def _changed_queries() -> list[SearchQuery]:
+    """Final queries which retrieve differently than _QUERY"""
+    return [
+        _QUERY.copy(
+            update={
+                "filters": _QUERY.filters.copy(
+                    update={"time_cutoff": datetime(2024, 1, 1, tzinfo=timezone.utc)}
+                )
+            }
+        ),
+        _QUERY.copy(
+            update={
+                "filters": _QUERY.filters.copy(
+                    update={"source_type": [DocumentSource.WEB]}
+                )
+            }
+        ),
+        _QUERY.copy(update={"recency_bias_multiplier": 0.5}),
+        _QUERY.copy(update={"query": "how do I get a refund?"}),
+    ]
+
+
+class _FakeRetrieval:
+    def __init__(self, error: Exception | None = None) -> None:
+        self.error = error
+        self.chunks = [MagicMock()]
+        self.queries: list[SearchQuery] = []
+
+    def retrieve(
+        self,
+        query: SearchQuery,
+        retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None]
+        | None = None,
+        **kwargs: Any,
+    ) -> list[Any]:
+        self.queries.append(query)
+        if self.error is not None:
+            raise self.error
+        if retrieval_metrics_callback is not None:
+            retrieval_metrics_callback(_METRICS)
+        return self.chunks
+
+    async def aretrieve(self, query: SearchQuery, **kwargs: Any) -> list[Any]:
+        return self.retrieve(query, **kwargs)
+
+
+class TestRetrievesSameChunks(unittest.TestCase):
+    def test_retrieval_fields(self) -> None:
+        self.assertTrue(retrieves_same_chunks(_QUERY, _QUERY.copy()))
+        # Reranking and the LLM chunk filter run with the final query anyway
+        self.assertTrue(
+            retrieves_same_chunks(
+                _QUERY, _QUERY.copy(update={"skip_rerank": False, "num_rerank": 5})
+            )
+        )
+        for changed_query in _changed_queries():
+            self.assertFalse(retrieves_same_chunks(_QUERY, changed_query))
+
+
+class TestSpeculativeRetrieval(unittest.TestCase):
+    def _speculate(self, fake_retrieval: _FakeRetrieval) -> SpeculativeRetrieval:
+        with patch.object(
+            speculative_retrieval,
+            "retrieve_chunks",
+            side_effect=fake_retrieval.retrieve,
+        ):
+            speculation = SpeculativeRetrieval(_QUERY, document_index=MagicMock())
+            # The patch has to outlive the background retrieval
+            wait([speculation._future])
+        return speculation
+
+    def test_matching_query_reuses_retrieval(self) -> None:
+        fake_retrieval = _FakeRetrieval()
+        speculation = self._speculate(fake_retrieval)
+
+        metrics: list[RetrievalMetricsContainer] = []
+        self.assertIs(
+            speculation.retrieved_chunks(_QUERY.copy(), metrics.append),
+            fake_retrieval.chunks,
+        )
+        self.assertEqual(metrics, [_METRICS])
+        self.assertEqual(fake_retrieval.queries, [_QUERY])
+
+    def test_changed_query_discards_retrieval(self) -> None:
+        for changed_query in _changed_queries():
+            speculation = self._speculate(_FakeRetrieval())
+
+            metrics: list[RetrievalMetricsContainer] = []
+            self.assertIsNone(
+                speculation.retrieved_chunks(changed_query, metrics.append)
+            )
+            # The discarded retrieval is not reported
+            self.assertEqual(metrics, [])
+
+    def test_failed_retrieval_falls_back(self) -> None:
+        speculation = self._speculate(_FakeRetrieval(error=RuntimeError("timed out")))
+        metrics: list[RetrievalMetricsContainer] = []
+        retrieved_chunks = speculation.retrieved_chunks(_QUERY, metrics.append)
+        self.assertIsNone(retrieved_chunks)
+
+        # The search then retrieves with the final query itself
+        fallback_retrieval = _FakeRetrieval()
+        with patch.object(
+            search_runner, "_get_semantic_search_cache", return_value=None
+        ), patch.object(
+            search_runner, "retrieve_chunks", side_effect=fallback_retrieval.retrieve
+        ), patch.object(
+            search_runner, "_log_top_chunk_links"
+        ):
+            top_chunks = next(
+                full_chunk_search_generator(
+                    search_query=_QUERY,
+                    document_index=MagicMock(),
+                    retrieval_metrics_callback=metrics.append,
+                    retrieved_chunks=retrieved_chunks,
+                )
+            )
+
+        self.assertIs(top_chunks, fallback_retrieval.chunks)
+        self.assertEqual(fallback_retrieval.queries, [_QUERY])
+        self.assertEqual(metrics, [_METRICS])
+
+
+class TestAsyncSpeculativeRetrieval(unittest.TestCase):
+    def _run(self, fake_retrieval: _FakeRetrieval, coroutine: Any) -> Any:
+        with patch.object(
+            speculative_retrieval,
+            "aretrieve_chunks",
+            side_effect=fake_retrieval.aretrieve,
+        ):
+            return asyncio.run(coroutine)
+
+    def test_matching_query_reuses_retrieval(self) -> None:
+        fake_retrieval = _FakeRetrieval()
+        metrics: list[RetrievalMetricsContainer] = []
+
+        async def _speculate() -> Any:
+            speculation = AsyncSpeculativeRetrieval(_QUERY, document_index=MagicMock())
+            return await speculation.retrieved_chunks(_QUERY.copy(), metrics.append)
+
+        self.assertIs(self._run(fake_retrieval, _speculate()), fake_retrieval.chunks)
+        self.assertEqual(metrics, [_METRICS])
+        self.assertEqual(fake_retrieval.queries, [_QUERY])
+
+    def test_changed_query_cancels_retrieval(self) -> None:
+        async def _speculate(changed_query: SearchQuery) -> bool:
+            retrieval_started = asyncio.Event()
+
+            async def _slow_retrieval(**kwargs: Any) -> list[Any]:
+                retrieval_started.set()
+                await asyncio.sleep(60)
+                return []
+
+            with patch.object(
+                speculative_retrieval, "aretrieve_chunks", side_effect=_slow_retrieval
+            ):
+                speculation = AsyncSpeculativeRetrieval(
+                    _QUERY, document_index=MagicMock()
+                )
+            await retrieval_started.wait()
+            self.assertIsNone(await speculation.retrieved_chunks(changed_query))
+            # Let the cancellation reach the task
+            await asyncio.sleep(0)
+            return speculation._task.cancelled()
+
+        for changed_query in _changed_queries():
+            self.assertTrue(asyncio.run(_speculate(changed_query)))
+
+    def test_failed_retrieval_falls_back(self) -> None:
+        fake_retrieval = _FakeRetrieval(error=RuntimeError("timed out"))
+        metrics: list[RetrievalMetricsContainer] = []
+
+        async def _speculate() -> Any:
+            speculation = AsyncSpeculativeRetrieval(_QUERY, document_index=MagicMock())
+            return await speculation.retrieved_chunks(_QUERY, metrics.append)
+
+        self.assertIsNone(self._run(fake_retrieval, _speculate()))
+        self.assertEqual(metrics, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
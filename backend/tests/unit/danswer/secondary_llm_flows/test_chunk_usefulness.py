@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from payserai.secondary_llm_flows import chunk_usefulness
+from payserai.secondary_llm_flows.chunk_usefulness import extract_batch_usefulness
+from payserai.secondary_llm_flows.chunk_usefulness import llm_batch_eval_chunks
+from payserai.utils.cache import SqliteCacheBacking
+from payserai.utils.cache import TTLLRUCache
+
+
+class TestExtractBatchUsefulness(unittest.TestCase):
+    def test_verdict_line_formats(self) -> None:
+        model_output = "\n".join(
+            [
+                "1: Yes useful",
+                "Section 2) Not Useful",
+                "**3.** Not useful",
+                '4 - "Not useful"',
+                "**5.** Yes useful",
+            ]
+        )
+        self.assertEqual(
+            extract_batch_usefulness(model_output, 5),
+            [True, False, False, False, True],
+        )
+
+    def test_out_of_range_sections_ignored(self) -> None:
+        model_output = "0: Not useful\n3: Not useful\n1: Not useful"
+        self.assertEqual(extract_batch_usefulness(model_output, 2), [False, True])
+
+    def test_missing_lines_default_to_useful(self) -> None:
+        model_output = "Here are the verdicts:\n2: Not useful"
+        self.assertEqual(extract_batch_usefulness(model_output, 3), [True, False, True])
+        self.assertEqual(extract_batch_usefulness("", 2), [True, True])
+
+
+class TestLlmBatchEvalChunks(unittest.TestCase):
+    def test_failed_evaluations_not_cached(self) -> None:
+        cache: TTLLRUCache[bool] = TTLLRUCache(max_size=10)
+        with patch.object(
+            chunk_usefulness, "DISABLE_GENERATIVE_AI", False
+        ), patch.object(
+            chunk_usefulness, "_get_chunk_verdict_cache", return_value=cache
+        ), patch.object(
+            chunk_usefulness,
+            "_llm_eval_uncached_chunks",
+            return_value=[False, None],
+        ) as mock_eval:
+            verdicts = llm_batch_eval_chunks(
+                "query", ["chunk a", "chunk b"], use_threads=False
+            )
+            # The failed evaluation keeps the chunk
+            self.assertEqual(verdicts, [False, True])
+            self.assertEqual(len(cache), 1)
+
+            mock_eval.return_value = [True]
+            verdicts = llm_batch_eval_chunks(
+                "query", ["chunk a", "chunk b"], use_threads=False
+            )
+            # Only the chunk without a cached verdict is evaluated again
+            self.assertEqual(mock_eval.call_args.args[1], ["chunk b"])
+            self.assertEqual(verdicts, [False, True])
+            self.assertEqual(len(cache), 2)
+
+    def test_verdict_table_pruned(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "verdicts.sqlite")
+            backing = SqliteCacheBacking(db_path, table_name="chunk_verdicts")
+            backing.set_many({f"stale{ind}": True for ind in range(5)})
+
+            with patch.object(
+                chunk_usefulness, "_CHUNK_VERDICT_CACHE", None
+            ), patch.object(
+                chunk_usefulness, "LLM_CHUNK_FILTER_CACHE_PATH", db_path
+            ), patch.object(
+                chunk_usefulness, "LLM_CHUNK_FILTER_CACHE_SIZE", 2
+            ):
+                cache = chunk_usefulness._get_chunk_verdict_cache()
+                assert cache is not None
+                cache.set("fresh", False)
+
+            self.assertEqual(len(backing), 2)
+            self.assertEqual(backing.get("fresh"), False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import time
+import unittest
+
+from payserai.utils.cache import SqliteCacheBacking
+from payserai.utils.cache import TTLLRUCache
+
+
+class TestTTLLRUCache(unittest.TestCase):
+    def test_lru_eviction(self) -> None:
+        cache: TTLLRUCache[int] = TTLLRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)  # "b" is now least recently used
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+        stats = cache.stats()
+        self.assertEqual(stats.hits, 3)
+        self.assertEqual(stats.misses, 1)
+        self.assertEqual(stats.size, 2)
+
+    def test_ttl_expiry(self) -> None:
+        cache: TTLLRUCache[int] = TTLLRUCache(max_size=10, ttl_secs=0.05)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_sqlite_backing_shared(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "cache.sqlite")
+            writer: TTLLRUCache[list[float]] = TTLLRUCache(
+                max_size=10, backing=SqliteCacheBacking(db_path)
+            )
+            reader: TTLLRUCache[list[float]] = TTLLRUCache(
+                max_size=10, backing=SqliteCacheBacking(db_path)
+            )
+            writer.set("query", [0.1, 0.2])
+            self.assertEqual(reader.get("query"), [0.1, 0.2])
+
+            backing = SqliteCacheBacking(db_path)
+            backing.set_many({"x": 1, "y": 2})
+            backing.evict(max_entries=1)
+            self.assertEqual(len(backing), 1)
+
+    def test_sqlite_backing_pruned_on_write(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            backing = SqliteCacheBacking(os.path.join(tmp_dir, "cache.sqlite"))
+            cache: TTLLRUCache[int] = TTLLRUCache(
+                max_size=2, backing=backing, eviction_interval_secs=0
+            )
+            for ind in range(5):
+                cache.set(f"key{ind}", ind)
+            self.assertEqual(len(backing), 2)
+            self.assertEqual(backing.get_many(["key3", "key4"]), {"key3": 3, "key4": 4})
+
+            # Expired rows are deleted, not only skipped on read
+            expiring_cache: TTLLRUCache[int] = TTLLRUCache(
+                max_size=10, ttl_secs=0.05, backing=backing, eviction_interval_secs=0
+            )
+            time.sleep(0.1)
+            expiring_cache.set("fresh", 1)
+            self.assertEqual(len(backing), 1)
+
+    def test_sqlite_backing_eviction_throttled(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            backing = SqliteCacheBacking(os.path.join(tmp_dir, "cache.sqlite"))
+            cache: TTLLRUCache[int] = TTLLRUCache(max_size=1, backing=backing)
+            for ind in range(3):
+                cache.set(f"key{ind}", ind)
+            # Only the first write evicted, the following ones are within the interval
+            self.assertEqual(len(backing), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+import httpx
+
+from payserai.utils.http_client import get_shared_http_client
+from payserai.utils.http_client import HttpClientConfig
+from payserai.utils.http_client import send_with_retries
+
+_NO_BACKOFF_CONFIG = HttpClientConfig(retries=2, backoff_secs=0)
+
+
+def _client_with_responses(
+    responses: list[httpx.Response | Exception],
+) -> tuple[httpx.Client, list[httpx.Request]]:
+    sent_requests: list[httpx.Request] = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        sent_requests.append(request)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    return httpx.Client(transport=httpx.MockTransport(_handler)), sent_requests
+
+
+class TestSendWithRetries(unittest.TestCase):
+    def test_retries_server_errors(self) -> None:
+        client, sent_requests = _client_with_responses(
+            [
+                httpx.Response(503),
+                httpx.ConnectError("refused"),
+                httpx.Response(200, json={"ok": True}),
+            ]
+        )
+        response = send_with_retries(
+            client, _NO_BACKOFF_CONFIG, "POST", "http://model-server/x", json={}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(sent_requests), 3)
+
+    def test_does_not_retry_client_errors(self) -> None:
+        client, sent_requests = _client_with_responses([httpx.Response(422)])
+        response = send_with_retries(
+            client, _NO_BACKOFF_CONFIG, "POST", "http://model-server/x", json={}
+        )
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(len(sent_requests), 1)
+
+    def test_raises_after_last_attempt(self) -> None:
+        client, sent_requests = _client_with_responses(
+            [httpx.ConnectError("refused") for _ in range(3)]
+        )
+        with self.assertRaises(httpx.ConnectError):
+            send_with_retries(client, _NO_BACKOFF_CONFIG, "GET", "http://model-server/")
+        self.assertEqual(len(sent_requests), 3)
+
+
+class TestSharedHttpClient(unittest.TestCase):
+    def test_client_is_reused_per_name(self) -> None:
+        config = HttpClientConfig()
+        client = get_shared_http_client("test-a", config)
+
+        self.assertIs(get_shared_http_client("test-a", config), client)
+        self.assertIsNot(get_shared_http_client("test-b", config), client)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import asyncio
+import contextvars
+import threading
+import time
+import unittest
+from collections.abc import Iterator
+from unittest.mock import patch
+
+from payserai.utils.threadpool_concurrency import aiterate_in_thread
+from payserai.utils.threadpool_concurrency import ExecutorName
+from payserai.utils.threadpool_concurrency import FunctionCall
+from payserai.utils.threadpool_concurrency import gather_with_limit
+from payserai.utils.threadpool_concurrency import run_functions_in_parallel
+from payserai.utils.threadpool_concurrency import run_functions_tuples_in_parallel
+from payserai.utils.threadpool_concurrency import run_in_pipelined_stages
+from payserai.utils.threadpool_concurrency import SharedExecutor
+
+_REQUEST_ID: contextvars.ContextVar[str] = contextvars.ContextVar("request_id")
+
+
+class TestRunInPipelinedStages(unittest.TestCase):
+    def test_results_are_ordered(self) -> None:
+        def _slow_for_even(item: int) -> int:
+            if item % 2 == 0:
+                time.sleep(0.01)
+            return item * 10
+
+        results = list(
+            run_in_pipelined_stages(
+                range(10),
+                stages=[("multiply", _slow_for_even), ("add", lambda item: item + 1)],
+            )
+        )
+
+        self.assertEqual(results, [item * 10 + 1 for item in range(10)])
+
+    def test_stages_overlap(self) -> None:
+        # Only passed if the first stage handles item 1 while the second handles item 0
+        barrier = threading.Barrier(2, timeout=5)
+
+        def _first_stage(item: int) -> int:
+            if item == 1:
+                barrier.wait()
+            return item
+
+        def _second_stage(item: int) -> int:
+            if item == 0:
+                barrier.wait()
+            return item
+
+        results = list(
+            run_in_pipelined_stages(
+                range(3), stages=[("first", _first_stage), ("second", _second_stage)]
+            )
+        )
+        self.assertEqual(results, [0, 1, 2])
+
+    def test_failure_is_raised_after_earlier_results(self) -> None:
+        def _fail_on_two(item: int) -> int:
+            if item == 2:
+                raise ValueError("bad item")
+            return item
+
+        results: list[int] = []
+        with self.assertRaises(ValueError):
+            for result in run_in_pipelined_stages(
+                range(100),
+                stages=[("first", lambda item: item), ("second", _fail_on_two)],
+            ):
+                results.append(result)
+
+        self.assertEqual(results, [0, 1])
+
+
+class TestSharedExecutors(unittest.TestCase):
+    def test_results_and_failures(self) -> None:
+        def _fail_on_two(item: int) -> int:
+            if item == 2:
+                raise ValueError("bad item")
+            time.sleep(0.01)
+            return item
+
+        functions_with_args = [(_fail_on_two, (item,)) for item in range(5)]
+        self.assertEqual(
+            run_functions_tuples_in_parallel(functions_with_args, allow_failures=True),
+            [0, 1, None, 3, 4],
+        )
+        with self.assertRaises(ValueError):
+            run_functions_tuples_in_parallel(functions_with_args)
+
+        function_call = FunctionCall(_fail_on_two, (1,))
+        self.assertEqual(
+            run_functions_in_parallel([function_call]), {function_call.result_id: 1}
+        )
+        self.assertEqual(run_functions_in_parallel([]), {})
+
+    def test_nested_calls_on_saturated_executor(self) -> None:
+        # A single thread which is busy with the outer calls, the caller has to help out
+        executor = SharedExecutor("test", max_workers=1)
+        with patch.dict(
+            "payserai.utils.threadpool_concurrency._EXECUTORS",
+            {ExecutorName.SEARCH_IO: executor},
+        ):
+
+            def _outer(item: int) -> list[int]:
+                return run_functions_tuples_in_parallel(
+                    [(lambda x: x * 10, (item + ind,)) for ind in range(3)]
+                )
+
+            results = run_functions_tuples_in_parallel(
+                [(_outer, (item,)) for item in range(4)]
+            )
+
+        self.assertEqual(
+            results, [[item * 10 + ind * 10 for ind in range(3)] for item in range(4)]
+        )
+        # Leftover helper jobs find nothing to do
+        executor._executor.shutdown(wait=True)
+        self.assertEqual(executor.stats().queued, 0)
+
+    def test_context_is_propagated(self) -> None:
+        _REQUEST_ID.set("abc")
+        results = run_functions_tuples_in_parallel(
+            [(_REQUEST_ID.get, ()) for _ in range(4)]
+        )
+        self.assertEqual(results, ["abc"] * 4)
+
+        executor = SharedExecutor("test", max_workers=2)
+        self.assertEqual(executor.submit(_REQUEST_ID.get).result(), "abc")
+        stats = executor.stats()
+        self.assertEqual((stats.completed, stats.active, stats.queued), (1, 0, 0))
+
+
+class TestAiterateInThread(unittest.TestCase):
+    def test_items_and_errors_are_forwarded(self) -> None:
+        def _items() -> Iterator[int]:
+            yield 1
+            yield 2
+            raise ValueError("bad item")
+
+        async def _consume() -> list[int]:
+            return [item async for item in aiterate_in_thread(_items())]
+
+        with self.assertRaises(ValueError):
+            asyncio.run(_consume())
+
+        async def _consume_range() -> list[int]:
+            return [item async for item in aiterate_in_thread(iter(range(5)))]
+
+        self.assertEqual(asyncio.run(_consume_range()), [0, 1, 2, 3, 4])
+
+    def test_event_loop_is_not_blocked(self) -> None:
+        def _slow_items() -> Iterator[int]:
+            for item in range(3):
+                time.sleep(0.05)
+                yield item
+
+        async def _run() -> tuple[list[int], int]:
+            ticks = 0
+
+            async def _ticker() -> None:
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticker = asyncio.create_task(_ticker())
+            items = [item async for item in aiterate_in_thread(_slow_items())]
+            ticker.cancel()
+            return items, ticks
+
+        items, ticks = asyncio.run(_run())
+        self.assertEqual(items, [0, 1, 2])
+        # The blocking sleeps happen off the loop so the ticker keeps running
+        self.assertGreater(ticks, 5)
+
+
+class TestGatherWithLimit(unittest.TestCase):
+    def test_in_flight_limit(self) -> None:
+        in_flight = 0
+        max_seen = 0
+
+        async def _request(value: int) -> int:
+            nonlocal in_flight, max_seen
+            in_flight += 1
+            max_seen = max(max_seen, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            if value == 3:
+                raise ValueError("bad request")
+            return value
+
+        results = asyncio.run(
+            gather_with_limit(
+                [_request(value) for value in range(8)],
+                max_in_flight=2,
+                return_exceptions=True,
+            )
+        )
+        self.assertEqual(max_seen, 2)
+        self.assertEqual(results[:3], [0, 1, 2])
+        self.assertIsInstance(results[3], ValueError)
+        self.assertEqual(results[4:], [4, 5, 6, 7])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import threading
+import unittest
+
+from model_server.batching import EmbedRequestBatcher
+
+
+class TestEmbedRequestBatcher(unittest.TestCase):
+    def test_concurrent_requests_are_coalesced(self) -> None:
+        batch_sizes: list[int] = []
+
+        def fake_embed(texts: list[str]) -> list[list[float]]:
+            batch_sizes.append(len(texts))
+            return [[float(len(text))] for text in texts]
+
+        batcher = EmbedRequestBatcher(
+            embed_func=fake_embed, max_batch_size=64, max_wait_ms=200
+        )
+        texts = ["a" * i for i in range(1, 9)]
+        results: dict[int, list[list[float]]] = {}
+
+        def _call(ind: int) -> None:
+            results[ind] = batcher.embed([texts[ind]])
+
+        threads = [threading.Thread(target=_call, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for ind, text in enumerate(texts):
+            self.assertEqual(results[ind], [[float(len(text))]])
+        self.assertEqual(sum(batch_sizes), 8)
+        self.assertLess(len(batch_sizes), 8)
+
+    def test_max_batch_size_respected(self) -> None:
+        batch_sizes: list[int] = []
+
+        def fake_embed(texts: list[str]) -> list[list[float]]:
+            batch_sizes.append(len(texts))
+            return [[0.0] for _ in texts]
+
+        batcher = EmbedRequestBatcher(
+            embed_func=fake_embed, max_batch_size=4, max_wait_ms=100
+        )
+        threads = [
+            threading.Thread(target=batcher.embed, args=(["x", "y", "z"],))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(batch_sizes), 12)
+        self.assertTrue(all(size <= 4 for size in batch_sizes))
+
+    def test_failure_propagates(self) -> None:
+        def failing_embed(texts: list[str]) -> list[list[float]]:
+            raise RuntimeError("model failure")
+
+        batcher = EmbedRequestBatcher(embed_func=failing_embed, max_wait_ms=1)
+        with self.assertRaises(RuntimeError):
+            batcher.embed(["query"])
+
+
+if __name__ == "__main__":
+    unittest.main()
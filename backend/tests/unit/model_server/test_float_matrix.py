@@ -0,0 +1,48 @@
+import unittest
+
+import numpy as np
+
+from shared_models.model_server_models import deserialize_float_matrix
+from shared_models.model_server_models import serialize_float_matrix
+
+
+class TestFloatMatrixSerialization(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        matrix = np.random.default_rng(0).standard_normal((3, 5))
+        result = deserialize_float_matrix(serialize_float_matrix(matrix))
+
+        self.assertEqual(result.shape, (3, 5))
+        self.assertEqual(result.dtype, np.float32)
+        np.testing.assert_array_equal(result, matrix.astype(np.float32))
+
+    def test_round_trip_from_lists(self) -> None:
+        result = deserialize_float_matrix(serialize_float_matrix([[1.0, 2.5]]))
+        self.assertEqual(result.tolist(), [[1.0, 2.5]])
+
+    def test_empty_matrix(self) -> None:
+        empty_matrices: list[np.ndarray | list[list[float]]] = [[], np.zeros((0, 4))]
+        for matrix in empty_matrices:
+            result = deserialize_float_matrix(serialize_float_matrix(matrix))
+            self.assertEqual(result.size, 0)
+            self.assertEqual(result.ndim, 2)
+
+    def test_not_a_matrix(self) -> None:
+        with self.assertRaises(ValueError):
+            serialize_float_matrix(np.zeros(3))
+
+    def test_malformed_payload(self) -> None:
+        data = serialize_float_matrix(np.ones((2, 3)))
+        for malformed in [
+            b"",
+            data[:5],
+            # Truncated in the middle of the values
+            data[:-4],
+            data[:-2],
+            data + b"\x00\x00\x00\x00",
+        ]:
+            with self.assertRaises(ValueError):
+                deserialize_float_matrix(malformed)
+
+
+if __name__ == "__main__":
+    unittest.main()